@@ -7,21 +7,75 @@ data from OpenStreetMap using OSMnx, with support for local incremental storage.
 
 Usage:
     python map_tool.py fetch "<PLACE_NAME>" --output-dir path/to/data
-    python map_tool.py merge --folder path/to/data --output path/to/master.graphml
+    python map_tool.py geocode places.txt
+    python map_tool.py fetch-batch places.txt --output-dir path/to/data
+    python map_tool.py fetch-plan plan.json --output-dir path/to/data
+    python map_tool.py merge --folder path/to/data --output path/to/master.graphml.gz
     python map_tool.py stats path/to/network.graphml
+    python map_tool.py compact-routing path/to/master.graphml --output path/to/routing.graphml
+    python map_tool.py isochrones path/to/master.graphml --hub 49.19,-122.85 --output path/to/isochrones
+    python map_tool.py shard path/to/master.graphml --output-dir path/to/shards
+    python map_tool.py diff old.graphml new.graphml --output changes.jsonl
+    python map_tool.py apply-osc path/to/master.graphml changes.osc.gz
 """
 
 import argparse
+import ast
+import cProfile
+import csv
+import glob
+import gzip
+import hashlib
+import heapq
 import json
 import logging
+import multiprocessing
+import os
+import queue
 import re
+import shutil
+import sqlite3
 import sys
+import tempfile
+import threading
 import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
 import networkx as nx
+import numpy as np
 import osmnx as ox
+import pyproj
+import shapely
+from shapely import wkb as shapely_wkb
+from shapely import wkt as shapely_wkt
+from shapely.geometry import LineString, Polygon
+from shapely.geometry import box as shapely_box
+from shapely.ops import unary_union
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows; peak RSS is reported as null there
+    resource = None
+
+try:
+    import zstandard
+except ImportError:
+    # optional; only needed for .graphml.zst files
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # optional; only needed for the parquet/arrow export
+    pa = pq = None
 
 # =============================================================================
 # Constants
@@ -91,9 +145,21 @@ DEFAULT_CONFIG = {
     "overpass_memory": 1073741824,
     "overpass_endpoint": None,
     "data_root": "./data",
+    "geocode_db": None,
+    "edge_db": None,
     "extra_useful_tags": [],
+    "routing_profiles": {},
 }
 
+# Geocode store file under data_root when "geocode_db" is not set
+DEFAULT_GEOCODE_DB_NAME = "geocode.sqlite"
+
+# Edge store file under data_root when "edge_db" is not set
+DEFAULT_EDGE_DB_NAME = "edges.sqlite"
+
+# Default directory for --profile output
+DEFAULT_PROFILE_DIR = Path("./data/profiles")
+
 # =============================================================================
 # Logging Setup
 # =============================================================================
@@ -110,6 +176,210 @@ def setup_logging(verbose: bool = False) -> None:
     )
 
 
+# =============================================================================
+# Instrumentation
+# =============================================================================
+
+# Profile currently collecting phases (set by profiled_run)
+_ACTIVE_PROFILE = None
+
+
+def peak_rss_mb() -> float | None:
+    """Return the peak resident set size of this process in MB, if known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class RunProfile:
+    """
+    Named phase timings for a single command run.
+
+    Each phase records wall time, the CPU time of the thread that ran it
+    (phases overlap in pipeline threads, so process CPU would be counted
+    once per overlapping phase) and the process peak RSS when the phase
+    ends; the run total uses process CPU time. Phases entered several times under the same name (e.g. one
+    load per merged file) are aggregated. With ``detailed=True`` the whole run
+    is also captured with cProfile and tracemalloc.
+    """
+
+    def __init__(self, command: str, detailed: bool = False):
+        self.command = command
+        self.detailed = detailed
+        self.phases = {}
+        self.started_at = None
+        self._wall_start = None
+        self._cpu_start = None
+        self._profiler = None
+        self._summary = None
+        # tracemalloc peaks are reset per phase, so keep the run-wide maximum
+        self._traced_peak_mb = 0.0
+        # phases may be timed from pipeline worker threads
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the run clock (and cProfile/tracemalloc when detailed)."""
+        self.started_at = datetime.now().isoformat()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        if self.detailed:
+            tracemalloc.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as phase ``name``."""
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        if self.detailed and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            with self._lock:
+                entry = self.phases.setdefault(
+                    name,
+                    {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None},
+                )
+                entry["calls"] += 1
+                entry["wall_s"] += wall
+                entry["cpu_s"] += cpu
+                entry["peak_rss_mb"] = peak_rss_mb()
+                if self.detailed and tracemalloc.is_tracing():
+                    traced_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                    entry["tracemalloc_peak_mb"] = max(
+                        entry.get("tracemalloc_peak_mb", 0.0), traced_peak
+                    )
+                    self._traced_peak_mb = max(self._traced_peak_mb, traced_peak)
+            logging.debug(f"Phase '{name}' took {wall:.3f}s wall, {cpu:.3f}s CPU")
+
+    def record(self, name: str, wall_s: float, cpu_s: float) -> None:
+        """Add a phase timed elsewhere (e.g. in a worker process) to the summary."""
+        with self._lock:
+            entry = self.phases.setdefault(
+                name,
+                {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None},
+            )
+            entry["calls"] += 1
+            entry["wall_s"] += wall_s
+            entry["cpu_s"] += cpu_s
+
+    def stop(self) -> dict:
+        """Stop the run clock and return the JSON-serializable summary."""
+        if self._profiler is not None:
+            self._profiler.disable()
+        tracemalloc_peak = None
+        if self.detailed and tracemalloc.is_tracing():
+            traced_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc_peak = round(max(self._traced_peak_mb, traced_peak), 6)
+            tracemalloc.stop()
+
+        self._summary = {
+            "command": self.command,
+            "started_at": self.started_at,
+            "total": {
+                "wall_s": round(time.perf_counter() - self._wall_start, 6),
+                "cpu_s": round(time.process_time() - self._cpu_start, 6),
+                "peak_rss_mb": peak_rss_mb(),
+                "tracemalloc_peak_mb": tracemalloc_peak,
+            },
+            "phases": [
+                {"name": name, **{k: round(v, 6) if isinstance(v, float) else v for k, v in data.items()}}
+                for name, data in self.phases.items()
+            ],
+        }
+        return self._summary
+
+    def write(self, output_dir: Path) -> Path:
+        """
+        Write the summary JSON (and cProfile stats when detailed) to output_dir.
+
+        Returns:
+            Path to the written JSON summary.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{self.command}__{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+        summary = dict(self._summary or self.stop())
+        summary["cprofile"] = None
+        if self._profiler is not None:
+            prof_path = output_dir / f"{stem}.prof"
+            self._profiler.dump_stats(prof_path)
+            summary["cprofile"] = str(prof_path)
+
+        json_path = output_dir / f"{stem}.json"
+        with open(json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+        return json_path
+
+
+@contextmanager
+def profile_phase(name: str):
+    """Time the enclosed block as a phase of the active run profile, if any."""
+    if _ACTIVE_PROFILE is None:
+        yield
+        return
+    with _ACTIVE_PROFILE.phase(name):
+        yield
+
+
+def record_phase(name: str, wall_s: float, cpu_s: float) -> None:
+    """Add externally timed work to the active run profile, if any."""
+    if _ACTIVE_PROFILE is not None:
+        _ACTIVE_PROFILE.record(name, wall_s, cpu_s)
+
+
+@contextmanager
+def profiled_run(command: str, enabled: bool = False, output_dir: Path | None = None):
+    """
+    Activate a RunProfile for the duration of a command.
+
+    Phase timers are always collected; the JSON summary, cProfile stats and
+    tracemalloc peaks are only captured and written when ``enabled`` is set.
+
+    Args:
+        command: Name used for the summary and output file names.
+        enabled: Whether --profile was requested.
+        output_dir: Directory for the summary files (default: ./data/profiles).
+    """
+    global _ACTIVE_PROFILE
+    profile = RunProfile(command, detailed=enabled)
+    previous = _ACTIVE_PROFILE
+    _ACTIVE_PROFILE = profile
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        _ACTIVE_PROFILE = previous
+        if enabled:
+            json_path = profile.write(output_dir or DEFAULT_PROFILE_DIR)
+            print(f"Profile summary written to {json_path}")
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the shared --profile/--profile-dir options to a parser."""
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write a JSON phase timing summary plus cProfile/tracemalloc data",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        default=None,
+        help=f"Directory for profile output (default: {DEFAULT_PROFILE_DIR})",
+    )
+
+
 # =============================================================================
 # Configuration
 # =============================================================================
@@ -214,6 +484,7 @@ def get_output_filepath(
     output_dir: Path,
     output_name: str | None = None,
     date: str | None = None,
+    compress: str = "none",
 ) -> Path:
     """
     Generate the output filepath for a GraphML file.
@@ -223,6 +494,7 @@ def get_output_filepath(
         output_dir: Output directory path.
         output_name: Optional custom filename.
         date: Optional date string (YYYY-MM-DD).
+        compress: Compression of the default name ("none", "gz" or "zst").
 
     Returns:
         Full path to the output file.
@@ -237,7 +509,7 @@ def get_output_filepath(
     else:
         date_str = datetime.now().strftime("%Y%m%d")
 
-    filename = f"{place_slug}__{date_str}.graphml"
+    filename = f"{place_slug}__{date_str}.graphml{COMPRESSION_SUFFIXES[compress]}"
     return output_dir / filename
 
 
@@ -259,29 +531,27 @@ def calculate_edge_length_km(graph: nx.MultiDiGraph, filter_func) -> float:
     return total_meters / 1000.0
 
 
-def _extract_surface_values(data):
+def _split_tag_values(raw):
     """
-    Extract surface tag values from an edge data dict as a list of normalized strings.
+    Split a raw OSM tag value into a list of normalized strings.
 
-    Handles cases where the `surface` tag is a string, a list, or None. Splits
-    string values on common separators (comma/semicolon/pipe) and normalizes
-    whitespace and casing.
+    Handles values that are a string, a list, or None. Splits string values
+    on common separators (comma/semicolon/pipe) and normalizes whitespace and
+    casing.
     """
-    surface = data.get("surface")
-    if surface is None:
+    if raw is None:
         return []
 
     values = []
-    if isinstance(surface, list):
-        values = surface
-    elif isinstance(surface, str):
+    if isinstance(raw, list):
+        values = raw
+    elif isinstance(raw, str):
         # split on common separators used in OSM tag values
-        parts = re.split(r"[;,|]\\s*", surface)
-        values = parts
+        values = re.split(r"[;,|]\s*", raw)
     else:
         # unexpected type: try to convert to string
         try:
-            values = [str(surface)]
+            values = [str(raw)]
         except Exception:
             return []
 
@@ -290,328 +560,5520 @@ def _extract_surface_values(data):
     return normalized
 
 
-# =============================================================================
-# Fetch Command
-# =============================================================================
-
+def _extract_surface_values(data):
+    """
+    Extract surface tag values from an edge data dict as a list of normalized strings.
 
-def fetch_network(
-    place_name: str,
-    output_dir: Path,
-    output_name: str | None = None,
-    date: str | None = None,
-    timeout: int = 180,
-    memory: int = 1073741824,
-    retry: int = 3,
-    sleep_seconds: int = 60,
-    config: dict | None = None,
-) -> int:
+    Handles cases where the `surface` tag is a string, a list, or None.
     """
-    Fetch street network for a place and save as GraphML.
+    return _split_tag_values(data.get("surface"))
 
-    Args:
-        place_name: Place name for OSMnx query.
-        output_dir: Directory to save the output file.
-        output_name: Optional custom output filename.
-        date: Optional date string (YYYY-MM-DD).
-        timeout: Overpass timeout in seconds.
-        memory: Overpass memory in bytes.
-        retry: Number of retries on failure.
-        sleep_seconds: Seconds to wait between retries.
-        config: Configuration dictionary.
 
-    Returns:
-        Exit code (0 for success, non-zero for failure).
-    """
-    if config is None:
-        config = DEFAULT_CONFIG.copy()
+def _is_unpaved_surface(surfaces) -> bool:
+    """Unpaved if at least one surface value is known and none are paved."""
+    if not surfaces:
+        return False
+    return not any(s in PAVED_SURFACES for s in surfaces)
 
-    # Configure OSMnx
-    configure_osmnx(config, timeout=timeout, memory=memory)
 
-    # Ensure output directory exists
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
+# =============================================================================
+# Graph I/O
+# =============================================================================
 
-    # Attempt to fetch the graph with retries
-    graph = None
-    last_error = None
+# GraphML file name endings recognized in folders and globs
+GRAPHML_SUFFIXES = (".graphml", ".graphml.gz", ".graphml.zst")
 
-    for attempt in range(1, retry + 1):
-        try:
-            logging.info(f"Fetching network for '{place_name}' (attempt {attempt}/{retry})")
-            graph = ox.graph_from_place(
-                place_name,
-                custom_filter=CUSTOM_FILTER,
-                retain_all=True,
-                truncate_by_edge=True,
-            )
-            logging.info(f"Successfully fetched graph with {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
-            break
-        except Exception as e:
-            last_error = e
-            logging.warning(f"Attempt {attempt} failed: {e}")
-            if attempt < retry:
-                logging.info(f"Waiting {sleep_seconds} seconds before retry...")
-                time.sleep(sleep_seconds)
+# File suffix appended for each --compress choice
+COMPRESSION_SUFFIXES = {"none": "", "gz": ".gz", "zst": ".zst"}
 
-    if graph is None:
-        logging.error(
-            f"Overpass request failed after {retry} retries. "
-            "Please wait and run the same command again."
-        )
-        logging.error(f"Last error: {last_error}")
-        return 1
+# Buffer size used when streaming to and from compressed files
+IO_CHUNK_SIZE = 1 << 20
 
-    # Post-processing: add speeds and travel times
-    logging.info("Adding edge speeds and travel times...")
-    try:
-        graph = ox.add_edge_speeds(graph)
-        graph = ox.add_edge_travel_times(graph)
-    except Exception as e:
-        logging.warning(f"Could not add speeds/travel times: {e}")
 
-    # Add metadata to graph
-    fetch_date = date or datetime.now().strftime("%Y-%m-%d")
-    graph.graph["source_place"] = place_name
-    graph.graph["fetched_at"] = datetime.now().isoformat()
-    graph.graph["osmnx_version"] = ox.__version__
-    graph.graph["custom_filter"] = CUSTOM_FILTER
+def graph_compression(path: Path) -> str:
+    """Return the compression of a graph file from its suffix ("none", "gz" or "zst")."""
+    suffix = Path(path).suffix
+    if suffix == ".gz":
+        return "gz"
+    if suffix == ".zst":
+        return "zst"
+    return "none"
 
-    # Add date_fetched to all edges
-    for u, v, key, data in graph.edges(keys=True, data=True):
-        data["date_fetched"] = fetch_date
 
-    # Determine output filepath
-    filepath = get_output_filepath(place_name, output_dir, output_name, date)
+def graph_stem(path: Path) -> str:
+    """Return the file name without its compression and ``.graphml`` suffixes."""
+    name = Path(path).name
+    for suffix in sorted(GRAPHML_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return Path(path).stem
 
-    # Save to GraphML
-    logging.info(f"Saving graph to {filepath}")
-    ox.save_graphml(graph, filepath)
 
-    # Print summary stats
-    print_fetch_summary(graph)
+def is_graph_file(path: Path) -> bool:
+    """Return True for plain or compressed GraphML file names."""
+    return Path(path).name.endswith(GRAPHML_SUFFIXES)
 
-    logging.info("Fetch completed successfully.")
-    return 0
 
+def list_graph_files(folder: Path) -> list[Path]:
+    """Return the plain and compressed GraphML files of a folder, sorted."""
+    return sorted(p for p in Path(folder).iterdir() if p.is_file() and is_graph_file(p))
 
-def print_fetch_summary(graph: nx.MultiDiGraph) -> None:
-    """Print summary statistics after a fetch operation."""
-    print("\n" + "=" * 60)
-    print("FETCH SUMMARY")
-    print("=" * 60)
 
-    total_nodes = graph.number_of_nodes()
-    total_edges = graph.number_of_edges()
-    print(f"Total nodes: {total_nodes:,}")
-    print(f"Total edges: {total_edges:,}")
+def _require_zstandard() -> None:
+    if zstandard is None:
+        raise RuntimeError("zstandard is required for .zst files. pip install zstandard")
 
-    # Calculate lengths for different categories
-    def is_paved(data):
-        surfaces = _extract_surface_values(data)
-        if not surfaces:
-            return False
-        return any(s in PAVED_SURFACES for s in surfaces)
 
-    def is_unpaved(data):
-        surfaces = _extract_surface_values(data)
-        if not surfaces:
-            return False
-        # unpaved if we have at least one surface value and none are in paved set
-        return not any(s in PAVED_SURFACES for s in surfaces)
+def open_graph_file(path: Path, mode: str = "rb"):
+    """
+    Open a graph file as a binary stream, compressing or decompressing on the fly.
 
-    def is_track(data):
-        return data.get("highway") == "track"
+    Args:
+        path: Plain, ``.gz`` or ``.zst`` file.
+        mode: ``"rb"`` or ``"wb"``.
 
-    def is_alley(data):
-        return data.get("service") == "alley"
+    Returns:
+        File object; data is (de)compressed in chunks, never held whole in memory.
+    """
+    path = Path(path)
+    compression = graph_compression(path)
+    if compression == "gz":
+        return gzip.open(path, mode)
+    if compression == "zst":
+        _require_zstandard()
+        if mode == "rb":
+            return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return zstandard.ZstdCompressor(level=10, threads=-1).stream_writer(open(path, "wb"), closefd=True)
+    return open(path, mode)
+
+
+def load_graph(path: Path) -> nx.MultiDiGraph:
+    """
+    Load a plain or compressed GraphML file like ``ox.load_graphml``.
 
-    paved_km = calculate_edge_length_km(graph, is_paved)
-    unpaved_km = calculate_edge_length_km(graph, is_unpaved)
-    track_km = calculate_edge_length_km(graph, is_track)
-    alley_km = calculate_edge_length_km(graph, is_alley)
-    total_km = calculate_edge_length_km(graph, lambda _: True)
+    Gzip is decompressed as it is parsed (networkx opens ``.gz`` paths
+    itself). Zstandard is streamed into a temporary plain file next to the
+    input first, so memory use is the same as for a plain file.
+    """
+    path = Path(path)
+    if graph_compression(path) != "zst":
+        return ox.load_graphml(path)
 
-    print(f"\nEdge lengths:")
-    print(f"  Total:   {total_km:,.2f} km")
-    print(f"  Paved:   {paved_km:,.2f} km")
-    print(f"  Unpaved: {unpaved_km:,.2f} km")
-    print(f"  Tracks:  {track_km:,.2f} km")
-    print(f"  Alleys:  {alley_km:,.2f} km")
-    print("=" * 60 + "\n")
+    _require_zstandard()
+    fd, tmp = tempfile.mkstemp(suffix=".graphml", dir=path.parent)
+    try:
+        with open_graph_file(path) as src, os.fdopen(fd, "wb") as dst:
+            shutil.copyfileobj(src, dst, IO_CHUNK_SIZE)
+        return ox.load_graphml(tmp)
+    finally:
+        os.unlink(tmp)
+
+
+def save_graph(graph: nx.MultiDiGraph, path: Path) -> None:
+    """
+    Save a graph like ``ox.save_graphml``, compressing by file suffix.
+
+    The XML is compressed as it is written (``.gz`` by networkx, ``.zst``
+    from a temporary plain file in chunks), so no compressed copy of the
+    whole document is built in memory.
+    """
+    path = Path(path)
+    if graph_compression(path) != "zst":
+        ox.save_graphml(graph, path)
+        return
+
+    _require_zstandard()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".graphml", dir=path.parent)
+    os.close(fd)
+    try:
+        ox.save_graphml(graph, tmp)
+        with open(tmp, "rb") as src, open_graph_file(path, "wb") as dst:
+            shutil.copyfileobj(src, dst, IO_CHUNK_SIZE)
+    finally:
+        os.unlink(tmp)
 
 
 # =============================================================================
-# Merge Command
+# Edge Arrays
 # =============================================================================
 
+# Conversion factor used by OSMnx for "mph" maxspeed values
+MILES_TO_KM = 1.60934
 
-def merge_graphs(
-    folder: Path,
-    output: Path,
-) -> int:
+# Numeric part of a maxspeed value, optionally followed by a unit
+_MAXSPEED_PATTERN = re.compile(r"^([0-9][\.,0-9]*?)(?:[ ]?(?:km/h|kmh|kph|mph|knots))?$")
+
+
+def edge_table(graph: nx.MultiDiGraph, attrs) -> dict:
     """
-    Merge multiple GraphML files into a single graph.
+    Pull edge endpoints and attributes into columns with a single edge pass.
 
     Args:
-        folder: Directory containing GraphML files.
-        output: Output path for merged graph.
+        graph: NetworkX MultiDiGraph.
+        attrs: Edge attribute names to extract (missing values become None).
 
     Returns:
-        Exit code (0 for success, non-zero for failure).
+        Dict with "u", "v", "key" (int64 arrays), "data" (the edge data dicts,
+        in the same order, for bulk write-back) and one list per attribute.
     """
-    folder = Path(folder)
-    output = Path(output)
+    us, vs, keys, datas = [], [], [], []
+    columns = {name: [] for name in attrs}
+    for u, v, k, data in graph.edges(keys=True, data=True):
+        us.append(u)
+        vs.append(v)
+        keys.append(k)
+        datas.append(data)
+        for name, column in columns.items():
+            column.append(data.get(name))
+
+    table = {
+        "u": np.asarray(us, dtype=np.int64),
+        "v": np.asarray(vs, dtype=np.int64),
+        "key": np.asarray(keys, dtype=np.int64),
+        "data": datas,
+    }
+    table.update(columns)
+    return table
+
+
+def numeric_array(values) -> np.ndarray:
+    """Convert a column of raw values to float64, with NaN for non-numeric ones."""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            continue
+    return out
 
-    # Find all GraphML files
-    graphml_files = list(folder.glob("*.graphml"))
-    if not graphml_files:
-        logging.error(f"No .graphml files found in {folder}")
-        return 1
 
-    logging.info(f"Found {len(graphml_files)} GraphML files to merge")
+def set_edge_column(edge_data, name: str, values: np.ndarray) -> None:
+    """
+    Write a numeric column back onto edge data dicts in bulk.
 
-    # Load and merge graphs
-    g_total = None
-    source_files = []
+    NaN entries remove the attribute so callers can see that it is missing.
+    """
+    for data, value in zip(edge_data, values.tolist()):
+        if value != value:  # NaN
+            data.pop(name, None)
+        else:
+            data[name] = value
 
-    for filepath in graphml_files:
-        logging.info(f"Loading {filepath.name}...")
-        try:
-            g_new = ox.load_graphml(filepath)
-            source_files.append(filepath.name)
 
-            if g_total is None:
-                g_total = g_new
-            else:
-                g_total = nx.compose(g_total, g_new)
+def _first_value(value):
+    """Collapse a list-valued tag (from graph simplification) to its first element."""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
 
-        except Exception as e:
-            logging.error(f"Failed to load {filepath}: {e}")
-            return 1
 
-    if g_total is None:
-        logging.error("No graphs were loaded")
-        return 1
+def parse_maxspeed(value) -> float:
+    """
+    Parse an OSM maxspeed value to km/h following OSMnx's rules.
 
-    # Add metadata
-    g_total.graph["source_files"] = source_files
-    g_total.graph["merged_at"] = datetime.now().isoformat()
+    Lists (from simplification) and "|"-separated lane values are averaged,
+    mph values are converted, and implicit values such as "CA:urban" are
+    looked up in the OSMnx table. Unparseable values return NaN.
+    """
+    if isinstance(value, list):
+        parsed = [parse_maxspeed(v) for v in value]
+        parsed = [p for p in parsed if p == p]
+        return float(np.mean(parsed)) if parsed else np.nan
+    if not isinstance(value, str):
+        return np.nan
 
-    # Ensure output directory exists
-    output.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        speeds = []
+        for part in value.split("|"):
+            match = _MAXSPEED_PATTERN.match(part.strip())
+            speed = float(match.group(1).replace(",", "."))
+            if "mph" in value.lower():
+                speed *= MILES_TO_KM
+            speeds.append(speed)
+        return float(np.mean(speeds))
+    except (AttributeError, ValueError):
+        implicit = getattr(ox.routing, "_IMPLICIT_MAXSPEEDS", {}).get(value)
+        return float(implicit) if implicit is not None else np.nan
+
+
+def _factorize(values) -> tuple[list, np.ndarray]:
+    """Dictionary-encode raw tag values (lists are keyed as tuples)."""
+    codes = np.empty(len(values), dtype=np.int64)
+    lookup = {}
+    uniques = []
+    for i, value in enumerate(values):
+        key = tuple(value) if isinstance(value, list) else value
+        code = lookup.get(key)
+        if code is None:
+            code = lookup[key] = len(uniques)
+            uniques.append(value)
+        codes[i] = code
+    return uniques, codes
+
+
+def impute_edge_speeds(
+    highway,
+    maxspeed,
+    hwy_speeds: dict | None = None,
+) -> tuple[np.ndarray, dict]:
+    """
+    Compute speed_kph for every edge from highway and maxspeed columns.
 
-    # Save merged graph
-    logging.info(f"Saving merged graph to {output}")
-    ox.save_graphml(g_total, output)
+    Mirrors ``ox.add_edge_speeds``: edges with a parseable maxspeed keep it,
+    the rest get the mean known speed of their highway type, and highway types
+    without any known speed get the mean of the per-type means. Each distinct
+    tag value is parsed once and the rest is done with NumPy.
 
-    logging.info(
-        f"Merge completed: {g_total.number_of_nodes():,} nodes, "
-        f"{g_total.number_of_edges():,} edges"
-    )
-    return 0
+    Args:
+        highway: Column of raw highway values.
+        maxspeed: Column of raw maxspeed values.
+        hwy_speeds: Optional fixed speeds per highway type (e.g. the table
+            saved by a previous full recompute) that take precedence over
+            imputed means.
 
+    Returns:
+        Tuple of (speed_kph float64 array, per-highway speed table).
+    """
+    if len(highway) == 0:
+        return np.empty(0), dict(hwy_speeds or {})
+
+    unique_speeds, speed_codes = _factorize(maxspeed)
+    parsed = np.array([parse_maxspeed(v) for v in unique_speeds], dtype=np.float64)
+    speeds = parsed[speed_codes] if len(speed_codes) else np.empty(0)
+
+    highway_names, hwy_codes = _factorize([_first_value(h) for h in highway])
+    known = ~np.isnan(speeds)
+    totals = np.bincount(hwy_codes[known], weights=speeds[known], minlength=len(highway_names))
+    counts = np.bincount(hwy_codes[known], minlength=len(highway_names))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hwy_means = totals / counts
+
+    fixed = {k: float(v) for k, v in (hwy_speeds or {}).items() if v is not None}
+    for i, name in enumerate(highway_names):
+        if name in fixed:
+            hwy_means[i] = fixed[name]
+    if np.isnan(hwy_means).all() and not fixed:
+        raise ValueError(
+            "No edges have a usable 'maxspeed' value; pass hwy_speeds to impute speeds."
+        )
+    # like OSMnx, types without any speed get the mean over all type speeds
+    present = set(highway_names)
+    extra = [speed for name, speed in fixed.items() if name not in present]
+    fallback = np.nanmean(np.concatenate([hwy_means, extra]))
+    hwy_means = np.where(np.isnan(hwy_means), fallback, hwy_means)
 
-# =============================================================================
-# Stats Command
-# =============================================================================
+    speeds = np.where(known, speeds, hwy_means[hwy_codes])
+    table = {str(name): float(speed) for name, speed in zip(highway_names, hwy_means)}
+    table.update(fixed)
+    return speeds, table
+
+
+def compute_travel_times(length_m: np.ndarray, speed_kph: np.ndarray) -> np.ndarray:
+    """Return travel_time seconds = length / speed, NaN where not computable."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        travel_time = length_m / (speed_kph * 1000.0 / 3600.0)
+    travel_time[~(speed_kph > 0)] = np.nan
+    return travel_time
+
+
+def recompute_edge_travel_times(graph: nx.MultiDiGraph, edges) -> None:
+    """
+    Recompute ``speed_kph`` and ``travel_time`` for the given edges only.
+
+    Edges without a usable maxspeed get the speed of their highway type from
+    the ``speed_table`` stored on the graph by the last full vectorized
+    recompute, so the result matches a full recompute as long as the
+    per-type means hold. Graphs without a table get one computed from all
+    of their edges first.
+
+    Args:
+        graph: Graph to update in place.
+        edges: (u, v, key) tuples to recompute.
+    """
+    if "speed_table" not in graph.graph:
+        table = edge_table(graph, ("highway", "maxspeed"))
+        _, speed_table = impute_edge_speeds(table["highway"], table["maxspeed"])
+        graph.graph["speed_table"] = json.dumps(speed_table, sort_keys=True)
+    speed_table = json.loads(graph.graph["speed_table"])
+
+    data = [graph[u][v][k] for u, v, k in edges]
+    length_m = numeric_array([d.get("length") for d in data])
+    speed_kph, _ = impute_edge_speeds(
+        [d.get("highway") for d in data],
+        [d.get("maxspeed") for d in data],
+        hwy_speeds=speed_table,
+    )
+    travel_time = compute_travel_times(length_m, speed_kph)
+    set_edge_column(data, "length", length_m)
+    set_edge_column(data, "speed_kph", speed_kph)
+    set_edge_column(data, "travel_time", travel_time)
 
 
-def calculate_stats(filepath: Path) -> int:
+def write_edge_sidecar(path: Path, table: dict, columns: dict) -> Path:
     """
-    Calculate and print statistics for a GraphML network file.
+    Write selected edge columns keyed by (u, v, key) to a compressed .npz file.
 
     Args:
-        filepath: Path to GraphML file.
+        path: Output path (".npz" is appended by NumPy if missing).
+        table: Edge table from ``edge_table`` (for the u/v/key columns).
+        columns: Mapping of attribute name to float array aligned with table.
 
     Returns:
-        Exit code (0 for success, non-zero for failure).
+        Path of the written sidecar.
     """
-    filepath = Path(filepath)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        path,
+        u=table["u"],
+        v=table["v"],
+        key=table["key"],
+        **{f"col_{name}": np.asarray(values, dtype=np.float64) for name, values in columns.items()},
+    )
+    return path if path.suffix == ".npz" else path.with_name(path.name + ".npz")
 
-    if not filepath.exists():
-        logging.error(f"File not found: {filepath}")
-        return 1
 
-    logging.info(f"Loading graph from {filepath}")
-    try:
-        graph = ox.load_graphml(filepath)
-    except Exception as e:
-        logging.error(f"Failed to load graph: {e}")
-        return 1
+def apply_edge_sidecar(graph: nx.MultiDiGraph, path: Path) -> int:
+    """
+    Apply edge columns from a sidecar written by ``write_edge_sidecar``.
 
-    # Define filter functions
-    def is_alley(data):
-        return data.get("service") == "alley"
+    Edges that are not present in the graph are skipped.
 
-    def is_track(data):
-        return data.get("highway") == "track"
+    Returns:
+        Number of edges updated.
+    """
+    with np.load(Path(path)) as sidecar:
+        us = sidecar["u"].tolist()
+        vs = sidecar["v"].tolist()
+        keys = sidecar["key"].tolist()
+        columns = {
+            name[len("col_"):]: sidecar[name].tolist()
+            for name in sidecar.files
+            if name.startswith("col_")
+        }
+
+    adj = graph.adj
+    updated = 0
+    for i, (u, v, k) in enumerate(zip(us, vs, keys)):
+        data = adj.get(u, {}).get(v, {}).get(k)
+        if data is None:
+            continue
+        for name, values in columns.items():
+            value = values[i]
+            if value != value:  # NaN
+                data.pop(name, None)
+            else:
+                data[name] = value
+        updated += 1
+    return updated
 
-    def is_private(data):
-        return data.get("access") == "private"
 
-    def is_unpaved(data):
-        surfaces = _extract_surface_values(data)
-        if not surfaces:
+# =============================================================================
+# Routing Profiles
+# =============================================================================
+
+# Dijkstra cutoff that prunes edges a profile excludes (weight = inf) while
+# leaving every finite path untouched
+ROUTABLE_CUTOFF = sys.float_info.max
+
+
+def routing_weight_attr(profile_name: str) -> str:
+    """Return the edge attribute holding the compiled weight of a profile."""
+    return f"weight_{profile_name}"
+
+
+def _tag_value_matcher(values):
+    """Build a predicate that matches any normalized value of a raw tag."""
+    wanted = {str(v).strip().lower() for v in values}
+    return lambda raw: any(v in wanted for v in _split_tag_values(raw))
+
+
+def _map_unique(column, func, dtype) -> np.ndarray:
+    """Evaluate func once per distinct raw value and broadcast over the column."""
+    uniques, codes = _factorize(column)
+    results = np.array([func(value) for value in uniques], dtype=dtype)
+    return results[codes] if len(codes) else np.empty(0, dtype=dtype)
+
+
+def compile_routing_profile(graph: nx.MultiDiGraph, name: str, spec: dict, table: dict | None = None) -> dict:
+    """
+    Compile a routing profile into a per-edge weight array and edge mask.
+
+    A profile spec (from the ``routing_profiles`` config section) may contain:
+
+    - ``base_weight``: edge attribute to start from (default "travel_time").
+    - ``exclude``: tag -> list of values; matching edges are unroutable.
+    - ``penalties``: tag -> {value: multiplier}; the largest matching
+      multiplier is applied.
+    - ``unpaved_penalty``: multiplier for edges whose surface is not paved.
+
+    Excluded edges (and edges without a base weight) get an infinite weight,
+    which Dijkstra prunes when called with ``cutoff=ROUTABLE_CUTOFF``. The
+    compiled weights are also written to the ``weight_<name>`` edge attribute
+    so queries only switch the weight name.
+
+    Args:
+        graph: Graph to compile against.
+        name: Profile name.
+        spec: Profile definition.
+        table: Optional pre-built edge table with the needed columns.
+
+    Returns:
+        Dict with "name", "weight_attr", "weights" (float64 array), "allowed"
+        (bool array) and "excluded" (count), aligned with graph edge order.
+    """
+    base = spec.get("base_weight", "travel_time")
+    exclude = spec.get("exclude", {})
+    penalties = spec.get("penalties", {})
+    unpaved_penalty = spec.get("unpaved_penalty")
+
+    needed = {base, *exclude, *penalties}
+    if unpaved_penalty:
+        needed.add("surface")
+    if table is None or any(col not in table for col in needed):
+        table = edge_table(graph, sorted(needed))
+
+    weights = numeric_array(table[base])
+    allowed = ~np.isnan(weights)
+
+    for tag, values in exclude.items():
+        allowed &= ~_map_unique(table[tag], _tag_value_matcher(values), bool)
+
+    multiplier = np.ones(len(weights))
+    for tag, factors in penalties.items():
+        normalized = {str(k).strip().lower(): float(f) for k, f in factors.items()}
+        multiplier = np.maximum(
+            multiplier,
+            _map_unique(
+                table[tag],
+                lambda raw: max([normalized.get(v, 1.0) for v in _split_tag_values(raw)] or [1.0]),
+                np.float64,
+            ),
+        )
+    if unpaved_penalty:
+        unpaved = _map_unique(
+            table["surface"],
+            lambda raw: _is_unpaved_surface(_split_tag_values(raw)),
+            bool,
+        )
+        multiplier = np.where(unpaved, np.maximum(multiplier, float(unpaved_penalty)), multiplier)
+
+    weights = np.where(allowed, weights * multiplier, np.inf)
+    weight_attr = routing_weight_attr(name)
+    set_edge_column(table["data"], weight_attr, weights)
+
+    excluded = int((~allowed).sum())
+    logging.debug(f"Compiled routing profile '{name}': {excluded:,} of {len(weights):,} edges excluded")
+    return {
+        "name": name,
+        "weight_attr": weight_attr,
+        "weights": weights,
+        "allowed": allowed,
+        "excluded": excluded,
+    }
+
+
+def compile_routing_profiles(graph: nx.MultiDiGraph, profiles: dict, names=None) -> dict:
+    """
+    Compile several routing profiles with a single pass over the edges.
+
+    Args:
+        graph: Graph to compile against.
+        profiles: Mapping of profile name to spec (the config section).
+        names: Optional subset of profile names to compile.
+
+    Returns:
+        Mapping of profile name to its compiled profile.
+    """
+    names = list(profiles) if names is None else list(names)
+    missing = [n for n in names if n not in profiles]
+    if missing:
+        raise KeyError(f"Unknown routing profile(s): {', '.join(missing)}")
+
+    needed = set()
+    for n in names:
+        spec = profiles[n]
+        needed |= {spec.get("base_weight", "travel_time"), *spec.get("exclude", {}), *spec.get("penalties", {})}
+        if spec.get("unpaved_penalty"):
+            needed.add("surface")
+    table = edge_table(graph, sorted(needed))
+    return {n: compile_routing_profile(graph, n, profiles[n], table=table) for n in names}
+
+
+# =============================================================================
+# Connected Components
+# =============================================================================
+
+
+def file_fingerprint(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def routable_view(graph: nx.MultiDiGraph, weight: str | None = None):
+    """Return a read-only view without the edges whose weight is infinite."""
+    if weight is None:
+        return graph
+
+    def routable(u, v, k):
+        return graph[u][v][k].get(weight, 0.0) < float("inf")
+
+    return nx.subgraph_view(graph, filter_edge=routable)
+
+
+class ComponentIndex:
+    """
+    Strongly connected component label per node, plus the component DAG.
+
+    Labels are numbered by decreasing component size, so label 0 is the main
+    component. Two nodes in the same component are reachable from each other
+    (``mutually_reachable``); ``reachable`` also follows one-way links
+    between components through the condensation DAG.
+    """
+
+    def __init__(self, nodes, labels, weight: str | None = None, dag_indptr=None, dag_indices=None):
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.weight = weight
+        self._label_of = dict(zip(self.nodes.tolist(), self.labels.tolist()))
+        self.sizes = np.bincount(self.labels) if len(self.labels) else np.zeros(0, dtype=np.int64)
+        # condensation DAG in CSR form: successors of label c are
+        # dag_indices[dag_indptr[c]:dag_indptr[c + 1]]
+        if dag_indptr is None:
+            dag_indptr = np.zeros(len(self.sizes) + 1, dtype=np.int64)
+            dag_indices = np.zeros(0, dtype=np.int32)
+        self.dag_indptr = np.asarray(dag_indptr, dtype=np.int64)
+        self.dag_indices = np.asarray(dag_indices, dtype=np.int32)
+        self._descendants = {}
+
+    @classmethod
+    def build(cls, graph: nx.MultiDiGraph, weight: str | None = None) -> "ComponentIndex":
+        """Label the components of graph, ignoring edges excluded by weight."""
+        view = routable_view(graph, weight)
+        components = sorted(nx.strongly_connected_components(view), key=len, reverse=True)
+        nodes = []
+        labels = []
+        for label, component in enumerate(components):
+            nodes.extend(component)
+            labels.extend([label] * len(component))
+
+        label_of = dict(zip(nodes, labels))
+        links = sorted({
+            (label_of[u], label_of[v]) for u, v in view.edges() if label_of[u] != label_of[v]
+        })
+        dag_indptr = np.zeros(len(components) + 1, dtype=np.int64)
+        np.add.at(dag_indptr, [src + 1 for src, _ in links], 1)
+        dag_indptr = np.cumsum(dag_indptr)
+        dag_indices = [dst for _, dst in links]
+        return cls(nodes, labels, weight=weight, dag_indptr=dag_indptr, dag_indices=dag_indices)
+
+    def save(self, path: Path, fingerprint: str = "", weight_fingerprint: str = "") -> Path:
+        """Write the labels to a compressed .npz keyed by the graph (and weight) fingerprint."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            nodes=self.nodes,
+            labels=self.labels,
+            dag_indptr=self.dag_indptr,
+            dag_indices=self.dag_indices,
+            fingerprint=np.array(fingerprint),
+            weight=np.array(self.weight or ""),
+            weight_fingerprint=np.array(weight_fingerprint),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str | None = None,
+             weight_fingerprint: str | None = None) -> "ComponentIndex | None":
+        """Load labels saved by ``save``; returns None if a fingerprint differs or the file predates the DAG."""
+        with np.load(Path(path)) as data:
+            if fingerprint is not None and str(data["fingerprint"]) != fingerprint:
+                return None
+            if "dag_indptr" not in data.files:
+                return None
+            if weight_fingerprint is not None:
+                stored = str(data["weight_fingerprint"]) if "weight_fingerprint" in data.files else ""
+                if stored != weight_fingerprint:
+                    return None
+            weight = str(data["weight"]) or None
+            return cls(data["nodes"], data["labels"], weight=weight,
+                       dag_indptr=data["dag_indptr"], dag_indices=data["dag_indices"])
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def component(self, node) -> int:
+        """Return the component label of node (-1 if unknown)."""
+        return self._label_of.get(node, -1)
+
+    def mutually_reachable(self, u, v) -> bool:
+        """Return True if u and v are in the same strongly connected component."""
+        label = self._label_of.get(u, -1)
+        return label >= 0 and label == self._label_of.get(v, -2)
+
+    def reachable(self, u, v) -> bool:
+        """Return True if a directed path leads from u to v."""
+        source = self._label_of.get(u, -1)
+        target = self._label_of.get(v, -1)
+        if source < 0 or target < 0:
             return False
-        return not any(s in PAVED_SURFACES for s in surfaces)
+        return source == target or target in self._component_descendants(source)
+
+    def _component_descendants(self, label: int) -> set:
+        # components reachable from label, cached per source component
+        cached = self._descendants.get(label)
+        if cached is None:
+            cached = set()
+            stack = [label]
+            while stack:
+                current = stack.pop()
+                for nxt in self.dag_indices[self.dag_indptr[current]:self.dag_indptr[current + 1]].tolist():
+                    if nxt not in cached:
+                        cached.add(nxt)
+                        stack.append(nxt)
+            self._descendants[label] = cached
+        return cached
+
+    def main_component_nodes(self) -> list:
+        """Return the node IDs of the largest component."""
+        return self.nodes[self.labels == 0].tolist()
+
+
+def weight_fingerprint(graph: nx.MultiDiGraph, weight: str | None) -> str:
+    """
+    Return a digest of which edges a routing weight excludes.
+
+    Component labels only depend on whether an edge's weight is infinite, so
+    this changes when a routing profile's exclusions are edited even though
+    the GraphML file (and the weight attribute's name) stay the same.
+    """
+    if weight is None:
+        return ""
+    excluded = np.fromiter(
+        (data.get(weight, 0.0) == float("inf") for _, _, data in graph.edges(data=True)),
+        dtype=bool,
+        count=graph.number_of_edges(),
+    )
+    return hashlib.sha1(np.packbits(excluded).tobytes()).hexdigest()
+
+
+def component_index_path(graph_path: Path, weight: str | None = None) -> Path:
+    """Return the sidecar path for a graph's component labels."""
+    graph_path = Path(graph_path)
+    suffix = f".components.{weight}.npz" if weight else ".components.npz"
+    return graph_path.with_name(graph_stem(graph_path) + suffix)
+
+
+def load_component_index(
+    graph: nx.MultiDiGraph,
+    graph_path: Path,
+    weight: str | None = None,
+) -> ComponentIndex:
+    """
+    Load persisted component labels for graph_path, computing them if needed.
+
+    The sidecar is reused only while the GraphML file's fingerprint matches
+    and, for a routing weight, the set of edges it excludes is unchanged (so
+    editing a profile in config.json rebuilds the labels).
+
+    Args:
+        graph: Graph loaded from graph_path.
+        graph_path: GraphML file the graph was loaded from.
+        weight: Optional routing weight; edges with infinite weight are ignored.
+
+    Returns:
+        ComponentIndex for the graph.
+    """
+    sidecar = component_index_path(graph_path, weight)
+    fingerprint = file_fingerprint(graph_path)
+    weight_fp = weight_fingerprint(graph, weight)
+    if sidecar.exists():
+        index = ComponentIndex.load(sidecar, fingerprint=fingerprint, weight_fingerprint=weight_fp)
+        if index is not None:
+            logging.debug(f"Loaded component labels from {sidecar}")
+            return index
+    index = ComponentIndex.build(graph, weight=weight)
+    try:
+        index.save(sidecar, fingerprint=fingerprint, weight_fingerprint=weight_fp)
+    except OSError as e:
+        logging.warning(f"Could not save component labels to {sidecar}: {e}")
+    else:
+        register_artifact(graph_path, sidecar.name, "components", sidecar, fingerprint)
+    return index
+
+
+# =============================================================================
+# Node Index
+# =============================================================================
+
+
+class NodeIndex:
+    """
+    Contiguous 0..N-1 numbering of a graph's (sparse, 64-bit) node IDs.
+
+    Index i is the i-th node in graph order, so sampling over indices picks
+    the same nodes as sampling over ``graph.nodes``. Coordinates, degrees
+    and the directed adjacency are arrays over that numbering; the adjacency
+    is in CSR form (successors of i are ``indices[indptr[i]:indptr[i + 1]]``,
+    one entry per parallel edge, in ``graph.edges`` order). IDs are
+    translated back with ``ids`` only where they are written out.
+    """
+
+    def __init__(self, ids, x, y, indptr, indices):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        # out-degree plus in-degree, as MultiDiGraph.degree counts it
+        self.degree = np.diff(self.indptr) + np.bincount(self.indices, minlength=len(self.ids))
+        self._order = np.argsort(self.ids, kind="stable")
+        self._sorted = self.ids[self._order]
+
+    @classmethod
+    def build(cls, graph: nx.MultiDiGraph) -> "NodeIndex":
+        """Number the nodes of graph in graph order."""
+        n = graph.number_of_nodes()
+        ids = np.fromiter(graph.nodes, dtype=np.int64, count=n)
+        x = np.fromiter((float(d.get("x", np.nan)) for _, d in graph.nodes(data=True)), dtype=np.float64, count=n)
+        y = np.fromiter((float(d.get("y", np.nan)) for _, d in graph.nodes(data=True)), dtype=np.float64, count=n)
+        index = cls(ids, x, y, np.zeros(n + 1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+        m = graph.number_of_edges()
+        u = index.positions(np.fromiter((e[0] for e in graph.edges()), dtype=np.int64, count=m))
+        v = index.positions(np.fromiter((e[1] for e in graph.edges()), dtype=np.int64, count=m))
+        # graph.edges yields each source's edges together, in node order
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(u, minlength=n))])
+        return cls(ids, x, y, indptr, v)
+
+    def save(self, path: Path, fingerprint: str = "") -> Path:
+        """Write the index to an .npz keyed by the graph fingerprint."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, ids=self.ids, x=self.x, y=self.y, indptr=self.indptr, indices=self.indices,
+                 fingerprint=np.array(fingerprint))
+        return path
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str | None = None) -> "NodeIndex | None":
+        """Load an index saved by ``save``; returns None if the fingerprint differs."""
+        with np.load(Path(path)) as data:
+            if fingerprint is not None and str(data["fingerprint"]) != fingerprint:
+                return None
+            return cls(data["ids"], data["x"], data["y"], data["indptr"], data["indices"])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def index(self, node) -> int:
+        """Return the index of a node ID (-1 if unknown)."""
+        return int(self.positions([node])[0])
+
+    def positions(self, nodes) -> np.ndarray:
+        """Return the indices of an array of node IDs (-1 for unknown IDs)."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(nodes), -1, dtype=np.int64)
+        pos = np.clip(np.searchsorted(self._sorted, nodes), 0, len(self.ids) - 1)
+        return np.where(self._sorted[pos] == nodes, self._order[pos], -1)
+
+    def mask(self, nodes) -> np.ndarray:
+        """Return a boolean mask over the index that is True for the given node IDs."""
+        selected = np.zeros(len(self.ids), dtype=bool)
+        pos = self.positions(nodes)
+        selected[pos[pos >= 0]] = True
+        return selected
+
+    def valid(self, min_degree: int = 1, pool: np.ndarray | None = None) -> np.ndarray:
+        """Return the indices with at least min_degree, optionally only where the pool mask is set."""
+        keep = self.degree >= min_degree
+        if pool is not None:
+            keep &= pool
+        return np.flatnonzero(keep)
+
+    def within_km(self, i: int, radius_km: float, pool: np.ndarray | None = None) -> np.ndarray:
+        """Return the indices within radius_km (great-circle) of node index i."""
+        dist_m = ox.distance.great_circle(self.y[i], self.x[i], self.y, self.x)
+        keep = dist_m <= radius_km * 1000.0
+        if pool is not None:
+            keep &= pool
+        return np.flatnonzero(keep)
+
+    def edge_costs(self, graph: nx.MultiDiGraph, weight: str) -> np.ndarray:
+        """Return the weight of every CSR entry (1 where missing, as networkx assumes)."""
+        costs = np.fromiter(
+            (float(w) for _, _, w in graph.edges(data=weight, default=1.0)),
+            dtype=np.float64,
+            count=graph.number_of_edges(),
+        )
+        if len(costs) != len(self.indices):
+            raise ValueError("Graph edges do not match the node index")
+        return costs
+
+    def dijkstra(self, source: int, costs: np.ndarray, cutoff: float | None = None,
+                 targets=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Run Dijkstra's algorithm over the CSR adjacency.
+
+        Args:
+            source: Source node index.
+            costs: Per-entry edge costs from ``edge_costs``; infinite costs are never followed.
+            cutoff: Optional maximum path cost.
+            targets: Optional node indices; the search stops once all are settled.
+
+        Returns:
+            (dist, pred): float64 cost (inf if unreached) and int32 predecessor
+            index (-1 for the source and unreached nodes).
+        """
+        n = len(self.ids)
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        weights = costs.tolist()
+        limit = float("inf") if cutoff is None else cutoff
+        dist = [float("inf")] * n
+        pred = [-1] * n
+        settled = bytearray(n)
+        remaining = set(int(t) for t in targets) if targets is not None else None
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, i = heapq.heappop(heap)
+            if settled[i]:
+                continue
+            settled[i] = 1
+            if remaining is not None:
+                remaining.discard(i)
+                if not remaining:
+                    break
+            for e in range(indptr[i], indptr[i + 1]):
+                j = indices[e]
+                nd = d + weights[e]
+                if nd > limit or nd >= dist[j]:
+                    continue
+                dist[j] = nd
+                pred[j] = i
+                heapq.heappush(heap, (nd, j))
+        return np.array(dist, dtype=np.float64), np.array(pred, dtype=np.int32)
+
+    def tree_totals(self, dist: np.ndarray, pred: np.ndarray, costs: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Sum a per-entry edge value along every path of a ``dijkstra`` result.
+
+        Between parallel edges the lowest-cost one is used, as
+        ``route_summary`` does with choose_by. Sums are accumulated by
+        pointer jumping over the predecessor array, so the cost is
+        O(N log depth) array operations rather than one path walk per node.
+
+        Args:
+            dist: Distances from ``dijkstra``.
+            pred: Predecessors from ``dijkstra``.
+            costs: Per-entry costs the search used.
+            values: Per-entry values to sum (e.g. ``edge_costs(graph, "length")``).
+
+        Returns:
+            float64 total per node (NaN where unreached).
+        """
+        n = len(self.ids)
+        src = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+        tree = np.flatnonzero(pred[self.indices] == src)
+        # lowest-cost entry per destination among the tree's parallel edges
+        tree = tree[np.lexsort((costs[tree], self.indices[tree]))]
+        dst = self.indices[tree]
+        first = np.ones(len(tree), dtype=bool)
+        first[1:] = dst[1:] != dst[:-1]
+        totals = np.zeros(n, dtype=np.float64)
+        totals[dst[first]] = values[tree[first]]
+        ancestor = pred.astype(np.int64)
+        active = np.flatnonzero(ancestor >= 0)
+        while len(active):
+            up = ancestor[active]
+            totals[active] += totals[up]
+            ancestor[active] = ancestor[up]
+            active = active[ancestor[active] >= 0]
+        totals[~np.isfinite(dist)] = np.nan
+        return totals
+
+    def path(self, pred: np.ndarray, target: int) -> list:
+        """Walk predecessors from target back to the source; returns node indices."""
+        indices = [int(target)]
+        while pred[indices[-1]] >= 0:
+            indices.append(int(pred[indices[-1]]))
+        return indices[::-1]
+
+    def node_ids(self, indices) -> list:
+        """Translate node indices back to node IDs."""
+        return self.ids[np.asarray(indices, dtype=np.int64)].tolist()
+
+
+def node_index_path(graph_path: Path) -> Path:
+    """Return the sidecar path for a graph's node index."""
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_stem(graph_path) + ".nodeindex.npz")
+
+
+def load_node_index(graph: nx.MultiDiGraph, graph_path: Path) -> NodeIndex:
+    """
+    Load the persisted node index of graph_path, building it if needed.
+
+    The sidecar is reused while the GraphML file's fingerprint matches and
+    is registered as a ``node_index`` artifact, so updates that change the
+    topology or node positions drop it.
+
+    Args:
+        graph: Graph loaded from graph_path.
+        graph_path: GraphML file the graph was loaded from.
+
+    Returns:
+        NodeIndex for the graph.
+    """
+    sidecar = node_index_path(graph_path)
+    fingerprint = file_fingerprint(graph_path)
+    if sidecar.exists():
+        index = NodeIndex.load(sidecar, fingerprint=fingerprint)
+        if index is not None and len(index) == graph.number_of_nodes():
+            logging.debug(f"Loaded node index from {sidecar}")
+            return index
+    index = NodeIndex.build(graph)
+    try:
+        index.save(sidecar, fingerprint=fingerprint)
+    except OSError as e:
+        logging.warning(f"Could not save node index to {sidecar}: {e}")
+    else:
+        register_artifact(graph_path, sidecar.name, "node_index", sidecar, fingerprint)
+    return index
+
+
+# =============================================================================
+# Artifact Registry
+# =============================================================================
+
+# Kinds of change an incremental update can make to a graph
+CHANGE_KINDS = ("topology", "tags", "travel_time", "geometry")
+
+# Change kinds each derived artifact depends on; an artifact whose
+# dependencies are untouched by an update is re-stamped instead of rebuilt.
+# Shards are refreshed tile by tile and are not listed here.
+ARTIFACT_DEPENDENCIES = {
+    "components": {"topology", "tags"},
+    "hub_tables": {"topology", "tags", "travel_time"},
+    "node_index": {"topology", "geometry"},
+}
+
+
+def artifact_registry_path(graph_path: Path) -> Path:
+    """Return the path of the artifact registry for a graph file."""
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_stem(graph_path) + ".artifacts.json")
+
+
+def load_artifact_registry(graph_path: Path) -> dict:
+    """Load the artifact registry for a graph file (empty if none exists)."""
+    path = artifact_registry_path(graph_path)
+    if not path.exists():
+        return {"artifacts": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_artifact_registry(graph_path: Path, registry: dict) -> None:
+    """Write the artifact registry for a graph file."""
+    with open(artifact_registry_path(graph_path), "w") as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+
+
+def _stored_artifact_path(graph_path: Path, path: Path) -> str:
+    # relative to the graph's directory when possible, so folders can move
+    path = Path(path).resolve()
+    try:
+        return str(path.relative_to(Path(graph_path).resolve().parent))
+    except ValueError:
+        return str(path)
+
+
+def register_artifact(graph_path: Path, name: str, kind: str, path: Path, fingerprint: str) -> None:
+    """
+    Record a derived artifact built from a graph file.
+
+    Args:
+        graph_path: Graph file the artifact was derived from.
+        name: Unique artifact name.
+        kind: Artifact kind (a key of ``ARTIFACT_DEPENDENCIES`` or "shards").
+        path: Artifact file or folder (stored relative to the graph's directory when possible).
+        fingerprint: Fingerprint of graph_path the artifact was built from.
+    """
+    graph_path = Path(graph_path)
+    registry = load_artifact_registry(graph_path)
+    registry["artifacts"][name] = {"kind": kind, "path": _stored_artifact_path(graph_path, path),
+                                   "fingerprint": fingerprint}
+    try:
+        save_artifact_registry(graph_path, registry)
+    except OSError as e:
+        logging.warning(f"Could not update artifact registry for {graph_path}: {e}")
+
+
+def restamp_artifact(path: Path, fingerprint: str) -> None:
+    """Update the source fingerprint stored inside an .npz, .json or hub table artifact."""
+    path = Path(path)
+    if path.is_dir():
+        path = path / HUB_TABLES_META
+    if path.suffix == ".npz":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        arrays["fingerprint"] = np.array(fingerprint)
+        np.savez_compressed(path, **arrays)
+    elif path.suffix == ".json":
+        with open(path) as f:
+            content = json.load(f)
+        content["source_fingerprint"] = fingerprint
+        with open(path, "w") as f:
+            json.dump(content, f, indent=2)
+
+
+def _remove_artifact(path: Path) -> None:
+    # hub tables are a folder of .npy files
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink()
+
+
+def _artifact_destination(kind: str, path: Path, source_path: Path, graph_path: Path) -> Path:
+    """Return where an artifact of source_path goes for graph_path (named after its stem)."""
+    stem, source_stem = graph_stem(graph_path), graph_stem(source_path)
+    if kind == "hub_tables":
+        return hub_tables_dir(graph_path, path.name)
+    if kind == "shards":
+        return graph_path.parent / f"{stem}.shards" / path.name
+    name = path.name
+    if name.startswith(source_stem + "."):
+        name = stem + name[len(source_stem):]
+    return graph_path.parent / name
+
+
+def _copy_artifact(kind: str, path: Path, destination: Path) -> None:
+    # shards are registered by their index file; copy the whole folder
+    if kind == "shards":
+        path, destination = path.parent, destination.parent
+    if path.is_dir():
+        shutil.copytree(path, destination, dirs_exist_ok=True)
+    else:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, destination)
+
+
+def refresh_artifacts(
+    graph: nx.MultiDiGraph,
+    graph_path: Path,
+    changes: set,
+    source_path: Path | None = None,
+    nodes=(),
+    points=(),
+) -> dict:
+    """
+    Bring the derived artifacts of a graph file up to date after an update.
+
+    Artifacts whose dependencies are not in changes are re-stamped with the
+    new fingerprint, dependent ones are deleted (and rebuilt on next use), and
+    shards are rewritten only for the tiles around the changed nodes.
+
+    When the update was written to a new file, the source's artifacts and
+    registry are left alone: unaffected artifacts (and shards) are copied
+    under graph_path's stem, re-stamped and registered for it, and dependent
+    ones are simply not carried over.
+
+    Args:
+        graph: Updated graph, already saved to graph_path.
+        graph_path: Updated graph file.
+        changes: Change kinds from ``apply_changeset``.
+        source_path: Graph file the artifacts were registered against
+            (defaults to graph_path).
+        nodes: Changed node IDs (for shard refresh).
+        points: Old and new (x, y) positions of changed elements.
+
+    Returns:
+        Mapping with "kept", "invalidated" and "refreshed" artifact names.
+    """
+    graph_path = Path(graph_path)
+    source_path = Path(source_path or graph_path)
+    in_place = source_path.resolve() == graph_path.resolve()
+    registry = load_artifact_registry(source_path)
+    base = source_path.resolve().parent
+    source_stem, stem = graph_stem(source_path), graph_stem(graph_path)
+    fingerprint = file_fingerprint(graph_path)
+    result = {"kept": [], "invalidated": [], "refreshed": []}
+    # artifacts registered for an earlier output file are all stale
+    updated = {"artifacts": {}} if not in_place else registry
+
+    for name, entry in list(registry["artifacts"].items()):
+        kind = entry["kind"]
+        path = base / entry["path"]
+        if not path.exists():
+            if in_place:
+                del registry["artifacts"][name]
+            continue
+        if kind != "shards" and changes & ARTIFACT_DEPENDENCIES.get(kind, set(CHANGE_KINDS)):
+            if in_place:
+                _remove_artifact(path)
+                del registry["artifacts"][name]
+            result["invalidated"].append(name)
+            continue
+        if not in_place:
+            destination = _artifact_destination(kind, path, source_path, graph_path)
+            _copy_artifact(kind, path, destination)
+            path = destination
+            if name.startswith(source_stem + "."):
+                name = stem + name[len(source_stem):]
+        if kind == "shards":
+            if changes:
+                with profile_phase("refresh_shards"):
+                    tiles = refresh_shards(graph, path, nodes=nodes, points=points)
+                logging.info(f"Refreshed {len(tiles)} shard tiles of {name}")
+            result["refreshed"].append(name)
+        else:
+            result["kept"].append(name)
+        restamp_artifact(path, fingerprint)
+        if in_place:
+            entry["fingerprint"] = fingerprint
+        else:
+            updated["artifacts"][name] = {"kind": kind, "path": _stored_artifact_path(graph_path, path),
+                                          "fingerprint": fingerprint}
+
+    save_artifact_registry(graph_path, updated)
+    return result
+
+
+# =============================================================================
+# Geocode Store
+# =============================================================================
+
+
+def geocode_store_path(config: dict) -> Path:
+    """Return the geocode store path from config ("geocode_db" or data_root/geocode.sqlite)."""
+    if config.get("geocode_db"):
+        return Path(config["geocode_db"])
+    return Path(config.get("data_root", "./data")) / DEFAULT_GEOCODE_DB_NAME
+
+
+def _place_key(place_name: str) -> str:
+    # Nominatim ignores case and repeated whitespace
+    return " ".join(place_name.split()).casefold()
+
+
+class GeocodeStore:
+    """
+    Place name -> boundary polygon, bbox and OSM id, in one SQLite file.
+
+    Replaces the per-request Nominatim round trip (and the JSON blob it
+    leaves in the OSMnx cache) with a single indexed lookup. Each call opens
+    its own connection, so the store can be shared by fetch-batch threads.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS places (
+                    key TEXT PRIMARY KEY,
+                    place_name TEXT NOT NULL,
+                    display_name TEXT,
+                    osm_type TEXT,
+                    osm_id INTEGER,
+                    west REAL, south REAL, east REAL, north REAL,
+                    geometry BLOB NOT NULL,
+                    geocoded_at TEXT NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        # commit on success, then always close
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __contains__(self, place_name: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM places WHERE key = ?", (_place_key(place_name),)).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+    def get(self, place_name: str) -> dict | None:
+        """Return the stored record (with a shapely ``geometry``), or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT place_name, display_name, osm_type, osm_id, west, south, east, north, geometry, geocoded_at "
+                "FROM places WHERE key = ?",
+                (_place_key(place_name),),
+            ).fetchone()
+        if row is None:
+            return None
+        name, display_name, osm_type, osm_id, west, south, east, north, geometry, geocoded_at = row
+        return {
+            "place_name": name,
+            "display_name": display_name,
+            "osm_type": osm_type,
+            "osm_id": osm_id,
+            "bbox": (west, south, east, north),
+            "geometry": shapely_wkb.loads(geometry),
+            "geocoded_at": geocoded_at,
+        }
+
+    def put(self, place_name: str, geometry, osm_type: str | None = None, osm_id: int | None = None,
+            display_name: str | None = None) -> None:
+        """Insert or replace the record for a place."""
+        west, south, east, north = geometry.bounds
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _place_key(place_name), place_name, display_name, osm_type,
+                    None if osm_id is None else int(osm_id),
+                    west, south, east, north, shapely_wkb.dumps(geometry),
+                    datetime.now().isoformat(),
+                ),
+            )
+
+    def geocode(self, place_name: str, refresh: bool = False) -> dict:
+        """
+        Return the record for a place, querying Nominatim only if it is not stored.
+
+        Args:
+            place_name: Place name for the Nominatim query.
+            refresh: Query Nominatim even if the place is stored.
+
+        Returns:
+            The stored record.
+        """
+        if not refresh:
+            record = self.get(place_name)
+            if record is not None:
+                return record
+
+        with profile_phase("geocode"):
+            gdf = ox.geocode_to_gdf(place_name)
+        row = gdf.iloc[0]
+        self.put(
+            place_name,
+            gdf["geometry"].union_all(),
+            osm_type=row.get("osm_type"),
+            osm_id=row.get("osm_id"),
+            display_name=row.get("display_name"),
+        )
+        return self.get(place_name)
+
+
+def open_geocode_store(config: dict) -> GeocodeStore | None:
+    """Return the configured geocode store if it exists (created by ``geocode``), else None."""
+    path = geocode_store_path(config)
+    return GeocodeStore(path) if path.exists() else None
+
+
+def geocode_places(places: list[str], config: dict | None = None, db_path: Path | None = None,
+                   refresh: bool = False) -> int:
+    """
+    Resolve a whole list of places into the geocode store up front.
+
+    Places already stored are skipped (unless ``refresh``), so re-running an
+    ingestion plan only queries Nominatim for new names.
+
+    Args:
+        places: Place names.
+        config: Configuration dictionary (locates the store).
+        db_path: Store path overriding the config.
+        refresh: Re-query places that are already stored.
+
+    Returns:
+        Exit code (0 if every place resolved to a polygon, 1 otherwise).
+    """
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+    if not places:
+        logging.error("No places to geocode")
+        return 1
+
+    configure_osmnx(config)
+    store = GeocodeStore(db_path or geocode_store_path(config))
+    cached = resolved = 0
+    failed = []
+    for place in places:
+        if not refresh and place in store:
+            cached += 1
+            continue
+        try:
+            record = store.geocode(place, refresh=True)
+        except Exception as e:
+            logging.error(f"Could not geocode '{place}': {e}")
+            failed.append(place)
+            continue
+        if record["geometry"].geom_type not in ("Polygon", "MultiPolygon"):
+            logging.warning(f"'{place}' geocoded to a {record['geometry'].geom_type}, not a boundary polygon")
+            failed.append(place)
+            continue
+        resolved += 1
+        logging.info(f"Geocoded '{place}' -> {record['display_name']} ({record['osm_type']} {record['osm_id']})")
+
+    print(f"Geocode store {store.path}: {resolved} resolved, {cached} already stored, {len(failed)} failed")
+    if failed:
+        logging.error(f"Failed places: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+# =============================================================================
+# Fetch Command
+# =============================================================================
+
+
+def download_graph(
+    place_name: str,
+    retry: int = 3,
+    sleep_seconds: int = 60,
+    geocode_store: GeocodeStore | None = None,
+    polygon=None,
+) -> nx.MultiDiGraph | None:
+    """
+    Download the street network of a place from Overpass, with retries.
+
+    Args:
+        place_name: Place name for OSMnx query.
+        retry: Number of retries on failure.
+        sleep_seconds: Seconds to wait between retries.
+        geocode_store: Store to read the place polygon from (places it lacks
+            are geocoded once and added). Without a store, OSMnx geocodes
+            through Nominatim on every call.
+        polygon: Area to download; skips geocoding (place_name is then
+            only a label).
+
+    Returns:
+        The raw graph, or None if every attempt failed.
+    """
+    # Resolve the boundary once, outside the Overpass retries
+    if polygon is None and geocode_store is not None:
+        try:
+            polygon = geocode_store.geocode(place_name)["geometry"]
+        except Exception as e:
+            logging.error(f"Geocoding '{place_name}' failed: {e}")
+            return None
+        if polygon.geom_type not in ("Polygon", "MultiPolygon"):
+            logging.error(f"'{place_name}' geocoded to a {polygon.geom_type}, not a boundary polygon")
+            return None
+
+    graph = None
+    last_error = None
+
+    for attempt in range(1, retry + 1):
+        try:
+            logging.info(f"Fetching network for '{place_name}' (attempt {attempt}/{retry})")
+            with profile_phase("download"):
+                if polygon is None:
+                    graph = ox.graph_from_place(
+                        place_name,
+                        custom_filter=CUSTOM_FILTER,
+                        retain_all=True,
+                        truncate_by_edge=True,
+                    )
+                else:
+                    graph = ox.graph_from_polygon(
+                        polygon,
+                        custom_filter=CUSTOM_FILTER,
+                        retain_all=True,
+                        truncate_by_edge=True,
+                    )
+            logging.info(f"Successfully fetched graph with {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+            break
+        except Exception as e:
+            last_error = e
+            logging.warning(f"Attempt {attempt} failed: {e}")
+            if attempt < retry:
+                logging.info(f"Waiting {sleep_seconds} seconds before retry...")
+                time.sleep(sleep_seconds)
+
+    if graph is None:
+        logging.error(
+            f"Overpass request failed after {retry} retries. "
+            "Please wait and run the same command again."
+        )
+        logging.error(f"Last error: {last_error}")
+    return graph
+
+
+def process_fetched_graph(graph: nx.MultiDiGraph, place_name: str, date: str | None = None) -> nx.MultiDiGraph:
+    """
+    Add speeds, travel times, fetch metadata and ``date_fetched`` to a downloaded graph.
+
+    Args:
+        graph: Graph returned by ``download_graph``.
+        place_name: Place name the graph was fetched for.
+        date: Optional date string (YYYY-MM-DD, default: today).
+
+    Returns:
+        The processed graph.
+    """
+    # Post-processing: add speeds and travel times
+    logging.info("Adding edge speeds and travel times...")
+    try:
+        with profile_phase("add_edge_speeds"):
+            graph = ox.add_edge_speeds(graph)
+        with profile_phase("add_edge_travel_times"):
+            graph = ox.add_edge_travel_times(graph)
+    except Exception as e:
+        logging.warning(f"Could not add speeds/travel times: {e}")
+
+    # Add metadata to graph
+    fetch_date = date or datetime.now().strftime("%Y-%m-%d")
+    graph.graph["source_place"] = place_name
+    graph.graph["fetched_at"] = datetime.now().isoformat()
+    graph.graph["osmnx_version"] = ox.__version__
+    graph.graph["custom_filter"] = CUSTOM_FILTER
+
+    # Add date_fetched to all edges
+    with profile_phase("stamp_date_fetched"):
+        for u, v, key, data in graph.edges(keys=True, data=True):
+            data["date_fetched"] = fetch_date
+    return graph
+
+
+def fetch_network(
+    place_name: str,
+    output_dir: Path,
+    output_name: str | None = None,
+    date: str | None = None,
+    timeout: int = 180,
+    memory: int = 1073741824,
+    retry: int = 3,
+    sleep_seconds: int = 60,
+    config: dict | None = None,
+    compress: str = "none",
+) -> int:
+    """
+    Fetch street network for a place and save as GraphML.
+
+    If the geocode store exists (see ``geocode``), the place boundary is
+    read from it instead of querying Nominatim. If the edge store exists
+    (see ``edge-db``), the saved file is loaded into it.
+
+    Args:
+        place_name: Place name for OSMnx query.
+        output_dir: Directory to save the output file.
+        output_name: Optional custom output filename.
+        date: Optional date string (YYYY-MM-DD).
+        timeout: Overpass timeout in seconds.
+        memory: Overpass memory in bytes.
+        retry: Number of retries on failure.
+        sleep_seconds: Seconds to wait between retries.
+        config: Configuration dictionary.
+        compress: Compression of the default output name ("none", "gz", "zst").
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+
+    # Configure OSMnx
+    configure_osmnx(config, timeout=timeout, memory=memory)
+
+    # Ensure output directory exists
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    store = open_geocode_store(config)
+    graph = download_graph(place_name, retry=retry, sleep_seconds=sleep_seconds, geocode_store=store)
+    if graph is None:
+        return 1
+
+    graph = process_fetched_graph(graph, place_name, date)
+
+    # Determine output filepath
+    filepath = get_output_filepath(place_name, output_dir, output_name, date, compress)
+
+    # Save to GraphML
+    logging.info(f"Saving graph to {filepath}")
+    with profile_phase("save_graphml"):
+        save_graph(graph, filepath)
+    update_edge_store(open_edge_store(config), filepath)
+
+    # Print summary stats
+    with profile_phase("fetch_summary"):
+        print_fetch_summary(graph)
+
+    logging.info("Fetch completed successfully.")
+    return 0
+
+
+def print_fetch_summary(graph: nx.MultiDiGraph) -> None:
+    """Print summary statistics after a fetch operation."""
+    print("\n" + "=" * 60)
+    print("FETCH SUMMARY")
+    print("=" * 60)
+
+    total_nodes = graph.number_of_nodes()
+    total_edges = graph.number_of_edges()
+    print(f"Total nodes: {total_nodes:,}")
+    print(f"Total edges: {total_edges:,}")
+
+    # Calculate lengths for different categories
+    def is_paved(data):
+        surfaces = _extract_surface_values(data)
+        if not surfaces:
+            return False
+        return any(s in PAVED_SURFACES for s in surfaces)
+
+    def is_unpaved(data):
+        surfaces = _extract_surface_values(data)
+        if not surfaces:
+            return False
+        # unpaved if we have at least one surface value and none are in paved set
+        return not any(s in PAVED_SURFACES for s in surfaces)
+
+    def is_track(data):
+        return data.get("highway") == "track"
+
+    def is_alley(data):
+        return data.get("service") == "alley"
+
+    paved_km = calculate_edge_length_km(graph, is_paved)
+    unpaved_km = calculate_edge_length_km(graph, is_unpaved)
+    track_km = calculate_edge_length_km(graph, is_track)
+    alley_km = calculate_edge_length_km(graph, is_alley)
+    total_km = calculate_edge_length_km(graph, lambda _: True)
+
+    print(f"\nEdge lengths:")
+    print(f"  Total:   {total_km:,.2f} km")
+    print(f"  Paved:   {paved_km:,.2f} km")
+    print(f"  Unpaved: {unpaved_km:,.2f} km")
+    print(f"  Tracks:  {track_km:,.2f} km")
+    print(f"  Alleys:  {alley_km:,.2f} km")
+    print("=" * 60 + "\n")
+
+
+# =============================================================================
+# Batch Fetch Command
+# =============================================================================
+
+# Marks the end of a stage's input queue (one per worker)
+_STAGE_DONE = object()
+
+
+def read_places_file(path: Path) -> list[str]:
+    """Read place names from a text file, one per line; blank lines and # comments are skipped."""
+    places = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                places.append(line)
+    return places
+
+
+class PipelineStage:
+    """
+    A pipeline stage run by worker threads between two queues.
+
+    Workers take items from ``inbox``, apply ``func`` and put the result on
+    ``outbox``. A bounded outbox blocks a worker while the next stage is
+    behind, so only a few graphs are held in memory at once. Busy time (in
+    ``func``) and blocked time (waiting on a full outbox) are recorded per
+    stage.
+    """
+
+    def __init__(self, name: str, func, inbox: queue.Queue, outbox: queue.Queue | None, workers: int = 1):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = workers
+        self.items = 0
+        self.failed = []
+        self.busy_s = 0.0
+        self.blocked_s = 0.0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def finish(self) -> None:
+        """Signal the end of input and wait for the workers to drain it."""
+        for _ in self._threads:
+            self.inbox.put(_STAGE_DONE)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self) -> None:
+        while True:
+            item = self.inbox.get()
+            if item is _STAGE_DONE:
+                return
+            place = item[0]
+            start = time.perf_counter()
+            try:
+                result = self.func(*item)
+            except Exception as e:
+                logging.error(f"{self.name} failed for '{place}': {e}")
+                result = None
+            busy = time.perf_counter() - start
+
+            start = time.perf_counter()
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+            blocked = time.perf_counter() - start
+
+            with self._lock:
+                self.busy_s += busy
+                self.blocked_s += blocked
+                if result is None:
+                    self.failed.append(place)
+                else:
+                    self.items += 1
+
+
+def print_pipeline_summary(stages: list[PipelineStage], wall_s: float) -> None:
+    """Print per-stage item counts, busy/blocked time and throughput."""
+    print("\n" + "=" * 72)
+    print("FETCH-BATCH PIPELINE")
+    print("=" * 72)
+    print(f"  {'Stage':<10} {'Workers':>7} {'Done':>5} {'Failed':>6} {'Busy (s)':>9} {'Blocked (s)':>11} {'s/place':>9}")
+    print("-" * 72)
+    for stage in stages:
+        per_place = stage.busy_s / stage.items if stage.items else 0.0
+        print(
+            f"  {stage.name:<10} {stage.workers:>7} {stage.items:>5} {len(stage.failed):>6} "
+            f"{stage.busy_s:>9.1f} {stage.blocked_s:>11.1f} {per_place:>9.1f}"
+        )
+    print("-" * 72)
+    done = stages[-1].items
+    rate = done / wall_s * 60 if wall_s > 0 else 0.0
+    serial_s = sum(stage.busy_s for stage in stages)
+    print(f"  Wall time: {wall_s:.1f}s for {done} places ({rate:.2f} places/min)")
+    print(f"  Stage busy time: {serial_s:.1f}s (roughly a one-by-one fetch)")
+    print("=" * 72 + "\n")
+
+
+def fetch_batch(
+    places: list[str],
+    output_dir: Path,
+    date: str | None = None,
+    timeout: int = 180,
+    memory: int = 1073741824,
+    retry: int = 3,
+    sleep_seconds: int = 60,
+    config: dict | None = None,
+    compress: str = "none",
+    download_workers: int = 2,
+    process_workers: int = 1,
+    write_workers: int = 1,
+    queue_size: int = 2,
+    polygons: dict | None = None,
+    on_saved=None,
+) -> int:
+    """
+    Fetch several places with download, processing and writing overlapped.
+
+    Each place flows through three stages connected by bounded queues:
+    ``download`` (Overpass, I/O bound), ``process`` (speeds, travel times,
+    metadata) and ``write`` (GraphML). While one place is processed or
+    saved, the next ones are already downloading. Boundaries come from the
+    geocode store when it exists, as in ``fetch_network``.
+
+    Args:
+        places: Place names for OSMnx queries.
+        output_dir: Directory to save the output files.
+        date: Optional date string (YYYY-MM-DD).
+        timeout: Overpass timeout in seconds.
+        memory: Overpass memory in bytes.
+        retry: Number of retries per place on failure.
+        sleep_seconds: Seconds to wait between retries.
+        config: Configuration dictionary.
+        compress: Compression of the output files ("none", "gz", "zst").
+        download_workers: Concurrent Overpass downloads.
+        process_workers: Threads post-processing downloaded graphs.
+        write_workers: Threads saving GraphML files.
+        queue_size: Graphs allowed to wait between two stages.
+        polygons: Optional {place: polygon} areas downloaded as given,
+            without geocoding (the place is then only a label).
+        on_saved: Optional callback ``on_saved(place, filepath)`` run by the
+            write stage after each file is saved.
+
+    Returns:
+        Exit code (0 if every place was saved, 1 otherwise).
+    """
+    if not places:
+        logging.error("No places to fetch")
+        return 1
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+
+    configure_osmnx(config, timeout=timeout, memory=memory)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    store = open_geocode_store(config)
+    edge_store = open_edge_store(config)
+
+    def download(place):
+        polygon = polygons.get(place) if polygons else None
+        graph = download_graph(place, retry=retry, sleep_seconds=sleep_seconds, geocode_store=store, polygon=polygon)
+        return None if graph is None else (place, graph)
+
+    def process(place, graph):
+        return place, process_fetched_graph(graph, place, date)
+
+    def write(place, graph):
+        filepath = get_output_filepath(place, output_dir, date=date, compress=compress)
+        save_graph(graph, filepath)
+        update_edge_store(edge_store, filepath)
+        print(f"Saved {place}: {graph.number_of_nodes():,} nodes, {graph.number_of_edges():,} edges -> {filepath}")
+        if on_saved is not None:
+            on_saved(place, filepath)
+        return (place,)
+
+    pending = queue.Queue()
+    downloaded = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+    stages = [
+        PipelineStage("download", download, pending, downloaded, download_workers),
+        PipelineStage("process", process, downloaded, processed, process_workers),
+        PipelineStage("write", write, processed, None, write_workers),
+    ]
+
+    logging.info(f"Fetching {len(places)} places ({download_workers} download, {process_workers} process, {write_workers} write workers)")
+    start = time.perf_counter()
+    with profile_phase("fetch_batch"):
+        for place in places:
+            pending.put((place,))
+        for stage in stages:
+            stage.start()
+        # finish in stage order so each stage sees its input end after all upstream items
+        for stage in stages:
+            stage.finish()
+    wall_s = time.perf_counter() - start
+
+    print_pipeline_summary(stages, wall_s)
+    failed = [place for stage in stages for place in stage.failed]
+    if failed:
+        logging.error(f"{len(failed)} of {len(places)} places failed: {', '.join(failed)}")
+        return 1
+    logging.info("Batch fetch completed successfully.")
+    return 0
+
+
+# =============================================================================
+# Fetch Plan Command
+# =============================================================================
+
+# Ledger of the area each fetch-plan output file covers, kept in the output folder
+COVERAGE_LEDGER_NAME = "coverage.json"
+
+# Largest gap piece sent to Overpass in one request, in degrees per side
+DEFAULT_PLAN_TILE_DEG = 0.25
+
+# Gap slivers smaller than this (border mismatches) are not fetched
+DEFAULT_MIN_GAP_KM2 = 0.05
+
+
+def load_fetch_plan(path: Path) -> dict:
+    """
+    Load a fetch-plan manifest.
+
+    The manifest is JSON with a ``name``, an optional default ``buffer_deg``
+    and a list of ``areas``; each area has either a ``place`` name or a
+    ``bbox`` ([west, south, east, north]) and may override ``buffer_deg``.
+    """
+    with open(path) as f:
+        plan = json.load(f)
+    areas = plan.get("areas")
+    if not isinstance(areas, list) or not areas:
+        raise ValueError(f"{path}: manifest needs a non-empty 'areas' list")
+    for i, area in enumerate(areas):
+        if ("place" in area) == ("bbox" in area):
+            raise ValueError(f"{path}: area {i} needs exactly one of 'place' or 'bbox'")
+        if "bbox" in area and len(area["bbox"]) != 4:
+            raise ValueError(f"{path}: area {i} bbox must be [west, south, east, north]")
+    plan.setdefault("name", Path(path).stem)
+    plan.setdefault("buffer_deg", 0.0)
+    return plan
+
+
+def plan_area_polygon(area: dict, store: GeocodeStore, buffer_deg: float = 0.0):
+    """Return the (buffered) polygon of a manifest area, geocoding places through the store."""
+    if "bbox" in area:
+        polygon = shapely_box(*area["bbox"])
+    else:
+        polygon = store.geocode(area["place"])["geometry"]
+        if polygon.geom_type not in ("Polygon", "MultiPolygon"):
+            raise ValueError(f"'{area['place']}' geocoded to a {polygon.geom_type}, not a boundary polygon")
+    buffer_deg = area.get("buffer_deg", buffer_deg)
+    return polygon.buffer(buffer_deg) if buffer_deg else polygon
+
+
+# lat/lon -> World Cylindrical Equal Area, for area measurements anywhere
+_EQUAL_AREA = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:6933", always_xy=True)
+
+
+def area_km2(geometry) -> float:
+    """Return the area of a lat/lon geometry in km² (equal-area projection)."""
+    if geometry.is_empty:
+        return 0.0
+    projected = shapely.transform(geometry, lambda xy: np.column_stack(_EQUAL_AREA.transform(xy[:, 0], xy[:, 1])))
+    return projected.area / 1e6
+
+
+def load_coverage_ledger(output_dir: Path) -> list[dict]:
+    """Return the coverage ledger entries of a fetch-plan output folder."""
+    path = Path(output_dir) / COVERAGE_LEDGER_NAME
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return json.load(f).get("files", [])
+
+
+def save_coverage_ledger(output_dir: Path, entries: list[dict]) -> None:
+    """Write the coverage ledger of a fetch-plan output folder."""
+    with open(Path(output_dir) / COVERAGE_LEDGER_NAME, "w") as f:
+        json.dump({"files": entries}, f, indent=2)
+
+
+# Fetch date in default output names (PLACE_SLUG__YYYYMMDD.graphml)
+_FILE_DATE_PATTERN = re.compile(r"__(\d{4})(\d{2})(\d{2})(?:\D|$)")
+
+
+def graph_file_date(path: Path) -> str | None:
+    """Return the YYYY-MM-DD fetch date in a default output file name, or None."""
+    match = _FILE_DATE_PATTERN.search(Path(path).name)
+    return "-".join(match.groups()) if match else None
+
+
+def graph_node_hull(path: Path):
+    """Return the convex hull of a GraphML file's node coordinates (empty if under three nodes)."""
+    arrays = graphml_coordinate_arrays(path)
+    keep = np.isfinite(arrays["x"]) & np.isfinite(arrays["y"])
+    hull = shapely.convex_hull(shapely.multipoints(np.column_stack([arrays["x"][keep], arrays["y"][keep]])))
+    return hull if hull.geom_type == "Polygon" else Polygon()
+
+
+def covered_area(output_dir: Path, since: str | None = None):
+    """
+    Return the union of areas covered by the GraphML files in a fetch-plan folder.
+
+    Files recorded in ``coverage.json`` count with their exact fetched area.
+    Other GraphML files in the folder (e.g. from ``fetch`` or ``fetch-batch``)
+    count with the convex hull of their nodes, which can overstate coverage
+    for oddly shaped places.
+
+    Args:
+        output_dir: Fetch-plan output folder.
+        since: Only count files fetched on or after this date (YYYY-MM-DD);
+            unlisted files need the date in their name to count.
+    """
+    output_dir = Path(output_dir)
+    if not output_dir.is_dir():
+        return Polygon()
+    ledger = {entry["file"]: entry for entry in load_coverage_ledger(output_dir)}
+    polygons = []
+    for path in list_graph_files(output_dir):
+        entry = ledger.get(path.name)
+        date = entry["date"] if entry else graph_file_date(path)
+        if since is not None and (date is None or date < since):
+            continue
+        if entry:
+            polygons.append(shapely_wkt.loads(entry["area"]))
+        else:
+            try:
+                polygons.append(graph_node_hull(path))
+            except (OSError, ValueError, ET.ParseError) as e:
+                logging.warning(f"Could not read coverage of {path.name}: {e}")
+    return unary_union(polygons) if polygons else Polygon()
+
+
+def split_gaps(gap, tile_deg: float = DEFAULT_PLAN_TILE_DEG, min_km2: float = DEFAULT_MIN_GAP_KM2) -> list:
+    """
+    Cut the uncovered area into polygons no larger than a grid cell.
+
+    Cells are aligned to multiples of ``tile_deg`` so repeated runs cut the
+    same pieces; pieces under ``min_km2`` are dropped.
+    """
+    if gap.is_empty:
+        return []
+    west, south, east, north = gap.bounds
+    pieces = []
+    x = np.floor(west / tile_deg) * tile_deg
+    while x < east:
+        y = np.floor(south / tile_deg) * tile_deg
+        while y < north:
+            part = gap.intersection(shapely_box(x, y, x + tile_deg, y + tile_deg))
+            parts = getattr(part, "geoms", [part])
+            pieces.extend(p for p in parts if p.geom_type == "Polygon" and area_km2(p) >= min_km2)
+            y += tile_deg
+        x += tile_deg
+    return pieces
+
+
+def fetch_plan(
+    manifest: Path,
+    output_dir: Path,
+    date: str | None = None,
+    since: str | None = None,
+    tile_deg: float = DEFAULT_PLAN_TILE_DEG,
+    min_gap_km2: float = DEFAULT_MIN_GAP_KM2,
+    dry_run: bool = False,
+    config: dict | None = None,
+    **batch_options,
+) -> int:
+    """
+    Fetch only the parts of a manifest's areas not already covered on disk.
+
+    The manifest's places and bboxes are unioned, so overlapping borders and
+    buffered tiles are requested once; the area covered by the GraphML files
+    already in ``output_dir`` (see ``covered_area``) is subtracted, and the
+    remainder is cut into grid-aligned pieces fetched with the ``fetch-batch``
+    pipeline. Pieces are named by a hash of their shape, so a re-run with a
+    grown manifest adds files instead of overwriting earlier ones.
+
+    Args:
+        manifest: Fetch-plan manifest (see ``load_fetch_plan``).
+        output_dir: Directory for the output files and coverage ledger.
+        date: Optional date string (YYYY-MM-DD, default: today).
+        since: Only treat files fetched on or after this date as covered.
+        tile_deg: Largest piece per Overpass request, in degrees.
+        min_gap_km2: Smallest gap piece worth fetching.
+        dry_run: Print the plan without fetching.
+        config: Configuration dictionary.
+        **batch_options: Passed on to ``fetch_batch`` (timeout, retry, workers...).
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+    try:
+        plan = load_fetch_plan(manifest)
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not read manifest: {e}")
+        return 1
+
+    configure_osmnx(config)
+    store = GeocodeStore(geocode_store_path(config))
+    output_dir = Path(output_dir)
+    fetch_date = date or datetime.now().strftime("%Y-%m-%d")
+
+    with profile_phase("plan_areas"):
+        polygons = []
+        for area in plan["areas"]:
+            try:
+                polygons.append(plan_area_polygon(area, store, plan["buffer_deg"]))
+            except Exception as e:
+                logging.error(f"Could not resolve area {area}: {e}")
+                return 1
+        requested = unary_union(polygons)
+        covered = covered_area(output_dir, since=since)
+        gaps = split_gaps(requested.difference(covered), tile_deg, min_gap_km2)
+
+    naive_km2 = sum(area_km2(p) for p in polygons)
+    requested_km2 = area_km2(requested)
+    gap_km2 = sum(area_km2(p) for p in gaps)
+    print(f"Plan '{plan['name']}': {len(polygons)} areas, {naive_km2:,.1f} km² if fetched one by one")
+    print(f"  Union of areas:   {requested_km2:,.1f} km²")
+    print(f"  Already covered:  {area_km2(requested.intersection(covered)):,.1f} km²")
+    print(f"  To fetch:         {gap_km2:,.1f} km² in {len(gaps)} requests")
+
+    if dry_run or not gaps:
+        return 0
+
+    # name pieces by their shape, so a re-run with a grown manifest never reuses a name
+    labels = {f"{plan['name']} gap {hashlib.sha1(piece.wkt.encode()).hexdigest()[:10]}": piece for piece in gaps}
+    saved = []
+
+    def record(label, filepath):
+        # list.append is atomic, so write-stage threads can share it
+        saved.append({"file": filepath.name, "label": label, "date": fetch_date, "area": labels[label].wkt})
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    result = fetch_batch(
+        list(labels),
+        output_dir,
+        date=fetch_date,
+        config=config,
+        polygons=labels,
+        on_saved=record,
+        **batch_options,
+    )
+    if saved:
+        ledger = [e for e in load_coverage_ledger(output_dir) if e["file"] not in {s["file"] for s in saved}]
+        save_coverage_ledger(output_dir, ledger + sorted(saved, key=lambda e: e["file"]))
+    return result
+
+
+# =============================================================================
+# Merge Command
+# =============================================================================
+
+
+def merge_graphs(
+    folder: Path,
+    output: Path,
+    config: dict | None = None,
+) -> int:
+    """
+    Merge multiple GraphML files into a single graph.
+
+    If the edge store exists (see ``edge-db``), the merged file is loaded
+    into it.
+
+    Args:
+        folder: Directory containing GraphML files.
+        output: Output path for merged graph.
+        config: Configuration dictionary (locates the edge store).
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    folder = Path(folder)
+    output = Path(output)
+
+    # Find all GraphML files
+    graphml_files = list_graph_files(folder)
+    if not graphml_files:
+        logging.error(f"No GraphML files ({', '.join(GRAPHML_SUFFIXES)}) found in {folder}")
+        return 1
+
+    logging.info(f"Found {len(graphml_files)} GraphML files to merge")
+
+    # Load and merge graphs
+    g_total = None
+    source_files = []
+
+    for filepath in graphml_files:
+        logging.info(f"Loading {filepath.name}...")
+        try:
+            with profile_phase("load_graphml"):
+                g_new = load_graph(filepath)
+            source_files.append(filepath.name)
+
+            if g_total is None:
+                g_total = g_new
+            else:
+                with profile_phase("compose"):
+                    g_total = nx.compose(g_total, g_new)
+
+        except Exception as e:
+            logging.error(f"Failed to load {filepath}: {e}")
+            return 1
+
+    if g_total is None:
+        logging.error("No graphs were loaded")
+        return 1
+
+    # Add metadata
+    g_total.graph["source_files"] = source_files
+    g_total.graph["merged_at"] = datetime.now().isoformat()
+
+    # Ensure output directory exists
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    # Save merged graph
+    logging.info(f"Saving merged graph to {output}")
+    with profile_phase("save_graphml"):
+        save_graph(g_total, output)
+    update_edge_store(open_edge_store(config or DEFAULT_CONFIG), output)
+
+    logging.info(
+        f"Merge completed: {g_total.number_of_nodes():,} nodes, "
+        f"{g_total.number_of_edges():,} edges"
+    )
+    return 0
+
+
+# =============================================================================
+# Stats Command
+# =============================================================================
+
+
+# Bump when compute_stats changes so cached results are recomputed
+STATS_CACHE_VERSION = 1
+
+# Tracktype grades counted in the histogram
+TRACKTYPE_GRADES = ("grade1", "grade2", "grade3", "grade4", "grade5")
+
+
+def compute_stats(graph: nx.MultiDiGraph) -> dict:
+    """
+    Compute the road-type lengths and tracktype histogram reported by ``stats``.
+
+    Args:
+        graph: Graph to summarize.
+
+    Returns:
+        Mapping with node/edge counts, lengths in km and ``tracktype`` counts.
+    """
+
+    # Define filter functions
+    def is_alley(data):
+        return data.get("service") == "alley"
+
+    def is_track(data):
+        return data.get("highway") == "track"
+
+    def is_private(data):
+        return data.get("access") == "private"
+
+    def is_unpaved(data):
+        surfaces = _extract_surface_values(data)
+        if not surfaces:
+            return False
+        return not any(s in PAVED_SURFACES for s in surfaces)
+
+    # Calculate tracktype histogram (normalize possible list/mixed values)
+    tracktype_counts = dict.fromkeys(TRACKTYPE_GRADES, 0)
+    for u, v, data in graph.edges(data=True):
+        if data.get("highway") == "track":
+            raw_tracktype = data.get("tracktype", "unknown")
+
+            # Normalize tracktype to a single lowercase string
+            if isinstance(raw_tracktype, list):
+                candidates = [str(x).strip().lower() for x in raw_tracktype if str(x).strip()]
+                tracktype = candidates[0] if candidates else "unknown"
+            else:
+                tracktype = (
+                    str(raw_tracktype).strip().lower()
+                    if raw_tracktype is not None
+                    else "unknown"
+                )
+
+            if tracktype in tracktype_counts:
+                tracktype_counts[tracktype] += 1
+
+    return {
+        "nodes": graph.number_of_nodes(),
+        "edges": graph.number_of_edges(),
+        "total_km": calculate_edge_length_km(graph, lambda _: True),
+        "alley_km": calculate_edge_length_km(graph, is_alley),
+        "track_km": calculate_edge_length_km(graph, is_track),
+        "private_km": calculate_edge_length_km(graph, is_private),
+        "unpaved_km": calculate_edge_length_km(graph, is_unpaved),
+        "tracktype": tracktype_counts,
+    }
+
+
+def stats_cache_path(filepath: Path) -> Path:
+    """Return the stats sidecar path for a graph file."""
+    filepath = Path(filepath)
+    return filepath.with_name(graph_stem(filepath) + ".stats.json")
+
+
+def cached_stats(filepath: Path) -> dict | None:
+    """
+    Return the cached ``compute_stats`` result for a file, or None if stale.
+
+    A matching size and modification time is trusted without reading the
+    file; otherwise the SHA-1 fingerprint decides (a touched but unchanged
+    file is still a hit, and its sidecar is re-stamped).
+    """
+    filepath = Path(filepath)
+    cache = stats_cache_path(filepath)
+    if not cache.exists():
+        return None
+    try:
+        with open(cache) as f:
+            cached = json.load(f)
+        if cached.get("version") != STATS_CACHE_VERSION:
+            return None
+        stat = filepath.stat()
+        if cached.get("size") == stat.st_size and cached.get("mtime_ns") == stat.st_mtime_ns:
+            return cached["stats"]
+        if cached.get("fingerprint") != file_fingerprint(filepath):
+            return None
+        _write_stats_cache(filepath, cached["fingerprint"], cached["stats"])
+        return cached["stats"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_stats_cache(filepath: Path, fingerprint: str, stats: dict) -> None:
+    cache = stats_cache_path(filepath)
+    stat = Path(filepath).stat()
+    try:
+        with open(cache, "w") as f:
+            json.dump(
+                {
+                    "fingerprint": fingerprint,
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "version": STATS_CACHE_VERSION,
+                    "stats": stats,
+                },
+                f,
+                indent=2,
+            )
+    except OSError as e:
+        logging.warning(f"Could not write stats cache {cache}: {e}")
+
+
+def file_stats(filepath: Path, use_cache: bool = True) -> dict:
+    """
+    Return ``compute_stats`` for a GraphML file, using its sidecar cache.
+
+    The sidecar is reused only while the file is unchanged (see
+    ``cached_stats``) and the stats version matches.
+    """
+    if use_cache:
+        stats = cached_stats(filepath)
+        if stats is not None:
+            return stats
+    return _compute_file_stats(filepath, use_cache)[0]
+
+
+def _compute_file_stats(filepath: Path, write_cache: bool = True) -> tuple[dict, dict]:
+    # Returns the stats and the (wall, cpu) time of each phase, so timings
+    # from pool workers can be added to the parent's run profile.
+    timings = {}
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    with profile_phase("load_graphml"):
+        graph = load_graph(filepath)
+    timings["load_graphml"] = (time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    with profile_phase("compute_stats"):
+        stats = compute_stats(graph)
+    timings["compute_stats"] = (time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+    if write_cache:
+        _write_stats_cache(filepath, file_fingerprint(filepath), stats)
+    return stats, timings
+
+
+def resolve_graph_files(target) -> list[Path]:
+    """Expand a GraphML file, a folder of GraphML files or a glob pattern."""
+    path = Path(target)
+    if path.is_dir():
+        return list_graph_files(path)
+    if path.exists():
+        return [path]
+    return sorted(Path(p) for p in glob.glob(str(target), recursive=True) if Path(p).is_file())
+
+
+def print_stats(filename: str, stats: dict) -> None:
+    """Print the statistics of a single network file."""
+    print("\n" + "=" * 60)
+    print("NETWORK STATISTICS")
+    print("=" * 60)
+    print(f"File: {filename}")
+    print(f"Total nodes: {stats['nodes']:,}")
+    print(f"Total edges: {stats['edges']:,}")
+    print(f"Total length: {stats['total_km']:,.2f} km")
+    print()
+    print("Road Type Lengths (km):")
+    print("-" * 40)
+    print(f"  {'Category':<25} {'Length (km)':>12}")
+    print("-" * 40)
+    print(f"  {'Alleys (service=alley)':<25} {stats['alley_km']:>12,.2f}")
+    print(f"  {'Wilderness tracks':<25} {stats['track_km']:>12,.2f}")
+    print(f"  {'Private roads':<25} {stats['private_km']:>12,.2f}")
+    print(f"  {'Unpaved roads':<25} {stats['unpaved_km']:>12,.2f}")
+    print("-" * 40)
+    print()
+    print("Tracktype Histogram (highway=track edges):")
+    print("-" * 40)
+    print(f"  {'Tracktype':<15} {'Count':>10}")
+    print("-" * 40)
+    for grade, count in sorted(stats["tracktype"].items()):
+        print(f"  {grade:<15} {count:>10}")
+    print("-" * 40)
+    print("=" * 60 + "\n")
+
+
+def print_stats_table(rows: list[tuple[str, dict]], label: str = "File") -> None:
+    """Print one row per file (or other group) plus a combined row and tracktype histogram."""
+    columns = [
+        ("nodes", "Nodes", "{:>10,}"),
+        ("edges", "Edges", "{:>10,}"),
+        ("total_km", "Total km", "{:>11,.1f}"),
+        ("alley_km", "Alley km", "{:>10,.1f}"),
+        ("track_km", "Track km", "{:>10,.1f}"),
+        ("private_km", "Private km", "{:>11,.1f}"),
+        ("unpaved_km", "Unpaved km", "{:>11,.1f}"),
+    ]
+    combined = {key: sum(stats[key] for _, stats in rows) for key, _, _ in columns}
+    combined["tracktype"] = {
+        grade: sum(stats["tracktype"].get(grade, 0) for _, stats in rows) for grade in TRACKTYPE_GRADES
+    }
+    name_width = max(len("Combined"), len(label), *(len(name) for name, _ in rows))
+
+    def row(name, stats):
+        return f"  {name:<{name_width}}" + "".join(" " + fmt.format(stats[key]) for key, _, fmt in columns)
+
+    header = f"  {label:<{name_width}}" + "".join(
+        f" {label:>{len(fmt.format(0))}}" for _, label, fmt in columns
+    )
+    width = len(header)
+
+    print("\n" + "=" * width)
+    print(f"NETWORK STATISTICS ({len(rows)} {'files' if label == 'File' else 'groups'})")
+    print("=" * width)
+    print(header)
+    print("-" * width)
+    for name, stats in rows:
+        print(row(name, stats))
+    print("-" * width)
+    print(row("Combined", combined))
+    print("=" * width)
+    print()
+    print(f"Tracktype Histogram (highway=track edges, all {'files' if label == 'File' else 'groups'}):")
+    print("-" * 40)
+    print(f"  {'Tracktype':<15} {'Count':>10}")
+    print("-" * 40)
+    for grade, count in sorted(combined["tracktype"].items()):
+        print(f"  {grade:<15} {count:>10}")
+    print("-" * 40 + "\n")
+
+
+def calculate_stats(filepath: Path, workers: int | None = None, use_cache: bool = True) -> int:
+    """
+    Calculate and print statistics for one or more GraphML network files.
+
+    Args:
+        filepath: GraphML file, folder of GraphML files, or glob pattern.
+        workers: Worker processes for uncached files (default: CPU count).
+        use_cache: Reuse and write per-file ``.stats.json`` sidecars.
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    files = resolve_graph_files(filepath)
+    if not files:
+        logging.error(f"File not found: {filepath}")
+        return 1
+
+    results = {}
+    if use_cache:
+        # cache hits are answered here and never reach the worker pool
+        with profile_phase("stats_cache"):
+            for path in files:
+                stats = cached_stats(path)
+                if stats is not None:
+                    results[path] = stats
+    pending = [path for path in files if path not in results]
+    logging.info(f"Statistics for {len(files)} file(s): {len(files) - len(pending)} cached, {len(pending)} to compute")
+
+    if len(pending) <= 1 or workers == 1:
+        for path in pending:
+            try:
+                results[path] = _compute_file_stats(path, use_cache)[0]
+            except Exception as e:
+                logging.error(f"Failed to load graph {path}: {e}")
+                return 1
+    else:
+        max_workers = min(len(pending), workers or os.cpu_count() or 1)
+        with profile_phase("stats_pool"), ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_compute_file_stats, path, use_cache): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results[path], timings = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to load graph {path}: {e}")
+                    return 1
+                for name, (wall_s, cpu_s) in timings.items():
+                    record_phase(name, wall_s, cpu_s)
+
+    if len(files) == 1:
+        print_stats(files[0].name, results[files[0]])
+    else:
+        print_stats_table([(path.name, results[path]) for path in files])
+    return 0
+
+
+# =============================================================================
+# Edge Store
+# =============================================================================
+
+# Edge attributes kept in their own indexed columns; all others go to ``tags``
+EDGE_STORE_COLUMNS = ("highway", "service", "surface", "tracktype", "access", "date_fetched")
+
+# Columns ``stats --sql`` can group by
+EDGE_STORE_GROUPS = ("source", "date_fetched", "highway", "surface", "tracktype", "access")
+
+# Edges inserted per executemany call
+EDGE_STORE_CHUNK = 50000
+
+
+def edge_store_path(config: dict) -> Path:
+    """Return the edge store path from config ("edge_db" or data_root/edges.sqlite)."""
+    if config.get("edge_db"):
+        return Path(config["edge_db"])
+    return Path(config.get("data_root", "./data")) / DEFAULT_EDGE_DB_NAME
+
+
+class EdgeStore:
+    """
+    One row per edge of any number of GraphML files, in one SQLite file.
+
+    ``highway``, ``service``, ``surface``, ``tracktype``, ``access`` and
+    ``date_fetched`` are indexed columns, the edge bbox is indexed for
+    spatial filters, and the remaining attributes are kept as JSON in
+    ``tags`` (queryable with ``json_extract``). Each source file replaces its
+    own rows when it is loaded again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # one loader at a time, e.g. for fetch-batch write workers
+        self._load_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sources (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE NOT NULL,
+                    name TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    nodes INTEGER NOT NULL,
+                    edges INTEGER NOT NULL,
+                    loaded_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS edges (
+                    source_id INTEGER NOT NULL REFERENCES sources(id),
+                    u INTEGER NOT NULL,
+                    v INTEGER NOT NULL,
+                    key INTEGER NOT NULL,
+                    osmid TEXT,
+                    highway TEXT,
+                    service TEXT,
+                    surface TEXT,
+                    tracktype TEXT,
+                    access TEXT,
+                    date_fetched TEXT,
+                    unpaved INTEGER NOT NULL,
+                    length REAL NOT NULL,
+                    min_x REAL, min_y REAL, max_x REAL, max_y REAL,
+                    tags TEXT
+                );
+                CREATE INDEX IF NOT EXISTS edges_source ON edges(source_id);
+                CREATE INDEX IF NOT EXISTS edges_highway ON edges(highway);
+                CREATE INDEX IF NOT EXISTS edges_surface ON edges(surface);
+                CREATE INDEX IF NOT EXISTS edges_tracktype ON edges(tracktype);
+                CREATE INDEX IF NOT EXISTS edges_access ON edges(access);
+                CREATE INDEX IF NOT EXISTS edges_date_fetched ON edges(date_fetched);
+                CREATE INDEX IF NOT EXISTS edges_bbox_x ON edges(min_x, max_x);
+                CREATE INDEX IF NOT EXISTS edges_bbox_y ON edges(min_y, max_y);
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        # commit on success, then always close
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def sources(self) -> list[dict]:
+        """Return the loaded source files."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, path, name, fingerprint, nodes, edges, loaded_at FROM sources ORDER BY name")
+            names = [c[0] for c in rows.description]
+            return [dict(zip(names, row)) for row in rows]
+
+    def load(self, filepath: Path, force: bool = False) -> bool:
+        """
+        Stream a GraphML file into the store, replacing its previous rows.
+
+        Args:
+            filepath: GraphML file (plain or compressed).
+            force: Reload even if the file's fingerprint is unchanged.
+
+        Returns:
+            True if the file was (re)loaded, False if it was already current.
+        """
+        filepath = Path(filepath).resolve()
+        fingerprint = file_fingerprint(filepath)
+        with self._load_lock, self._connect() as conn:
+            row = conn.execute("SELECT id, fingerprint FROM sources WHERE path = ?", (str(filepath),)).fetchone()
+            if row is not None and row[1] == fingerprint and not force:
+                return False
+            if row is not None:
+                conn.execute("DELETE FROM edges WHERE source_id = ?", (row[0],))
+                conn.execute("DELETE FROM sources WHERE id = ?", (row[0],))
+            source_id = conn.execute(
+                "INSERT INTO sources (path, name, fingerprint, nodes, edges, loaded_at) VALUES (?, ?, ?, 0, 0, ?)",
+                (str(filepath), filepath.name, fingerprint, datetime.now().isoformat()),
+            ).lastrowid
+
+            coords = {}
+            chunk = []
+            edges = 0
+            for kind, ident, key, attrs in iter_graphml_elements(filepath):
+                if kind == "node":
+                    coords[ident] = (float(attrs.get("x", "nan")), float(attrs.get("y", "nan")))
+                    continue
+                chunk.append((ident, key, attrs))
+                if len(chunk) >= EDGE_STORE_CHUNK:
+                    edges += self._insert_edges(conn, source_id, chunk, coords)
+                    chunk = []
+            edges += self._insert_edges(conn, source_id, chunk, coords)
+            conn.execute("UPDATE sources SET nodes = ?, edges = ? WHERE id = ?", (len(coords), edges, source_id))
+        logging.info(f"Edge store {self.path}: loaded {edges:,} edges from {filepath.name}")
+        return True
+
+    @staticmethod
+    def _insert_edges(conn, source_id: int, chunk: list, coords: dict) -> int:
+        if not chunk:
+            return 0
+        # edge bboxes from the geometry where present, else from the end nodes
+        wkt = np.array([attrs.get("geometry") or None for _, _, attrs in chunk], dtype=object)
+        bounds = shapely.bounds(shapely.from_wkt(wkt))
+        rows = []
+        for (ident, key, attrs), bbox in zip(chunk, bounds):
+            if np.isnan(bbox[0]):
+                (x1, y1), (x2, y2) = coords.get(ident[0], (None, None)), coords.get(ident[1], (None, None))
+                bbox = (None, None, None, None) if x1 is None or x2 is None else (
+                    min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+                )
+            values = {name: attrs.get(name) or None for name in EDGE_STORE_COLUMNS}
+            if values["tracktype"] is not None:
+                # same normalization as compute_stats
+                values["tracktype"] = values["tracktype"].strip().lower()
+            tags = {k: v for k, v in attrs.items() if k not in EDGE_STORE_COLUMNS and k not in ("osmid", "length", "geometry")}
+            rows.append((
+                source_id, int(ident[0]), int(ident[1]), int(key) if key else 0, attrs.get("osmid"),
+                *values.values(),
+                int(_is_unpaved_surface(_split_tag_values(values["surface"]))),
+                float(attrs.get("length") or 0.0),
+                *(None if c is None else float(c) for c in bbox),
+                json.dumps(tags, sort_keys=True) if tags else None,
+            ))
+        conn.executemany(f"INSERT INTO edges VALUES ({', '.join('?' * len(rows[0]))})", rows)
+        return len(rows)
+
+    def stats(self, group_by: str = "source", where: str | None = None, bbox=None,
+              sources: list[Path] | None = None) -> list[tuple[str, dict]]:
+        """
+        Compute ``compute_stats`` figures as SQL aggregations, one row per group.
+
+        Args:
+            group_by: One of EDGE_STORE_GROUPS.
+            where: Extra SQL condition on the ``edges`` table.
+            bbox: Only edges whose bbox intersects (west, south, east, north).
+            sources: Only edges loaded from these files.
+
+        Returns:
+            List of (group label, stats) with the keys of ``compute_stats``;
+            ``nodes`` counts the distinct end nodes of the matching edges.
+        """
+        if group_by not in EDGE_STORE_GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(EDGE_STORE_GROUPS)}")
+        group = "s.name" if group_by == "source" else f"e.{group_by}"
+        conditions, params = [], []
+        if where:
+            conditions.append(f"({where})")
+        if bbox is not None:
+            west, south, east, north = bbox
+            conditions.append("e.max_x >= ? AND e.min_x <= ? AND e.max_y >= ? AND e.min_y <= ?")
+            params += [west, east, south, north]
+        if sources is not None:
+            paths = [str(Path(p).resolve()) for p in sources]
+            conditions.append(f"s.path IN ({', '.join('?' * len(paths))})")
+            params += paths
+        matching = (
+            f"SELECT {group} AS grp, e.* FROM edges e JOIN sources s ON s.id = e.source_id"
+            + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+        )
+        grades = ", ".join("?" * len(TRACKTYPE_GRADES))
+        with self._connect() as conn:
+            totals = conn.execute(
+                f"""
+                WITH m AS ({matching})
+                SELECT grp, COUNT(*),
+                    SUM(length) / 1000.0,
+                    COALESCE(SUM(CASE WHEN service = 'alley' THEN length END), 0) / 1000.0,
+                    COALESCE(SUM(CASE WHEN highway = 'track' THEN length END), 0) / 1000.0,
+                    COALESCE(SUM(CASE WHEN access = 'private' THEN length END), 0) / 1000.0,
+                    COALESCE(SUM(CASE WHEN unpaved THEN length END), 0) / 1000.0
+                FROM m GROUP BY grp ORDER BY grp
+                """,
+                params,
+            ).fetchall()
+            nodes = dict(conn.execute(
+                f"""
+                WITH m AS ({matching})
+                SELECT grp, COUNT(*) FROM (SELECT grp, u FROM m UNION SELECT grp, v FROM m) GROUP BY grp
+                """,
+                params,
+            ).fetchall())
+            histogram = conn.execute(
+                f"""
+                WITH m AS ({matching})
+                SELECT grp, tracktype, COUNT(*) FROM m
+                WHERE highway = 'track' AND tracktype IN ({grades}) GROUP BY grp, tracktype
+                """,
+                params + list(TRACKTYPE_GRADES),
+            ).fetchall()
+
+        results = {}
+        for grp, edges, total_km, alley_km, track_km, private_km, unpaved_km in totals:
+            results[grp] = {
+                "nodes": nodes.get(grp, 0),
+                "edges": edges,
+                "total_km": total_km,
+                "alley_km": alley_km,
+                "track_km": track_km,
+                "private_km": private_km,
+                "unpaved_km": unpaved_km,
+                "tracktype": dict.fromkeys(TRACKTYPE_GRADES, 0),
+            }
+        for grp, grade, count in histogram:
+            results[grp]["tracktype"][grade] = count
+        return [("(none)" if grp is None else str(grp), stats) for grp, stats in results.items()]
+
+
+def open_edge_store(config: dict) -> EdgeStore | None:
+    """Return the configured edge store if it exists (created by ``edge-db``), else None."""
+    path = edge_store_path(config)
+    return EdgeStore(path) if path.exists() else None
+
+
+def update_edge_store(store: EdgeStore | None, filepath: Path) -> None:
+    """Load a freshly written graph file into the edge store, if there is one."""
+    if store is None:
+        return
+    try:
+        with profile_phase("edge_store"):
+            store.load(filepath)
+    except Exception as e:
+        # the GraphML file is the source of truth; the store can be rebuilt
+        logging.warning(f"Could not update edge store {store.path} with {filepath}: {e}")
+
+
+def build_edge_store(filepath, config: dict | None = None, db_path: Path | None = None, force: bool = False) -> int:
+    """
+    Load GraphML files into the edge store (converter for existing files).
+
+    Args:
+        filepath: GraphML file, folder of GraphML files, or glob pattern.
+        config: Configuration dictionary (locates the store).
+        db_path: Store path overriding the config.
+        force: Reload files whose fingerprint is unchanged.
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+    files = resolve_graph_files(filepath)
+    if not files:
+        logging.error(f"File not found: {filepath}")
+        return 1
+
+    store = EdgeStore(db_path or edge_store_path(config))
+    loaded = 0
+    for path in files:
+        try:
+            with profile_phase("edge_store"):
+                loaded += store.load(path, force=force)
+        except Exception as e:
+            logging.error(f"Failed to load {path} into the edge store: {e}")
+            return 1
+    print(f"Edge store {store.path}: {loaded} loaded, {len(files) - loaded} unchanged, "
+          f"{len(store.sources())} source file(s) in total")
+    return 0
+
+
+def calculate_sql_stats(filepath=None, config: dict | None = None, db_path: Path | None = None,
+                        group_by: str = "source", where: str | None = None, bbox=None) -> int:
+    """
+    Print ``stats`` figures computed by SQL against the edge store.
+
+    Args:
+        filepath: Optional GraphML file, folder or glob restricting the sources.
+        config: Configuration dictionary (locates the store).
+        db_path: Store path overriding the config.
+        group_by: One of EDGE_STORE_GROUPS.
+        where: Extra SQL condition on the ``edges`` table.
+        bbox: Only edges whose bbox intersects (west, south, east, north).
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+    path = Path(db_path or edge_store_path(config))
+    if not path.exists():
+        logging.error(f"Edge store not found: {path} (create it with the edge-db command)")
+        return 1
+    sources = None
+    if filepath is not None:
+        sources = resolve_graph_files(filepath)
+        if not sources:
+            logging.error(f"File not found: {filepath}")
+            return 1
+
+    try:
+        with profile_phase("sql_stats"):
+            rows = EdgeStore(path).stats(group_by=group_by, where=where, bbox=bbox, sources=sources)
+    except sqlite3.Error as e:
+        logging.error(f"SQL stats failed: {e}")
+        return 1
+    if not rows:
+        logging.error("No edges match")
+        return 1
+    if len(rows) == 1 and group_by == "source":
+        print_stats(rows[0][0], rows[0][1])
+    else:
+        print_stats_table(rows, label=group_by.replace("_", " ").capitalize())
+    return 0
+
+
+# =============================================================================
+# Coverage Command
+# =============================================================================
+
+# Default raster cell size in degrees (about 5.5 km north-south)
+DEFAULT_COVERAGE_CELL_DEG = 0.05
+
+# Cells with less road than this (km) are flagged as sparse
+DEFAULT_SPARSE_KM = 1.0
+
+# Bands of the coverage raster, in order
+COVERAGE_BANDS = ("nodes", "edges", "length_km")
+
+# Cell status codes in the GeoJSON summary
+COVERAGE_STATUS = {0: "covered", 1: "sparse", 2: "empty"}
+
+
+def graphml_coordinate_arrays(filepath: Path) -> dict:
+    """
+    Stream node coordinates and edge endpoints/lengths from a GraphML file.
+
+    Returns:
+        Dict of numpy arrays: "node" (IDs), "x", "y", "u", "v" and "length" (m).
+    """
+    node_ids, xs, ys, us, vs, lengths = [], [], [], [], [], []
+    for kind, ident, _, attrs in iter_graphml_elements(filepath):
+        if kind == "node":
+            node_ids.append(int(ident))
+            xs.append(float(attrs.get("x", "nan")))
+            ys.append(float(attrs.get("y", "nan")))
+        else:
+            us.append(int(ident[0]))
+            vs.append(int(ident[1]))
+            lengths.append(float(attrs.get("length") or 0.0))
+    return {
+        "node": np.asarray(node_ids, dtype=np.int64),
+        "x": np.asarray(xs, dtype=np.float64),
+        "y": np.asarray(ys, dtype=np.float64),
+        "u": np.asarray(us, dtype=np.int64),
+        "v": np.asarray(vs, dtype=np.int64),
+        "length": np.asarray(lengths, dtype=np.float64),
+    }
+
+
+def _snap_bbox(bbox, cell_deg: float) -> tuple:
+    # widen to whole cells so repeated runs share one grid
+    west, south, east, north = bbox
+    west = np.floor(west / cell_deg) * cell_deg
+    south = np.floor(south / cell_deg) * cell_deg
+    east = max(np.ceil(east / cell_deg) * cell_deg, west + cell_deg)
+    north = max(np.ceil(north / cell_deg) * cell_deg, south + cell_deg)
+    return tuple(round(float(c), 9) for c in (west, south, east, north))
+
+
+def coverage_raster(arrays: dict, cell_deg: float = DEFAULT_COVERAGE_CELL_DEG, bbox=None) -> tuple[np.ndarray, tuple]:
+    """
+    Bin node and edge coordinates into a lat/lon grid.
+
+    Edges are counted in the cell of their midpoint (between the end nodes),
+    weighted by length for the ``length_km`` band.
+
+    Args:
+        arrays: Output of ``graphml_coordinate_arrays``.
+        cell_deg: Cell size in degrees.
+        bbox: Study area (west, south, east, north); default: the node extent.
+
+    Returns:
+        (raster, bbox): float32 array of shape (3, rows, cols) with the bands
+        of COVERAGE_BANDS, row 0 at the north edge, and the snapped bbox.
+    """
+    x, y = arrays["x"], arrays["y"]
+    if bbox is None:
+        bbox = (np.nanmin(x), np.nanmin(y), np.nanmax(x), np.nanmax(y))
+    west, south, east, north = _snap_bbox(bbox, cell_deg)
+    rows = int(round((north - south) / cell_deg))
+    cols = int(round((east - west) / cell_deg))
+    bins = [rows, cols]
+    extent = [[south, north], [west, east]]
+
+    # edge midpoints from the end-node coordinates
+    order = np.argsort(arrays["node"])
+    sorted_ids = arrays["node"][order]
+    u_idx = order[np.clip(np.searchsorted(sorted_ids, arrays["u"]), 0, len(order) - 1)]
+    v_idx = order[np.clip(np.searchsorted(sorted_ids, arrays["v"]), 0, len(order) - 1)]
+    mid_x = (x[u_idx] + x[v_idx]) / 2
+    mid_y = (y[u_idx] + y[v_idx]) / 2
+
+    raster = np.empty((len(COVERAGE_BANDS), rows, cols), dtype=np.float32)
+    raster[0] = np.histogram2d(y, x, bins=bins, range=extent)[0]
+    raster[1] = np.histogram2d(mid_y, mid_x, bins=bins, range=extent)[0]
+    raster[2] = np.histogram2d(mid_y, mid_x, bins=bins, range=extent, weights=arrays["length"] / 1000.0)[0]
+    # histogram2d puts the southern row first; rasters are north-up
+    return raster[:, ::-1, :].copy(), (west, south, east, north)
+
+
+def coverage_status(raster: np.ndarray, min_length_km: float = DEFAULT_SPARSE_KM) -> np.ndarray:
+    """Return per-cell status codes (see COVERAGE_STATUS) for a coverage raster."""
+    nodes = raster[COVERAGE_BANDS.index("nodes")]
+    length = raster[COVERAGE_BANDS.index("length_km")]
+    status = np.zeros(nodes.shape, dtype=np.uint8)
+    status[length < min_length_km] = 1
+    status[(nodes == 0) & (length == 0)] = 2
+    return status
+
+
+def coverage_geojson(raster: np.ndarray, bbox: tuple, cell_deg: float, min_length_km: float) -> dict:
+    """
+    Build the GeoJSON summary: grid metadata plus one feature per flagged cell.
+
+    Only empty and sparse cells become features, so the file stays small
+    for well-covered areas; covered cells are counted in the summary.
+    """
+    status = coverage_status(raster, min_length_km)
+    west, _, _, north = bbox
+    features = []
+    for row, col in zip(*np.nonzero(status)):
+        cell_west = west + col * cell_deg
+        cell_north = north - row * cell_deg
+        features.append({
+            "type": "Feature",
+            "geometry": shapely_box(cell_west, cell_north - cell_deg, cell_west + cell_deg, cell_north).__geo_interface__,
+            "properties": {
+                "row": int(row),
+                "col": int(col),
+                "status": COVERAGE_STATUS[int(status[row, col])],
+                **{band: round(float(raster[i, row, col]), 3) for i, band in enumerate(COVERAGE_BANDS)},
+            },
+        })
+    return {
+        "type": "FeatureCollection",
+        "summary": {
+            "bbox": list(bbox),
+            "cell_deg": cell_deg,
+            "rows": int(raster.shape[1]),
+            "cols": int(raster.shape[2]),
+            "bands": list(COVERAGE_BANDS),
+            "min_length_km": min_length_km,
+            **{name: int((status == code).sum()) for code, name in COVERAGE_STATUS.items()},
+            "total_length_km": round(float(raster[COVERAGE_BANDS.index("length_km")].sum()), 3),
+        },
+        "features": features,
+    }
+
+
+def coverage(
+    filepath: Path,
+    output: Path,
+    cell_deg: float = DEFAULT_COVERAGE_CELL_DEG,
+    bbox=None,
+    min_length_km: float = DEFAULT_SPARSE_KM,
+) -> int:
+    """
+    Write a coverage raster (NPY) and GeoJSON gap summary for GraphML networks.
+
+    Args:
+        filepath: GraphML file, folder of GraphML files, or glob pattern.
+        output: Output path prefix; ``.npy`` and ``.geojson`` are written.
+        cell_deg: Cell size in degrees.
+        bbox: Study area (west, south, east, north); default: the node extent.
+        min_length_km: Cells with less road than this are flagged sparse.
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    files = resolve_graph_files(filepath)
+    if not files:
+        logging.error(f"File not found: {filepath}")
+        return 1
+
+    with profile_phase("read_coordinates"):
+        parts = [graphml_coordinate_arrays(path) for path in files]
+    arrays = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+    if not len(arrays["node"]):
+        logging.error("No nodes found")
+        return 1
+
+    with profile_phase("bin"):
+        raster, bbox = coverage_raster(arrays, cell_deg, bbox)
+        summary = coverage_geojson(raster, bbox, cell_deg, min_length_km)
+
+    output = Path(output)
+    if output.suffix in (".npy", ".geojson"):
+        output = output.with_suffix("")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    np.save(output.with_name(output.name + ".npy"), raster)
+    with open(output.with_name(output.name + ".geojson"), "w") as f:
+        json.dump(summary, f)
+
+    info = summary["summary"]
+    cells = info["rows"] * info["cols"]
+    print(f"Coverage grid: {info['rows']} x {info['cols']} cells of {cell_deg} deg over {info['bbox']}")
+    for name in COVERAGE_STATUS.values():
+        print(f"  {name:<8} {info[name]:>8,} cells ({info[name] / cells:.1%})")
+    print(f"Wrote {output.name}.npy (bands: {', '.join(COVERAGE_BANDS)}) and {output.name}.geojson")
+    return 0
+
+
+# =============================================================================
+# Export Command
+# =============================================================================
+
+# Columnar export formats and their file suffixes
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Edge tags stored dictionary-encoded (few distinct values, many rows)
+EXPORT_CATEGORICAL_TAGS = ("highway", "surface", "tracktype", "access")
+
+# Rows buffered per record batch / parquet row group
+EXPORT_BATCH_ROWS = 65536
+
+
+def export_schemas() -> dict:
+    """
+    Return the fixed Arrow schemas of the exported node and edge tables.
+
+    Numeric attributes get float64 (coordinates, lengths) or float32
+    (speeds, travel times); EXPORT_CATEGORICAL_TAGS are dictionary-encoded
+    and the remaining OSM tags are kept as strings.
+    """
+    categorical = pa.dictionary(pa.int32(), pa.string())
+    nodes = pa.schema([
+        ("osmid", pa.int64()),
+        ("x", pa.float64()),
+        ("y", pa.float64()),
+        ("street_count", pa.int16()),
+        ("highway", categorical),
+        ("ref", pa.string()),
+    ])
+    edge_fields = [
+        ("u", pa.int64()),
+        ("v", pa.int64()),
+        ("key", pa.int32()),
+        ("osmid", pa.string()),
+        ("length", pa.float64()),
+        ("speed_kph", pa.float32()),
+        ("travel_time", pa.float32()),
+    ]
+    edge_fields += [(tag, categorical) for tag in EXPORT_CATEGORICAL_TAGS]
+    edge_fields += [
+        (tag, pa.string())
+        for tag in [*EXTRA_USEFUL_TAGS, "junction", "reversed", "geometry"]
+        if tag not in EXPORT_CATEGORICAL_TAGS
+    ]
+    return {"nodes": nodes, "edges": pa.schema(edge_fields)}
+
+
+class _DictionaryColumn:
+    """
+    Dictionary encoder whose dictionary only grows.
+
+    Every batch reuses the codes of earlier batches, so Arrow IPC files can
+    carry later batches as dictionary deltas.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, values: list):
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            indices.append(code)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, type=pa.int32()), pa.array(self.values, type=pa.string())
+        )
+
+
+def _parse_number(value: str, cast):
+    if not value:
+        return None
+    try:
+        return cast(float(value)) if cast is int else cast(value)
+    except ValueError:
+        # list-valued or malformed attributes
+        return None
+
+
+class _TableWriter:
+    """Buffer rows of one table and write them in record batches."""
+
+    def __init__(self, path: Path, schema, fmt: str, batch_rows: int):
+        self.path = path
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.columns = {field.name: [] for field in schema}
+        self.encoders = {field.name: _DictionaryColumn() for field in schema if pa.types.is_dictionary(field.type)}
+        self.rows = 0
+        if fmt == "parquet":
+            self.writer = pq.ParquetWriter(path, schema, compression="zstd")
+        else:
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = pa.ipc.new_file(path, schema, options=options)
+
+    def append(self, row: dict) -> None:
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        if len(self.columns[self.schema.names[0]]) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        count = len(self.columns[self.schema.names[0]])
+        if not count:
+            return
+        arrays = []
+        for field in self.schema:
+            values = self.columns[field.name]
+            if field.name in self.encoders:
+                arrays.append(self.encoders[field.name].encode(values))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+            values.clear()
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.rows += count
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+
+def _export_row(kind: str, ident, key, attrs: dict, schema) -> dict:
+    row = {}
+    for field in schema:
+        value = attrs.get(field.name) or None
+        if value is None:
+            continue
+        if pa.types.is_integer(field.type):
+            row[field.name] = _parse_number(value, int)
+        elif pa.types.is_floating(field.type):
+            row[field.name] = _parse_number(value, float)
+        else:
+            row[field.name] = value
+    if kind == "node":
+        row["osmid"] = int(ident)
+    else:
+        row["u"], row["v"] = int(ident[0]), int(ident[1])
+        row["key"] = int(key) if key else 0
+    return row
+
+
+def export_tables(
+    filepath: Path,
+    output: Path,
+    fmt: str = "parquet",
+    batch_rows: int = EXPORT_BATCH_ROWS,
+) -> dict:
+    """
+    Stream a GraphML file into columnar node and edge tables.
+
+    The file is read once with a streaming parser and rows are written in
+    batches, so memory stays bounded by ``batch_rows`` rather than the graph.
+
+    Args:
+        filepath: Input GraphML file (plain or compressed).
+        output: Output path prefix; ``<prefix>.nodes<suffix>`` and
+            ``<prefix>.edges<suffix>`` are written.
+        fmt: "parquet" (zstd-compressed) or "arrow" (uncompressed Arrow IPC
+            file, memory-mappable without decoding).
+        batch_rows: Rows per record batch / row group.
+
+    Returns:
+        Dict mapping "nodes" and "edges" to (path, row count).
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is required for export. pip install pyarrow")
+    suffix = EXPORT_FORMATS[fmt]
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    schemas = export_schemas()
+    writers = {
+        name: _TableWriter(output.with_name(f"{output.name}.{name}{suffix}"), schema, fmt, batch_rows)
+        for name, schema in schemas.items()
+    }
+    try:
+        for kind, ident, key, attrs in iter_graphml_elements(filepath):
+            table = "nodes" if kind == "node" else "edges"
+            writers[table].append(_export_row(kind, ident, key, attrs, schemas[table]))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {name: (writer.path, writer.rows) for name, writer in writers.items()}
+
+
+def export_network(filepath: Path, output: Path | None = None, fmt: str = "parquet", batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    """
+    Export a network's nodes and edges as Parquet or Arrow tables.
+
+    Args:
+        filepath: Input GraphML file (plain or compressed).
+        output: Output path prefix (default: the input path without suffix).
+        fmt: "parquet" or "arrow".
+        batch_rows: Rows per record batch / row group.
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    filepath = Path(filepath)
+    if not filepath.exists():
+        logging.error(f"File not found: {filepath}")
+        return 1
+    if pa is None:
+        logging.error("pyarrow is required for export. pip install pyarrow")
+        return 1
+    if output is None:
+        output = filepath.with_name(graph_stem(filepath))
+
+    with profile_phase("export"):
+        written = export_tables(filepath, output, fmt, batch_rows)
+    for name, (path, rows) in written.items():
+        print(f"Wrote {rows:,} {name} to {path} ({path.stat().st_size / 1e6:.1f} MB)")
+    return 0
+
+
+# =============================================================================
+# Diff Command
+# =============================================================================
+
+# Edge attributes compared by default (OSM tags plus the edge shape); derived
+# values such as speed_kph and travel_time are left out
+DIFF_EDGE_ATTRS = sorted(set(EXTRA_USEFUL_TAGS) | {"junction", "length", "geometry"})
+
+# Node attributes compared by default
+DIFF_NODE_ATTRS = ["x", "y", "highway", "junction", "ref"]
+
+# Number of temporary hash partitions per snapshot
+DEFAULT_DIFF_PARTITIONS = 64
+
+
+def iter_graphml_elements(filepath: Path):
+    """
+    Stream nodes and edges from a (possibly compressed) GraphML file without
+    building a graph.
+
+    Yields:
+        ("node", node_id, None, attrs) and ("edge", (source, target), key, attrs)
+        tuples, where attrs maps attribute names to their raw string values.
+    """
+    names = {}
+    graph_elem = None
+    with open_graph_file(filepath) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                if tag == "graph":
+                    graph_elem = elem
+                continue
+            if tag == "key":
+                names[elem.get("id")] = elem.get("attr.name")
+            elif tag in ("node", "edge"):
+                attrs = {names.get(d.get("key"), d.get("key")): d.text or "" for d in elem if d.tag.endswith("data")}
+                if tag == "node":
+                    yield "node", elem.get("id"), None, attrs
+                else:
+                    yield "edge", (elem.get("source"), elem.get("target")), elem.get("id"), attrs
+                # drop processed elements so memory stays flat
+                elem.clear()
+                if graph_elem is not None:
+                    graph_elem.clear()
+
+
+def _diff_identity(kind: str, ident, key, attrs: dict) -> str:
+    if kind == "node":
+        return f"n {ident}"
+    # the GraphML edge key tells parallel edges sharing (u, v, osmid) apart
+    return f"e {ident[0]} {ident[1]} {attrs.get('osmid', '')} {key or 0}"
+
+
+def _partition_snapshot(filepath: Path, workdir: Path, prefix: str, partitions: int, edge_attrs, node_attrs) -> None:
+    """Write one "identity \\t digest \\t record" line per element into hash partitions."""
+    files = [open(workdir / f"{prefix}{i}.tsv", "w", encoding="utf-8") for i in range(partitions)]
+    try:
+        for kind, ident, key, attrs in iter_graphml_elements(filepath):
+            selected = node_attrs if kind == "node" else edge_attrs
+            values = {a: attrs[a] for a in selected if a in attrs}
+            identity = _diff_identity(kind, ident, key, attrs)
+            digest = hashlib.sha1(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+            record = {"type": kind, "attrs": values}
+            if kind == "node":
+                record["id"] = ident
+            else:
+                record.update(u=ident[0], v=ident[1], key=key, osmid=attrs.get("osmid"))
+            files[zlib.crc32(identity.encode("utf-8")) % partitions].write(
+                f"{identity}\t{digest}\t{json.dumps(record)}\n"
+            )
+    finally:
+        for f in files:
+            f.close()
+
+
+def _read_partition(path: Path) -> dict:
+    """Load a partition as {identity: (digest, record)}."""
+    entries = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            identity, digest, record = line.rstrip("\n").split("\t", 2)
+            entries[identity] = (digest, record)
+    return entries
+
+
+def diff_graphml(
+    old_path: Path,
+    new_path: Path,
+    output: Path | None = None,
+    edge_attrs=None,
+    node_attrs=None,
+    partitions: int = DEFAULT_DIFF_PARTITIONS,
+) -> dict:
+    """
+    Compare two GraphML snapshots in bounded memory.
+
+    Both files are streamed once into hash partitions on disk keyed by node ID
+    or (u, v, osmid, key); partitions are then compared one at a time, so peak
+    memory is roughly one partition of the older snapshot.
+
+    Args:
+        old_path: Earlier snapshot.
+        new_path: Later snapshot.
+        output: Optional JSON Lines changeset path.
+        edge_attrs: Edge attributes to compare (default: DIFF_EDGE_ATTRS).
+        node_attrs: Node attributes to compare (default: DIFF_NODE_ATTRS).
+        partitions: Number of hash partitions.
+
+    Returns:
+        Counts keyed by "<type>_<op>", e.g. "edge_modified".
+    """
+    edge_attrs = list(DIFF_EDGE_ATTRS if edge_attrs is None else edge_attrs)
+    node_attrs = list(DIFF_NODE_ATTRS if node_attrs is None else node_attrs)
+    counts = {f"{kind}_{op}": 0 for kind in ("node", "edge") for op in ("added", "removed", "modified")}
+
+    out = None
+    if output is not None:
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        out = open(output, "w", encoding="utf-8")
+
+    def emit(op, record, old_record=None):
+        counts[f"{record['type']}_{op}"] += 1
+        if out is None:
+            return
+        change = {"op": op, **record}
+        if old_record is not None:
+            changed = {
+                a: [old_record["attrs"].get(a), record["attrs"].get(a)]
+                for a in sorted(set(old_record["attrs"]) | set(record["attrs"]))
+                if old_record["attrs"].get(a) != record["attrs"].get(a)
+            }
+            change["changed"] = changed
+        out.write(json.dumps(change) + "\n")
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="map_tool_diff_") as tmp:
+            workdir = Path(tmp)
+            with profile_phase("partition"):
+                _partition_snapshot(old_path, workdir, "old", partitions, edge_attrs, node_attrs)
+                _partition_snapshot(new_path, workdir, "new", partitions, edge_attrs, node_attrs)
+
+            with profile_phase("compare"):
+                for i in range(partitions):
+                    old_entries = _read_partition(workdir / f"old{i}.tsv")
+                    for identity, (digest, record) in _read_partition(workdir / f"new{i}.tsv").items():
+                        previous = old_entries.pop(identity, None)
+                        if previous is None:
+                            emit("added", json.loads(record))
+                        elif previous[0] != digest:
+                            emit("modified", json.loads(record), json.loads(previous[1]))
+                    for _, record in old_entries.values():
+                        emit("removed", json.loads(record))
+    finally:
+        if out is not None:
+            out.close()
+    return counts
+
+
+# Edge attributes whose change requires speed_kph/travel_time to be recomputed
+SPEED_INPUT_ATTRS = {"highway", "maxspeed", "length"}
+
+# Attributes converted from their GraphML strings like ox.load_graphml does
+_GRAPHML_FLOAT_ATTRS = {"x", "y", "length", "speed_kph", "travel_time"}
+_GRAPHML_BOOL_ATTRS = {"oneway", "reversed"}
+
+
+def _graphml_value(name: str, raw):
+    """Convert a raw GraphML attribute string to the type OSMnx loads it as."""
+    if raw is None:
+        return None
+    if name == "geometry":
+        return shapely_wkt.loads(raw)
+    if name in _GRAPHML_FLOAT_ATTRS:
+        return float(raw)
+    if name in _GRAPHML_BOOL_ATTRS:
+        return raw == "True"
+    if raw.startswith("[") and raw.endswith("]"):
+        try:
+            return ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            return raw
+    if name == "osmid":
+        return int(raw)
+    return raw
+
+
+def read_changeset(path: Path):
+    """Yield the records of a JSON Lines changeset written by ``diff``."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _find_edge_key(graph: nx.MultiDiGraph, u, v, key, osmid):
+    """Return the key of edge (u, v) with the given osmid, preferring key."""
+    edges = graph.get_edge_data(u, v) or {}
+    if key in edges and str(edges[key].get("osmid")) == str(osmid):
+        return key
+    for k, data in edges.items():
+        if str(data.get("osmid")) == str(osmid):
+            return k
+    return None
+
+
+def apply_changeset(graph: nx.MultiDiGraph, changes) -> dict:
+    """
+    Apply changeset records from ``diff`` to a graph in place.
+
+    Nodes are added and moved first, then edges are applied, and removed
+    nodes (with any edges still attached) are dropped last.
+
+    Args:
+        graph: Graph loaded with ``ox.load_graphml``.
+        changes: Iterable of changeset records.
+
+    Returns:
+        Mapping with "edges" (added or modified (u, v, key) still present),
+        "nodes" (changed node IDs), "points" (old and new (x, y) positions),
+        "kinds" (set of CHANGE_KINDS touched) and "applied"/"skipped" counts.
+    """
+    records = {"node": [], "edge": []}
+    for record in changes:
+        records[record["type"]].append(record)
+
+    result = {"edges": [], "nodes": set(), "points": [], "kinds": set(), "applied": 0, "skipped": 0}
+    removed_nodes = []
+
+    def point(attrs):
+        if attrs.get("x") is not None and attrs.get("y") is not None:
+            result["points"].append((float(attrs["x"]), float(attrs["y"])))
+
+    for record in records["node"]:
+        node = int(record["id"])
+        attrs = {a: _graphml_value(a, raw) for a, raw in record["attrs"].items()}
+        point(record["attrs"])
+        result["nodes"].add(node)
+        if record["op"] == "removed":
+            removed_nodes.append(node)
+            result["kinds"].add("topology")
+            continue
+        changed = record.get("changed", {})
+        if record["op"] == "modified":
+            point({**record["attrs"], **{a: values[0] for a, values in changed.items()}})
+            result["kinds"].add("geometry")
+        else:
+            result["kinds"].add("topology")
+        graph.add_node(node, **attrs)
+        for a, values in changed.items():
+            if values[1] is None:
+                graph.nodes[node].pop(a, None)
+        result["applied"] += 1
+
+    for record in records["edge"]:
+        u, v = int(record["u"]), int(record["v"])
+        key = int(record["key"]) if record.get("key") is not None else 0
+        for n in (u, v):
+            if n in graph:
+                result["nodes"].add(n)
+                point(graph.nodes[n])
+        attrs = {a: _graphml_value(a, raw) for a, raw in record["attrs"].items()}
+        if record.get("osmid") is not None:
+            attrs["osmid"] = _graphml_value("osmid", record["osmid"])
+
+        if record["op"] == "added":
+            if u not in graph or v not in graph:
+                result["skipped"] += 1
+                continue
+            if graph.has_edge(u, v, key):
+                key = graph.new_edge_key(u, v)
+            graph.add_edge(u, v, key, **attrs)
+            result["edges"].append((u, v, key))
+            result["kinds"].update(("topology", "travel_time"))
+            result["applied"] += 1
+            continue
+
+        k = _find_edge_key(graph, u, v, key, record.get("osmid"))
+        if k is None:
+            result["skipped"] += 1
+            continue
+        if record["op"] == "removed":
+            graph.remove_edge(u, v, k)
+            result["kinds"].add("topology")
+        else:
+            data = graph[u][v][k]
+            changed = set(record.get("changed", {}))
+            for a in changed:
+                if record["changed"][a][1] is None:
+                    data.pop(a, None)
+            data.update(attrs)
+            result["edges"].append((u, v, k))
+            if changed & SPEED_INPUT_ATTRS:
+                result["kinds"].add("travel_time")
+            if "geometry" in changed:
+                result["kinds"].add("geometry")
+            if changed - {"geometry", "length"}:
+                result["kinds"].add("tags")
+        result["applied"] += 1
+
+    for node in removed_nodes:
+        if node in graph:
+            graph.remove_node(node)
+            result["applied"] += 1
+    return result
+
+
+def diff_snapshots(
+    old_path: Path,
+    new_path: Path,
+    output: Path | None = None,
+    attrs: str | None = None,
+    partitions: int = DEFAULT_DIFF_PARTITIONS,
+    exit_code: bool = False,
+) -> int:
+    """
+    Report added, removed and modified nodes and edges between two snapshots.
+
+    Args:
+        old_path: Earlier GraphML snapshot.
+        new_path: Later GraphML snapshot.
+        output: Optional JSON Lines changeset path.
+        attrs: Optional comma-separated edge attributes to compare.
+        partitions: Number of hash partitions.
+        exit_code: Return 1 when the snapshots differ (like ``diff``).
+
+    Returns:
+        Exit code: 0 for success (or no differences with exit_code), 1 for
+        differences with exit_code, 2 on errors.
+    """
+    for path in (old_path, new_path):
+        if not Path(path).exists():
+            logging.error(f"File not found: {path}")
+            return 2
+
+    edge_attrs = [a.strip() for a in attrs.split(",") if a.strip()] if attrs else None
+    logging.info(f"Comparing {old_path} -> {new_path}")
+    try:
+        counts = diff_graphml(old_path, new_path, output=output, edge_attrs=edge_attrs, partitions=partitions)
+    except ET.ParseError as e:
+        logging.error(f"Failed to parse GraphML: {e}")
+        return 2
+
+    print("\n" + "=" * 60)
+    print(f"DIFF: {Path(old_path).name} -> {Path(new_path).name}")
+    print("=" * 60)
+    for kind in ("node", "edge"):
+        print(
+            f"{kind.capitalize()}s: +{counts[f'{kind}_added']:,} "
+            f"-{counts[f'{kind}_removed']:,} ~{counts[f'{kind}_modified']:,}"
+        )
+    if output is not None:
+        print(f"Changeset written to {output}")
+    print("=" * 60 + "\n")
+
+    if exit_code and any(counts.values()):
+        return 1
+    return 0
+
+
+# =============================================================================
+# Apply-OSC Command
+# =============================================================================
+
+# Highway regex of CUSTOM_FILTER, applied to ways from change files
+HIGHWAY_FILTER_PATTERN = re.compile(re.search(r'"highway"~"([^"]+)"', CUSTOM_FILTER).group(1))
+
+# OSM oneway values meaning "one-way", and those meaning "against node order"
+# (same rules as OSMnx uses when building graphs)
+ONEWAY_VALUES = {"yes", "true", "1", "-1", "reverse", "T", "F"}
+REVERSED_ONEWAY_VALUES = {"-1", "reverse", "T"}
+
+
+def parse_osc(path: Path, way_tags) -> dict:
+    """
+    Stream an osmChange file (optionally gzipped) into node and way changes.
+
+    Creates and modifies are both treated as upserts; within a file the last
+    action on an element wins.
+
+    Args:
+        path: .osc or .osc.gz file.
+        way_tags: Way tags to keep (other tags are dropped as in fetch).
+
+    Returns:
+        Mapping with "nodes" ({id: (x, y)}), "created_nodes" and
+        "deleted_nodes" (sets of IDs), "ways" ({id: {"nodes": [...],
+        "tags": {...}}}) and "deleted_ways".
+    """
+    way_tags = set(way_tags)
+    changes = {"nodes": {}, "created_nodes": set(), "deleted_nodes": set(), "ways": {}, "deleted_ways": set()}
+    action = None
+    root = None
+    with open_graph_file(path) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if root is None:
+                    root = elem
+                elif tag in ("create", "modify", "delete"):
+                    action = tag
+                continue
+            if tag not in ("node", "way"):
+                if tag in ("create", "modify", "delete"):
+                    root.clear()
+                continue
+
+            element_id = int(elem.get("id"))
+            if tag == "node":
+                if action == "delete":
+                    changes["nodes"].pop(element_id, None)
+                    changes["deleted_nodes"].add(element_id)
+                else:
+                    changes["deleted_nodes"].discard(element_id)
+                    changes["nodes"][element_id] = (float(elem.get("lon")), float(elem.get("lat")))
+                    if action == "create":
+                        changes["created_nodes"].add(element_id)
+            elif action == "delete":
+                changes["ways"].pop(element_id, None)
+                changes["deleted_ways"].add(element_id)
+            else:
+                changes["deleted_ways"].discard(element_id)
+                changes["ways"][element_id] = {
+                    "nodes": [int(nd.get("ref")) for nd in elem.iter("nd")],
+                    "tags": {t.get("k"): t.get("v") for t in elem.iter("tag") if t.get("k") in way_tags},
+                }
+            elem.clear()
+    return changes
+
+
+def _edge_osmids(data) -> list:
+    osmid = data.get("osmid")
+    return osmid if isinstance(osmid, list) else [osmid]
+
+
+def _edge_coords(graph: nx.MultiDiGraph, u, v, data) -> list:
+    geometry = data.get("geometry")
+    if geometry is not None:
+        return list(geometry.coords)
+    return [_node_xy(graph, u), _node_xy(graph, v)]
+
+
+def _path_length(coords) -> float:
+    xs, ys = np.array(coords, dtype=np.float64).T
+    return float(ox.distance.great_circle(ys[:-1], xs[:-1], ys[1:], xs[1:]).sum())
+
+
+def _resolve_way_coords(graph: nx.MultiDiGraph, refs, known: dict, created, old_edges) -> dict | None:
+    """
+    Find coordinates for every node of a way.
+
+    Nodes come from the change file, the graph, or the interior points of the
+    way's current edges: between the two graph nodes of an edge, the way's
+    nodes that are not newly created are matched in order to the edge's
+    interior points when their counts agree. Returns None if any node cannot
+    be placed.
+    """
+    coords = {}
+    for ref in refs:
+        if ref in known:
+            coords[ref] = known[ref]
+        elif ref in graph:
+            coords[ref] = _node_xy(graph, ref)
+    if all(ref in coords for ref in refs):
+        return coords
+
+    positions = {}
+    for i, ref in enumerate(refs):
+        positions.setdefault(ref, []).append(i)
+    for u, v, _, data in old_edges:
+        points = _edge_coords(graph, u, v, data)
+        # one-way edges against the node order run from a later ref to an earlier one
+        for a, b, shape in ((u, v, points), (v, u, points[::-1])):
+            for i in positions.get(a, ()):
+                j = next((j for j in positions.get(b, ()) if j > i), None)
+                if j is None:
+                    continue
+                existing = [ref for ref in refs[i + 1:j] if ref not in created]
+                if len(existing) == len(shape) - 2:
+                    for ref, point in zip(existing, shape[1:-1]):
+                        coords.setdefault(ref, point)
+    if any(ref not in coords for ref in refs):
+        return None
+    return coords
+
+
+def apply_osc_changes(graph: nx.MultiDiGraph, changes: dict, date: str | None = None) -> dict:
+    """
+    Apply parsed osmChange data to a simplified OSMnx graph in place.
+
+    Edges of deleted and changed ways are removed and changed ways that match
+    the CUSTOM_FILTER highway selection are rebuilt as simplified edges split
+    at existing graph nodes. Graph nodes that moved take their new position
+    (incident edge shapes and lengths follow) and deleted graph nodes are
+    removed. Edges that merge a changed way with unchanged ones are left as
+    they are, and ways with nodes that cannot be placed are skipped. Moves
+    of nodes inside a way (not graph nodes) only take effect when the way
+    itself changes.
+
+    Args:
+        graph: Graph to update.
+        changes: Output of ``parse_osc``.
+        date: ``date_fetched`` for new edges (default: today).
+
+    Returns:
+        Mapping with "edges" (new or reshaped (u, v, key)), "nodes", "points",
+        "kinds" (as in ``apply_changeset``) and per-action counts.
+    """
+    date = date or datetime.now().strftime("%Y-%m-%d")
+    ways = changes["ways"]
+    changed_ways = set(ways) | changes["deleted_ways"]
+    result = {
+        "edges": [], "nodes": set(), "points": [], "kinds": set(),
+        "ways_applied": 0, "ways_removed": 0, "ways_skipped": 0, "merged_kept": 0,
+        "nodes_moved": 0, "nodes_deleted": 0,
+    }
+
+    # one linear pass to find the current edges of every changed way
+    old_edges = {}
+    kept_pairs = set()
+    for u, v, k, data in graph.edges(keys=True, data=True):
+        osmids = _edge_osmids(data)
+        hits = [o for o in osmids if o in changed_ways]
+        if not hits:
+            continue
+        if len(hits) < len(osmids):
+            result["merged_kept"] += 1
+            kept_pairs.update((u, v, o) for o in hits)
+            continue
+        for o in hits:
+            old_edges.setdefault(o, []).append((u, v, k, data))
+
+    xs = [float(x) for _, x in graph.nodes(data="x")]
+    ys = [float(y) for _, y in graph.nodes(data="y")]
+    bounds = shapely_box(min(xs), min(ys), max(xs), max(ys)) if xs else None
+
+    resolved = {}
+    dropped = set(changes["deleted_ways"])
+    for way_id, way in ways.items():
+        if not HIGHWAY_FILTER_PATTERN.search(way["tags"].get("highway", "") or ""):
+            # no longer (or never) a road in our selection
+            dropped.add(way_id)
+            continue
+        coords = _resolve_way_coords(
+            graph, way["nodes"], changes["nodes"], changes["created_nodes"], old_edges.get(way_id, ())
+        )
+        if coords is None or len(way["nodes"]) < 2:
+            if way_id in old_edges or any(ref in graph for ref in way["nodes"]):
+                result["ways_skipped"] += 1
+            continue
+        if way_id not in old_edges and not any(ref in graph for ref in way["nodes"]):
+            # brand-new ways are only added inside the area the graph covers
+            if bounds is None or not bounds.contains(LineString([coords[r] for r in way["nodes"]])):
+                continue
+        resolved[way_id] = coords
+
+    removed = set()
+    for way_id in dropped | set(resolved):
+        for u, v, k, _ in old_edges.get(way_id, ()):
+            if (u, v, k) in removed or not graph.has_edge(u, v, k):
+                continue
+            result["points"].extend([_node_xy(graph, u), _node_xy(graph, v)])
+            result["nodes"].update((u, v))
+            graph.remove_edge(u, v, k)
+            removed.add((u, v, k))
+        if way_id in dropped and way_id in old_edges:
+            result["ways_removed"] += 1
+    if removed:
+        result["kinds"].add("topology")
+
+    for node in changes["deleted_nodes"]:
+        if node in graph:
+            result["points"].append(_node_xy(graph, node))
+            result["nodes"].update(graph.predecessors(node))
+            result["nodes"].update(graph.successors(node))
+            graph.remove_node(node)
+            result["nodes_deleted"] += 1
+            result["kinds"].add("topology")
+
+    for node, xy in changes["nodes"].items():
+        if node not in graph or _node_xy(graph, node) == xy:
+            continue
+        result["points"].extend([_node_xy(graph, node), xy])
+        graph.nodes[node]["x"], graph.nodes[node]["y"] = xy
+        for u, v, k, data in [*graph.in_edges(node, keys=True, data=True), *graph.out_edges(node, keys=True, data=True)]:
+            points = _edge_coords(graph, u, v, data)
+            if "geometry" in data:
+                points[0], points[-1] = _node_xy(graph, u), _node_xy(graph, v)
+                data["geometry"] = LineString(points)
+            data["length"] = _path_length(points)
+            result["edges"].append((u, v, k))
+        result["nodes"].add(node)
+        result["nodes_moved"] += 1
+        result["kinds"].update(("geometry", "travel_time"))
+
+    # nodes shared by several changed ways must stay graph nodes
+    ref_counts = {}
+    for way_id in resolved:
+        for ref in set(ways[way_id]["nodes"]):
+            ref_counts[ref] = ref_counts.get(ref, 0) + 1
+
+    for way_id, coords in resolved.items():
+        tags = ways[way_id]["tags"]
+        refs = list(ways[way_id]["nodes"])
+        one_way = tags.get("oneway") in ONEWAY_VALUES or tags.get("junction") == "roundabout"
+        if one_way and tags.get("oneway") in REVERSED_ONEWAY_VALUES:
+            refs.reverse()
+
+        seen = set()
+        anchors = []
+        for i, ref in enumerate(refs):
+            if i in (0, len(refs) - 1) or ref in graph or ref_counts.get(ref, 0) > 1 or ref in seen:
+                anchors.append(i)
+            seen.add(ref)
+
+        for a, b in zip(anchors[:-1], anchors[1:]):
+            u, v = refs[a], refs[b]
+            if (u, v, way_id) in kept_pairs:
+                continue
+            points = [coords[ref] for ref in refs[a:b + 1]]
+            for n in (u, v):
+                if n not in graph:
+                    graph.add_node(n, x=coords[n][0], y=coords[n][1])
+            attrs = {"osmid": way_id, **tags, "oneway": one_way, "length": _path_length(points), "date_fetched": date}
+            directions = [(u, v, points, False)]
+            if not one_way:
+                directions.append((v, u, points[::-1], True))
+            for start, end, shape, is_reversed in directions:
+                edge_attrs = dict(attrs, reversed=is_reversed)
+                if len(shape) > 2:
+                    edge_attrs["geometry"] = LineString(shape)
+                key = graph.add_edge(start, end, **edge_attrs)
+                result["edges"].append((start, end, key))
+            result["nodes"].update((u, v))
+            result["points"].extend(points)
+        result["ways_applied"] += 1
+        result["kinds"].update(CHANGE_KINDS)
+
+    # drop nodes left without edges by removed ways, as a fresh fetch would
+    isolated = [n for n in result["nodes"] if n in graph and graph.degree(n) == 0]
+    graph.remove_nodes_from(isolated)
+    result["nodes"].difference_update(isolated)
+    result["edges"] = [e for e in dict.fromkeys(result["edges"]) if graph.has_edge(*e)]
+
+    if result["nodes"]:
+        street_counts = ox.stats.count_streets_per_node(graph, nodes=result["nodes"])
+        for node, count in street_counts.items():
+            graph.nodes[node]["street_count"] = count
+    return result
+
+
+def apply_osc(
+    input_path: Path,
+    osc_paths,
+    output: Path | None = None,
+    config: dict | None = None,
+) -> int:
+    """
+    Apply local osmChange files to a master GraphML network.
+
+    Args:
+        input_path: Master GraphML file.
+        osc_paths: .osc or .osc.gz files, applied in order.
+        output: Output GraphML path (default: overwrite input_path).
+        config: Configuration dictionary (for extra_useful_tags).
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    input_path = Path(input_path)
+    output = Path(output or input_path)
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+
+    for path in [input_path, *osc_paths]:
+        if not Path(path).exists():
+            logging.error(f"File not found: {path}")
+            return 1
+
+    way_tags = set(ox.settings.useful_tags_way) | set(EXTRA_USEFUL_TAGS) | set(config.get("extra_useful_tags", []))
+
+    logging.info(f"Loading graph from {input_path}")
+    with profile_phase("load_graphml"):
+        graph = load_graph(input_path)
+
+    edges, nodes, points, kinds = [], set(), [], set()
+    for osc_path in osc_paths:
+        logging.info(f"Applying {osc_path}")
+        try:
+            with profile_phase("parse_osc"):
+                changes = parse_osc(osc_path, way_tags)
+        except (ET.ParseError, OSError, ValueError) as e:
+            logging.error(f"Failed to read {osc_path}: {e}")
+            return 1
+        with profile_phase("apply_osc"):
+            result = apply_osc_changes(graph, changes)
+        edges.extend(result["edges"])
+        nodes |= result["nodes"]
+        points.extend(result["points"])
+        kinds |= result["kinds"]
+        logging.info(
+            f"{Path(osc_path).name}: {result['ways_applied']:,} ways rebuilt, "
+            f"{result['ways_removed']:,} removed, {result['ways_skipped']:,} skipped; "
+            f"{result['nodes_moved']:,} nodes moved, {result['nodes_deleted']:,} deleted"
+        )
+        if result["ways_skipped"]:
+            logging.warning(f"{result['ways_skipped']:,} ways reference nodes not in the graph or change file")
+        if result["merged_kept"]:
+            logging.warning(f"{result['merged_kept']:,} edges merge changed and unchanged ways and were left as is")
+
+    edges = [e for e in dict.fromkeys(edges) if graph.has_edge(*e)]
+    with profile_phase("recompute_edges"):
+        recompute_edge_travel_times(graph, edges)
+    applied = graph.graph.get("osc_applied", "")
+    graph.graph["osc_applied"] = ",".join(filter(None, [applied, *(Path(p).name for p in osc_paths)]))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    logging.info(f"Saving graph to {output}")
+    with profile_phase("save_graphml"):
+        save_graph(graph, output)
+
+    with profile_phase("refresh_artifacts"):
+        refreshed = refresh_artifacts(graph, output, kinds, source_path=input_path, nodes=nodes, points=points)
+    for status in ("kept", "refreshed", "invalidated"):
+        if refreshed[status]:
+            logging.info(f"Artifacts {status}: {', '.join(refreshed[status])}")
+    return 0
+
+
+# =============================================================================
+# Compact Routing Command
+# =============================================================================
+
+# Prefix of compiled routing-profile weight attributes
+ROUTING_WEIGHT_PREFIX = "weight_"
+
+# Edge attributes that are summed along contracted chains
+SUMMED_EDGE_ATTRS = ("length", "travel_time")
+
+
+def _is_chain_interior(graph: nx.MultiDiGraph, node, keep) -> bool:
+    """
+    Return True if node is a pure pass-through point of a road.
+
+    That is either a one-way segment (one edge in, one edge out, to different
+    neighbours) or a two-way segment (exactly one edge each way to each of
+    two different neighbours).
+    """
+    if node in keep:
+        return False
+    preds = list(graph.predecessors(node))
+    succs = list(graph.successors(node))
+    in_deg = graph.in_degree(node)
+    out_deg = graph.out_degree(node)
+    if node in preds:
+        return False
+    if in_deg == 1 and out_deg == 1:
+        return preds[0] != succs[0]
+    if in_deg == 2 and out_deg == 2:
+        return len(set(preds)) == 2 and set(preds) == set(succs)
+    return False
+
+
+def _node_xy(graph: nx.MultiDiGraph, node) -> tuple[float, float]:
+    data = graph.nodes[node]
+    return float(data["x"]), float(data["y"])
+
+
+def compact_routing_graph(
+    graph: nx.MultiDiGraph,
+    drop_unroutable: str | None = None,
+    keep_nodes=(),
+) -> nx.MultiDiGraph:
+    """
+    Build a routing-only graph with degree-2 chains contracted to single edges.
+
+    Interior nodes of chains are removed; each contracted edge sums
+    ``length``, ``travel_time`` and every ``weight_<profile>`` attribute,
+    keeps the interior node IDs in ``via`` and the full coordinate sequence
+    in ``geometry`` so paths can be expanded back to original node IDs.
+
+    Args:
+        graph: Source graph (not modified).
+        drop_unroutable: Optional compiled weight attribute; edges whose weight
+            is infinite (excluded by that routing profile) are dropped first.
+        keep_nodes: Node IDs that must survive contraction (e.g. hubs).
+
+    Returns:
+        New MultiDiGraph containing only the routing attributes.
+    """
+    routing_attrs = [
+        *SUMMED_EDGE_ATTRS,
+        *sorted({
+            attr
+            for _, _, data in graph.edges(data=True)
+            for attr in data
+            if attr.startswith(ROUTING_WEIGHT_PREFIX)
+        }),
+    ]
+
+    work = nx.MultiDiGraph()
+    work.add_nodes_from((n, {"x": d.get("x"), "y": d.get("y")}) for n, d in graph.nodes(data=True))
+    for u, v, k, data in graph.edges(keys=True, data=True):
+        if drop_unroutable and not data.get(drop_unroutable, 0.0) < float("inf"):
+            continue
+        attrs = {a: float(data[a]) for a in routing_attrs if data.get(a) is not None}
+        attrs["osmid"] = data.get("osmid")
+        attrs["highway"] = _first_value(data.get("highway"))
+        work.add_edge(u, v, k, **attrs)
+    if drop_unroutable:
+        work.remove_nodes_from([n for n in list(work.nodes) if work.degree(n) == 0])
+
+    keep = set(keep_nodes)
+    interior = {n for n in work.nodes if _is_chain_interior(work, n, keep)}
+
+    compact = nx.MultiDiGraph()
+    compact.graph.update(graph.graph)
+    compact.graph["routing_compacted"] = True
+    visited = set()
+
+    def walk(start, first_edge):
+        u, v, k, data = first_edge
+        via = []
+        coords = [_node_xy(work, u)]
+        sums = {a: data.get(a) for a in routing_attrs}
+        osmids = []
+        highway = data.get("highway")
+        prev, cur = u, v
+        visited.add((u, v, k))
+        osmids.append(data.get("osmid"))
+        while cur in interior and cur != start:
+            via.append(cur)
+            coords.append(_node_xy(work, cur))
+            # leave through the edge that does not turn back (one-way nodes have one)
+            for _, w, kk, d in work.out_edges(cur, keys=True, data=True):
+                if w != prev or work.out_degree(cur) == 1:
+                    break
+            visited.add((cur, w, kk))
+            for a in routing_attrs:
+                if sums[a] is not None and d.get(a) is not None:
+                    sums[a] += d[a]
+                else:
+                    sums[a] = None
+            osmids.append(d.get("osmid"))
+            prev, cur = cur, w
+        coords.append(_node_xy(work, cur))
+
+        attrs = {a: value for a, value in sums.items() if value is not None}
+        unique_osmids = list(dict.fromkeys(o for o in osmids if o is not None))
+        attrs["osmid"] = unique_osmids[0] if len(unique_osmids) == 1 else unique_osmids
+        attrs["highway"] = highway
+        if via:
+            attrs["via"] = via
+            attrs["geometry"] = LineString(coords)
+        compact.add_node(start, **work.nodes[start])
+        compact.add_node(cur, **work.nodes[cur])
+        compact.add_edge(start, cur, **attrs)
+
+    anchors = [n for n in work.nodes if n not in interior]
+    for node in anchors:
+        for edge in work.out_edges(node, keys=True, data=True):
+            if edge[:3] not in visited:
+                walk(node, edge)
+
+    # closed loops made only of interior nodes: anchor them at one of their nodes
+    for node in list(interior):
+        edges = list(work.out_edges(node, keys=True, data=True))
+        if any(edge[:3] not in visited for edge in edges):
+            interior.discard(node)
+            for edge in edges:
+                if edge[:3] not in visited:
+                    walk(node, edge)
+
+    logging.info(
+        f"Compacted {work.number_of_nodes():,} nodes / {work.number_of_edges():,} edges "
+        f"to {compact.number_of_nodes():,} nodes / {compact.number_of_edges():,} edges"
+    )
+    return compact
+
+
+def load_routing_graph(filepath: Path) -> nx.MultiDiGraph:
+    """Load a GraphML graph and restore float ``weight_<profile>`` attributes."""
+    graph = load_graph(filepath)
+    for _, _, data in graph.edges(data=True):
+        for attr, value in data.items():
+            if attr.startswith(ROUTING_WEIGHT_PREFIX) and isinstance(value, str):
+                data[attr] = float(value)
+    if isinstance(graph.graph.get("routing_compacted"), str):
+        graph.graph["routing_compacted"] = graph.graph["routing_compacted"] == "True"
+    return graph
+
+
+def contracted_node_coords(graph: nx.MultiDiGraph) -> dict:
+    """Return {node: (x, y)} for the interior nodes recorded in ``via`` lists."""
+    coords = {}
+    for _, _, data in graph.edges(data=True):
+        via = data.get("via")
+        geometry = data.get("geometry")
+        if not via or geometry is None:
+            continue
+        points = list(geometry.coords)[1:-1]
+        coords.update(zip(via, points))
+    return coords
+
+
+def expand_compact_path(graph: nx.MultiDiGraph, path, weight: str | None = None) -> list:
+    """
+    Expand a path over a compacted graph back to original node IDs.
+
+    Between parallel edges the one with the lowest ``weight`` is expanded
+    (the first edge when weight is None). Paths on uncompacted graphs are
+    returned unchanged.
+    """
+    if not graph.graph.get("routing_compacted") or len(path) < 2:
+        return list(path)
+    expanded = [path[0]]
+    for u, v in zip(path[:-1], path[1:]):
+        edges = graph[u][v]
+        if weight is None:
+            data = next(iter(edges.values()))
+        else:
+            data = min(edges.values(), key=lambda d: d.get(weight, float("inf")))
+        expanded.extend(data.get("via", ()))
+        expanded.append(v)
+    return expanded
+
+
+def compact_routing(
+    input_path: Path,
+    output: Path,
+    routing_profile: str | None = None,
+    drop_excluded: bool = False,
+    config: dict | None = None,
+) -> int:
+    """
+    Write a compacted routing-only copy of a GraphML network.
+
+    Args:
+        input_path: Source GraphML file.
+        output: Output GraphML path.
+        routing_profile: Optional profile to compile before compaction.
+        drop_excluded: Drop edges excluded by routing_profile.
+        config: Configuration dictionary (for routing_profiles).
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    input_path = Path(input_path)
+    output = Path(output)
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+
+    if not input_path.exists():
+        logging.error(f"File not found: {input_path}")
+        return 1
+    if drop_excluded and not routing_profile:
+        logging.error("--drop-excluded requires --routing-profile")
+        return 1
+
+    logging.info(f"Loading graph from {input_path}")
+    with profile_phase("load_graphml"):
+        graph = load_routing_graph(input_path)
+
+    drop_attr = None
+    if routing_profile:
+        try:
+            with profile_phase("compile_profile"):
+                compiled = compile_routing_profiles(
+                    graph, config.get("routing_profiles", {}), names=[routing_profile]
+                )[routing_profile]
+        except KeyError as e:
+            logging.error(str(e))
+            return 1
+        if drop_excluded:
+            drop_attr = compiled["weight_attr"]
+
+    with profile_phase("compact"):
+        compact = compact_routing_graph(graph, drop_unroutable=drop_attr)
+    compact.graph["compacted_from"] = input_path.name
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    logging.info(f"Saving compact routing graph to {output}")
+    with profile_phase("save_graphml"):
+        save_graph(compact, output)
+    return 0
+
+
+# =============================================================================
+# Isochrone Command
+# =============================================================================
+
+# Default time bands in minutes
+DEFAULT_ISOCHRONE_BANDS = (20, 30, 45)
+
+# Concave hull ratio for band polygons (0 = tightest, 1 = convex hull)
+ISOCHRONE_HULL_RATIO = 0.3
+
+# Band polygon buffer/simplification tolerance in degrees (about 100 m)
+ISOCHRONE_SIMPLIFY_DEG = 0.001
+
+# Graph and weight used by isochrone worker processes
+_ISOCHRONE_WORKER = None
+
+
+def routing_weight(graph: nx.MultiDiGraph, routing_profile: str | None, config: dict) -> str:
+    """
+    Return the edge weight to route on, compiling the profile if needed.
+
+    Compact graphs carry the weights compiled before compaction; otherwise
+    the profile is compiled from config. Without a profile, ``travel_time``.
+    """
+    if not routing_profile:
+        return "travel_time"
+    if graph.graph.get("routing_compacted"):
+        weight = routing_weight_attr(routing_profile)
+        if not any(weight in data for _, _, data in graph.edges(data=True)):
+            raise KeyError(f"Compact graph has no '{weight}' weights; rebuild it with --routing-profile {routing_profile}")
+        return weight
+    with profile_phase("compile_profile"):
+        compiled = compile_routing_profiles(graph, config.get("routing_profiles", {}), names=[routing_profile])
+    return compiled[routing_profile]["weight_attr"]
+
+
+def profile_digest(weight: str, spec: dict | None = None) -> str:
+    """Return a digest of a routing weight and its profile spec, for cache keys."""
+    return hashlib.sha1(json.dumps([weight, spec], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def nearest_node(graph: nx.MultiDiGraph, lat: float, lon: float):
+    """Return the node closest to (lat, lon) (equirectangular distance)."""
+    nodes = list(graph.nodes)
+    xs = np.fromiter((graph.nodes[n]["x"] for n in nodes), dtype=np.float64, count=len(nodes))
+    ys = np.fromiter((graph.nodes[n]["y"] for n in nodes), dtype=np.float64, count=len(nodes))
+    dist = ((xs - lon) * np.cos(np.radians(lat))) ** 2 + (ys - lat) ** 2
+    return nodes[int(np.argmin(dist))]
+
+
+def resolve_hubs(graph: nx.MultiDiGraph, specs) -> list:
+    """
+    Resolve hub specs to graph nodes.
+
+    Args:
+        graph: Routing graph.
+        specs: Node IDs or "lat,lon" strings (snapped to the nearest node).
+
+    Returns:
+        Hub node IDs, in order and without duplicates.
+    """
+    hubs = []
+    for spec in specs:
+        spec = str(spec).strip()
+        if "," in spec:
+            lat, lon = (float(part) for part in spec.split(","))
+            hub = nearest_node(graph, lat, lon)
+        else:
+            hub = int(spec)
+            if hub not in graph:
+                raise KeyError(f"Hub node {hub} is not in the graph")
+        if hub not in hubs:
+            hubs.append(hub)
+    return hubs
+
+
+def hub_reach(graph: nx.MultiDiGraph, hub, cutoff_s: float, weight: str = "travel_time") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Run one cutoff-bounded Dijkstra search from a hub.
+
+    Returns:
+        (nodes, seconds): node IDs reached within cutoff_s and their travel
+        times, sorted by time. Edges with an infinite weight are never taken.
+    """
+    lengths = nx.single_source_dijkstra_path_length(graph, hub, cutoff=cutoff_s, weight=weight)
+    nodes = np.fromiter(lengths.keys(), dtype=np.int64, count=len(lengths))
+    seconds = np.fromiter(lengths.values(), dtype=np.float64, count=len(lengths))
+    order = np.argsort(seconds, kind="stable")
+    return nodes[order], seconds[order]
+
+
+class IsochroneCache:
+    """
+    Per-hub search results of one graph file, one .npz per (hub, profile, cutoff).
+
+    A stored search also answers any smaller cutoff. Files record the graph
+    fingerprint and a digest of the routing profile, and are ignored (then
+    overwritten) once either changes.
+    """
+
+    def __init__(self, directory: Path, fingerprint: str, profile: str | None = None, profile_digest: str = ""):
+        self.directory = Path(directory)
+        self.fingerprint = fingerprint
+        self.profile = profile or "default"
+        self.profile_digest = profile_digest
+
+    def _path(self, hub, cutoff_s: float) -> Path:
+        return self.directory / f"{self.profile}__{hub}__{int(round(cutoff_s))}.npz"
+
+    def get(self, hub, cutoff_s: float) -> tuple[np.ndarray, np.ndarray] | None:
+        """Return (nodes, seconds) within cutoff_s from the smallest covering search, or None."""
+        candidates = []
+        for path in self.directory.glob(f"{self.profile}__{hub}__*.npz"):
+            stored = int(path.stem.rsplit("__", 1)[1])
+            if stored >= cutoff_s:
+                candidates.append((stored, path))
+        for _, path in sorted(candidates):
+            with np.load(path) as data:
+                if str(data["fingerprint"]) != self.fingerprint or str(data["profile_digest"]) != self.profile_digest:
+                    continue
+                keep = data["seconds"] <= cutoff_s
+                return data["nodes"][keep], data["seconds"][keep]
+        return None
+
+    def put(self, hub, cutoff_s: float, nodes: np.ndarray, seconds: np.ndarray) -> None:
+        """Store a search result."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            self._path(hub, cutoff_s),
+            nodes=nodes,
+            seconds=seconds,
+            fingerprint=np.array(self.fingerprint),
+            profile_digest=np.array(self.profile_digest),
+        )
+
+
+def isochrone_cache_dir(graph_path: Path) -> Path:
+    """Return the isochrone cache folder next to a graph file."""
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_stem(graph_path) + ".isochrones")
+
+
+def _init_isochrone_worker(graph: nx.MultiDiGraph, weight: str) -> None:
+    global _ISOCHRONE_WORKER
+    _ISOCHRONE_WORKER = (graph, weight)
+
+
+def _isochrone_task(hub, cutoff_s: float):
+    graph, weight = _ISOCHRONE_WORKER
+    return hub, *hub_reach(graph, hub, cutoff_s, weight)
+
+
+def hub_isochrones(
+    graph: nx.MultiDiGraph,
+    hubs,
+    cutoff_s: float,
+    weight: str = "travel_time",
+    workers: int | None = None,
+    cache: IsochroneCache | None = None,
+) -> dict:
+    """
+    Search from many hubs, in parallel across hubs, reusing cached searches.
 
-    # Calculate totals
-    alley_km = calculate_edge_length_km(graph, is_alley)
-    track_km = calculate_edge_length_km(graph, is_track)
-    private_km = calculate_edge_length_km(graph, is_private)
-    unpaved_km = calculate_edge_length_km(graph, is_unpaved)
-    total_km = calculate_edge_length_km(graph, lambda _: True)
+    Cache hits are answered in this process; the remaining hubs are spread
+    over a process pool (forked where available, so the graph is shared
+    rather than pickled per worker).
 
-    # Calculate tracktype histogram (normalize possible list/mixed values)
-    tracktype_counts = {"grade1": 0, "grade2": 0, "grade3": 0, "grade4": 0, "grade5": 0}
-    for u, v, data in graph.edges(data=True):
-        if data.get("highway") == "track":
-            raw_tracktype = data.get("tracktype", "unknown")
+    Args:
+        graph: Routing graph.
+        hubs: Hub node IDs.
+        cutoff_s: Largest travel time of interest in seconds.
+        weight: Edge weight attribute.
+        workers: Worker processes (default: CPU count; 1 searches in-process).
+        cache: Optional cache of earlier searches.
 
-            # Normalize tracktype to a single lowercase string
-            if isinstance(raw_tracktype, list):
-                candidates = [str(x).strip().lower() for x in raw_tracktype if str(x).strip()]
-                tracktype = candidates[0] if candidates else "unknown"
+    Returns:
+        Mapping of hub to (nodes, seconds) as returned by ``hub_reach``.
+    """
+    results = {}
+    if cache is not None:
+        with profile_phase("isochrone_cache"):
+            for hub in hubs:
+                hit = cache.get(hub, cutoff_s)
+                if hit is not None:
+                    results[hub] = hit
+    pending = [hub for hub in hubs if hub not in results]
+    logging.info(f"Isochrones for {len(hubs)} hub(s): {len(hubs) - len(pending)} cached, {len(pending)} to search")
+
+    computed = {}
+    if len(pending) <= 1 or workers == 1:
+        with profile_phase("isochrone_search"):
+            for hub in pending:
+                computed[hub] = hub_reach(graph, hub, cutoff_s, weight)
+    else:
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        max_workers = min(len(pending), workers or os.cpu_count() or 1)
+        with profile_phase("isochrone_pool"), ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_isochrone_worker,
+            initargs=(graph, weight),
+        ) as pool:
+            futures = [pool.submit(_isochrone_task, hub, cutoff_s) for hub in pending]
+            for future in as_completed(futures):
+                hub, nodes, seconds = future.result()
+                computed[hub] = (nodes, seconds)
+
+    for hub, (nodes, seconds) in computed.items():
+        results[hub] = (nodes, seconds)
+        if cache is not None:
+            cache.put(hub, cutoff_s, nodes, seconds)
+    return {hub: results[hub] for hub in hubs}
+
+
+def isochrone_polygon(graph: nx.MultiDiGraph, nodes, ratio: float = ISOCHRONE_HULL_RATIO,
+                      tolerance: float = ISOCHRONE_SIMPLIFY_DEG):
+    """
+    Return a simplified concave hull around nodes.
+
+    The hull is buffered by the tolerance, so one or two nodes still give a
+    (small) polygon, and then simplified with the same tolerance.
+    """
+    coords = [(graph.nodes[n]["x"], graph.nodes[n]["y"]) for n in nodes]
+    if not coords:
+        return Polygon()
+    hull = shapely.concave_hull(shapely.multipoints(coords), ratio=ratio)
+    return hull.buffer(tolerance).simplify(tolerance)
+
+
+def isochrones(
+    graph_path: Path,
+    hubs,
+    output: Path,
+    bands_min=DEFAULT_ISOCHRONE_BANDS,
+    routing_profile: str | None = None,
+    config: dict | None = None,
+    workers: int | None = None,
+    hull_ratio: float = ISOCHRONE_HULL_RATIO,
+    use_cache: bool = True,
+) -> int:
+    """
+    Compute travel-time isochrones around hubs.
+
+    Writes ``<output>.geojson`` with one simplified polygon per hub and time
+    band, and ``<output>.nodes.csv`` with every reached node, its travel time
+    and the smallest band containing it.
+
+    Args:
+        graph_path: GraphML file (full or compact routing graph).
+        hubs: Node IDs or "lat,lon" strings.
+        output: Output path prefix.
+        bands_min: Time bands in minutes (cumulative).
+        routing_profile: Optional routing profile from config.
+        config: Configuration dictionary (for routing_profiles).
+        workers: Worker processes for uncached hubs (default: CPU count).
+        hull_ratio: Concave hull ratio (1 = convex hull).
+        use_cache: Reuse and write per-hub searches next to the graph.
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    graph_path = Path(graph_path)
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+    if not graph_path.exists():
+        logging.error(f"File not found: {graph_path}")
+        return 1
+    bands_min = sorted({int(b) if float(b).is_integer() else float(b) for b in bands_min})
+    if not bands_min or not hubs:
+        logging.error("Isochrones need at least one hub and one band")
+        return 1
+
+    logging.info(f"Loading graph from {graph_path}")
+    with profile_phase("load_graphml"):
+        graph = load_routing_graph(graph_path)
+    try:
+        weight = routing_weight(graph, routing_profile, config)
+        hub_nodes = resolve_hubs(graph, hubs)
+    except (KeyError, ValueError) as e:
+        logging.error(str(e))
+        return 1
+
+    cache = None
+    if use_cache:
+        spec = config.get("routing_profiles", {}).get(routing_profile) if routing_profile else None
+        digest = profile_digest(weight, spec)
+        cache = IsochroneCache(isochrone_cache_dir(graph_path), file_fingerprint(graph_path), routing_profile, digest)
+    reach = hub_isochrones(graph, hub_nodes, max(bands_min) * 60.0, weight=weight, workers=workers, cache=cache)
+
+    output = Path(output)
+    if output.suffix in (".geojson", ".csv"):
+        output = output.with_suffix("")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    features = []
+    with profile_phase("isochrone_polygons"), open(output.with_name(output.name + ".nodes.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["hub", "node", "travel_min", "band_min"])
+        for hub, (nodes, seconds) in reach.items():
+            band_of = np.searchsorted(np.asarray(bands_min) * 60.0, seconds, side="left")
+            writer.writerows(
+                (hub, node, round(sec / 60.0, 2), bands_min[band])
+                for node, sec, band in zip(nodes.tolist(), seconds.tolist(), band_of.tolist())
+            )
+            # largest band first, so smaller bands draw on top
+            for band in reversed(bands_min):
+                inside = nodes[seconds <= band * 60.0]
+                polygon = isochrone_polygon(graph, inside.tolist(), ratio=hull_ratio)
+                features.append({
+                    "type": "Feature",
+                    "geometry": polygon.__geo_interface__,
+                    "properties": {
+                        "hub": hub,
+                        "band_min": band,
+                        "profile": routing_profile,
+                        "nodes": int(len(inside)),
+                        "area_km2": round(area_km2(polygon), 3),
+                    },
+                })
+    with open(output.with_name(output.name + ".geojson"), "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+    print(f"Isochrones ({weight}) for {len(hub_nodes)} hub(s):")
+    print(f"  {'Hub':>12} " + " ".join(f"{f'<= {band} min':>18}" for band in bands_min))
+    for hub in hub_nodes:
+        counts = {f["properties"]["band_min"]: f["properties"] for f in features if f["properties"]["hub"] == hub}
+        print(f"  {hub:>12} " + " ".join(
+            f"{counts[band]['nodes']:>7,} / {counts[band]['area_km2']:>5,.0f}km²" for band in bands_min
+        ))
+    print(f"Wrote {output.name}.geojson and {output.name}.nodes.csv")
+    return 0
+
+
+# =============================================================================
+# Route Cache
+# =============================================================================
+
+# Default size cap of the route cache (sum of stored path bytes)
+DEFAULT_ROUTE_CACHE_MB = 256
+
+# Fraction of the cap the cache is trimmed to when it overflows
+ROUTE_CACHE_TRIM = 0.9
+
+
+def encode_path(path) -> bytes:
+    """Pack a node path as zlib-compressed int64 deltas."""
+    nodes = np.asarray(path, dtype=np.int64)
+    return zlib.compress(np.diff(nodes, prepend=0).tobytes())
+
+
+def decode_path(blob: bytes) -> list:
+    """Unpack a node path packed by ``encode_path``."""
+    return np.cumsum(np.frombuffer(zlib.decompress(blob), dtype=np.int64)).tolist()
+
+
+def route_graph_hash(graph_path: Path, *parts) -> str:
+    """
+    Return a digest identifying a routable graph for cache keys.
+
+    Args:
+        graph_path: GraphML file, or a shard index (file or folder).
+        parts: Anything else that changes the routes, e.g. a region bbox or
+            an edge sidecar path (whose fingerprint is used).
+
+    Returns:
+        SHA-1 hex digest.
+    """
+    graph_path = Path(graph_path)
+    if graph_path.is_dir():
+        graph_path = graph_path / SHARD_INDEX_NAME
+    digest = hashlib.sha1(file_fingerprint(graph_path).encode("ascii"))
+    for part in parts:
+        if isinstance(part, Path):
+            part = file_fingerprint(part)
+        digest.update(json.dumps(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RouteCache:
+    """
+    On-disk LRU cache of routes keyed by (graph hash, profile, origin, destination).
+
+    Stores the node path (see ``encode_path``) plus length and travel time.
+    When the stored paths exceed ``max_bytes``, the least recently used
+    routes are evicted down to ROUTE_CACHE_TRIM of the cap. Lookups keep one
+    connection open and batch their recency updates, so a hit costs one
+    indexed read; use as a context manager (or call ``close``) to persist
+    them.
+    """
+
+    def __init__(self, path: Path, graph_hash: str, profile: str, max_bytes: int = DEFAULT_ROUTE_CACHE_MB << 20):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.graph_hash = graph_hash
+        self.profile = profile
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._added_bytes = 0
+        self._conn = sqlite3.connect(self.path, timeout=30)
+        with self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS routes (
+                    graph_hash TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    origin INTEGER NOT NULL,
+                    destination INTEGER NOT NULL,
+                    path BLOB NOT NULL,
+                    length_m REAL,
+                    travel_s REAL,
+                    nbytes INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (graph_hash, profile, origin, destination)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS routes_last_used ON routes(last_used);
+                """
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+    def get(self, origin, destination) -> dict | None:
+        """Return {"path", "length_m", "travel_s"} for a cached route, or None."""
+        key = (self.graph_hash, self.profile, int(origin), int(destination))
+        row = self._conn.execute(
+            "SELECT path, length_m, travel_s FROM routes "
+            "WHERE graph_hash = ? AND profile = ? AND origin = ? AND destination = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched[key] = time.time()
+        return {"path": decode_path(row[0]), "length_m": row[1], "travel_s": row[2]}
+
+    def put(self, origin, destination, path, length_m: float | None = None, travel_s: float | None = None) -> None:
+        """Store a route, evicting least recently used routes past the size cap."""
+        blob = encode_path(path)
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.graph_hash, self.profile, int(origin), int(destination), blob,
+                 length_m, travel_s, len(blob), time.time()),
+            )
+        self._added_bytes += len(blob)
+        # checking the total costs a scan, so only after ~1% of the cap was added
+        if self._added_bytes > self.max_bytes // 100:
+            self.evict()
+
+    def flush(self) -> None:
+        """Write batched recency updates of cache hits."""
+        if not self._touched:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE routes SET last_used = ? WHERE graph_hash = ? AND profile = ? AND origin = ? AND destination = ?",
+                [(used, *key) for key, used in self._touched.items()],
+            )
+        self._touched.clear()
+
+    def evict(self) -> int:
+        """Trim the cache to the size cap; returns the number of routes evicted."""
+        self.flush()
+        self._added_bytes = 0
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM routes").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        excess = total - int(self.max_bytes * ROUTE_CACHE_TRIM)
+        freed = 0
+        victims = []
+        for *key, nbytes in self._conn.execute(
+            "SELECT graph_hash, profile, origin, destination, nbytes FROM routes ORDER BY last_used"
+        ):
+            victims.append(key)
+            freed += nbytes
+            if freed >= excess:
+                break
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM routes WHERE graph_hash = ? AND profile = ? AND origin = ? AND destination = ?",
+                victims,
+            )
+        logging.debug(f"Route cache {self.path}: evicted {len(victims)} routes ({freed:,} bytes)")
+        return len(victims)
+
+    def close(self) -> None:
+        """Persist recency updates, enforce the size cap and close the file."""
+        if self._conn is None:
+            return
+        self.evict()
+        self._conn.close()
+        self._conn = None
+
+
+def cached_shortest_path(graph: nx.MultiDiGraph, origin, destination, weight: str = "travel_time",
+                         cache: RouteCache | None = None) -> list | None:
+    """
+    Return the shortest node path, answered from the route cache when possible.
+
+    Misses are searched with Dijkstra and stored. Returns None if no path exists.
+    """
+    if cache is not None:
+        hit = cache.get(origin, destination)
+        if hit is not None:
+            return hit["path"]
+    try:
+        path = nx.dijkstra_path(graph, origin, destination, weight=weight)
+    except (nx.NetworkXNoPath, nx.NodeNotFound):
+        return None
+    if cache is not None:
+        cache.put(origin, destination, path)
+    return path
+
+
+def cached_route(graph: nx.MultiDiGraph, origin, destination, cache_path: Path | None, source: Path,
+                 *hash_parts, weight: str = "travel_time") -> list | None:
+    """
+    Return the shortest node path, reusing a route cache file when given.
+
+    Args:
+        graph: Graph loaded from source.
+        origin: Origin node ID.
+        destination: Destination node ID.
+        cache_path: SQLite route cache, or None to always search.
+        source: GraphML file or shard index the graph came from.
+        *hash_parts: Anything else that shaped the graph (e.g. a region
+            buffer); see ``route_graph_hash``.
+        weight: Edge weight attribute.
+
+    Returns:
+        Node path, or None if no path exists.
+    """
+    if not cache_path:
+        return cached_shortest_path(graph, origin, destination, weight=weight)
+    with RouteCache(cache_path, route_graph_hash(Path(source), *hash_parts), profile_digest(weight)) as cache:
+        path = cached_shortest_path(graph, origin, destination, weight=weight, cache=cache)
+        logging.info(f"Route cache {cache.path}: {'hit' if cache.hits else 'miss'}")
+    return path
+
+
+# =============================================================================
+# Hub Tables
+# =============================================================================
+
+# Metadata file of a hub table folder (registered as the artifact)
+HUB_TABLES_META = "meta.json"
+
+# Layout of hub table folders; version 2 lays arrays out in NodeIndex (graph) order
+HUB_TABLES_VERSION = 2
+
+# Node index and edge costs used by hub table worker processes
+_HUB_TABLE_WORKER = None
+
+
+def hub_tables_dir(graph_path: Path, weight: str) -> Path:
+    """Return the hub table folder of a graph file and routing weight."""
+    graph_path = Path(graph_path)
+    return graph_path.with_name(graph_stem(graph_path) + ".hubtables") / weight
+
+
+def hub_table_arrays(node_index: NodeIndex, costs: np.ndarray, source: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Run one full Dijkstra search from a hub over the node index.
+
+    Args:
+        node_index: Node index of the routing graph.
+        costs: Per-entry edge costs from ``NodeIndex.edge_costs``.
+        source: Node index of the hub.
+
+    Returns:
+        (dist, pred): float32 travel cost (inf if unreachable) and int32
+        predecessor index (-1 for the hub and unreachable nodes).
+    """
+    dist, pred = node_index.dijkstra(source, costs, cutoff=ROUTABLE_CUTOFF)
+    return dist.astype(np.float32), pred
+
+
+def _init_hub_table_worker(node_index: NodeIndex, costs: np.ndarray) -> None:
+    global _HUB_TABLE_WORKER
+    _HUB_TABLE_WORKER = (node_index, costs)
+
+
+def _hub_table_task(hub, source):
+    node_index, costs = _HUB_TABLE_WORKER
+    return hub, *hub_table_arrays(node_index, costs, source)
+
+
+class HubTables:
+    """
+    Memory-mapped one-to-all distance and predecessor arrays per hub.
+
+    A folder holds ``<hub>.dist.npy`` / ``<hub>.pred.npy`` per hub (named by
+    node ID) and ``meta.json`` with the graph fingerprint and a key for the
+    weight. Arrays are laid out in the graph's ``NodeIndex`` order (the
+    persisted ``.nodeindex.npz``), so lookups take and return node indices:
+    a distance is an array read and a path is a predecessor walk.
+    """
+
+    def __init__(self, directory: Path, meta: dict, node_index: NodeIndex):
+        self.directory = Path(directory)
+        self.meta = meta
+        self.weight = meta["weight"]
+        self.node_index = node_index
+        self._arrays = {}
+
+    @classmethod
+    def open(
+        cls,
+        directory: Path,
+        node_index: NodeIndex,
+        fingerprint: str | None = None,
+        key: str | None = None,
+    ) -> "HubTables | None":
+        """Open a table folder; returns None if missing or built for another graph, key or layout."""
+        meta_path = Path(directory) / HUB_TABLES_META
+        if not meta_path.exists():
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("version") != HUB_TABLES_VERSION or meta.get("nodes") != len(node_index):
+            return None
+        if fingerprint is not None and meta.get("source_fingerprint") != fingerprint:
+            return None
+        if key is not None and meta.get("key") != key:
+            return None
+        return cls(directory, meta, node_index)
+
+    @property
+    def hubs(self) -> list:
+        return list(self.meta["hubs"])
+
+    def __contains__(self, hub) -> bool:
+        return int(hub) in self.meta["hubs"]
+
+    def arrays(self, hub) -> tuple[np.ndarray, np.ndarray]:
+        """Return the memory-mapped (dist, pred) arrays of a hub node ID."""
+        cached = self._arrays.get(hub)
+        if cached is None:
+            cached = self._arrays[hub] = (
+                np.load(self.directory / f"{hub}.dist.npy", mmap_mode="r"),
+                np.load(self.directory / f"{hub}.pred.npy", mmap_mode="r"),
+            )
+        return cached
+
+    def distance(self, hub, target: int) -> float:
+        """Return the routing cost from a hub node ID to a node index (inf if unreachable)."""
+        return float(self.arrays(hub)[0][target])
+
+    def path(self, hub, target: int) -> list | None:
+        """Return the node index path from a hub node ID to a node index, or None if unreachable."""
+        dist, pred = self.arrays(hub)
+        if not np.isfinite(dist[target]):
+            return None
+        return self.node_index.path(pred, target)
+
+    @classmethod
+    def build(
+        cls,
+        graph: nx.MultiDiGraph,
+        hubs,
+        weight: str,
+        directory: Path,
+        fingerprint: str = "",
+        key: str = "",
+        workers: int | None = None,
+        existing: "HubTables | None" = None,
+        node_index: NodeIndex | None = None,
+    ) -> "HubTables":
+        """
+        Compute and write the tables of hubs, keeping those already in existing.
+
+        Searches run ``NodeIndex.dijkstra`` in parallel across hubs, like
+        ``hub_isochrones``; node_index defaults to a fresh index of graph.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        if existing is not None:
+            node_index = existing.node_index
+        elif node_index is None:
+            node_index = NodeIndex.build(graph)
+        kept = [hub for hub in (existing.hubs if existing is not None else []) if hub in graph]
+        pending = [int(hub) for hub in hubs if int(hub) not in kept]
+        sources = node_index.positions(pending).tolist()
+        unknown = [hub for hub, source in zip(pending, sources) if source < 0]
+        if unknown:
+            raise ValueError(f"Hub nodes not in the graph: {unknown}")
+        if existing is None:
+            # tables of an older graph, weight definition or layout are dropped
+            for stale in directory.glob("*.npy"):
+                stale.unlink()
+        costs = node_index.edge_costs(graph, weight)
+
+        def write(hub, dist, pred):
+            np.save(directory / f"{hub}.dist.npy", dist)
+            np.save(directory / f"{hub}.pred.npy", pred)
+
+        if len(pending) <= 1 or workers == 1:
+            for hub, source in zip(pending, sources):
+                write(hub, *hub_table_arrays(node_index, costs, source))
+        else:
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            max_workers = min(len(pending), workers or os.cpu_count() or 1)
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=context,
+                initializer=_init_hub_table_worker,
+                initargs=(node_index, costs),
+            ) as pool:
+                futures = [pool.submit(_hub_table_task, hub, source) for hub, source in zip(pending, sources)]
+                for future in as_completed(futures):
+                    write(*future.result())
+
+        meta = {
+            "version": HUB_TABLES_VERSION,
+            "weight": weight,
+            "key": key,
+            "source_fingerprint": fingerprint,
+            "hubs": kept + pending,
+            "nodes": len(node_index),
+            "built_at": datetime.now().isoformat(),
+        }
+        with open(directory / HUB_TABLES_META, "w") as f:
+            json.dump(meta, f, indent=2)
+        return cls(directory, meta, node_index)
+
+
+def load_hub_tables(
+    graph: nx.MultiDiGraph,
+    graph_path: Path,
+    hubs,
+    weight: str = "travel_time",
+    key: str | None = None,
+    workers: int | None = None,
+    node_index: NodeIndex | None = None,
+) -> HubTables:
+    """
+    Load the hub tables of a graph file, computing missing hubs if needed.
+
+    Tables are reused while the GraphML fingerprint and key (see
+    ``profile_digest``) match; otherwise all hubs are recomputed. New hubs
+    are added to valid tables without recomputing the others. The folder
+    is registered as a ``hub_tables`` artifact, so ``apply-osc`` and
+    ``recompute_travel_times.py`` updates invalidate it.
+
+    Args:
+        graph: Graph loaded from graph_path.
+        graph_path: GraphML file the graph was loaded from.
+        hubs: Hub node IDs needed.
+        weight: Routing weight attribute.
+        key: Digest of the weight definition (default: ``profile_digest(weight)``).
+        workers: Worker processes for new hubs (default: CPU count).
+        node_index: Node index of graph (default: ``load_node_index``).
+
+    Returns:
+        HubTables covering all hubs.
+    """
+    directory = hub_tables_dir(graph_path, weight)
+    fingerprint = file_fingerprint(graph_path)
+    key = key or profile_digest(weight)
+    if node_index is None:
+        node_index = load_node_index(graph, graph_path)
+    tables = HubTables.open(directory, node_index, fingerprint=fingerprint, key=key)
+    missing = [hub for hub in hubs if tables is None or hub not in tables]
+    if not missing:
+        logging.debug(f"Loaded hub tables from {directory}")
+        return tables
+    logging.info(f"Computing hub tables for {len(missing)} hub(s) in {directory}")
+    with profile_phase("hub_tables"):
+        tables = HubTables.build(graph, missing, weight, directory, fingerprint=fingerprint, key=key,
+                                 workers=workers, existing=tables, node_index=node_index)
+    register_artifact(graph_path, f"hub_tables.{weight}", "hub_tables", directory, fingerprint)
+    return tables
+
+
+def build_hub_tables(
+    graph_path: Path,
+    hubs,
+    routing_profile: str | None = None,
+    config: dict | None = None,
+    workers: int | None = None,
+) -> int:
+    """
+    Precompute hub tables for a graph file (the ``hub-tables`` command).
+
+    Args:
+        graph_path: GraphML file.
+        hubs: Node IDs or "lat,lon" strings.
+        routing_profile: Optional routing profile from config.
+        config: Configuration dictionary (for routing_profiles).
+        workers: Worker processes (default: CPU count).
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    graph_path = Path(graph_path)
+    if config is None:
+        config = DEFAULT_CONFIG.copy()
+    if not graph_path.exists():
+        logging.error(f"File not found: {graph_path}")
+        return 1
+    if not hubs:
+        logging.error("No hubs given")
+        return 1
+
+    logging.info(f"Loading graph from {graph_path}")
+    with profile_phase("load_graphml"):
+        graph = load_routing_graph(graph_path)
+    try:
+        weight = routing_weight(graph, routing_profile, config)
+        hub_nodes = resolve_hubs(graph, hubs)
+    except (KeyError, ValueError) as e:
+        logging.error(str(e))
+        return 1
+    spec = config.get("routing_profiles", {}).get(routing_profile) if routing_profile else None
+    tables = load_hub_tables(graph, graph_path, hub_nodes, weight, key=profile_digest(weight, spec), workers=workers)
+
+    size = sum(p.stat().st_size for p in tables.directory.glob("*.npy"))
+    print(f"Hub tables ({weight}) in {tables.directory}: {len(tables.hubs)} hub(s) x {len(tables.node_index):,} nodes, "
+          f"{size / 1e6:.1f} MB")
+    for hub in hub_nodes:
+        dist = tables.arrays(hub)[0]
+        reached = np.isfinite(dist)
+        print(f"  {hub:>12}  {int(reached.sum()):>10,} reachable nodes, max {float(dist[reached].max()) / 60:,.1f} min")
+    return 0
+
+
+# =============================================================================
+# Streaming Statistics
+# =============================================================================
+
+# KLL sketch size: rank error is about 1.7 / k of the count
+DEFAULT_SKETCH_K = 200
+
+# Capacity ratio between a KLL level and the one above it
+KLL_DECAY = 2.0 / 3.0
+
+
+class StreamingStats:
+    """
+    Mergeable one-pass summary of a metric in bounded memory.
+
+    Count, mean, standard deviation (Welford, combined with Chan's formula
+    on merge), min and max are exact. Quantiles come from a KLL sketch:
+    level h holds sorted samples of weight 2**h, and a full level is
+    compacted by promoting every other item. The sketch keeps
+    O(k log(n / k)) values and is exact until the first compaction.
+    Sketches built in separate processes merge with ``merge``; the state
+    also round-trips through ``to_dict`` / ``from_dict`` (JSON). Compaction
+    draws from a generator seeded with ``seed``, so the quantile estimates
+    are reproducible for a given seed and sequence of adds and merges.
+    """
+
+    def __init__(self, k: int = DEFAULT_SKETCH_K, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self._levels = [[]]
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, value: float) -> None:
+        """Add one value (NaN and infinities are ignored)."""
+        value = float(value)
+        if not np.isfinite(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self._levels[0].append(value)
+        if len(self._levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def update(self, values) -> None:
+        """Add an array of values (non-finite values are ignored)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        mean = float(values.mean())
+        self._combine(len(values), mean, float(((values - mean) ** 2).sum()),
+                      float(values.min()), float(values.max()))
+        self._levels[0].extend(values.tolist())
+        self._compress()
+
+    def merge(self, other: "StreamingStats") -> "StreamingStats":
+        """Fold another summary of the same metric (and sketch size k) into this one."""
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge sketches of different sizes (k={self.k} and k={other.k})")
+        if other.count:
+            self._combine(other.count, other.mean, other._m2, other.min, other.max)
+            for h, items in enumerate(other._levels):
+                if h == len(self._levels):
+                    self._levels.append([])
+                self._levels[h].extend(items)
+            self._compress()
+        return self
+
+    def _combine(self, count: int, mean: float, m2: float, low: float, high: float) -> None:
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._levels) - level - 1
+        return max(2, int(np.ceil(self.k * KLL_DECAY ** depth)))
+
+    def _compress(self) -> None:
+        while sum(len(items) for items in self._levels) > sum(self._capacity(h) for h in range(len(self._levels))):
+            for h, items in enumerate(self._levels):
+                if len(items) < self._capacity(h):
+                    continue
+                if h + 1 == len(self._levels):
+                    self._levels.append([])
+                items.sort()
+                # an odd item out stays behind; a random offset keeps ranks unbiased
+                odd = len(items) % 2
+                offset = int(self._rng.integers(2))
+                self._levels[h + 1].extend(items[odd + offset::2])
+                self._levels[h] = items[:odd]
+                break
+
+    def quantiles(self, qs) -> list:
+        """Return the values at ranks qs (0..1); None values when empty."""
+        if not self.count:
+            return [None for _ in qs]
+        items = np.concatenate([np.asarray(items, dtype=np.float64) for items in self._levels])
+        weights = np.concatenate([np.full(len(items), 2 ** h, dtype=np.int64) for h, items in enumerate(self._levels)])
+        order = np.argsort(items, kind="stable")
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+        picks = np.searchsorted(cumulative, np.asarray(qs, dtype=np.float64) * cumulative[-1], side="left")
+        picks = np.clip(picks, 0, len(items) - 1)
+        return [min(max(float(items[i]), self.min), self.max) for i in picks]
+
+    def quantile(self, q: float) -> float | None:
+        """Return the value at rank q (0..1), or None when empty."""
+        return self.quantiles([q])[0]
+
+    @property
+    def std(self) -> float | None:
+        """Population standard deviation, or None when empty."""
+        return float(np.sqrt(self._m2 / self.count)) if self.count else None
+
+    def summary(self) -> dict:
+        """Return count, mean, std, min, p50, p90, p99 and max (None values when empty)."""
+        p50, p90, p99 = self.quantiles([0.5, 0.9, 0.99])
+        return {
+            "count": self.count,
+            "mean": self.mean if self.count else None,
+            "std": self.std,
+            "min": self.min,
+            "p50": p50,
+            "p90": p90,
+            "p99": p99,
+            "max": self.max,
+        }
+
+    def to_dict(self) -> dict:
+        """Return the full state as JSON-serializable data."""
+        return {
+            "k": self.k,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self._m2,
+            "min": self.min,
+            "max": self.max,
+            "levels": [list(items) for items in self._levels],
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "StreamingStats":
+        """Rebuild a summary saved with ``to_dict``."""
+        stats = cls(k=state["k"])
+        stats.count = state["count"]
+        stats.mean = state["mean"]
+        stats._m2 = state["m2"]
+        stats.min = state["min"]
+        stats.max = state["max"]
+        stats._levels = [list(items) for items in state["levels"]] or [[]]
+        return stats
+
+
+# =============================================================================
+# Shard Command
+# =============================================================================
+
+# Default tile edge length in degrees for sharded storage
+DEFAULT_TILE_SIZE_DEG = 0.25
+
+# Name of the shard index written next to the tiles
+SHARD_INDEX_NAME = "index.json"
+
+# Node lookup (IDs, tile and float32 coordinates) written next to the tiles
+SHARD_NODES_NAME = "nodes.npz"
+
+
+def _tile_key(ix: int, iy: int) -> str:
+    return f"{ix}_{iy}"
+
+
+def _tile_bbox(ix: int, iy: int, tile_size: float) -> list[float]:
+    return [round(c * tile_size, 9) for c in (ix, iy, ix + 1, iy + 1)]
+
+
+def _node_tiles(graph: nx.MultiDiGraph, tile_size: float):
+    """Return (nodes, xs, ys, {node: (ix, iy)}) for every node of graph."""
+    nodes = list(graph.nodes)
+    xs = np.array([float(graph.nodes[n]["x"]) for n in nodes])
+    ys = np.array([float(graph.nodes[n]["y"]) for n in nodes])
+    ixs = np.floor(xs / tile_size).astype(np.int64)
+    iys = np.floor(ys / tile_size).astype(np.int64)
+    tile_of = {n: (ix, iy) for n, ix, iy in zip(nodes, ixs.tolist(), iys.tolist())}
+    return nodes, xs, ys, tile_of
+
+
+def _write_shard(graph: nx.MultiDiGraph, tile, owned, tile_of: dict, output_dir: Path, tile_size: float) -> dict:
+    """Write the shard of one tile and return its index entry."""
+    shard = nx.MultiDiGraph()
+    shard.graph.update(graph.graph)
+    shard.add_nodes_from((n, graph.nodes[n]) for n in owned)
+    boundary = set()
+    for u in owned:
+        for _, v, k, data in graph.out_edges(u, keys=True, data=True):
+            if tile_of[v] != tile and v not in boundary:
+                boundary.add(v)
+                shard.add_node(v, **graph.nodes[v])
+            shard.add_edge(u, v, k, **data)
+
+    filename = f"tile_{_tile_key(*tile)}.graphml"
+    with profile_phase("save_graphml"):
+        save_graph(shard, Path(output_dir) / filename)
+    return {
+        "file": filename,
+        "bbox": _tile_bbox(*tile, tile_size),
+        "nodes": len(owned),
+        "edges": shard.number_of_edges(),
+        "boundary_nodes": sorted(boundary),
+    }
+
+
+def _write_shard_nodes(output_dir: Path, nodes, xs, ys) -> None:
+    order = np.argsort(np.array(nodes, dtype=np.int64))
+    np.savez_compressed(
+        Path(output_dir) / SHARD_NODES_NAME,
+        nodes=np.array(nodes, dtype=np.int64)[order],
+        x=xs[order].astype(np.float32),
+        y=ys[order].astype(np.float32),
+    )
+
+
+def shard_graph(graph: nx.MultiDiGraph, output_dir: Path, tile_size: float = DEFAULT_TILE_SIZE_DEG) -> dict:
+    """
+    Split a graph into square lon/lat tiles stored as separate GraphML files.
+
+    Every node is owned by the tile containing it and every edge by the tile
+    of its start node. Edges leaving a tile keep their end node in the shard
+    as a boundary node, so loading adjacent shards reconnects the network.
+
+    Args:
+        graph: Graph to split.
+        output_dir: Directory for the tiles, ``index.json`` and ``nodes.npz``.
+        tile_size: Tile edge length in degrees.
+
+    Returns:
+        The shard index (also written to ``output_dir / index.json``).
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    nodes, xs, ys, tile_of = _node_tiles(graph, tile_size)
+    owned = {}
+    for n, tile in tile_of.items():
+        owned.setdefault(tile, []).append(n)
+
+    index = {
+        "tile_size": tile_size,
+        "nodes_file": SHARD_NODES_NAME,
+        "tiles": {},
+    }
+    for tile in sorted(owned):
+        index["tiles"][_tile_key(*tile)] = _write_shard(graph, tile, owned[tile], tile_of, output_dir, tile_size)
+
+    _write_shard_nodes(output_dir, nodes, xs, ys)
+    with open(output_dir / SHARD_INDEX_NAME, "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def refresh_shards(graph: nx.MultiDiGraph, index_path: Path, nodes=(), points=()) -> list[str]:
+    """
+    Rewrite only the shards affected by changed nodes.
+
+    A tile is rewritten when it contains one of the points (old or new
+    positions of changed elements) or a changed node, or lists a changed node
+    as a boundary node. Tiles left without nodes are removed.
+
+    Args:
+        graph: Updated graph the shards were cut from.
+        index_path: Shard index file (or its directory).
+        nodes: Changed node IDs.
+        points: Extra (x, y) positions whose tiles must be rewritten.
+
+    Returns:
+        Keys of the rewritten or removed tiles.
+    """
+    index = load_shard_index(index_path)
+    root = index.pop("root")
+    tile_size = index["tile_size"]
+
+    all_nodes, xs, ys, tile_of = _node_tiles(graph, tile_size)
+    nodes = set(nodes)
+    tiles = {tile_of[n] for n in nodes if n in tile_of}
+    tiles |= {(int(np.floor(x / tile_size)), int(np.floor(y / tile_size))) for x, y in points}
+    for key, entry in index["tiles"].items():
+        if nodes.intersection(entry["boundary_nodes"]):
+            tiles.add(tuple(int(c) for c in key.split("_")))
+
+    owned = {tile: [] for tile in tiles}
+    for n, tile in tile_of.items():
+        if tile in owned:
+            owned[tile].append(n)
+
+    refreshed = []
+    for tile in sorted(tiles):
+        key = _tile_key(*tile)
+        if owned[tile]:
+            index["tiles"][key] = _write_shard(graph, tile, owned[tile], tile_of, root, tile_size)
+        elif key in index["tiles"]:
+            (root / index["tiles"].pop(key)["file"]).unlink(missing_ok=True)
+        else:
+            continue
+        refreshed.append(key)
+
+    _write_shard_nodes(root, all_nodes, xs, ys)
+    with open(root / SHARD_INDEX_NAME, "w") as f:
+        json.dump(index, f, indent=2)
+    return refreshed
+
+
+def load_shard_index(index_path: Path) -> dict:
+    """Load a shard index, accepting either the index file or its directory."""
+    index_path = Path(index_path)
+    if index_path.is_dir():
+        index_path = index_path / SHARD_INDEX_NAME
+    with open(index_path) as f:
+        index = json.load(f)
+    index["root"] = index_path.parent
+    return index
+
+
+def is_shard_index(path: Path) -> bool:
+    """Return True if path is a shard index file or a directory holding one."""
+    path = Path(path)
+    if path.is_dir():
+        path = path / SHARD_INDEX_NAME
+    if path.suffix != ".json" or not path.is_file():
+        return False
+    # any other JSON file (config, artifact registry, ...) is not an index
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(index, dict) and "tiles" in index and "tile_size" in index
+
+
+def shard_node_coords(index: dict, node_ids) -> dict:
+    """Return {node: (x, y)} for node IDs using the index's node lookup."""
+    with np.load(index["root"] / index["nodes_file"]) as data:
+        nodes = data["nodes"]
+        wanted = np.asarray(list(node_ids), dtype=np.int64)
+        pos = np.clip(np.searchsorted(nodes, wanted), 0, max(len(nodes) - 1, 0))
+        found = nodes[pos] == wanted
+        xs = data["x"][pos]
+        ys = data["y"][pos]
+    return {
+        int(n): (float(x), float(y))
+        for n, x, y, ok in zip(wanted.tolist(), xs, ys, found)
+        if ok
+    }
+
+
+def corridor_polygon(start_xy, end_xy, buffer_km: float):
+    """Return a lon/lat polygon buffering the straight line between two points."""
+    mean_lat = (start_xy[1] + end_xy[1]) / 2.0
+    # buffer in degrees of longitude, which is the wider of the two axes
+    buffer_deg = buffer_km / (111.32 * max(np.cos(np.radians(mean_lat)), 0.01))
+    return LineString([start_xy, end_xy]).buffer(buffer_deg)
+
+
+def select_tiles(index: dict, bbox=None, corridor=None, buffer_km: float = 10.0) -> list[str]:
+    """
+    Return the keys of the tiles intersecting a bbox or a corridor.
+
+    Args:
+        index: Shard index from ``load_shard_index``.
+        bbox: Optional (west, south, east, north) in degrees.
+        corridor: Optional (origin, destination); each endpoint is a node ID
+            or an (x, y) lon/lat pair.
+        buffer_km: Corridor half-width in kilometres.
+
+    Returns:
+        Tile keys; every tile when neither bbox nor corridor is given.
+    """
+    if bbox is None and corridor is None:
+        return list(index["tiles"])
+
+    if corridor is not None:
+        endpoints = list(corridor)
+        node_ids = [p for p in endpoints if not isinstance(p, (tuple, list))]
+        coords = shard_node_coords(index, node_ids) if node_ids else {}
+        points = []
+        for p in endpoints:
+            if isinstance(p, (tuple, list)):
+                points.append((float(p[0]), float(p[1])))
+            elif int(p) in coords:
+                points.append(coords[int(p)])
             else:
-                tracktype = (
-                    str(raw_tracktype).strip().lower()
-                    if raw_tracktype is not None
-                    else "unknown"
-                )
+                raise KeyError(f"Node {p} is not in the shard index")
+        area = corridor_polygon(points[0], points[1], buffer_km)
+    else:
+        area = shapely_box(*bbox)
 
-            if tracktype in tracktype_counts:
-                tracktype_counts[tracktype] += 1
+    selected = []
+    for key, tile in index["tiles"].items():
+        tile_box = shapely_box(*tile["bbox"])
+        # tiles that only share an edge with the area hold none of it
+        if area.intersects(tile_box) and not area.touches(tile_box):
+            selected.append(key)
+    return selected
 
-    # Print results
-    print("\n" + "=" * 60)
-    print("NETWORK STATISTICS")
-    print("=" * 60)
-    print(f"File: {filepath.name}")
-    print(f"Total nodes: {graph.number_of_nodes():,}")
-    print(f"Total edges: {graph.number_of_edges():,}")
-    print(f"Total length: {total_km:,.2f} km")
-    print()
-    print("Road Type Lengths (km):")
-    print("-" * 40)
-    print(f"  {'Category':<25} {'Length (km)':>12}")
-    print("-" * 40)
-    print(f"  {'Alleys (service=alley)':<25} {alley_km:>12,.2f}")
-    print(f"  {'Wilderness tracks':<25} {track_km:>12,.2f}")
-    print(f"  {'Private roads':<25} {private_km:>12,.2f}")
-    print(f"  {'Unpaved roads':<25} {unpaved_km:>12,.2f}")
-    print("-" * 40)
-    print()
-    print("Tracktype Histogram (highway=track edges):")
-    print("-" * 40)
-    print(f"  {'Tracktype':<15} {'Count':>10}")
-    print("-" * 40)
-    for grade, count in sorted(tracktype_counts.items()):
-        print(f"  {grade:<15} {count:>10}")
-    print("-" * 40)
-    print("=" * 60 + "\n")
 
+def load_region(index_path: Path, bbox=None, corridor=None, buffer_km: float = 10.0) -> nx.MultiDiGraph:
+    """
+    Load only the shards covering a bbox or a corridor.
+
+    Args:
+        index_path: Shard index file (or its directory) written by ``shard_graph``.
+        bbox: Optional (west, south, east, north) in degrees.
+        corridor: Optional (origin, destination) node IDs or (x, y) pairs.
+        buffer_km: Corridor half-width in kilometres.
+
+    Returns:
+        Graph composed from the selected shards.
+    """
+    index = load_shard_index(index_path)
+    keys = select_tiles(index, bbox=bbox, corridor=corridor, buffer_km=buffer_km)
+    logging.info(f"Loading {len(keys)} of {len(index['tiles'])} shards")
+
+    region = nx.MultiDiGraph()
+    for key in keys:
+        with profile_phase("load_graphml"):
+            shard = load_routing_graph(index["root"] / index["tiles"][key]["file"])
+        # boundary copies carry the same node data as the owning shard
+        region.add_nodes_from(shard.nodes(data=True))
+        region.add_edges_from(shard.edges(keys=True, data=True))
+        if not region.graph:
+            region.graph.update(shard.graph)
+    region.graph["shard_tiles"] = keys
+    return region
+
+
+def shard_network(
+    input_path: Path,
+    output_dir: Path,
+    tile_size: float = DEFAULT_TILE_SIZE_DEG,
+) -> int:
+    """
+    Split a GraphML network into spatial shards.
+
+    Args:
+        input_path: Source GraphML file.
+        output_dir: Directory for the tiles and index.
+        tile_size: Tile edge length in degrees.
+
+    Returns:
+        Exit code (0 for success, non-zero for failure).
+    """
+    input_path = Path(input_path)
+    if not input_path.exists():
+        logging.error(f"File not found: {input_path}")
+        return 1
+    if tile_size <= 0:
+        logging.error("--tile-size must be positive")
+        return 1
+
+    logging.info(f"Loading graph from {input_path}")
+    with profile_phase("load_graphml"):
+        graph = load_graph(input_path)
+
+    with profile_phase("shard"):
+        index = shard_graph(graph, output_dir, tile_size=tile_size)
+    index_path = Path(output_dir) / SHARD_INDEX_NAME
+    fingerprint = file_fingerprint(input_path)
+    restamp_artifact(index_path, fingerprint)
+    register_artifact(input_path, "shards", "shards", index_path, fingerprint)
+
+    boundary = sum(len(t["boundary_nodes"]) for t in index["tiles"].values())
+    logging.info(
+        f"Wrote {len(index['tiles'])} shards ({boundary:,} boundary nodes) "
+        f"to {index_path}"
+    )
     return 0
 
 
@@ -620,6 +6082,68 @@ def calculate_stats(filepath: Path) -> int:
 # =============================================================================
 
 
+def add_batch_fetch_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the fetch and pipeline options shared by fetch-batch and fetch-plan."""
+    parser.add_argument(
+        "--date",
+        help="Date for the fetch (YYYY-MM-DD format, default: today)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=180,
+        help="Overpass timeout in seconds (default: 180)",
+    )
+    parser.add_argument(
+        "--memory",
+        type=int,
+        default=1073741824,
+        help="Overpass memory in bytes (default: 1073741824)",
+    )
+    parser.add_argument(
+        "--retry",
+        type=int,
+        default=3,
+        help="Number of retries per place on failure (default: 3)",
+    )
+    parser.add_argument(
+        "--sleep-seconds",
+        type=int,
+        default=60,
+        help="Seconds to wait between retries (default: 60)",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(COMPRESSION_SUFFIXES),
+        default="none",
+        help="Save as .graphml.gz or .graphml.zst (default: none)",
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        default=2,
+        help="Concurrent Overpass downloads (default: 2)",
+    )
+    parser.add_argument(
+        "--process-workers",
+        type=int,
+        default=1,
+        help="Threads adding speeds/travel times (default: 1)",
+    )
+    parser.add_argument(
+        "--write-workers",
+        type=int,
+        default=1,
+        help="Threads saving GraphML (default: 1)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=2,
+        help="Graphs allowed to wait between two stages (default: 2)",
+    )
+
+
 def create_parser() -> argparse.ArgumentParser:
     """Create the argument parser for the CLI tool."""
     parser = argparse.ArgumentParser(
@@ -630,11 +6154,55 @@ Examples:
   Fetch a network:
     python map_tool.py fetch "Langley, British Columbia, Canada" --output-dir ./data/raw
 
+  Resolve an ingestion plan's place polygons once, up front:
+    python map_tool.py geocode places.txt
+
+  Fetch a list of places with downloads overlapping processing and saving:
+    python map_tool.py fetch-batch places.txt --output-dir ./data/raw --download-workers 3
+
+  Refresh a region, fetching only areas not yet covered by earlier plan runs:
+    python map_tool.py fetch-plan plans/lower_mainland.json --output-dir ./data/raw/plan
+
   Merge networks:
     python map_tool.py merge --folder ./data/raw --output ./data/master/merged.graphml
 
   Show statistics:
     python map_tool.py stats ./data/raw/Langley_BC__20241201.graphml
+    python map_tool.py stats ./data/raw --workers 4
+
+  Build a compact routing graph for the nurse profile:
+    python map_tool.py compact-routing ./data/master/merged.graphml \\
+      --output ./data/master/merged_routing.graphml --routing-profile nurse --drop-excluded
+
+  SQLite edge store and SQL statistics (no graph loading):
+    python map_tool.py edge-db ./data/raw
+    python map_tool.py stats --sql --group-by date_fetched --where "highway = 'track' AND access = 'private'"
+
+  Nodes and polygons within 20/30/45 minutes of two hubs:
+    python map_tool.py isochrones ./data/master/merged.graphml --hub 49.19,-122.85 --hub 49.05,-122.30 \\
+      --bands 20 30 45 --routing-profile nurse --output ./data/isochrones/hubs
+
+  Precompute distance tables for fixed hubs (reused by generate_nurse_routes.py --hub-tables):
+    python map_tool.py hub-tables ./data/master/merged.graphml --hubs-file hubs.txt --routing-profile nurse
+
+  Coverage raster of the master graph with empty/sparse cells flagged:
+    python map_tool.py coverage ./data/master/merged.graphml --output ./data/coverage/merged --cell-deg 0.05
+
+  Columnar node/edge tables for pandas/DuckDB analytics:
+    python map_tool.py export ./data/master/merged.graphml --format parquet
+
+  Changeset between two dated snapshots:
+    python map_tool.py diff ./data/raw/Langley_BC__20241201.graphml \\
+      ./data/raw/Langley_BC__20250101.graphml --output ./data/changes/langley.jsonl
+
+  Apply a daily OSM change file to the master graph:
+    python map_tool.py apply-osc ./data/master/merged.graphml ./data/changes/daily.osc.gz
+
+  Shard the master graph into 0.25 degree tiles:
+    python map_tool.py shard ./data/master/merged.graphml --output-dir ./data/master/shards
+
+  Profile a run (writes ./data/profiles/merge__*.json and .prof):
+    python map_tool.py --profile merge --folder ./data/raw --output ./data/master/merged.graphml
         """,
     )
 
@@ -650,6 +6218,8 @@ Examples:
         help="Path to configuration JSON file",
     )
 
+    add_profile_arguments(parser)
+
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     # Fetch command
@@ -699,6 +6269,91 @@ Examples:
         default=60,
         help="Seconds to wait between retries (default: 60)",
     )
+    fetch_parser.add_argument(
+        "--compress",
+        choices=sorted(COMPRESSION_SUFFIXES),
+        default="none",
+        help="Compress the default output name as .graphml.gz or .graphml.zst (default: none)",
+    )
+
+    # Fetch-batch command
+    batch_parser = subparsers.add_parser(
+        "fetch-batch",
+        help="Fetch many places with download, processing and saving overlapped",
+    )
+    batch_parser.add_argument(
+        "places_file",
+        type=Path,
+        help="Text file with one place name per line (# starts a comment)",
+    )
+    batch_parser.add_argument(
+        "--output-dir",
+        type=Path,
+        required=True,
+        help="Directory to save the output files",
+    )
+    add_batch_fetch_arguments(batch_parser)
+
+    # Fetch-plan command
+    plan_parser = subparsers.add_parser(
+        "fetch-plan",
+        help="Fetch the union of a manifest's areas minus coverage already on disk",
+    )
+    plan_parser.add_argument(
+        "manifest",
+        type=Path,
+        help="JSON manifest with a list of areas (place names or bboxes)",
+    )
+    plan_parser.add_argument(
+        "--output-dir",
+        type=Path,
+        required=True,
+        help="Directory for the output files and its coverage.json ledger",
+    )
+    plan_parser.add_argument(
+        "--since",
+        help="Only count files fetched on or after this date (YYYY-MM-DD) as coverage",
+    )
+    plan_parser.add_argument(
+        "--tile-deg",
+        type=float,
+        default=DEFAULT_PLAN_TILE_DEG,
+        help=f"Largest piece per Overpass request in degrees (default: {DEFAULT_PLAN_TILE_DEG})",
+    )
+    plan_parser.add_argument(
+        "--min-gap-km2",
+        type=float,
+        default=DEFAULT_MIN_GAP_KM2,
+        help=f"Skip gap slivers smaller than this (default: {DEFAULT_MIN_GAP_KM2})",
+    )
+    plan_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the requested, covered and remaining areas without fetching",
+    )
+    add_batch_fetch_arguments(plan_parser)
+
+    # Geocode command
+    geocode_parser = subparsers.add_parser(
+        "geocode",
+        help="Resolve a list of places into the local geocode store",
+    )
+    geocode_parser.add_argument(
+        "places_file",
+        type=Path,
+        help="Text file with one place name per line (# starts a comment)",
+    )
+    geocode_parser.add_argument(
+        "--geocode-db",
+        type=Path,
+        default=None,
+        help=f"Geocode store path (default: config geocode_db or <data_root>/{DEFAULT_GEOCODE_DB_NAME})",
+    )
+    geocode_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Query Nominatim again for places already in the store",
+    )
 
     # Merge command
     merge_parser = subparsers.add_parser(
@@ -721,12 +6376,335 @@ Examples:
     # Stats command
     stats_parser = subparsers.add_parser(
         "stats",
-        help="Show statistics for a network file",
+        help="Show statistics for one or more network files",
+    )
+    stats_parser.add_argument(
+        "filepath",
+        type=Path,
+        nargs="?",
+        help="GraphML file, folder of GraphML files, or quoted glob pattern "
+             "(with --sql: optional, restricts the source files)",
+    )
+    stats_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for uncached files (default: CPU count)",
+    )
+    stats_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore and do not write the per-file .stats.json cache",
+    )
+    stats_parser.add_argument(
+        "--sql",
+        action="store_true",
+        help="Compute the statistics with SQL against the edge store instead of loading graphs",
     )
     stats_parser.add_argument(
+        "--db",
+        type=Path,
+        default=None,
+        help="Edge store path (default: config edge_db or <data_root>/edges.sqlite)",
+    )
+    stats_parser.add_argument(
+        "--group-by",
+        choices=EDGE_STORE_GROUPS,
+        default="source",
+        help="With --sql: one row per source file or per attribute value (default: source)",
+    )
+    stats_parser.add_argument(
+        "--where",
+        help="With --sql: extra SQL condition on the edges table, e.g. \"highway = 'track'\"",
+    )
+    stats_parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+        help="With --sql: only edges intersecting this area",
+    )
+
+    # Edge-db command
+    edge_db_parser = subparsers.add_parser(
+        "edge-db",
+        help="Load GraphML files into the SQLite edge store",
+    )
+    edge_db_parser.add_argument(
+        "filepath",
+        type=Path,
+        help="GraphML file, folder of GraphML files, or quoted glob pattern",
+    )
+    edge_db_parser.add_argument(
+        "--db",
+        type=Path,
+        default=None,
+        help="Edge store path (default: config edge_db or <data_root>/edges.sqlite)",
+    )
+    edge_db_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Reload files that are already loaded and unchanged",
+    )
+
+    # Coverage command
+    coverage_parser = subparsers.add_parser(
+        "coverage",
+        help="Grid road coverage and flag empty or sparse cells",
+    )
+    coverage_parser.add_argument(
+        "filepath",
+        type=Path,
+        help="GraphML file, folder of GraphML files, or quoted glob pattern",
+    )
+    coverage_parser.add_argument(
+        "--output",
+        type=Path,
+        required=True,
+        help="Output prefix; writes <prefix>.npy and <prefix>.geojson",
+    )
+    coverage_parser.add_argument(
+        "--cell-deg",
+        type=float,
+        default=DEFAULT_COVERAGE_CELL_DEG,
+        help=f"Cell size in degrees (default: {DEFAULT_COVERAGE_CELL_DEG})",
+    )
+    coverage_parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+        help="Study area (default: extent of the nodes)",
+    )
+    coverage_parser.add_argument(
+        "--min-length-km",
+        type=float,
+        default=DEFAULT_SPARSE_KM,
+        help=f"Flag cells with less road than this as sparse (default: {DEFAULT_SPARSE_KM})",
+    )
+
+    # Export command
+    export_parser = subparsers.add_parser(
+        "export",
+        help="Export nodes and edges as Parquet or Arrow tables",
+    )
+    export_parser.add_argument(
         "filepath",
         type=Path,
-        help="Path to GraphML file",
+        help="Path to GraphML file (.graphml, .graphml.gz or .graphml.zst)",
+    )
+    export_parser.add_argument(
+        "--format",
+        choices=sorted(EXPORT_FORMATS),
+        default="parquet",
+        help="Table format (default: parquet)",
+    )
+    export_parser.add_argument(
+        "--output",
+        type=Path,
+        help="Output prefix; writes <prefix>.nodes.<fmt> and <prefix>.edges.<fmt> "
+             "(default: next to the input)",
+    )
+    export_parser.add_argument(
+        "--batch-rows",
+        type=int,
+        default=EXPORT_BATCH_ROWS,
+        help=f"Rows per record batch / row group (default: {EXPORT_BATCH_ROWS})",
+    )
+
+    # Apply-osc command
+    osc_parser = subparsers.add_parser(
+        "apply-osc",
+        help="Apply local osmChange (.osc/.osc.gz) files to a GraphML network",
+    )
+    osc_parser.add_argument(
+        "input",
+        type=Path,
+        help="Path to master GraphML file",
+    )
+    osc_parser.add_argument(
+        "osc",
+        type=Path,
+        nargs="+",
+        help="osmChange files, applied in order",
+    )
+    osc_parser.add_argument(
+        "--output",
+        type=Path,
+        help="Output GraphML path (default: overwrite input)",
+    )
+
+    # Isochrones command
+    iso_parser = subparsers.add_parser(
+        "isochrones",
+        help="Travel-time bands around hubs: reached nodes and polygons",
+    )
+    iso_parser.add_argument(
+        "graph",
+        type=Path,
+        help="Routing graph (GraphML, full or compact)",
+    )
+    iso_parser.add_argument(
+        "--hub",
+        action="append",
+        default=[],
+        help="Hub node ID or \"lat,lon\" (repeatable)",
+    )
+    iso_parser.add_argument(
+        "--hubs-file",
+        type=Path,
+        help="Text file with one hub (node ID or lat,lon) per line",
+    )
+    iso_parser.add_argument(
+        "--bands",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_ISOCHRONE_BANDS),
+        help=f"Time bands in minutes (default: {' '.join(map(str, DEFAULT_ISOCHRONE_BANDS))})",
+    )
+    iso_parser.add_argument(
+        "--output",
+        type=Path,
+        required=True,
+        help="Output prefix; writes <prefix>.geojson and <prefix>.nodes.csv",
+    )
+    iso_parser.add_argument(
+        "--routing-profile",
+        help="Routing profile from config.json (default: travel_time)",
+    )
+    iso_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for uncached hubs (default: CPU count)",
+    )
+    iso_parser.add_argument(
+        "--hull-ratio",
+        type=float,
+        default=ISOCHRONE_HULL_RATIO,
+        help=f"Concave hull ratio, 1 = convex hull (default: {ISOCHRONE_HULL_RATIO})",
+    )
+    iso_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore and do not write the per-hub search cache",
+    )
+
+    # Hub-tables command
+    hub_tables_parser = subparsers.add_parser(
+        "hub-tables",
+        help="Precompute memory-mapped one-to-all distance tables per hub",
+    )
+    hub_tables_parser.add_argument(
+        "graph",
+        type=Path,
+        help="Routing graph (GraphML, full or compact)",
+    )
+    hub_tables_parser.add_argument(
+        "--hub",
+        action="append",
+        default=[],
+        help="Hub node ID or \"lat,lon\" (repeatable)",
+    )
+    hub_tables_parser.add_argument(
+        "--hubs-file",
+        type=Path,
+        help="Text file with one hub (node ID or lat,lon) per line",
+    )
+    hub_tables_parser.add_argument(
+        "--routing-profile",
+        help="Routing profile from config.json (default: travel_time)",
+    )
+    hub_tables_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: CPU count)",
+    )
+
+    # Shard command
+    shard_parser = subparsers.add_parser(
+        "shard",
+        help="Split a network into spatial tiles with an index for region loading",
+    )
+    shard_parser.add_argument(
+        "input",
+        type=Path,
+        help="Path to source GraphML file",
+    )
+    shard_parser.add_argument(
+        "--output-dir",
+        type=Path,
+        required=True,
+        help="Directory for the tiles and index.json",
+    )
+    shard_parser.add_argument(
+        "--tile-size",
+        type=float,
+        default=DEFAULT_TILE_SIZE_DEG,
+        help=f"Tile edge length in degrees (default: {DEFAULT_TILE_SIZE_DEG})",
+    )
+
+    # Diff command
+    diff_parser = subparsers.add_parser(
+        "diff",
+        help="Report changed nodes and edges between two GraphML snapshots",
+    )
+    diff_parser.add_argument(
+        "old",
+        type=Path,
+        help="Earlier GraphML snapshot",
+    )
+    diff_parser.add_argument(
+        "new",
+        type=Path,
+        help="Later GraphML snapshot",
+    )
+    diff_parser.add_argument(
+        "--output",
+        type=Path,
+        help="Write the changeset as JSON Lines to this path",
+    )
+    diff_parser.add_argument(
+        "--attrs",
+        help="Comma-separated edge attributes to compare (default: OSM tags, length and geometry)",
+    )
+    diff_parser.add_argument(
+        "--partitions",
+        type=int,
+        default=DEFAULT_DIFF_PARTITIONS,
+        help=f"Temporary hash partitions; more partitions use less memory (default: {DEFAULT_DIFF_PARTITIONS})",
+    )
+    diff_parser.add_argument(
+        "--exit-code",
+        action="store_true",
+        help="Exit with 1 if the snapshots differ (2 on errors)",
+    )
+
+    # Compact-routing command
+    compact_parser = subparsers.add_parser(
+        "compact-routing",
+        help="Write a routing-only graph with degree-2 chains contracted",
+    )
+    compact_parser.add_argument(
+        "input",
+        type=Path,
+        help="Path to source GraphML file",
+    )
+    compact_parser.add_argument(
+        "--output",
+        type=Path,
+        required=True,
+        help="Output path for the compact routing graph",
+    )
+    compact_parser.add_argument(
+        "--routing-profile",
+        help="Routing profile (from config routing_profiles) to compile into the graph",
+    )
+    compact_parser.add_argument(
+        "--drop-excluded",
+        action="store_true",
+        help="Drop edges excluded by --routing-profile before contraction",
     )
 
     return parser
@@ -737,18 +6715,8 @@ Examples:
 # =============================================================================
 
 
-def main() -> int:
-    """Main entry point for the CLI tool."""
-    parser = create_parser()
-    args = parser.parse_args()
-
-    # Setup logging
-    setup_logging(verbose=args.verbose)
-
-    # Load configuration
-    config = load_config(args.config)
-
-    # Dispatch to appropriate command
+def run_command(parser: argparse.ArgumentParser, args: argparse.Namespace, config: dict) -> int:
+    """Dispatch parsed arguments to the appropriate command."""
     if args.command == "fetch":
         return fetch_network(
             place_name=args.place_name,
@@ -760,20 +6728,172 @@ def main() -> int:
             retry=args.retry,
             sleep_seconds=args.sleep_seconds,
             config=config,
+            compress=args.compress,
+        )
+    elif args.command == "fetch-batch":
+        return fetch_batch(
+            places=read_places_file(args.places_file),
+            output_dir=args.output_dir,
+            date=args.date,
+            timeout=args.timeout,
+            memory=args.memory,
+            retry=args.retry,
+            sleep_seconds=args.sleep_seconds,
+            config=config,
+            compress=args.compress,
+            download_workers=args.download_workers,
+            process_workers=args.process_workers,
+            write_workers=args.write_workers,
+            queue_size=args.queue_size,
+        )
+    elif args.command == "fetch-plan":
+        return fetch_plan(
+            manifest=args.manifest,
+            output_dir=args.output_dir,
+            date=args.date,
+            since=args.since,
+            tile_deg=args.tile_deg,
+            min_gap_km2=args.min_gap_km2,
+            dry_run=args.dry_run,
+            config=config,
+            timeout=args.timeout,
+            memory=args.memory,
+            retry=args.retry,
+            sleep_seconds=args.sleep_seconds,
+            compress=args.compress,
+            download_workers=args.download_workers,
+            process_workers=args.process_workers,
+            write_workers=args.write_workers,
+            queue_size=args.queue_size,
+        )
+    elif args.command == "geocode":
+        return geocode_places(
+            places=read_places_file(args.places_file),
+            config=config,
+            db_path=args.geocode_db,
+            refresh=args.refresh,
         )
     elif args.command == "merge":
         return merge_graphs(
             folder=args.folder,
             output=args.output,
+            config=config,
+        )
+    elif args.command == "edge-db":
+        return build_edge_store(
+            filepath=args.filepath,
+            config=config,
+            db_path=args.db,
+            force=args.force,
         )
     elif args.command == "stats":
+        if args.sql:
+            return calculate_sql_stats(
+                filepath=args.filepath,
+                config=config,
+                db_path=args.db,
+                group_by=args.group_by,
+                where=args.where,
+                bbox=args.bbox,
+            )
+        if args.filepath is None:
+            parser.error("stats: filepath is required unless --sql is given")
         return calculate_stats(
             filepath=args.filepath,
+            workers=args.workers,
+            use_cache=not args.no_cache,
+        )
+    elif args.command == "coverage":
+        return coverage(
+            filepath=args.filepath,
+            output=args.output,
+            cell_deg=args.cell_deg,
+            bbox=args.bbox,
+            min_length_km=args.min_length_km,
+        )
+    elif args.command == "export":
+        return export_network(
+            filepath=args.filepath,
+            output=args.output,
+            fmt=args.format,
+            batch_rows=args.batch_rows,
+        )
+    elif args.command == "diff":
+        return diff_snapshots(
+            old_path=args.old,
+            new_path=args.new,
+            output=args.output,
+            attrs=args.attrs,
+            partitions=args.partitions,
+            exit_code=args.exit_code,
+        )
+    elif args.command == "apply-osc":
+        return apply_osc(
+            input_path=args.input,
+            osc_paths=args.osc,
+            output=args.output,
+            config=config,
+        )
+    elif args.command == "isochrones":
+        hubs = list(args.hub)
+        if args.hubs_file:
+            hubs += read_places_file(args.hubs_file)
+        return isochrones(
+            graph_path=args.graph,
+            hubs=hubs,
+            output=args.output,
+            bands_min=args.bands,
+            routing_profile=args.routing_profile,
+            config=config,
+            workers=args.workers,
+            hull_ratio=args.hull_ratio,
+            use_cache=not args.no_cache,
+        )
+    elif args.command == "hub-tables":
+        hubs = list(args.hub)
+        if args.hubs_file:
+            hubs += read_places_file(args.hubs_file)
+        return build_hub_tables(
+            graph_path=args.graph,
+            hubs=hubs,
+            routing_profile=args.routing_profile,
+            config=config,
+            workers=args.workers,
+        )
+    elif args.command == "shard":
+        return shard_network(
+            input_path=args.input,
+            output_dir=args.output_dir,
+            tile_size=args.tile_size,
+        )
+    elif args.command == "compact-routing":
+        return compact_routing(
+            input_path=args.input,
+            output=args.output,
+            routing_profile=args.routing_profile,
+            drop_excluded=args.drop_excluded,
+            config=config,
         )
     else:
         parser.print_help()
         return 0
 
 
+def main() -> int:
+    """Main entry point for the CLI tool."""
+    parser = create_parser()
+    args = parser.parse_args()
+
+    # Setup logging
+    setup_logging(verbose=args.verbose)
+
+    # Load configuration
+    config = load_config(args.config)
+
+    profile_dir = args.profile_dir or Path(config.get("data_root", "./data")) / "profiles"
+    with profiled_run(args.command or "help", enabled=args.profile, output_dir=profile_dir):
+        return run_command(parser, args, config)
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark GraphML compression: file size vs. save and load time.
+
+Writes the input graph once per format (plain, .gz and, if the zstandard
+package is installed, .zst) into a scratch folder and reports the size,
+compression ratio and the best of N save/load timings.
+
+Example:
+  python scripts/bench_graphml_compression.py --graph ./data/master/merged.graphml --repeat 3
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Make the repository root importable for the shared map_tool helpers
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from map_tool import add_profile_arguments, load_graph, profile_phase, profiled_run, save_graph, zstandard  # noqa: E402
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(args):
+    with profile_phase("load_graph"):
+        G = load_graph(args.graph)
+    print(f"Graph: {args.graph} ({G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges)")
+
+    suffixes = [".graphml", ".graphml.gz"]
+    if zstandard is not None:
+        suffixes.append(".graphml.zst")
+    else:
+        print("zstandard not installed; skipping .graphml.zst")
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+        rows = []
+        for suffix in suffixes:
+            path = Path(tmp) / f"bench{suffix}"
+            with profile_phase(f"save{suffix}"):
+                save_s = best_time(lambda: save_graph(G, path), args.repeat)
+            with profile_phase(f"load{suffix}"):
+                load_s = best_time(lambda: load_graph(path), args.repeat)
+            rows.append((suffix, path.stat().st_size, save_s, load_s))
+
+    plain_size = rows[0][1]
+    print()
+    print(f"  {'Format':<14} {'Size (MB)':>10} {'Ratio':>7} {'Save (s)':>9} {'Load (s)':>9}")
+    print("  " + "-" * 52)
+    for suffix, size, save_s, load_s in rows:
+        print(f"  {suffix:<14} {size / 1e6:>10.2f} {plain_size / size:>6.1f}x {save_s:>9.2f} {load_s:>9.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark compressed GraphML size vs. save/load time")
+    ap.add_argument("--graph", required=True, help="GraphML file to benchmark (plain or compressed)")
+    ap.add_argument("--repeat", type=int, default=3, help="Timings per format; the best is reported (default: 3)")
+    ap.add_argument("--workdir", help="Scratch folder for the written files (default: system temp)")
+    add_profile_arguments(ap)
+    args = ap.parse_args()
+
+    with profiled_run("bench_graphml_compression", enabled=args.profile, output_dir=args.profile_dir):
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
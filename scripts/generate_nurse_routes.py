@@ -2,7 +2,8 @@
 """Generate mock routes for nurses using a merged OSMnx GraphML.
 
 Creates N nurses and assigns M routes each to random patient nodes.
-Saves a CSV summary and prints details to stdout.
+Routes are streamed to a CSV summary (or Parquet/Arrow with full node paths)
+as they are computed and details are printed to stdout.
 
 Usage:
   python scripts/generate_nurse_routes.py --graph ./data/master/merged.graphml \
@@ -10,13 +11,51 @@ Usage:
 """
 import argparse
 import csv
+import json
+import math
+import multiprocessing
+import os
 import random
 import sys
 import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import networkx as nx
-import osmnx as ox
+import numpy as np
+
+# Make the repository root importable for the shared map_tool helpers
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from map_tool import (  # noqa: E402
+    DEFAULT_ROUTE_CACHE_MB,
+    DEFAULT_SKETCH_K,
+    ROUTABLE_CUTOFF,
+    ComponentIndex,
+    NodeIndex,
+    RouteCache,
+    StreamingStats,
+    add_profile_arguments,
+    apply_edge_sidecar,
+    compile_routing_profiles,
+    contracted_node_coords,
+    expand_compact_path,
+    file_fingerprint,
+    is_shard_index,
+    load_component_index,
+    load_config,
+    load_hub_tables,
+    load_node_index,
+    load_region,
+    load_routing_graph,
+    profile_digest,
+    profile_phase,
+    profiled_run,
+    route_graph_hash,
+    routing_weight_attr,
+)
+
 try:
     import folium
 except Exception:
@@ -27,6 +66,28 @@ try:
 except Exception:
     psutil = None
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+    pq = None
+
+# Columns written for every route, in output order
+ROUTE_FIELDS = [
+    "route_id",
+    "nurse_id",
+    "origin",
+    "destination",
+    "origin_lat",
+    "origin_lon",
+    "dest_lat",
+    "dest_lon",
+    "nodes_in_path",
+    "length_km",
+    "travel_min",
+]
+
 
 def ensure_numeric_edge_attrs(G, attrs=("length", "travel_time")):
     """Ensure listed edge attributes are numeric (float) when possible."""
@@ -55,8 +116,10 @@ def memory_report(prefix: str = "") -> None:
         return
 
 
-def select_valid_nodes(G, count, min_degree=1, seed=None):
-    nodes = [n for n, d in G.degree() if d >= min_degree]
+def select_valid_nodes(index, count, min_degree=1, seed=None, pool=None):
+    """Sample count node indices with at least min_degree, optionally only where the pool mask is set."""
+    with profile_phase("select_nodes"):
+        nodes = index.valid(min_degree, pool).tolist()
     if seed is not None:
         random.seed(seed)
     if count > len(nodes):
@@ -64,7 +127,12 @@ def select_valid_nodes(G, count, min_degree=1, seed=None):
     return random.sample(nodes, count)
 
 
-def route_summary(G, path, weight_attr="length"):
+def route_summary(G, path, weight_attr="length", choose_by=None):
+    """Sum weight_attr along path.
+
+    Between parallel edges the first key is used, or the edge with the lowest
+    `choose_by` value (the routing weight) when given.
+    """
     total = 0.0
     for u, v in zip(path[:-1], path[1:]):
         # for MultiDiGraph find an edge between u->v and sum weight
@@ -77,7 +145,10 @@ def route_summary(G, path, weight_attr="length"):
             # choose the first key
             if isinstance(data, dict):
                 # values are keyed by edge-key
-                first = next(iter(data.values()))
+                if choose_by is None:
+                    first = next(iter(data.values()))
+                else:
+                    first = min(data.values(), key=lambda d: d.get(choose_by, float("inf")))
                 val = first.get(weight_attr, 0)
                 try:
                     total += float(val)
@@ -86,409 +157,1015 @@ def route_summary(G, path, weight_attr="length"):
     return total
 
 
-def main():
+class CsvRouteWriter:
+    """Stream route rows to CSV, flushing every `flush_every` rows."""
+
+    def __init__(self, path, flush_every=1000):
+        self.path = Path(path)
+        self.flush_every = max(1, flush_every)
+        self.count = 0
+        self._fh = self.path.open("w", newline="")
+        self._writer = csv.DictWriter(self._fh, fieldnames=ROUTE_FIELDS)
+        self._writer.writeheader()
+
+    def write(self, row, path):
+        # the CSV summary does not carry full node paths
+        self._writer.writerow(row)
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+class ArrowRouteWriter:
+    """Stream route rows to Parquet or an Arrow IPC stream in record batches.
+
+    Full node paths are stored as a list<int64> column. Each batch of
+    `flush_every` routes becomes one Parquet row group / one Arrow record
+    batch. Arrow streams stay readable up to the last completed batch after a
+    crash; Parquet files need `close()` to write their footer.
+    """
+
+    def __init__(self, path, fmt="parquet", flush_every=1000):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for Parquet/Arrow output. pip install pyarrow")
+        self.path = Path(path)
+        self.fmt = fmt
+        self.flush_every = max(1, flush_every)
+        self.count = 0
+        self.schema = pa.schema([
+            ("route_id", pa.int64()),
+            ("nurse_id", pa.dictionary(pa.int32(), pa.string())),
+            ("origin", pa.int64()),
+            ("destination", pa.int64()),
+            ("origin_lat", pa.float64()),
+            ("origin_lon", pa.float64()),
+            ("dest_lat", pa.float64()),
+            ("dest_lon", pa.float64()),
+            ("nodes_in_path", pa.int32()),
+            ("length_km", pa.float64()),
+            ("travel_min", pa.float64()),
+            ("path", pa.list_(pa.int64())),
+        ])
+        self._columns = {name: [] for name in self.schema.names}
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(str(self.path), self.schema)
+        else:
+            self._sink = pa.OSFile(str(self.path), "wb")
+            self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    def write(self, row, path):
+        for name in ROUTE_FIELDS:
+            self._columns[name].append(row[name])
+        self._columns["path"].append(path)
+        self.count += 1
+        if len(self._columns["route_id"]) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._columns["route_id"]:
+            return
+        batch = pa.RecordBatch.from_pydict(self._columns, schema=self.schema)
+        self._writer.write_batch(batch)
+        if self.fmt != "parquet":
+            self._sink.flush()
+        self._columns = {name: [] for name in self.schema.names}
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        if self.fmt != "parquet":
+            self._sink.close()
+
+
+def open_route_writer(path, fmt="auto", flush_every=1000):
+    """Open a streaming route writer; `auto` picks the format from the suffix."""
+    path = Path(path)
+    if fmt == "auto":
+        suffix = path.suffix.lower()
+        if suffix == ".parquet":
+            fmt = "parquet"
+        elif suffix in (".arrow", ".arrows", ".feather"):
+            fmt = "arrow"
+        else:
+            fmt = "csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "csv":
+        return CsvRouteWriter(path, flush_every=flush_every)
+    return ArrowRouteWriter(path, fmt=fmt, flush_every=flush_every)
+
+
+def node_latlon(G, n):
+    """Return (lat, lon) floats for node n, or None if unavailable.
+
+    Nodes contracted away in a compact routing graph are looked up in
+    G.graph["contracted_coords"].
+    """
+    if n not in G:
+        xy = G.graph.get("contracted_coords", {}).get(n)
+        return (float(xy[1]), float(xy[0])) if xy else None
+    nd = G.nodes[n]
+    # OSMnx stores lon in 'x' and lat in 'y'
+    lon = nd.get("x")
+    lat = nd.get("y")
+    try:
+        return float(lat), float(lon)
+    except Exception:
+        return None
+
+
+def add_legend(m, title, entries):
+    """Add a simple fixed-position legend of (label, color) entries to map m."""
+    legend_html = "<div style='position: fixed; bottom: 50px; left: 50px; z-index:9999; background: white; padding: 8px; border:1px solid #ccc;'>"
+    legend_html += f"<b>{title}</b><br>"
+    for label, col in entries:
+        legend_html += f"<span style='display:inline-block;width:12px;height:12px;background:{col};margin-right:6px;'></span>{label}<br>"
+    legend_html += "</div>"
+    m.get_root().html.add_child(folium.Element(legend_html))
+
+
+def render_route_map(G, map_routes, map_out):
+    """Draw one PolyLine and a marker pair per route."""
+    # compute map center from used nodes
+    used_nodes = set()
+    for _, _, path, _, _ in map_routes:
+        used_nodes.update(path[:1])
+        used_nodes.update(path[-1:])
+
+    coords = [node_latlon(G, n) for n in used_nodes]
+    coords = [c for c in coords if c]
+    if not coords:
+        print("Could not determine node coordinates; skipping map generation")
+        return
+
+    avg_lat = sum(c[0] for c in coords) / len(coords)
+    avg_lon = sum(c[1] for c in coords) / len(coords)
+
+    m = folium.Map(location=[avg_lat, avg_lon], tiles="cartodbpositron", zoom_start=12)
+
+    # color palette for nurses
+    colors = ["blue", "green", "red", "purple", "orange", "darkred", "cadetblue"]
+    nurse_colors = {}
+
+    for rid, nurse_id, path, length_km, time_min in map_routes:
+        if nurse_id not in nurse_colors:
+            nurse_colors[nurse_id] = colors[len(nurse_colors) % len(colors)]
+        color = nurse_colors[nurse_id]
+
+        # convert node path to latlon list
+        latlons = []
+        for n in path:
+            ll = node_latlon(G, n)
+            if ll:
+                latlons.append([ll[0], ll[1]])
+
+        if latlons:
+            folium.PolyLine(latlons, color=color, weight=4, opacity=0.8,
+                            tooltip=f"{nurse_id} route {rid}: {length_km:.2f} km, {time_min:.1f} min").add_to(m)
+
+            # add markers for origin and destination
+            folium.CircleMarker(latlons[0], radius=4, color=color, fill=True,
+                                popup=f"{nurse_id} origin {rid}").add_to(m)
+            folium.Marker(latlons[-1], icon=folium.Icon(color=color),
+                          popup=f"{nurse_id} dest {rid}<br>{length_km:.2f} km, {time_min:.1f} min").add_to(m)
+
+    add_legend(m, "Nurse colors", nurse_colors.items())
+
+    map_out.parent.mkdir(parents=True, exist_ok=True)
+    with profile_phase("save_map"):
+        m.save(str(map_out))
+    print(f"Saved map to {map_out}")
+
+
+class EdgeUsage:
+    """Per-edge usage counts accumulated from route node paths.
+
+    Edges are counted undirected, so memory grows with the part of the network
+    covered by routes rather than with the number of routes. Origins and
+    destinations are counted per node for marker clustering.
+    """
+
+    def __init__(self):
+        self.edges = {}
+        self.origins = {}
+        self.destinations = {}
+        self.routes = 0
+
+    def add(self, path):
+        if not path:
+            return
+        self.routes += 1
+        edges = self.edges
+        for u, v in zip(path[:-1], path[1:]):
+            key = (u, v) if u < v else (v, u)
+            edges[key] = edges.get(key, 0) + 1
+        self.origins[path[0]] = self.origins.get(path[0], 0) + 1
+        self.destinations[path[-1]] = self.destinations.get(path[-1], 0) + 1
+
+
+def usage_class(count):
+    """Bucket a usage count on a log2 scale: 1, 2-3, 4-7, 8-15, ..."""
+    return count.bit_length() - 1
+
+
+def merge_edge_chains(edges):
+    """Merge undirected (u, v) edges into maximal node chains.
+
+    Chains break at nodes whose degree within `edges` is not 2, so each
+    returned node list is a simple path (or a closed loop).
+    """
+    adjacency = {}
+    for u, v in edges:
+        adjacency.setdefault(u, []).append(v)
+        adjacency.setdefault(v, []).append(u)
+
+    visited = set()
+    chains = []
+
+    def walk(start, nxt):
+        chain = [start, nxt]
+        visited.add((start, nxt) if start < nxt else (nxt, start))
+        prev, cur = start, nxt
+        while len(adjacency[cur]) == 2:
+            a, b = adjacency[cur]
+            step = b if a == prev else a
+            key = (cur, step) if cur < step else (step, cur)
+            if key in visited:
+                break
+            visited.add(key)
+            chain.append(step)
+            prev, cur = cur, step
+        return chain
+
+    # open chains start at endpoints and junctions
+    for node, neighbours in adjacency.items():
+        if len(neighbours) != 2:
+            for nxt in neighbours:
+                key = (node, nxt) if node < nxt else (nxt, node)
+                if key not in visited:
+                    chains.append(walk(node, nxt))
+    # whatever is left consists of closed loops
+    for u, v in edges:
+        key = (u, v) if u < v else (v, u)
+        if key not in visited:
+            chains.append(walk(u, v))
+    return chains
+
+
+def render_usage_map(G, usage, map_out, tolerance=10.0):
+    """Draw aggregated edge usage with simplified geometry and clustered markers.
+
+    Edges are grouped into log2 usage classes, merged into chains per class,
+    simplified with a Douglas-Peucker tolerance (meters) and emitted as one
+    multi-line PolyLine per class. Destinations are drawn with a
+    FastMarkerCluster, so the HTML size tracks network coverage rather than
+    the number of routes.
+    """
+    from folium.plugins import FastMarkerCluster
+    from shapely.geometry import LineString
+
+    by_class = {}
+    for edge, count in usage.edges.items():
+        by_class.setdefault(usage_class(count), []).append(edge)
+
+    endpoint_coords = [node_latlon(G, n) for n in usage.origins]
+    endpoint_coords = [c for c in endpoint_coords if c]
+    if not endpoint_coords:
+        print("Could not determine node coordinates; skipping map generation")
+        return
+    avg_lat = sum(c[0] for c in endpoint_coords) / len(endpoint_coords)
+    avg_lon = sum(c[1] for c in endpoint_coords) / len(endpoint_coords)
+
+    m = folium.Map(location=[avg_lat, avg_lon], tiles="cartodbpositron", zoom_start=11)
+
+    # tolerance in degrees of latitude (~111 km per degree)
+    tolerance_deg = tolerance / 111_000.0
+    palette = ["#9ecae1", "#6baed6", "#4292c6", "#2171b5", "#08519c", "#08306b", "#54278f", "#3f007d"]
+    legend = []
+    for cls in sorted(by_class):
+        lines = []
+        for chain in merge_edge_chains(by_class[cls]):
+            coords = [node_latlon(G, n) for n in chain]
+            coords = [c for c in coords if c]
+            if len(coords) < 2:
+                continue
+            simplified = LineString(coords).simplify(tolerance_deg, preserve_topology=False)
+            lines.append([[round(lat, 5), round(lon, 5)] for lat, lon in simplified.coords])
+        if not lines:
+            continue
+        color = palette[min(cls, len(palette) - 1)]
+        low, high = 2 ** cls, 2 ** (cls + 1) - 1
+        label = f"{low} route{'s' if low > 1 else ''}" if low == high else f"{low}-{high} routes"
+        folium.PolyLine(lines, color=color, weight=2 + cls, opacity=0.8, tooltip=label).add_to(m)
+        legend.append((label, color))
+
+    # origins are few (hubs / nurse starts); destinations are clustered client-side
+    for n, count in usage.origins.items():
+        ll = node_latlon(G, n)
+        if ll:
+            folium.CircleMarker(ll, radius=6, color="black", fill=True,
+                                popup=f"origin {n}<br>{count} routes").add_to(m)
+    dest_points = []
+    for n, count in usage.destinations.items():
+        ll = node_latlon(G, n)
+        if ll:
+            dest_points.append([round(ll[0], 5), round(ll[1], 5), count])
+    if dest_points:
+        FastMarkerCluster(
+            dest_points,
+            callback=(
+                "function (row) {"
+                " var marker = L.marker(new L.LatLng(row[0], row[1]));"
+                " marker.bindPopup(row[2] + ' visit(s)');"
+                " return marker; }"
+            ),
+        ).add_to(m)
+
+    add_legend(m, f"Edge usage ({usage.routes} routes)", legend)
+
+    map_out.parent.mkdir(parents=True, exist_ok=True)
+    with profile_phase("save_map"):
+        m.save(str(map_out))
+    print(f"Saved aggregated map ({len(usage.edges)} edges, {len(dest_points)} destinations) to {map_out}")
+
+
+# Distributions aggregated over all simulated days, and per hub
+SIM_METRICS = ("route_min", "route_km", "nurse_day_min", "hub_day_min", "day_patients")
+SIM_HUB_METRICS = ("route_min", "day_min")
+
+# Days per simulation task; fixed so summaries do not depend on --workers
+DEFAULT_SCENARIO_CHUNK = 64
+
+# Per-hub arrays shared with simulation worker processes
+_SIMULATION = None
+
+
+def print_distribution_table(title, label, rows):
+    """Print count, mean, p50/p90/p99 and max of (name, StreamingStats) rows."""
+    print(f"\n{title}:")
+    print(f"  {label:<15} {'Count':>12} {'Mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'Max':>9}")
+    for name, stats in rows:
+        s = stats.summary()
+        if not s["count"]:
+            print(f"  {name:<15} {0:>12,}")
+            continue
+        print(f"  {name:<15} {s['count']:>12,} {s['mean']:>9.2f} {s['p50']:>9.2f} {s['p90']:>9.2f} "
+              f"{s['p99']:>9.2f} {s['max']:>9.2f}")
+
+
+def simulation_stats(nurses, seed=0):
+    """Empty overall, per-hub and per-nurse summaries for nurses[h] nurses at hub h.
+
+    Every sketch compacts with seed, so a chunk's summaries depend only
+    on its days.
+    """
+    return {
+        "overall": {name: StreamingStats(seed=seed) for name in SIM_METRICS},
+        "hubs": [{name: StreamingStats(seed=seed) for name in SIM_HUB_METRICS} for _ in nurses],
+        "nurses": [[StreamingStats(seed=seed) for _ in range(n)] for n in nurses],
+    }
+
+
+def merge_simulation_stats(total, part):
+    """Fold the summaries of one chunk of days into total."""
+    for name, stats in part["overall"].items():
+        total["overall"][name].merge(stats)
+    for mine, theirs in zip(total["hubs"], part["hubs"]):
+        for name, stats in theirs.items():
+            mine[name].merge(stats)
+    for mine, theirs in zip(total["nurses"], part["nurses"]):
+        for a, b in zip(mine, theirs):
+            a.merge(b)
+
+
+def _init_simulation_worker(simulation):
+    global _SIMULATION
+    _SIMULATION = simulation
+
+
+def simulate_scenarios(seeds):
+    """Simulate one day per seed from the shared per-hub arrays.
+
+    Each hub draws a Poisson number of patients from its candidate nodes;
+    they are handed round-robin to the hub's nurses. Travel times and
+    lengths are array lookups, so no search runs per scenario.
+
+    Returns:
+        (rows, stats): one summary row per scenario and the mergeable
+        overall, per-hub and per-nurse distributions (``simulation_stats``).
+    """
+    sim = _SIMULATION
+    stats = simulation_stats(sim["nurses"], seed=seeds[0] if len(seeds) else 0)
+    overall = stats["overall"]
+    rows = []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        row = {"seed": seed, "patients": 0, "unreachable": 0, "total_travel_min": 0.0,
+               "max_route_min": 0.0, "max_nurse_day_min": 0.0}
+        for h, candidates in enumerate(sim["candidates"]):
+            want = min(int(rng.poisson(sim["mean_patients"])), len(candidates))
+            drawn = rng.choice(candidates, size=want, replace=False)
+            minutes = sim["time_s"][h][drawn] / 60.0
+            reached = np.isfinite(minutes)
+            minutes = minutes[reached]
+            km = sim["length_m"][h][drawn][reached] / 1000.0
+            nurses = sim["nurses"][h]
+            nurse_min = np.bincount(np.arange(len(minutes)) % nurses, weights=minutes, minlength=nurses)
+
+            overall["route_min"].update(minutes)
+            overall["route_km"].update(km)
+            overall["nurse_day_min"].update(nurse_min)
+            overall["hub_day_min"].add(minutes.sum())
+            stats["hubs"][h]["route_min"].update(minutes)
+            stats["hubs"][h]["day_min"].add(minutes.sum())
+            for nurse_stats, value in zip(stats["nurses"][h], nurse_min.tolist()):
+                nurse_stats.add(value)
+            row["patients"] += want
+            row["unreachable"] += int((~reached).sum())
+            row["total_travel_min"] += float(minutes.sum())
+            row["max_route_min"] = max(row["max_route_min"], float(minutes.max(initial=0.0)))
+            row["max_nurse_day_min"] = max(row["max_nurse_day_min"], float(nurse_min.max(initial=0.0)))
+        overall["day_patients"].add(row["patients"])
+        row["total_travel_min"] = round(row["total_travel_min"], 2)
+        row["max_route_min"] = round(row["max_route_min"], 2)
+        row["max_nurse_day_min"] = round(row["max_nurse_day_min"], 2)
+        rows.append(row)
+    return rows, stats
+
+
+def run_simulation(args, G, node_index, edge_costs, pool):
+    """Monte Carlo mode: many simulated days over fixed hubs and nurses.
+
+    One search per hub is shared by every scenario; scenarios run in
+    chunks on worker processes and only per-scenario rows and mergeable
+    StreamingStats summaries come back, so memory does not grow with the
+    route count.
+    """
+    hubs = args.hubs if args.hubs > 0 else 1
+    if args.patients <= 0:
+        print("--simulate needs --patients (mean patients per day across all hubs)")
+        sys.exit(2)
+    if args.nurses < hubs:
+        print("--simulate needs at least one nurse per hub")
+        sys.exit(2)
+
+    hub_nodes = select_valid_nodes(node_index, hubs, seed=args.seed, pool=pool)
+    nurses = [args.nurses // hubs + (1 if i < args.nurses % hubs else 0) for i in range(hubs)]
+
+    # travel time and length from each hub to every node, summed along the
+    # search tree over the edges the routing weight picks
+    with profile_phase("edge_costs"):
+        time_costs = node_index.edge_costs(G, "travel_time")
+        length_costs = node_index.edge_costs(G, "length")
+    time_s, length_m, candidates = [], [], []
+    shared_candidates = node_index.valid(1, pool)
+    cluster_radius_km = float(args.cluster_radius or 0.0)
+    for hub in hub_nodes:
+        with profile_phase("hub_search"):
+            dist, pred = node_index.dijkstra(hub, edge_costs, cutoff=ROUTABLE_CUTOFF)
+            time_s.append(node_index.tree_totals(dist, pred, edge_costs, time_costs).astype(np.float32))
+            length_m.append(node_index.tree_totals(dist, pred, edge_costs, length_costs).astype(np.float32))
+        nearby = node_index.within_km(hub, cluster_radius_km, pool) if cluster_radius_km > 0 else shared_candidates
+        candidates.append(nearby if len(nearby) else shared_candidates)
+
+    simulation = {
+        "candidates": candidates,
+        "time_s": time_s,
+        "length_m": length_m,
+        "nurses": nurses,
+        "mean_patients": args.patients / hubs,
+    }
+    first_seed = args.scenario_seed if args.scenario_seed is not None else args.seed
+    seeds = range(first_seed, first_seed + args.simulate)
+    workers = min(args.workers or os.cpu_count() or 1, len(seeds))
+    # chunks and their merge order (seed order) do not depend on the worker count,
+    # so neither do the sketch quantiles
+    chunk = args.scenario_chunk or DEFAULT_SCENARIO_CHUNK
+    chunks = [seeds[i:i + chunk] for i in range(0, len(seeds), chunk)]
+    print(f"Simulating {len(seeds):,} days (seeds {seeds[0]}..{seeds[-1]}) over {hubs} hub(s), "
+          f"{args.nurses} nurses, {simulation['mean_patients']:.1f} patients/hub/day on {workers} worker(s)")
+
+    outp = Path(args.output)
+    outp.parent.mkdir(parents=True, exist_ok=True)
+    totals = simulation_stats(nurses, seed=first_seed)
+    scenario = 0
+    with open(outp, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["scenario", "seed", "patients", "unreachable", "total_travel_min",
+                                               "max_route_min", "max_nurse_day_min"])
+        writer.writeheader()
+
+        def collect(result):
+            nonlocal scenario
+            rows, stats = result
+            for row in rows:
+                scenario += 1
+                writer.writerow({"scenario": scenario, **row})
+            merge_simulation_stats(totals, stats)
+
+        with profile_phase("simulate"):
+            if workers == 1:
+                _init_simulation_worker(simulation)
+                for seeds_chunk in chunks:
+                    collect(simulate_scenarios(seeds_chunk))
+            else:
+                # a bounded window of chunks in flight keeps results in seed order
+                context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                         initializer=_init_simulation_worker, initargs=(simulation,)) as executor:
+                    in_flight = deque()
+                    for seeds_chunk in chunks:
+                        in_flight.append(executor.submit(simulate_scenarios, seeds_chunk))
+                        if len(in_flight) >= 2 * workers:
+                            collect(in_flight.popleft().result())
+                    while in_flight:
+                        collect(in_flight.popleft().result())
+
+    hub_ids = node_index.node_ids(hub_nodes)
+    # nurses are numbered hub by hub, as in route mode
+    nurse_names = [(f"nurse_{i + 1}", hub) for i, hub in enumerate(h for h, count in zip(hub_ids, nurses) for _ in range(count))]
+    nurse_totals = [stats for per_hub in totals["nurses"] for stats in per_hub]
+    print_distribution_table("SIMULATED DISTRIBUTIONS", "Metric", totals["overall"].items())
+    print_distribution_table("ROUTE MINUTES PER HUB", "Hub", zip(map(str, hub_ids), (t["route_min"] for t in totals["hubs"])))
+    print_distribution_table("DAILY MINUTES PER HUB", "Hub", zip(map(str, hub_ids), (t["day_min"] for t in totals["hubs"])))
+    print_distribution_table("DAILY MINUTES PER NURSE", "Nurse", zip((n for n, _ in nurse_names), nurse_totals))
+
+    summary_path = outp.with_suffix(".summary.json")
+    with open(summary_path, "w") as f:
+        json.dump({
+            "scenarios": len(seeds),
+            "seeds": [seeds[0], seeds[-1]],
+            "hubs": hub_ids,
+            "nurses_per_hub": nurses,
+            "mean_patients_per_hub": simulation["mean_patients"],
+            # p50/p90/p99 are KLL estimates; they are reproducible for a given seed range
+            # and chunk size, but another --scenario-chunk can shift them within the rank error
+            "quantiles": {
+                "method": "kll",
+                "k": DEFAULT_SKETCH_K,
+                "rank_error": round(1.7 / DEFAULT_SKETCH_K, 4),
+                "scenario_chunk": chunk,
+            },
+            # sketches let runs over other seed ranges be merged (StreamingStats.from_dict)
+            "metrics": {name: {**stats.summary(), "sketch": stats.to_dict()} for name, stats in totals["overall"].items()},
+            "per_hub": [
+                {"hub": hub, **{name: stats.summary() for name, stats in hub_stats.items()}}
+                for hub, hub_stats in zip(hub_ids, totals["hubs"])
+            ],
+            "per_nurse": [
+                {"nurse": name, "hub": hub, "day_min": stats.summary()}
+                for (name, hub), stats in zip(nurse_names, nurse_totals)
+            ],
+        }, f, indent=2)
+    print(f"Wrote {scenario:,} scenario rows to {outp} and distributions to {summary_path}")
+
+
+def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Generate mock nurse routes from merged graph")
-    p.add_argument("--graph", required=True, help="Path to merged GraphML file")
+    p.add_argument("--graph", required=True, help="Path to merged GraphML file or a shard index (map_tool.py shard)")
+    p.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                   help="With a shard index, load only the shards covering this bbox")
+    p.add_argument("--edge-sidecar", help="Apply speed_kph/travel_time from a recompute_travel_times.py --sidecar file")
+    p.add_argument("--routing-profile", help="Routing profile from config.json routing_profiles (e.g. nurse, nurse_winter)")
+    p.add_argument("--config", type=Path, help="Configuration JSON with routing_profiles (default: repository config.json)")
     p.add_argument("--nurses", type=int, default=2)
     p.add_argument("--routes-per", type=int, default=5)
     p.add_argument("--hubs", type=int, default=1, help="Number of hubs to place nurses at")
     p.add_argument("--patients", type=int, default=0, help="Number of patient homes to generate (if >0 overrides --routes-per logic)")
     p.add_argument("--cluster-radius", type=float, default=0.0, help="Cluster radius in km around hubs for patient generation (0 = global random)")
     p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--main-component", action="store_true",
+                   help="Sample hubs, nurses and patients only from the largest strongly connected component")
     p.add_argument("--output", default="./data/routes_summary.csv")
-    p.add_argument("--map-output", default="./data/routes_map.html", help="Optional HTML map output (requires folium)")
+    p.add_argument("--output-format", choices=["auto", "csv", "parquet", "arrow"], default="auto",
+                   help="Route output format; parquet/arrow also store full node paths (default: from --output suffix)")
+    p.add_argument("--flush-every", type=int, default=1000, help="Flush streamed routes to disk every N routes")
+    p.add_argument("--map-output", default="./data/routes_map.html", help="Optional HTML map output (requires folium; empty string to skip)")
+    p.add_argument("--map-mode", choices=["auto", "routes", "aggregate"], default="auto",
+                   help="Draw one line per route, or aggregated per-edge usage with clustered markers "
+                        "(auto: per-route up to --map-max-routes)")
+    p.add_argument("--map-max-routes", type=int, default=200, help="Route count above which auto mode aggregates (default: 200)")
+    p.add_argument("--map-simplify-m", type=float, default=10.0,
+                   help="Geometry simplification tolerance in meters for aggregated maps (default: 10)")
+    p.add_argument("--hub-tables", action="store_true",
+                   help="Answer hub -> patient routes from persisted distance/predecessor tables "
+                        "(map_tool.py hub-tables); missing hubs are computed and stored")
+    p.add_argument("--route-cache", help="SQLite route cache reused across runs (e.g. ./data/route_cache.sqlite)")
+    p.add_argument("--route-cache-mb", type=int, default=DEFAULT_ROUTE_CACHE_MB,
+                   help=f"Size cap of the route cache in MB; least recently used routes are evicted (default: {DEFAULT_ROUTE_CACHE_MB})")
+    p.add_argument("--simulate", type=int, metavar="N",
+                   help="Monte Carlo mode: simulate N days of Poisson patient draws per hub (mean --patients/--hubs) "
+                        "and write per-day rows plus aggregated distributions instead of routes")
+    p.add_argument("--scenario-seed", type=int, help="First scenario seed; days use seeds S..S+N-1 (default: --seed)")
+    p.add_argument("--scenario-chunk", type=int,
+                   help=f"Scenarios per worker task (default: {DEFAULT_SCENARIO_CHUNK}); quantiles are sketch estimates "
+                        "whose last digits can change with the chunk size, never with --workers")
+    p.add_argument("--workers", type=int,
+                   help="Worker processes for --simulate (default: CPU count; results do not depend on it)")
     p.add_argument("--mem-debug", action="store_true", help="Print memory usage at key steps (requires psutil)")
-    args = p.parse_args()
+    add_profile_arguments(p)
+    return p.parse_args(argv)
+
 
+def run(args):
     graph_path = Path(args.graph)
     if not graph_path.exists():
         print("Graph file not found:", graph_path)
         sys.exit(2)
 
-    print(f"Loading graph from {graph_path}...")
-    G = ox.load_graphml(graph_path)
+    sharded = is_shard_index(graph_path)
+    if sharded:
+        print(f"Loading region {args.bbox or 'all tiles'} from shard index {graph_path}...")
+        with profile_phase("load_graph"):
+            G = load_region(graph_path, bbox=args.bbox)
+        print(f"Loaded {len(G.graph['shard_tiles'])} shards: {G.number_of_nodes():,} nodes")
+    else:
+        if args.bbox:
+            print("--bbox requires --graph to be a shard index (see map_tool.py shard)")
+            sys.exit(2)
+        print(f"Loading graph from {graph_path}...")
+        with profile_phase("load_graph"):
+            G = load_routing_graph(graph_path)
+    compacted = bool(G.graph.get("routing_compacted"))
+    if compacted:
+        G.graph["contracted_coords"] = contracted_node_coords(G)
+        print(f"Compact routing graph: {len(G.graph['contracted_coords']):,} contracted nodes")
+
+    if args.edge_sidecar:
+        with profile_phase("apply_sidecar"):
+            updated = apply_edge_sidecar(G, Path(args.edge_sidecar))
+        print(f"Applied edge sidecar {args.edge_sidecar} to {updated:,} edges")
+
+    # nodes are numbered 0..N-1 once per graph; sampling, coordinate
+    # filters and searches work on arrays over that numbering
+    with profile_phase("node_index"):
+        node_index = NodeIndex.build(G) if sharded else load_node_index(G, graph_path)
+    node_ids = node_index.ids
 
     if args.mem_debug:
         memory_report("After loading graph")
 
     # normalize numeric edge attributes we will use
-    ensure_numeric_edge_attrs(G, attrs=("length", "travel_time"))
+    with profile_phase("numeric_attrs"):
+        ensure_numeric_edge_attrs(G, attrs=("length", "travel_time"))
 
     if args.mem_debug:
         memory_report("After ensure_numeric_edge_attrs")
 
     # choose weight preference
-    weight_attr = "travel_time" if any(
-        isinstance(v.get("travel_time"), (int, float)) and v.get("travel_time") > 0
-        for _, _, k, v in G.edges(keys=True, data=True)
-    ) else "length"
+    profile_spec = None
+    if args.routing_profile and compacted:
+        # tags were dropped by compaction; use the weights compiled into the graph
+        weight_attr = routing_weight_attr(args.routing_profile)
+        if not any(weight_attr in d for _, _, d in G.edges(data=True)):
+            print(f"Compact graph has no '{weight_attr}' weights; rebuild it with --routing-profile {args.routing_profile}")
+            sys.exit(2)
+    elif args.routing_profile:
+        profiles = load_config(args.config).get("routing_profiles", {})
+        profile_spec = profiles.get(args.routing_profile)
+        with profile_phase("compile_profile"):
+            compiled = compile_routing_profiles(G, profiles, names=[args.routing_profile])[args.routing_profile]
+        weight_attr = compiled["weight_attr"]
+        print(f"Routing profile '{args.routing_profile}': {compiled['excluded']:,} edges excluded")
+    else:
+        weight_attr = "travel_time" if any(
+            isinstance(v.get("travel_time"), (int, float)) and v.get("travel_time") > 0
+            for _, _, k, v in G.edges(keys=True, data=True)
+        ) else "length"
 
     print(f"Using weight attribute: {weight_attr}")
-
-    random.seed(args.seed)
-
-    rows = []
-    route_id = 0
-    route_paths = []
-
-    # If patients > 0, we'll generate per-patient routes: place hubs, assign nurses to hubs,
-    # pick patient home nodes, then assign each patient to the nearest nurse by travel time.
-    if args.patients and args.patients > 0:
-        hubs = args.hubs if args.hubs > 0 else 1
-        # select hub nodes
-        hub_nodes = select_valid_nodes(G, hubs, seed=args.seed)
-
-        # distribute nurses across hubs (as evenly as possible)
-        nurses = []
-        per_hub = args.nurses // hubs
-        remainder = args.nurses % hubs
-        nid = 1
-        for idx, hub in enumerate(hub_nodes):
-            count = per_hub + (1 if idx < remainder else 0)
-            for _ in range(count):
-                nurses.append((f"nurse_{nid}", hub))
-                nid += 1
-
-        # pick patient nodes
-        # If cluster radius given, sample patients around each hub within that radius (km)
-        cluster_radius_km = float(args.cluster_radius or 0.0)
-        patients = []
-
-        def haversine_km(a_lat, a_lon, b_lat, b_lon):
-            from math import radians, sin, cos, sqrt, asin
-            R = 6371.0
-            dlat = radians(b_lat - a_lat)
-            dlon = radians(b_lon - a_lon)
-            u = sin(dlat/2)**2 + cos(radians(a_lat))*cos(radians(b_lat))*sin(dlon/2)**2
-            return 2*R*asin(sqrt(u))
-
-        # build a quick node coordinate lookup
-        node_coords = {n: (d.get('y'), d.get('x')) for n, d in G.nodes(data=True)}
-
-        if cluster_radius_km > 0:
-            per_hub = args.patients // hubs
-            rem = args.patients % hubs
-            rng = random.Random(args.seed + 2)
-            for i, hub in enumerate(hub_nodes):
-                want = per_hub + (1 if i < rem else 0)
-                hub_latlon = node_coords.get(hub)
-                candidates = []
-                if hub_latlon:
-                    hlat, hlon = hub_latlon
-                    for n, (lat, lon) in node_coords.items():
-                        if lat is None or lon is None:
-                            continue
-                        if haversine_km(hlat, hlon, lat, lon) <= cluster_radius_km:
-                            candidates.append(n)
-                # fallback to global sampling if insufficient
-                if len(candidates) < want:
-                    all_nodes = [n for n, d in G.degree() if d >= 1]
-                    # choose nearest available or random if still short
-                    rng.shuffle(all_nodes)
-                    for n in all_nodes:
-                        if n not in candidates:
-                            candidates.append(n)
-                        if len(candidates) >= want:
-                            break
-
-                # sample without replacement
-                if want > len(candidates):
-                    sel = candidates[:]
-                else:
-                    sel = rng.sample(candidates, want)
-                patients.extend(sel)
+    with profile_phase("edge_costs"):
+        edge_costs = node_index.edge_costs(G, weight_attr)
+
+    # routes are cached per graph (file, region and sidecar) and profile
+    route_cache = None
+    if args.route_cache and not args.simulate:
+        with profile_phase("route_cache_open"):
+            graph_hash = route_graph_hash(
+                graph_path,
+                args.bbox if sharded else None,
+                Path(args.edge_sidecar) if args.edge_sidecar else None,
+            )
+            route_cache = RouteCache(args.route_cache, graph_hash, profile_digest(weight_attr, profile_spec),
+                                     max_bytes=args.route_cache_mb << 20)
+
+    # component labels are persisted next to the graph, so unreachable
+    # origin/destination pairs are rejected without a search
+    component_weight = weight_attr if args.routing_profile else None
+    with profile_phase("components"):
+        if sharded:
+            # regions differ per bbox, so their labels are not persisted
+            components = ComponentIndex.build(G, weight=component_weight)
         else:
-            patients = select_valid_nodes(G, args.patients, seed=args.seed + 2)
+            components = load_component_index(G, graph_path, weight=component_weight)
+    main_nodes = components.main_component_nodes()
+    print(f"{len(components):,} strongly connected components; main component has "
+          f"{len(main_nodes):,} of {G.number_of_nodes():,} nodes")
+    pool = node_index.mask(main_nodes) if args.main_component else None
 
-        print(f"Placing {len(nurses)} nurses across {len(hub_nodes)} hubs; {len(patients)} patients")
+    random.seed(args.seed)
 
-        if args.mem_debug:
-            memory_report("After selecting hubs/nurses/patients")
+    if args.simulate:
+        run_simulation(args, G, node_index, edge_costs, pool)
+        return
 
-        # For efficiency, process each nurse separately: single-source Dijkstra per nurse
-        total_patients = len(patients)
-        print("Computing routes nurse-by-nurse (single-source Dijkstra)...")
+    # Routes are streamed to disk as they are computed; only the running
+    # statistics (and compact node paths when a map will be drawn) are kept.
+    outp = Path(args.output)
+    writer = open_route_writer(outp, fmt=args.output_format, flush_every=args.flush_every)
+    length_stats = StreamingStats()
+    time_stats = StreamingStats()
+    # travel minutes per nurse and, when nurses start from hubs, per hub
+    nurse_stats = {}
+    hub_stats = {}
+    keep_paths = bool(args.map_output) and folium is not None
+    map_routes = []
+    # aggregated edge usage replaces per-route paths in aggregate mode, or in
+    # auto mode once more than --map-max-routes routes have been produced
+    usage = EdgeUsage() if keep_paths and args.map_mode == "aggregate" else None
+    route_id = 0
 
-        # simple round-robin assignment of patients to nurses
-        nurse_patient_lists = {nid: [] for nid, _ in nurses}
-        for idx, patient in enumerate(patients):
-            nurse_id, origin = nurses[idx % len(nurses)]
-            nurse_patient_lists[nurse_id].append(patient)
+    def add_map_route(route):
+        nonlocal usage
+        if usage is not None:
+            usage.add(route[2])
+            return
+        # keep the full path for mapping as a compact int64 array
+        map_routes.append(route)
+        if args.map_mode == "auto" and len(map_routes) > args.map_max_routes:
+            usage = EdgeUsage()
+            for _, _, p, _, _ in map_routes:
+                usage.add(p)
+            map_routes.clear()
+            print(f"More than {args.map_max_routes} routes; switching the map to aggregated edge usage")
+
+    def emit_route(nurse_id, origin, dest, path, indent="", cached=None):
+        nonlocal route_id
+
+        # compute metrics (cache hits carry them)
+        if cached is not None:
+            length_m, time_sec = cached["length_m"], cached["travel_s"]
+        else:
+            with profile_phase("route_metrics"):
+                length_m = route_summary(G, path, weight_attr="length", choose_by=weight_attr)
+                time_sec = route_summary(G, path, weight_attr="travel_time", choose_by=weight_attr)
+            if route_cache is not None:
+                with profile_phase("route_cache"):
+                    route_cache.put(origin, dest, path, length_m, time_sec)
+
+        length_km = (length_m or 0.0) / 1000.0
+        time_min = (time_sec or 0.0) / 60.0
+        # written and mapped paths always use original node IDs
+        path = expand_compact_path(G, path, weight=weight_attr)
+
+        # origin/destination coordinates (always present for written rows)
+        o_nd = G.nodes.get(origin, {})
+        d_nd = G.nodes.get(dest, {})
+        o_lat, o_lon = o_nd.get("y"), o_nd.get("x")
+        d_lat, d_lon = d_nd.get("y"), d_nd.get("x")
+
+        route_id += 1
+        row = {
+            "route_id": route_id,
+            "nurse_id": nurse_id,
+            "origin": origin,
+            "destination": dest,
+            "origin_lat": o_lat,
+            "origin_lon": o_lon,
+            "dest_lat": d_lat,
+            "dest_lon": d_lon,
+            "nodes_in_path": len(path),
+            "length_km": round(length_km, 3),
+            "travel_min": round(time_min, 2),
+        }
+        with profile_phase("write_routes"):
+            writer.write(row, path)
+        length_stats.add(length_km)
+        time_stats.add(time_min)
+        nurse_stats.setdefault(nurse_id, StreamingStats()).add(time_min)
+        if args.patients and args.patients > 0:
+            hub_stats.setdefault(origin, StreamingStats()).add(time_min)
+        if keep_paths:
+            add_map_route((route_id, nurse_id, array("q", path), length_km, time_min))
+        print(f"{indent}Route {route_id}: {nurse_id} {origin} -> {dest} | {length_km:.3f} km | {time_min:.2f} min")
 
-        for idx, (nurse_id, origin) in enumerate(nurses, start=1):
-            assigned_patients = nurse_patient_lists.get(nurse_id, [])
-            if not assigned_patients:
-                continue
+    try:
+        # If patients > 0, we'll generate per-patient routes: place hubs, assign nurses to hubs,
+        # pick patient home nodes, then assign each patient to the nearest nurse by travel time.
+        if args.patients and args.patients > 0:
+            hubs = args.hubs if args.hubs > 0 else 1
+            # select hub nodes (as node indices)
+            hub_nodes = select_valid_nodes(node_index, hubs, seed=args.seed, pool=pool)
+
+            # distribute nurses across hubs (as evenly as possible)
+            nurses = []
+            per_hub = args.nurses // hubs
+            remainder = args.nurses % hubs
+            nid = 1
+            for idx, hub in enumerate(hub_nodes):
+                count = per_hub + (1 if idx < remainder else 0)
+                for _ in range(count):
+                    nurses.append((f"nurse_{nid}", hub))
+                    nid += 1
+
+            # pick patient nodes
+            # If cluster radius given, sample patients around each hub within that radius (km)
+            cluster_radius_km = float(args.cluster_radius or 0.0)
+            patients = []
+
+            if cluster_radius_km > 0:
+                per_hub = args.patients // hubs
+                rem = args.patients % hubs
+                rng = random.Random(args.seed + 2)
+                for i, hub in enumerate(hub_nodes):
+                    want = per_hub + (1 if i < rem else 0)
+                    with profile_phase("cluster_candidates"):
+                        candidates = node_index.within_km(hub, cluster_radius_km, pool).tolist()
+                    # fallback to global sampling if insufficient
+                    if len(candidates) < want:
+                        all_nodes = node_index.valid(1, pool).tolist()
+                        # choose nearest available or random if still short
+                        rng.shuffle(all_nodes)
+                        seen = set(candidates)
+                        for n in all_nodes:
+                            if n not in seen:
+                                candidates.append(n)
+                                seen.add(n)
+                            if len(candidates) >= want:
+                                break
+
+                    # sample without replacement
+                    if want > len(candidates):
+                        sel = candidates[:]
+                    else:
+                        sel = rng.sample(candidates, want)
+                    patients.extend(sel)
+            else:
+                patients = select_valid_nodes(node_index, args.patients, seed=args.seed + 2, pool=pool)
+
+            print(f"Placing {len(nurses)} nurses across {len(hub_nodes)} hubs; {len(patients)} patients")
+
+            # one-to-all tables per hub replace the per-nurse searches
+            hub_tables = None
+            if args.hub_tables:
+                if sharded:
+                    print("--hub-tables requires --graph to be a GraphML file, not a shard index")
+                    sys.exit(2)
+                sidecar = file_fingerprint(args.edge_sidecar) if args.edge_sidecar else None
+                hub_tables = load_hub_tables(G, graph_path, node_index.node_ids(hub_nodes), weight_attr,
+                                             key=profile_digest(weight_attr, [profile_spec, sidecar]),
+                                             node_index=node_index)
+                print(f"Hub tables: {len(hub_tables.hubs)} hub(s) in {hub_tables.directory}")
 
-            print(f"Nurse {nurse_id}: origin {origin}, {len(assigned_patients)} patients")
             if args.mem_debug:
-                memory_report(f"Before Dijkstra for {nurse_id}")
+                memory_report("After selecting hubs/nurses/patients")
 
-            try:
-                lengths, paths = nx.single_source_dijkstra(G, origin, weight=weight_attr)
-            except Exception as e:
-                print(f"  Dijkstra failed for {nurse_id}: {e}")
-                continue
+            # For efficiency, process each nurse separately: single-source Dijkstra per nurse
+            print("Computing routes nurse-by-nurse (single-source Dijkstra)...")
 
-            if args.mem_debug:
-                memory_report(f"After Dijkstra for {nurse_id}")
+            # simple round-robin assignment of patients to nurses
+            nurse_patient_lists = {nid: [] for nid, _ in nurses}
+            for idx, patient in enumerate(patients):
+                nurse_id, origin = nurses[idx % len(nurses)]
+                nurse_patient_lists[nurse_id].append(patient)
 
-            for patient in assigned_patients:
-                path = paths.get(patient)
-                if not path:
-                    print(f"  No path to patient {patient} for {nurse_id}; skipping")
+            for idx, (nurse_id, origin) in enumerate(nurses, start=1):
+                assigned_patients = nurse_patient_lists.get(nurse_id, [])
+                if not assigned_patients:
                     continue
 
-                # compute metrics
-                if weight_attr == "length":
-                    length_m = route_summary(G, path, weight_attr="length")
-                    time_sec = route_summary(G, path, weight_attr="travel_time")
-                else:
-                    time_sec = route_summary(G, path, weight_attr="travel_time")
-                    length_m = route_summary(G, path, weight_attr="length")
-
-                length_km = (length_m or 0.0) / 1000.0
-                time_min = (time_sec or 0.0) / 60.0
-
-                # origin/destination coordinates (always present for written rows)
-                o_nd = G.nodes.get(origin, {})
-                d_nd = G.nodes.get(patient, {})
-                o_lat, o_lon = o_nd.get("y"), o_nd.get("x")
-                d_lat, d_lon = d_nd.get("y"), d_nd.get("x")
-
-                route_id += 1
-                rows.append({
-                    "route_id": route_id,
-                    "nurse_id": nurse_id,
-                    "origin": origin,
-                    "destination": patient,
-                    "origin_lat": o_lat,
-                    "origin_lon": o_lon,
-                    "dest_lat": d_lat,
-                    "dest_lon": d_lon,
-                    "nodes_in_path": len(path),
-                    "length_km": round(length_km, 3),
-                    "travel_min": round(time_min, 2),
-                })
-                route_paths.append((route_id, nurse_id, path, length_km, time_min))
-                print(f"  Route {route_id}: {nurse_id} {origin} -> {patient} | {length_km:.3f} km | {time_min:.2f} min")
-            if args.mem_debug:
-                memory_report(f"After processing patients for {nurse_id}")
+                # node IDs are only needed for output, the route cache and hub tables
+                origin_id = int(node_ids[origin])
+                print(f"Nurse {nurse_id}: origin {origin_id}, {len(assigned_patients)} patients")
+
+                # the search is skipped when every patient's route is cached
+                cached_routes = {}
+                if route_cache is not None:
+                    with profile_phase("route_cache"):
+                        for patient in assigned_patients:
+                            hit = route_cache.get(origin_id, int(node_ids[patient]))
+                            if hit is not None:
+                                cached_routes[patient] = hit
+
+                paths = {}
+                pending = [p for p in assigned_patients if p not in cached_routes]
+                if hub_tables is not None:
+                    with profile_phase("hub_table_paths"):
+                        paths = {p: hub_tables.path(origin_id, p) for p in pending}
+                        paths = {p: node_index.node_ids(path) for p, path in paths.items() if path}
+                elif pending:
+                    if args.mem_debug:
+                        memory_report(f"Before Dijkstra for {nurse_id}")
+
+                    # arrays over the node index replace networkx's per-node path dicts;
+                    # the search stops once every pending patient is settled
+                    with profile_phase("dijkstra"):
+                        dist, pred = node_index.dijkstra(origin, edge_costs, cutoff=ROUTABLE_CUTOFF, targets=pending)
+                    with profile_phase("paths"):
+                        paths = {p: node_index.node_ids(node_index.path(pred, p)) for p in pending if math.isfinite(dist[p])}
+
+                    if args.mem_debug:
+                        memory_report(f"After Dijkstra for {nurse_id}")
+
+                for patient in assigned_patients:
+                    patient_id = int(node_ids[patient])
+                    hit = cached_routes.get(patient)
+                    path = hit["path"] if hit is not None else paths.get(patient)
+                    if not path:
+                        print(f"  No path to patient {patient_id} for {nurse_id}; skipping")
+                        continue
+
+                    emit_route(nurse_id, origin_id, patient_id, path, indent="  ", cached=hit)
+
+                # make everything routed so far durable before the next nurse
+                writer.flush()
+                if args.mem_debug:
+                    memory_report(f"After processing patients for {nurse_id}")
 
-    else:
-        # fallback: previous behaviour (nurses origins sampled, routes per nurse)
-        nurse_origins = select_valid_nodes(G, args.nurses, seed=args.seed)
-        # prepare targets - pick a pool of candidate patient nodes
-        candidate_count = args.nurses * args.routes_per * 4
-        candidates = select_valid_nodes(G, candidate_count, seed=args.seed + 1)
-
-        max_attempts = 1000
-        for i, origin in enumerate(nurse_origins, start=1):
-            assigned = 0
-            attempts = 0
-            if args.mem_debug:
-                memory_report(f"Before routing for nurse_{i}")
-            while assigned < args.routes_per and attempts < max_attempts:
-                attempts += 1
-                dest = random.choice(candidates)
-                if dest == origin:
-                    continue
-                try:
-                    path = nx.shortest_path(G, origin, dest, weight=weight_attr)
-                except (nx.NetworkXNoPath, nx.NodeNotFound):
+        else:
+            # fallback: previous behaviour (nurses origins sampled, routes per nurse)
+            nurse_origins = select_valid_nodes(node_index, args.nurses, seed=args.seed, pool=pool)
+            # prepare targets - pick a pool of candidate patient nodes
+            candidate_count = args.nurses * args.routes_per * 4
+            candidates = select_valid_nodes(node_index, candidate_count, seed=args.seed + 1, pool=pool)
+
+            max_attempts = 1000
+            for i, origin in enumerate(nurse_origins, start=1):
+                assigned = 0
+                attempts = 0
+                if args.mem_debug:
+                    memory_report(f"Before routing for nurse_{i}")
+                origin_id = int(node_ids[origin])
+                reachable = [c for c in candidates if components.reachable(origin_id, int(node_ids[c]))]
+                if not reachable:
+                    print(f"nurse_{i}: origin {origin_id} cannot reach any candidate; skipping")
                     continue
+                while assigned < args.routes_per and attempts < max_attempts:
+                    attempts += 1
+                    dest = random.choice(reachable)
+                    if dest == origin:
+                        continue
+                    dest_id = int(node_ids[dest])
+                    hit = route_cache.get(origin_id, dest_id) if route_cache is not None else None
+                    if hit is not None:
+                        path = hit["path"]
+                    else:
+                        with profile_phase("shortest_path"):
+                            dist, pred = node_index.dijkstra(origin, edge_costs, cutoff=ROUTABLE_CUTOFF, targets=[dest])
+                        if not math.isfinite(dist[dest]):
+                            continue
+                        path = node_index.node_ids(node_index.path(pred, dest))
 
-                # compute metrics
-                if weight_attr == "length":
-                    length_m = route_summary(G, path, weight_attr="length")
-                    time_sec = route_summary(G, path, weight_attr="travel_time")
-                else:
-                    time_sec = route_summary(G, path, weight_attr="travel_time")
-                    length_m = route_summary(G, path, weight_attr="length")
-
-                length_km = (length_m or 0.0) / 1000.0
-                time_min = (time_sec or 0.0) / 60.0
-
-                # origin/destination coordinates (always present for written rows)
-                o_nd = G.nodes.get(origin, {})
-                d_nd = G.nodes.get(dest, {})
-                o_lat, o_lon = o_nd.get("y"), o_nd.get("x")
-                d_lat, d_lon = d_nd.get("y"), d_nd.get("x")
-
-                route_id += 1
-                rows.append({
-                    "route_id": route_id,
-                    "nurse_id": f"nurse_{i}",
-                    "origin": origin,
-                    "destination": dest,
-                    "origin_lat": o_lat,
-                    "origin_lon": o_lon,
-                    "dest_lat": d_lat,
-                    "dest_lon": d_lon,
-                    "nodes_in_path": len(path),
-                    "length_km": round(length_km, 3),
-                    "travel_min": round(time_min, 2),
-                })
-                # keep the full path for mapping
-                route_paths.append((route_id, f"nurse_{i}", path, length_km, time_min))
-                print(f"Route {route_id}: nurse_{i} {origin} -> {dest} | {length_km:.3f} km | {time_min:.2f} min")
-
-                assigned += 1
-
-    # Compute and print summary statistics for generated routes
-    def percentile(sorted_vals, p):
-        """Return percentile p (0..100) for sorted_vals using linear interpolation."""
-        if not sorted_vals:
-            return None
-        k = (len(sorted_vals) - 1) * (p / 100.0)
-        f = int(k)
-        c = f + 1
-        if c >= len(sorted_vals):
-            return float(sorted_vals[-1])
-        d0 = sorted_vals[f] * (c - k)
-        d1 = sorted_vals[c] * (k - f)
-        return float(d0 + d1)
-
-    lengths = [r[3] for r in route_paths]
-    times = [r[4] for r in route_paths]
-
-    if route_paths:
-        lengths_sorted = sorted(lengths)
-        times_sorted = sorted(times)
-
-        # print five stats: min, Q1, median, mean, Q3
-        stats = {
-            "min": lambda a: a[0],
-            "q1": lambda a: percentile(a, 25),
-            "median": lambda a: percentile(a, 50),
-            "mean": lambda a: (sum(a) / len(a)) if a else None,
-            "q3": lambda a: percentile(a, 75),
-        }
+                    emit_route(f"nurse_{i}", origin_id, dest_id, path, cached=hit)
 
-        order = ["min", "q1", "median", "mean", "q3"]
+                    assigned += 1
 
-        print("\nROUTE STATISTICS (km):")
-        print("  {:<8} {:>8}".format("Metric", "Value"))
-        for k in order:
-            v = stats[k](lengths_sorted)
-            if v is None:
-                print(f"  {k:<8} {'-':>8}")
-            else:
-                print(f"  {k:<8} {v:8.3f}")
-
-        print("\nROUTE STATISTICS (minutes):")
-        print("  {:<8} {:>8}".format("Metric", "Value"))
-        for k in order:
-            v = stats[k](times_sorted)
-            if v is None:
-                print(f"  {k:<8} {'-':>8}")
-            else:
-                print(f"  {k:<8} {v:8.2f}")
+                writer.flush()
+    finally:
+        writer.close()
+        if route_cache is not None:
+            route_cache.close()
+            print(f"Route cache {route_cache.path}: {route_cache.hits} hits, {route_cache.misses} misses")
 
-    # write CSV
-    outp = Path(args.output)
-    outp.parent.mkdir(parents=True, exist_ok=True)
-    with outp.open("w", newline="") as fh:
-        writer = csv.DictWriter(
-            fh,
-            fieldnames=[
-                "route_id",
-                "nurse_id",
-                "origin",
-                "destination",
-                "origin_lat",
-                "origin_lon",
-                "dest_lat",
-                "dest_lon",
-                "nodes_in_path",
-                "length_km",
-                "travel_min",
-            ],
-        )
-        writer.writeheader()
-        for r in rows:
-            writer.writerow(r)
+    # Print summary statistics computed incrementally while routing
+    if writer.count:
+        print_distribution_table("ROUTE STATISTICS", "Metric", [("length_km", length_stats), ("travel_min", time_stats)])
+        if hub_stats:
+            print_distribution_table("TRAVEL MINUTES PER HUB", "Hub", ((str(hub), stats) for hub, stats in hub_stats.items()))
+        print_distribution_table("TRAVEL MINUTES PER NURSE", "Nurse", nurse_stats.items())
 
-    print(f"Wrote {len(rows)} routes to {outp}")
+    print(f"Wrote {writer.count} routes to {outp}")
 
     if args.mem_debug:
-        memory_report("After writing CSV")
+        memory_report("After writing routes")
 
     # Generate folium map if requested and folium is available
+    if not args.map_output:
+        return
     map_out = Path(args.map_output)
     if folium is None:
         print("Folium not installed; skipping map generation. To enable, pip install folium")
         return
 
-    if len(route_paths) == 0:
+    if len(map_routes) == 0 and (usage is None or usage.routes == 0):
         print("No routes to map")
         return
 
-    # helper to get node lat/lon
-    def node_latlon(n):
-        nd = G.nodes[n]
-        # OSMnx stores lon in 'x' and lat in 'y'
-        lon = nd.get("x")
-        lat = nd.get("y")
-        try:
-            return float(lat), float(lon)
-        except Exception:
-            return None
-
-    # compute map center from used nodes
-    used_nodes = set()
-    for _, _, path, _, _ in route_paths:
-        used_nodes.update(path[:1])
-        used_nodes.update(path[-1:])
-
-    coords = [node_latlon(n) for n in used_nodes]
-    coords = [c for c in coords if c]
-    if not coords:
-        print("Could not determine node coordinates; skipping map generation")
-        return
-
-    avg_lat = sum(c[0] for c in coords) / len(coords)
-    avg_lon = sum(c[1] for c in coords) / len(coords)
-
-    m = folium.Map(location=[avg_lat, avg_lon], tiles="cartodbpositron", zoom_start=12)
-
-    # color palette for nurses
-    colors = ["blue", "green", "red", "purple", "orange", "darkred", "cadetblue"]
-    nurse_colors = {}
-
-    for rid, nurse_id, path, length_km, time_min in route_paths:
-        if nurse_id not in nurse_colors:
-            nurse_colors[nurse_id] = colors[len(nurse_colors) % len(colors)]
-        color = nurse_colors[nurse_id]
-
-        # convert node path to latlon list
-        latlons = []
-        for n in path:
-            ll = node_latlon(n)
-            if ll:
-                latlons.append([ll[0], ll[1]])
-
-        if latlons:
-            folium.PolyLine(latlons, color=color, weight=4, opacity=0.8,
-                            tooltip=f"{nurse_id} route {rid}: {length_km:.2f} km, {time_min:.1f} min").add_to(m)
-
-            # add markers for origin and destination
-            folium.CircleMarker(latlons[0], radius=4, color=color, fill=True,
-                                popup=f"{nurse_id} origin {rid}").add_to(m)
-            folium.Marker(latlons[-1], icon=folium.Icon(color=color),
-                          popup=f"{nurse_id} dest {rid}<br>{length_km:.2f} km, {time_min:.1f} min").add_to(m)
+    with profile_phase("render_map"):
+        if usage is not None:
+            render_usage_map(G, usage, map_out, tolerance=args.map_simplify_m)
+        else:
+            render_route_map(G, map_routes, map_out)
 
-    # add simple legend
-    legend_html = "<div style='position: fixed; bottom: 50px; left: 50px; z-index:9999; background: white; padding: 8px; border:1px solid #ccc;'>"
-    legend_html += "<b>Nurse colors</b><br>"
-    for nid, col in nurse_colors.items():
-        legend_html += f"<span style='display:inline-block;width:12px;height:12px;background:{col};margin-right:6px;'></span>{nid}<br>"
-    legend_html += "</div>"
-    m.get_root().html.add_child(folium.Element(legend_html))
 
-    map_out.parent.mkdir(parents=True, exist_ok=True)
-    m.save(str(map_out))
-    print(f"Saved map to {map_out}")
+def main():
+    args = parse_args()
+    with profiled_run("generate_nurse_routes", enabled=args.profile, output_dir=args.profile_dir):
+        run(args)
 
 
 if __name__ == "__main__":
@@ -1,22 +1,68 @@
 #!/usr/bin/env python3
+import argparse
+import sys
+from pathlib import Path
+
 import osmnx as ox
 
-G = ox.load_graphml("data/master/merged.graphml")
+# Make the repository root importable for the shared map_tool helpers
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from map_tool import (  # noqa: E402
+    add_profile_arguments,
+    cached_route,
+    load_graph,
+    load_region,
+    profile_phase,
+    profiled_run,
+)
+
+SURREY_NODE = 10199121387
+HOPE_NODE = 13053107295
+
+
+def run(args):
+    u = SURREY_NODE
+    v = HOPE_NODE
+
+    with profile_phase("load_graph"):
+        if args.shards:
+            # only the tiles along the Surrey -> Hope corridor
+            G = load_region(args.shards, corridor=(u, v), buffer_km=args.buffer_km)
+        else:
+            G = load_graph(args.graph)
+
+    with profile_phase("shortest_path"):
+        path = cached_route(G, u, v, args.route_cache, args.shards or args.graph,
+                            args.buffer_km if args.shards else None)
+
+    print("Nodes in path:", len(path))
+
+    with profile_phase("plot"):
+        fig, ax = ox.plot_graph_route(
+            G,
+            path,
+            node_size=0,
+            bgcolor="white",
+            edge_color="#cccccc",
+            edge_linewidth=0.5,
+            route_color="red",
+            route_linewidth=2,
+        )
+
 
-u = 10199121387  # Surrey node
-v = 13053107295  # Hope node
+def main():
+    ap = argparse.ArgumentParser(description="Plot the Surrey -> Hope route with matplotlib")
+    ap.add_argument("--graph", default="data/master/merged.graphml", help="Merged GraphML file")
+    ap.add_argument("--shards", help="Shard index (map_tool.py shard); loads only the corridor tiles")
+    ap.add_argument("--buffer-km", type=float, default=10.0, help="Corridor half-width for --shards (default: 10)")
+    ap.add_argument("--route-cache", help="SQLite route cache reused across runs (e.g. ./data/route_cache.sqlite)")
+    add_profile_arguments(ap)
+    args = ap.parse_args()
 
-path = ox.shortest_path(G, u, v, weight="travel_time")
+    with profiled_run("plot_surrey_hope", enabled=args.profile, output_dir=args.profile_dir):
+        run(args)
 
-print("Nodes in path:", len(path))
 
-fig, ax = ox.plot_graph_route(
-    G,
-    path,
-    node_size=0,
-    bgcolor="white",
-    edge_color="#cccccc",
-    edge_linewidth=0.5,
-    route_color="red",
-    route_linewidth=2,
-)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -4,28 +4,51 @@
 Outputs an HTML file you can open in a browser to visually inspect
 which route the graph is taking between Surrey and Hope.
 """
+import argparse
 import sys
 from pathlib import Path
 
 import folium
-import osmnx as ox
 
-
-def main():
-    graph_path = Path("data/master/merged_with_times.graphml")
-    if not graph_path.exists():
-        print("Graph file not found:", graph_path)
-        sys.exit(2)
-
-    print(f"Loading graph from {graph_path}...")
-    G = ox.load_graphml(graph_path)
-
-    # Known nodes from your earlier REPL session
-    u = 10199121387  # Surrey-ish
-    v = 13053107295  # Hope-ish
+# Make the repository root importable for the shared map_tool helpers
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from map_tool import (  # noqa: E402
+    add_profile_arguments,
+    cached_route,
+    load_graph,
+    load_region,
+    profile_phase,
+    profiled_run,
+)
+
+# Known nodes from your earlier REPL session
+SURREY_NODE = 10199121387  # Surrey-ish
+HOPE_NODE = 13053107295  # Hope-ish
+
+
+def run(args):
+    u = SURREY_NODE
+    v = HOPE_NODE
+
+    if args.shards:
+        print(f"Loading Surrey -> Hope corridor from shard index {args.shards}...")
+        with profile_phase("load_graph"):
+            G = load_region(args.shards, corridor=(u, v), buffer_km=args.buffer_km)
+    else:
+        graph_path = Path(args.graph)
+        if not graph_path.exists():
+            print("Graph file not found:", graph_path)
+            sys.exit(2)
+
+        print(f"Loading graph from {graph_path}...")
+        with profile_phase("load_graph"):
+            G = load_graph(graph_path)
 
     print("Computing shortest path (travel_time)...")
-    path = ox.shortest_path(G, u, v, weight="travel_time")
+    with profile_phase("shortest_path"):
+        path = cached_route(G, u, v, args.route_cache, args.shards or args.graph,
+                            args.buffer_km if args.shards else None)
     if path is None:
         print("No path found between Surrey node and Hope node.")
         sys.exit(1)
@@ -74,9 +97,23 @@ def main():
 
     out = Path("data/routes_surrey_hope.html")
     out.parent.mkdir(parents=True, exist_ok=True)
-    m.save(str(out))
+    with profile_phase("save_map"):
+        m.save(str(out))
     print(f"Saved Surrey->Hope route map to {out}")
 
 
+def main():
+    ap = argparse.ArgumentParser(description="Plot the Surrey -> Hope route on a Folium map")
+    ap.add_argument("--graph", default="data/master/merged_with_times.graphml", help="GraphML file with travel times")
+    ap.add_argument("--shards", help="Shard index (map_tool.py shard); loads only the corridor tiles")
+    ap.add_argument("--buffer-km", type=float, default=10.0, help="Corridor half-width for --shards (default: 10)")
+    ap.add_argument("--route-cache", help="SQLite route cache reused across runs (e.g. ./data/route_cache.sqlite)")
+    add_profile_arguments(ap)
+    args = ap.parse_args()
+
+    with profiled_run("plot_surrey_hope_folium", enabled=args.profile, output_dir=args.profile_dir):
+        run(args)
+
+
 if __name__ == "__main__":
     main()
@@ -9,16 +9,61 @@ edge as:
 
 so all edges have consistent, non-null travel_time suitable for routing.
 
+By default the computation is vectorized: `length`, `highway` and `maxspeed`
+are pulled into arrays in one pass, speeds and travel times are computed with
+NumPy and written back in bulk. `--method osmnx` keeps the original
+edge-by-edge implementation based on `ox.add_edge_speeds`.
+
 Usage:
   python scripts/recompute_travel_times.py \
     --input ./data/master/merged.graphml \
     --output ./data/master/merged_with_times.graphml
+
+  # write only speed_kph/travel_time to a small sidecar instead of a new GraphML
+  python scripts/recompute_travel_times.py \
+    --input ./data/master/merged.graphml \
+    --sidecar ./data/master/merged.times.npz
+
+  # incremental: apply a changeset from `map_tool.py diff` to an existing master
+  python scripts/recompute_travel_times.py \
+    --input ./data/master/merged_with_times.graphml \
+    --changeset ./data/changes/nightly.jsonl \
+    --output ./data/master/merged_with_times.graphml
+
+In incremental mode (`--changeset` or `--edges`) only the affected edges are
+recomputed, reusing the per-highway `speed_table` stored by the last full
+run, and derived artifacts registered for the input (component labels,
+shards) are re-stamped, refreshed or invalidated depending on what changed.
 """
 import argparse
+import json
+import sys
 from pathlib import Path
 
 import osmnx as ox
 
+# Make the repository root importable for the shared map_tool helpers
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from map_tool import (  # noqa: E402
+    CHANGE_KINDS,
+    add_profile_arguments,
+    apply_changeset,
+    compute_travel_times,
+    edge_table,
+    impute_edge_speeds,
+    load_graph,
+    numeric_array,
+    profile_phase,
+    profiled_run,
+    read_changeset,
+    recompute_edge_travel_times,
+    refresh_artifacts,
+    save_graph,
+    set_edge_column,
+    write_edge_sidecar,
+)
+
 
 def ensure_numeric_length(G):
     """Ensure edge `length` attributes are numeric floats where present."""
@@ -39,57 +84,171 @@ def recompute_speeds_and_times(G):
     the simple relationship travel_time = length / speed.
     """
     # Normalize existing length values first
-    ensure_numeric_length(G)
+    with profile_phase("numeric_length"):
+        ensure_numeric_length(G)
 
     # Let OSMnx assign default speeds by highway type
-    G = ox.add_edge_speeds(G)
+    with profile_phase("add_edge_speeds"):
+        G = ox.add_edge_speeds(G)
 
     # Ensure numeric speed_kph
-    for u, v, k, data in G.edges(keys=True, data=True):
-        if "speed_kph" in data:
-            try:
-                if not isinstance(data["speed_kph"], (int, float)):
-                    data["speed_kph"] = float(data["speed_kph"])
-            except Exception:
-                data.pop("speed_kph", None)
+    with profile_phase("numeric_speed"):
+        for u, v, k, data in G.edges(keys=True, data=True):
+            if "speed_kph" in data:
+                try:
+                    if not isinstance(data["speed_kph"], (int, float)):
+                        data["speed_kph"] = float(data["speed_kph"])
+                except Exception:
+                    data.pop("speed_kph", None)
 
     # Now enforce travel_time = length / speed for all edges with both attrs
-    for u, v, k, data in G.edges(keys=True, data=True):
-        length_m = data.get("length")
-        speed_kph = data.get("speed_kph")
-        if isinstance(length_m, (int, float)) and isinstance(speed_kph, (int, float)) and speed_kph > 0:
-            # meters / (km/h * 1000/3600) = seconds
-            data["travel_time"] = float(length_m) / (speed_kph * 1000.0 / 3600.0)
-        else:
-            # if we can't compute a sane time, drop it so caller sees it's missing
-            data.pop("travel_time", None)
+    with profile_phase("travel_time"):
+        for u, v, k, data in G.edges(keys=True, data=True):
+            length_m = data.get("length")
+            speed_kph = data.get("speed_kph")
+            if isinstance(length_m, (int, float)) and isinstance(speed_kph, (int, float)) and speed_kph > 0:
+                # meters / (km/h * 1000/3600) = seconds
+                data["travel_time"] = float(length_m) / (speed_kph * 1000.0 / 3600.0)
+            else:
+                # if we can't compute a sane time, drop it so caller sees it's missing
+                data.pop("travel_time", None)
 
     return G
 
 
-def main():
-    ap = argparse.ArgumentParser(description="Recompute edge travel_time on a GraphML graph")
-    ap.add_argument("--input", required=True, help="Input GraphML path")
-    ap.add_argument("--output", required=True, help="Output GraphML path")
-    args = ap.parse_args()
+def recompute_speeds_and_times_vectorized(G):
+    """Vectorized equivalent of `recompute_speeds_and_times`.
+
+    Pulls `length`, `highway` and `maxspeed` into arrays once, computes
+    `speed_kph` and `travel_time` with NumPy and writes both columns back in
+    bulk. The per-highway speed table used for imputation is stored on the
+    graph as `speed_table` (JSON) so later partial updates can reuse it.
+
+    Returns:
+        Tuple of (G, table, columns) where `table` is the edge table and
+        `columns` maps the recomputed attribute names to their arrays.
+    """
+    with profile_phase("pull_edge_arrays"):
+        table = edge_table(G, ("length", "highway", "maxspeed"))
+
+    with profile_phase("compute_speeds"):
+        length_m = numeric_array(table["length"])
+        speed_kph, speed_table = impute_edge_speeds(table["highway"], table["maxspeed"])
+        travel_time = compute_travel_times(length_m, speed_kph)
+
+    with profile_phase("write_back"):
+        # non-numeric lengths are dropped, as in ensure_numeric_length
+        set_edge_column(table["data"], "length", length_m)
+        set_edge_column(table["data"], "speed_kph", speed_kph)
+        set_edge_column(table["data"], "travel_time", travel_time)
+
+    G.graph["speed_table"] = json.dumps(speed_table, sort_keys=True)
+    return G, table, {"speed_kph": speed_kph, "travel_time": travel_time}
+
+
+def read_edge_ids(path):
+    """Read "u v [key]" lines (whitespace or comma separated, # comments)."""
+    edges = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].replace(",", " ").split()
+            if line:
+                u, v = int(line[0]), int(line[1])
+                edges.append((u, v, int(line[2]) if len(line) > 2 else 0))
+    return edges
+
+
+def run_incremental(args, G, in_path, out_path):
+    """Apply --changeset or --edges to G, recompute affected edges and refresh artifacts."""
+    if args.changeset:
+        with profile_phase("apply_changeset"):
+            result = apply_changeset(G, read_changeset(args.changeset))
+        print(f"Applied {result['applied']:,} changes ({result['skipped']:,} skipped); "
+              f"change kinds: {', '.join(sorted(result['kinds'])) or 'none'}")
+        edges, nodes, points, kinds = result["edges"], result["nodes"], result["points"], result["kinds"]
+    else:
+        edges = [e for e in read_edge_ids(args.edges) if G.has_edge(*e)]
+        nodes = {n for u, v, _ in edges for n in (u, v)}
+        points = []
+        # edges edited in place: assume anything but topology may have changed
+        kinds = set(CHANGE_KINDS) - {"topology"} if edges else set()
+
+    if "speed_table" in G.graph:
+        print(f"Recomputing speeds and travel times for {len(edges):,} affected edges...")
+        with profile_phase("recompute_edges"):
+            recompute_edge_travel_times(G, edges)
+    else:
+        print("Graph has no speed_table from a vectorized run; recomputing all edges")
+        G, _, _ = recompute_speeds_and_times_vectorized(G)
+        kinds.add("travel_time")
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with profile_phase("save_graph"):
+        save_graph(G, out_path)
+    print(f"Saved updated graph to {out_path}")
+
+    with profile_phase("refresh_artifacts"):
+        refreshed = refresh_artifacts(G, out_path, kinds, source_path=in_path, nodes=nodes, points=points)
+    for status in ("kept", "refreshed", "invalidated"):
+        if refreshed[status]:
+            print(f"Artifacts {status}: {', '.join(refreshed[status])}")
+
 
+def run(args):
     in_path = Path(args.input)
-    out_path = Path(args.output)
 
     if not in_path.exists():
         print("Input graph not found:", in_path)
         raise SystemExit(2)
 
     print(f"Loading graph from {in_path}...")
-    G = ox.load_graphml(in_path)
+    with profile_phase("load_graph"):
+        G = load_graph(in_path)
 
-    print("Recomputing speeds and travel times...")
-    G = recompute_speeds_and_times(G)
+    if args.changeset or args.edges:
+        run_incremental(args, G, in_path, Path(args.output))
+        return
+
+    print(f"Recomputing speeds and travel times ({args.method})...")
+    if args.method == "vectorized":
+        G, table, columns = recompute_speeds_and_times_vectorized(G)
+    else:
+        G = recompute_speeds_and_times(G)
+
+    if args.sidecar:
+        with profile_phase("save_sidecar"):
+            sidecar_path = write_edge_sidecar(Path(args.sidecar), table, columns)
+        print(f"Saved speed_kph/travel_time for {len(table['data']):,} edges to {sidecar_path}")
+
+    if args.output:
+        out_path = Path(args.output)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with profile_phase("save_graph"):
+            save_graph(G, out_path)
+        print(f"Saved updated graph with travel_time to {out_path}")
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    ox.save_graphml(G, out_path)
-    print(f"Saved updated graph with travel_time to {out_path}")
 
+def main():
+    ap = argparse.ArgumentParser(description="Recompute edge travel_time on a GraphML graph")
+    ap.add_argument("--input", required=True, help="Input GraphML path")
+    ap.add_argument("--output", help="Output GraphML path")
+    ap.add_argument("--sidecar", help="Write only speed_kph/travel_time keyed by (u, v, key) to this .npz file")
+    ap.add_argument("--method", choices=["vectorized", "osmnx"], default="vectorized",
+                    help="Computation method (default: vectorized)")
+    incremental = ap.add_mutually_exclusive_group()
+    incremental.add_argument("--changeset", help="Apply a changeset from `map_tool.py diff` and recompute only affected edges")
+    incremental.add_argument("--edges", help="Recompute only the edges listed as 'u v [key]' lines in this file")
+    add_profile_arguments(ap)
+    args = ap.parse_args()
+    if not args.output and not args.sidecar:
+        ap.error("at least one of --output or --sidecar is required")
+    if (args.changeset or args.edges) and (args.sidecar or not args.output):
+        ap.error("--changeset/--edges write a full graph: use --output (may equal --input) without --sidecar")
+    if args.sidecar and args.method != "vectorized":
+        ap.error("--sidecar requires --method vectorized")
+
+    with profiled_run("recompute_travel_times", enabled=args.profile, output_dir=args.profile_dir):
+        run(args)
 
 if __name__ == "__main__":
     main()
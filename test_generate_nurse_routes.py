@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Unit tests for scripts/generate_nurse_routes.py
+
+Runs the route generator on small synthetic graphs without network access.
+"""
+
+import csv
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import networkx as nx
+import numpy as np
+import osmnx as ox
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import generate_nurse_routes as gnr  # noqa: E402
+
+
+def grid_graph(size=6, spacing_deg=0.001):
+    """Return a two-way size x size street grid with length and travel_time on every edge."""
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    for row in range(size):
+        for col in range(size):
+            G.add_node(row * size + col + 1, x=-122.0 + col * spacing_deg, y=49.0 + row * spacing_deg)
+    for row in range(size):
+        for col in range(size):
+            node = row * size + col + 1
+            for other in ((node + 1) if col + 1 < size else None, (node + size) if row + 1 < size else None):
+                if other is None:
+                    continue
+                for u, v in ((node, other), (other, node)):
+                    G.add_edge(u, v, osmid=u * 1000 + v, length=100.0, travel_time=7.2, highway="residential")
+    return G
+
+
+def canonical_edges(chain):
+    """Return the undirected edges of a node chain."""
+    return {(u, v) if u < v else (v, u) for u, v in zip(chain[:-1], chain[1:])}
+
+
+class TestEdgeUsageMap(unittest.TestCase):
+    """Test edge usage aggregation for large route maps."""
+
+    def test_merge_chains_of_a_path(self):
+        """Test that a simple path becomes one chain in either direction."""
+        chains = gnr.merge_edge_chains([(2, 3), (1, 2), (3, 4)])
+        self.assertEqual(len(chains), 1)
+        self.assertIn(chains[0], ([1, 2, 3, 4], [4, 3, 2, 1]))
+
+    def test_merge_chains_break_at_junctions(self):
+        """Test that chains stop at nodes of degree other than two."""
+        # a T: 1-2-3 with a branch 2-4-5
+        edges = [(1, 2), (2, 3), (2, 4), (4, 5)]
+        chains = gnr.merge_edge_chains(edges)
+        self.assertEqual(len(chains), 3)
+        for chain in chains:
+            self.assertIn(2, (chain[0], chain[-1]))
+        self.assertEqual(set().union(*map(canonical_edges, chains)), canonical_edges([1, 2, 3]) | {(2, 4), (4, 5)})
+        self.assertEqual(sum(len(chain) - 1 for chain in chains), len(edges))
+
+    def test_merge_chains_closed_loop(self):
+        """Test that a ring with no endpoints is returned as one closed chain."""
+        chains = gnr.merge_edge_chains([(1, 2), (2, 3), (3, 4), (1, 4)])
+        self.assertEqual(len(chains), 1)
+        self.assertEqual(chains[0][0], chains[0][-1])
+        self.assertEqual(canonical_edges(chains[0]), {(1, 2), (2, 3), (3, 4), (1, 4)})
+
+        # a loop hanging off a path is still covered exactly once
+        chains = gnr.merge_edge_chains([(0, 1), (1, 2), (2, 3), (3, 1)])
+        self.assertEqual(sum(len(chain) - 1 for chain in chains), 4)
+        self.assertEqual(set().union(*map(canonical_edges, chains)), {(0, 1), (1, 2), (2, 3), (1, 3)})
+
+    def test_usage_class_buckets(self):
+        """Test the log2 buckets 1, 2-3, 4-7, 8-15."""
+        self.assertEqual([gnr.usage_class(c) for c in (1, 2, 3, 4, 7, 8, 15, 16)], [0, 1, 1, 2, 2, 3, 3, 4])
+
+    def test_edge_usage_counts_undirected(self):
+        """Test that both directions of a street add to one count."""
+        usage = gnr.EdgeUsage()
+        usage.add([1, 2, 3])
+        usage.add([3, 2])
+        usage.add([])
+        self.assertEqual(usage.routes, 2)
+        self.assertEqual(usage.edges, {(1, 2): 1, (2, 3): 2})
+        self.assertEqual(usage.origins, {1: 1, 3: 1})
+        self.assertEqual(usage.destinations, {3: 1, 2: 1})
+
+
+def route_row(route_id, path):
+    """Return a route row as the generator writes it."""
+    return {
+        "route_id": route_id,
+        "nurse_id": f"nurse_{route_id % 2 + 1}",
+        "origin": path[0],
+        "destination": path[-1],
+        "origin_lat": 49.0,
+        "origin_lon": -122.0,
+        "dest_lat": 49.01,
+        "dest_lon": -122.01,
+        "nodes_in_path": len(path),
+        "length_km": 0.1 * route_id,
+        "travel_min": 1.5 * route_id,
+    }
+
+
+# 64-bit OSM-style node IDs, to catch any narrowing of the path column
+ROUTE_PATHS = [[10_000_000_001 + i, 2**40 + i, 3] for i in range(5)]
+
+
+class TestRouteWriters(unittest.TestCase):
+    """Test the streaming CSV, Parquet and Arrow route writers."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_routes(self, path, fmt="auto", flush_every=2, close=True):
+        writer = gnr.open_route_writer(path, fmt=fmt, flush_every=flush_every)
+        for route_id, nodes in enumerate(ROUTE_PATHS, start=1):
+            writer.write(route_row(route_id, nodes), nodes)
+        if close:
+            writer.close()
+        return writer
+
+    def test_csv_round_trip(self):
+        """Test that CSV rows read back in order, without node paths."""
+        writer = self.write_routes(self.folder / "nested" / "routes.csv")
+        self.assertIsInstance(writer, gnr.CsvRouteWriter)
+        self.assertEqual(writer.count, len(ROUTE_PATHS))
+        with open(self.folder / "nested" / "routes.csv", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(list(rows[0]), gnr.ROUTE_FIELDS)
+        self.assertEqual([int(r["route_id"]) for r in rows], [1, 2, 3, 4, 5])
+        self.assertEqual([int(r["origin"]) for r in rows], [p[0] for p in ROUTE_PATHS])
+        self.assertEqual(float(rows[2]["travel_min"]), 4.5)
+
+    def test_format_from_suffix(self):
+        """Test that auto mode picks the format from the output suffix."""
+        self.assertIsInstance(self.write_routes(self.folder / "routes.txt"), gnr.CsvRouteWriter)
+        if pa is not None:
+            self.assertEqual(self.write_routes(self.folder / "routes.parquet").fmt, "parquet")
+            self.assertEqual(self.write_routes(self.folder / "routes.arrows").fmt, "arrow")
+
+    @unittest.skipIf(pa is None, "pyarrow not installed")
+    def test_parquet_round_trip_and_batching(self):
+        """Test the list<int64> path column and one row group per flushed batch."""
+        self.write_routes(self.folder / "routes.parquet", flush_every=2)
+        parquet = pq.ParquetFile(self.folder / "routes.parquet")
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        self.assertEqual([parquet.metadata.row_group(i).num_rows for i in range(3)], [2, 2, 1])
+        table = parquet.read()
+        self.assertEqual(table.schema.field("path").type, pa.list_(pa.int64()))
+        self.assertEqual(table.column("path").to_pylist(), ROUTE_PATHS)
+        self.assertEqual(table.column("route_id").to_pylist(), [1, 2, 3, 4, 5])
+        self.assertEqual(table.column("nurse_id").to_pylist(), [route_row(i, [0])["nurse_id"] for i in range(1, 6)])
+
+    @unittest.skipIf(pa is None, "pyarrow not installed")
+    def test_arrow_stream_readable_before_close(self):
+        """Test that flushed Arrow batches can be read while the writer is still open."""
+        path = self.folder / "routes.arrow"
+        writer = self.write_routes(path, flush_every=2, close=False)
+        # the stream has no end marker yet; reading stops after the completed batches
+        batches = []
+        with pa.ipc.open_stream(pa.OSFile(str(path), "rb")) as reader:
+            try:
+                while True:
+                    batches.append(reader.read_next_batch())
+            except StopIteration:
+                pass
+        self.assertEqual([b.num_rows for b in batches], [2, 2])
+        self.assertEqual(pa.Table.from_batches(batches).column("path").to_pylist(), ROUTE_PATHS[:4])
+
+        writer.close()
+        table = pa.ipc.open_stream(pa.OSFile(str(path), "rb")).read_all()
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.schema.field("path").type, pa.list_(pa.int64()))
+        self.assertEqual(table.column("path").to_pylist(), ROUTE_PATHS)
+
+
+class GraphFileTestCase(unittest.TestCase):
+    """Base class writing a small grid graph to a temporary folder."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmpdir.name)
+        self.graph_path = self.folder / "grid.graphml"
+        ox.save_graphml(grid_graph(), self.graph_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_script(self, *argv):
+        args = gnr.parse_args(["--graph", str(self.graph_path), *map(str, argv)])
+        with patch("builtins.print"):
+            gnr.run(args)
+        return args
+
+
+@unittest.skipIf(gnr.folium is None, "folium not installed")
+class TestMapModes(GraphFileTestCase):
+    """Test the switch from per-route maps to aggregated edge usage."""
+
+    def render(self, routes, *argv):
+        with patch("generate_nurse_routes.render_route_map") as per_route, \
+                patch("generate_nurse_routes.render_usage_map") as aggregated:
+            self.run_script("--nurses", 2, "--routes-per", routes // 2, "--output", self.folder / "r.csv",
+                            "--map-output", self.folder / "map.html", *argv)
+        return per_route, aggregated
+
+    def test_auto_mode_keeps_routes_up_to_limit(self):
+        """Test that auto mode draws each route while within --map-max-routes."""
+        per_route, aggregated = self.render(6, "--map-max-routes", 6)
+        aggregated.assert_not_called()
+        self.assertEqual(len(per_route.call_args.args[1]), 6)
+
+    def test_auto_mode_aggregates_past_limit(self):
+        """Test that auto mode switches to edge usage once the limit is passed."""
+        per_route, aggregated = self.render(6, "--map-max-routes", 5)
+        per_route.assert_not_called()
+        usage = aggregated.call_args.args[1]
+        self.assertEqual(usage.routes, 6)
+        self.assertEqual(sum(usage.origins.values()), 6)
+
+    def test_forced_modes(self):
+        """Test that --map-mode overrides the route count."""
+        per_route, aggregated = self.render(4, "--map-mode", "aggregate")
+        per_route.assert_not_called()
+        self.assertEqual(aggregated.call_args.args[1].routes, 4)
+        per_route, aggregated = self.render(8, "--map-mode", "routes", "--map-max-routes", 2)
+        aggregated.assert_not_called()
+        self.assertEqual(len(per_route.call_args.args[1]), 8)
+
+
+class TestSimulation(GraphFileTestCase):
+    """Test the Monte Carlo day simulation."""
+
+    def test_scenario_rows(self):
+        """Test per-day rows and distributions from known per-hub travel times."""
+        inf = np.inf
+        simulation = {
+            # hub 0 reaches three of its four candidates; hub 1 reaches both of its own
+            "candidates": [np.array([0, 1, 2, 3]), np.array([4, 5])],
+            "time_s": [np.array([60, 120, inf, 300, 0, 0], dtype=np.float32),
+                       np.array([0, 0, 0, 0, 600, 600], dtype=np.float32)],
+            "length_m": [np.array([1000, 2000, inf, 5000, 0, 0], dtype=np.float32),
+                         np.array([0, 0, 0, 0, 4000, 4000], dtype=np.float32)],
+            "nurses": [1, 2],
+            # far above the candidate counts, so every candidate is drawn each day
+            "mean_patients": 100.0,
+        }
+        with patch("generate_nurse_routes._SIMULATION", simulation):
+            rows, stats = gnr.simulate_scenarios(range(7, 10))
+
+        self.assertEqual([row["seed"] for row in rows], [7, 8, 9])
+        for row in rows:
+            self.assertEqual(row["patients"], 6)
+            self.assertEqual(row["unreachable"], 1)
+            self.assertEqual(row["total_travel_min"], 28.0)
+            self.assertEqual(row["max_route_min"], 10.0)
+            self.assertEqual(row["max_nurse_day_min"], 10.0)
+        overall = stats["overall"]
+        self.assertEqual(overall["route_min"].count, 3 * 5)
+        self.assertAlmostEqual(overall["route_km"].summary()["max"], 5.0)
+        self.assertEqual(overall["day_patients"].summary()["mean"], 6)
+        self.assertEqual(stats["hubs"][0]["day_min"].summary()["p50"], 8.0)
+        self.assertEqual(stats["hubs"][1]["day_min"].summary()["p50"], 20.0)
+        self.assertEqual([n.summary()["mean"] for n in stats["nurses"][1]], [10.0, 10.0])
+
+    def simulate(self, workers):
+        output = self.folder / f"sim{workers}.csv"
+        self.run_script("--simulate", 40, "--hubs", 2, "--nurses", 3, "--patients", 8,
+                        "--scenario-chunk", 6, "--workers", workers, "--output", output, "--map-output", "")
+        with open(output, newline="") as f:
+            rows = list(csv.DictReader(f))
+        return rows, json.loads(output.with_suffix(".summary.json").read_text())
+
+    def test_serial_and_pool_agree(self):
+        """Test that workers=1 and a two-process pool write the same rows and summaries."""
+        # a node that can leave the grid but never be reached from it
+        G = grid_graph()
+        G.add_edge(100, 1, osmid=1, length=100.0, travel_time=7.2, highway="residential")
+        G.nodes[100].update(x=-122.001, y=49.0)
+        ox.save_graphml(G, self.graph_path)
+
+        serial_rows, serial = self.simulate(1)
+        pool_rows, pooled = self.simulate(2)
+        self.assertEqual(serial_rows, pool_rows)
+        self.assertEqual(serial, pooled)
+
+        self.assertEqual([int(r["scenario"]) for r in serial_rows], list(range(1, 41)))
+        self.assertEqual([int(r["seed"]) for r in serial_rows], list(range(42, 82)))
+        self.assertEqual(sum(int(r["patients"]) for r in serial_rows), serial["metrics"]["day_patients"]["count"]
+                         * serial["metrics"]["day_patients"]["mean"])
+        reached = sum(int(r["patients"]) - int(r["unreachable"]) for r in serial_rows)
+        self.assertEqual(serial["metrics"]["route_min"]["count"], reached)
+        self.assertGreater(sum(int(r["unreachable"]) for r in serial_rows), 0)
+        self.assertEqual(serial["quantiles"]["scenario_chunk"], 6)
+        self.assertEqual(len(serial["per_nurse"]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,28 +6,112 @@ Tests the core functionality of the CLI tool without requiring network access.
 """
 
 import json
+import os
 import sys
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
 from unittest.mock import patch
 
+import geopandas as gpd
 import networkx as nx
+import numpy as np
 import osmnx as ox
+from shapely.geometry import LineString
+from shapely.geometry import box as shapely_box
+from shapely.ops import unary_union
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
 from map_tool import (
     CUSTOM_FILTER,
+    DEFAULT_CONFIG,
+    ComponentIndex,
+    EdgeStore,
+    HubTables,
+    NodeIndex,
+    IsochroneCache,
+    RouteCache,
+    StreamingStats,
+    GeocodeStore,
     EXTRA_USEFUL_TAGS,
     PAVED_SURFACES,
+    ROUTABLE_CUTOFF,
+    _split_tag_values,
     calculate_edge_length_km,
+    cached_route,
+    cached_shortest_path,
+    calculate_stats,
+    compact_routing_graph,
+    compile_routing_profiles,
     configure_osmnx,
+    coverage,
+    coverage_raster,
+    graphml_coordinate_arrays,
     create_parser,
+    covered_area,
+    diff_graphml,
+    decode_path,
+    diff_snapshots,
+    encode_path,
     get_output_filepath,
+    graph_stem,
+    hub_table_arrays,
+    hub_tables_dir,
+    hub_isochrones,
+    hub_reach,
+    isochrone_cache_dir,
+    isochrones,
+    is_shard_index,
+    list_graph_files,
+    load_graph,
+    load_hub_tables,
+    load_node_index,
+    merge_graphs,
+    parse_maxspeed,
+    RunProfile,
+    apply_changeset,
+    apply_edge_sidecar,
+    apply_osc_changes,
+    compute_stats,
+    compute_travel_times,
+    edge_table,
+    export_tables,
+    fetch_batch,
+    fetch_plan,
+    geocode_places,
+    file_fingerprint,
+    file_stats,
+    expand_compact_path,
+    impute_edge_speeds,
+    load_component_index,
     load_config,
+    load_region,
+    load_shard_index,
+    parse_osc,
+    profile_phase,
+    profiled_run,
+    read_changeset,
+    read_places_file,
+    refresh_artifacts,
+    register_artifact,
+    resolve_graph_files,
+    route_graph_hash,
+    save_graph,
     sanitize_place_name,
+    select_tiles,
+    shard_graph,
+    split_gaps,
+    write_edge_sidecar,
 )
 
 
@@ -174,6 +258,1319 @@ class TestCalculateEdgeLengthKm(unittest.TestCase):
         self.assertAlmostEqual(alley_km, 0.2, places=1)
 
 
+class TestEdgeSpeeds(unittest.TestCase):
+    """Test vectorized speed and travel time computation."""
+
+    def test_parse_maxspeed(self):
+        """Test maxspeed parsing rules."""
+        self.assertEqual(parse_maxspeed("50"), 50.0)
+        self.assertAlmostEqual(parse_maxspeed("30 mph"), 30 * 1.60934)
+        self.assertEqual(parse_maxspeed("60|40"), 50.0)
+        self.assertEqual(parse_maxspeed(["50", "70"]), 60.0)
+        self.assertTrue(parse_maxspeed("signals") != parse_maxspeed("signals"))
+        self.assertTrue(parse_maxspeed(None) != parse_maxspeed(None))
+
+    def test_impute_edge_speeds(self):
+        """Test imputation by highway type mean and global fallback."""
+        highway = ["primary", "primary", ["residential", "track"], "track"]
+        maxspeed = ["80", None, "40", None]
+        speeds, table = impute_edge_speeds(highway, maxspeed)
+        self.assertEqual(speeds.tolist(), [80.0, 80.0, 40.0, 60.0])
+        self.assertEqual(table["primary"], 80.0)
+        self.assertEqual(table["track"], 60.0)
+
+    def test_impute_with_fixed_speeds(self):
+        """Test that a stored speed table takes precedence."""
+        speeds, _ = impute_edge_speeds(["track"], [None], hwy_speeds={"track": 20.0})
+        self.assertEqual(speeds.tolist(), [20.0])
+
+    def test_travel_times(self):
+        """Test travel_time = length / speed, NaN for zero speed."""
+        tt = compute_travel_times(np.array([1000.0, 1000.0]), np.array([36.0, 0.0]))
+        self.assertAlmostEqual(tt[0], 100.0)
+        self.assertTrue(np.isnan(tt[1]))
+
+    def test_sidecar_roundtrip(self):
+        """Test writing and applying an edge sidecar."""
+        graph = nx.MultiDiGraph()
+        graph.add_edge(1, 2, 0, length=1000.0)
+        graph.add_edge(2, 1, 0, length=1000.0)
+        table = edge_table(graph, ("length",))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_edge_sidecar(
+                Path(tmp) / "times.npz", table, {"travel_time": np.array([10.0, np.nan])}
+            )
+            graph[2][1][0]["travel_time"] = 99.0
+            self.assertEqual(apply_edge_sidecar(graph, path), 2)
+        self.assertEqual(graph[1][2][0]["travel_time"], 10.0)
+        self.assertNotIn("travel_time", graph[2][1][0])
+
+
+class TestRoutingProfiles(unittest.TestCase):
+    """Test compiled routing profiles."""
+
+    PROFILES = {
+        "nurse": {
+            "exclude": {"access": ["private"], "tracktype": ["grade4", "grade5"]},
+        },
+        "winter": {
+            "exclude": {"access": ["private"]},
+            "unpaved_penalty": 2.0,
+        },
+    }
+
+    def setUp(self):
+        """Create a graph with a short private shortcut and a gravel edge."""
+        self.graph = nx.MultiDiGraph()
+        self.graph.add_edge(1, 2, 0, travel_time=10.0, access="private")
+        self.graph.add_edge(1, 3, 0, travel_time=10.0, surface="gravel")
+        self.graph.add_edge(3, 2, 0, travel_time=10.0, surface="asphalt")
+        self.graph.add_edge(2, 4, 0, travel_time=5.0, highway="track", tracktype="grade5")
+
+    def test_split_tag_values(self):
+        """Test splitting of multi-valued tags."""
+        self.assertEqual(_split_tag_values("Gravel; asphalt"), ["gravel", "asphalt"])
+        self.assertEqual(_split_tag_values(["dirt"]), ["dirt"])
+        self.assertEqual(_split_tag_values(None), [])
+
+    def test_exclusions_and_penalties(self):
+        """Test per-edge weights written for each profile."""
+        compiled = compile_routing_profiles(self.graph, self.PROFILES)
+        self.assertEqual(compiled["nurse"]["excluded"], 2)
+        self.assertEqual(self.graph[1][2][0]["weight_nurse"], float("inf"))
+        self.assertEqual(self.graph[1][3][0]["weight_winter"], 20.0)
+        self.assertEqual(self.graph[3][2][0]["weight_winter"], 10.0)
+
+    def test_cutoff_prunes_excluded_edges(self):
+        """Test that Dijkstra with ROUTABLE_CUTOFF avoids excluded edges."""
+        compile_routing_profiles(self.graph, self.PROFILES)
+        dist, paths = nx.single_source_dijkstra(
+            self.graph, 1, cutoff=ROUTABLE_CUTOFF, weight="weight_nurse"
+        )
+        self.assertEqual(paths[2], [1, 3, 2])
+        self.assertNotIn(4, dist)
+
+    def test_unknown_profile(self):
+        """Test that unknown profile names raise KeyError."""
+        with self.assertRaises(KeyError):
+            compile_routing_profiles(self.graph, self.PROFILES, names=["missing"])
+
+
+class TestCompactRouting(unittest.TestCase):
+    """Test routing-graph compaction."""
+
+    def setUp(self):
+        """Create a two-way chain 1-2-3-4 with a branch at 4 and a private spur."""
+        self.graph = nx.MultiDiGraph()
+        for n in range(1, 7):
+            self.graph.add_node(n, x=float(n), y=0.0)
+        for u, v in [(1, 2), (2, 3), (3, 4), (4, 5)]:
+            self.graph.add_edge(u, v, length=100.0, travel_time=10.0, weight_nurse=10.0, highway="residential")
+            self.graph.add_edge(v, u, length=100.0, travel_time=10.0, weight_nurse=10.0, highway="residential")
+        self.graph.add_edge(4, 6, length=50.0, travel_time=5.0, weight_nurse=float("inf"), highway="service")
+
+    def test_chain_contraction(self):
+        """Test that chain interiors are removed and attributes summed."""
+        compact = compact_routing_graph(self.graph)
+        self.assertTrue(compact.graph["routing_compacted"])
+        self.assertNotIn(2, compact)
+        self.assertNotIn(3, compact)
+        data = compact[1][4][0]
+        self.assertEqual(data["length"], 300.0)
+        self.assertEqual(data["weight_nurse"], 30.0)
+        self.assertEqual(data["via"], [2, 3])
+        self.assertEqual(len(data["geometry"].coords), 4)
+        self.assertEqual(compact[4][1][0]["via"], [3, 2])
+
+    def test_distances_preserved(self):
+        """Test that shortest-path distances match the original graph."""
+        compact = compact_routing_graph(self.graph)
+        for weight in ("length", "weight_nurse"):
+            self.assertEqual(
+                nx.shortest_path_length(compact, 1, 5, weight=weight),
+                nx.shortest_path_length(self.graph, 1, 5, weight=weight),
+            )
+
+    def test_expand_path(self):
+        """Test expanding a compact path back to original node IDs."""
+        compact = compact_routing_graph(self.graph)
+        path = nx.shortest_path(compact, 5, 1, weight="length")
+        self.assertEqual(expand_compact_path(compact, path, weight="length"), [5, 4, 3, 2, 1])
+        self.assertEqual(expand_compact_path(self.graph, [1, 2]), [1, 2])
+
+    def test_drop_unroutable(self):
+        """Test dropping edges excluded by a routing profile."""
+        compact = compact_routing_graph(self.graph, drop_unroutable="weight_nurse")
+        self.assertNotIn(6, compact)
+        # 4 becomes a pass-through once the spur is gone
+        self.assertEqual(compact[1][5][0]["via"], [2, 3, 4])
+
+
+class TestComponentIndex(unittest.TestCase):
+    """Test strongly connected component labels."""
+
+    def setUp(self):
+        """Create a two-way triangle, a one-way spur into it and an island."""
+        self.graph = nx.MultiDiGraph()
+        for u, v in [(1, 2), (2, 3), (3, 1)]:
+            self.graph.add_edge(u, v, weight_nurse=1.0)
+            self.graph.add_edge(v, u, weight_nurse=1.0)
+        self.graph.add_edge(4, 1, weight_nurse=1.0)
+        self.graph.add_edge(5, 6, weight_nurse=1.0)
+        self.graph.add_edge(6, 5, weight_nurse=1.0)
+
+    def test_reachable(self):
+        """Test same-component reachability and the main component."""
+        index = ComponentIndex.build(self.graph)
+        self.assertEqual(len(index), 3)
+        self.assertTrue(index.reachable(1, 3))
+        self.assertTrue(index.reachable(4, 1))
+        self.assertTrue(index.reachable(4, 3))
+        self.assertFalse(index.reachable(1, 4))
+        self.assertFalse(index.mutually_reachable(4, 1))
+        self.assertTrue(index.mutually_reachable(1, 3))
+        self.assertFalse(index.reachable(1, 5))
+        self.assertFalse(index.reachable(1, 99))
+        self.assertEqual(sorted(index.main_component_nodes()), [1, 2, 3])
+
+    def test_excluded_edges_split_components(self):
+        """Test that edges with infinite weight are ignored."""
+        self.graph[3][1][0]["weight_nurse"] = float("inf")
+        self.graph[1][3][0]["weight_nurse"] = float("inf")
+        self.graph[2][3][0]["weight_nurse"] = float("inf")
+        index = ComponentIndex.build(self.graph, weight="weight_nurse")
+        self.assertTrue(index.reachable(1, 2))
+        self.assertFalse(index.reachable(1, 3))
+
+    def test_persisted_labels_follow_fingerprint(self):
+        """Test that the sidecar is reused until the graph file changes."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            graph_path = Path(tmpdir) / "net.graphml"
+            graph_path.write_text("v1")
+            load_component_index(self.graph, graph_path)
+            sidecar = Path(tmpdir) / "net.components.npz"
+            self.assertTrue(sidecar.exists())
+
+            # a stale sidecar is ignored once the file contents change
+            self.graph.add_edge(3, 4, weight_nurse=1.0)
+            self.assertFalse(load_component_index(self.graph, graph_path).reachable(1, 4))
+            graph_path.write_text("v2")
+            self.assertTrue(load_component_index(self.graph, graph_path).reachable(1, 4))
+
+    def test_profile_edit_invalidates_weighted_labels(self):
+        """Test that changing which edges a weight excludes rebuilds the labels."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            graph_path = Path(tmpdir) / "net.graphml"
+            graph_path.write_text("v1")
+            self.assertTrue(load_component_index(self.graph, graph_path, "weight_nurse").reachable(1, 3))
+
+            # same file, same attribute name, but the profile now excludes 1 <-> 3 and 2 -> 3
+            for u, v in [(3, 1), (1, 3), (2, 3)]:
+                self.graph[u][v][0]["weight_nurse"] = float("inf")
+            index = load_component_index(self.graph, graph_path, "weight_nurse")
+            self.assertFalse(index.reachable(1, 3))
+
+
+class TestNodeIndex(unittest.TestCase):
+    """Test the contiguous node numbering and array searches."""
+
+    def setUp(self):
+        """Create a graph with sparse 64-bit IDs, parallel edges and an isolated node."""
+        self.G = nx.MultiDiGraph()
+        self.ids = [13053107295, 42, 9000000001, 77]
+        for i, node in enumerate(self.ids):
+            self.G.add_node(node, x=-122.0 + i * 0.01, y=49.0)
+        self.G.add_node(5, x=-121.0, y=49.0)
+        for u, v, t in ((0, 1, 4.0), (0, 1, 2.0), (1, 2, 3.0), (0, 2, 9.0), (2, 3, 1.0), (3, 0, 1.0)):
+            self.G.add_edge(self.ids[u], self.ids[v], travel_time=t)
+        self.G.add_edge(self.ids[1], self.ids[3], travel_time=float("inf"))
+
+    def test_numbering_and_degrees(self):
+        """Test graph-order indices, ID translation and degrees."""
+        index = NodeIndex.build(self.G)
+        self.assertEqual(index.ids.tolist(), [*self.ids, 5])
+        self.assertEqual(index.index(9000000001), 2)
+        self.assertEqual(index.index(123), -1)
+        self.assertEqual(index.positions([77, 13053107295, 1]).tolist(), [3, 0, -1])
+        self.assertEqual(index.degree.tolist(), [d for _, d in self.G.degree()])
+        self.assertEqual(index.valid(1).tolist(), [0, 1, 2, 3])
+        self.assertEqual(index.valid(1, index.mask([42, 77])).tolist(), [1, 3])
+        self.assertEqual(index.within_km(0, 1.0).tolist(), [0, 1])
+        self.assertEqual(index.node_ids([3, 0]), [77, 13053107295])
+
+    def test_dijkstra_matches_networkx(self):
+        """Test array distances, predecessor paths and early stopping."""
+        index = NodeIndex.build(self.G)
+        costs = index.edge_costs(self.G, "travel_time")
+        dist, pred = index.dijkstra(0, costs)
+        lengths, paths = nx.single_source_dijkstra(self.G, self.ids[0], weight="travel_time")
+        for node, length in lengths.items():
+            self.assertAlmostEqual(dist[index.index(node)], length)
+            self.assertEqual(index.node_ids(index.path(pred, index.index(node))), paths[node])
+        self.assertEqual(dist[4], float("inf"))
+        dist, _ = index.dijkstra(0, costs, targets=[1])
+        self.assertEqual(dist[1], 2.0)
+        self.assertEqual(dist[3], float("inf"))
+        dist, _ = index.dijkstra(0, costs, cutoff=5.0)
+        self.assertEqual(np.isfinite(dist).tolist(), [True, True, True, False, False])
+
+    def test_tree_totals_follow_chosen_edges(self):
+        """Test path sums along the search tree, using the cheaper parallel edge."""
+        for u, v, data in self.G.edges(data=True):
+            data["length"] = 10.0 * data["travel_time"]
+        index = NodeIndex.build(self.G)
+        costs = index.edge_costs(self.G, "travel_time")
+        dist, pred = index.dijkstra(0, costs)
+        np.testing.assert_allclose(index.tree_totals(dist, pred, costs, costs)[:4], dist[:4])
+        lengths = index.tree_totals(dist, pred, costs, index.edge_costs(self.G, "length"))
+        self.assertEqual(lengths[:4].tolist(), [0.0, 20.0, 50.0, 60.0])
+        self.assertTrue(np.isnan(lengths[4]))
+
+    def test_persisted_index_follows_fingerprint(self):
+        """Test reuse of the sidecar, rebuilds on change and topology invalidation."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            graph_path = Path(tmpdir) / "net.graphml"
+            graph_path.write_text("v1")
+            load_node_index(self.G, graph_path)
+            sidecar = Path(tmpdir) / "net.nodeindex.npz"
+            self.assertTrue(sidecar.exists())
+            with patch.object(NodeIndex, "build", side_effect=AssertionError("rebuilt")):
+                self.assertEqual(len(load_node_index(self.G, graph_path)), 5)
+
+            self.G.add_edge(5, 42, travel_time=1.0)
+            graph_path.write_text("v2")
+            self.assertEqual(load_node_index(self.G, graph_path).degree[4], 1)
+            refresh_artifacts(self.G, graph_path, {"travel_time"})
+            self.assertTrue(sidecar.exists())
+            refresh_artifacts(self.G, graph_path, {"topology"})
+            self.assertFalse(sidecar.exists())
+
+
+class TestShards(unittest.TestCase):
+    """Test spatial sharding and region loading."""
+
+    def setUp(self):
+        """Create a two-way path of 4 nodes spaced 1 degree apart in x."""
+        self.graph = nx.MultiDiGraph(crs="epsg:4326")
+        for n in range(4):
+            self.graph.add_node(n + 1, x=-123.5 + n, y=49.5, street_count=2)
+        for n in range(1, 4):
+            self.graph.add_edge(n, n + 1, length=1000.0, osmid=n)
+            self.graph.add_edge(n + 1, n, length=1000.0, osmid=n)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = shard_graph(self.graph, Path(self.tmpdir.name), tile_size=1.0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_index(self):
+        """Test one tile per node with boundary nodes for crossing edges."""
+        self.assertEqual(len(self.index["tiles"]), 4)
+        tile = self.index["tiles"]["-123_49"]
+        self.assertEqual(tile["bbox"], [-123.0, 49.0, -122.0, 50.0])
+        self.assertEqual(tile["boundary_nodes"], [1, 3])
+
+    def test_load_all_shards(self):
+        """Test that loading every shard restores the graph."""
+        region = load_region(Path(self.tmpdir.name))
+        self.assertEqual(set(region.edges(keys=True)), set(self.graph.edges(keys=True)))
+
+    def test_bbox_and_corridor_selection(self):
+        """Test tile selection by bbox and by a node-ID corridor."""
+        index = load_shard_index(Path(self.tmpdir.name) / "index.json")
+        self.assertEqual(select_tiles(index, bbox=(-123.9, 49.2, -123.1, 49.8)), ["-124_49"])
+        self.assertEqual(sorted(select_tiles(index, corridor=(1, 2), buffer_km=5.0)), ["-123_49", "-124_49"])
+        region = load_region(Path(self.tmpdir.name), corridor=(1, 2), buffer_km=5.0)
+        self.assertEqual(nx.shortest_path(region, 1, 2), [1, 2])
+
+    def test_is_shard_index(self):
+        """Test that only real shard indexes (or their folders) are detected."""
+        root = Path(self.tmpdir.name)
+        self.assertTrue(is_shard_index(root))
+        self.assertTrue(is_shard_index(root / "index.json"))
+        config = root / "config.json"
+        config.write_text('{"routing_profiles": {}}')
+        self.assertFalse(is_shard_index(config))
+        self.assertFalse(is_shard_index(root / "missing.json"))
+        self.assertFalse(is_shard_index(root / "tile_-124_49.graphml"))
+
+
+class TestDiff(unittest.TestCase):
+    """Test streaming snapshot diffs."""
+
+    def setUp(self):
+        """Write an old snapshot and a new one with one change of each kind."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = Path(self.tmpdir.name)
+        graph = nx.MultiDiGraph(crs="epsg:4326")
+        for n in range(1, 5):
+            graph.add_node(n, x=float(n), y=0.0)
+        graph.add_edge(1, 2, osmid=10, highway="residential", length=100.0, travel_time=9.0)
+        graph.add_edge(2, 3, osmid=11, highway="residential", length=100.0)
+        graph.add_edge(3, 4, osmid=12, highway="track", length=100.0)
+        self.old = root / "Place__20240101.graphml"
+        ox.save_graphml(graph, self.old)
+
+        graph[1][2][0]["travel_time"] = 12.0  # derived value, not compared
+        graph[2][3][0]["maxspeed"] = "30"
+        graph.remove_edge(3, 4)
+        graph.add_edge(4, 1, osmid=13, highway="service", length=50.0)
+        graph.nodes[4]["y"] = 0.5
+        self.new = root / "Place__20250101.graphml"
+        ox.save_graphml(graph, self.new)
+        self.changes = root / "changes.jsonl"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_changeset(self):
+        """Test counts and changeset records."""
+        counts = diff_graphml(self.old, self.new, output=self.changes, partitions=4)
+        self.assertEqual(counts["edge_added"], 1)
+        self.assertEqual(counts["edge_removed"], 1)
+        self.assertEqual(counts["edge_modified"], 1)
+        self.assertEqual(counts["node_modified"], 1)
+
+        records = [json.loads(line) for line in self.changes.read_text().splitlines()]
+        modified = [r for r in records if r["op"] == "modified" and r["type"] == "edge"]
+        self.assertEqual(modified[0]["osmid"], "11")
+        self.assertEqual(modified[0]["changed"], {"maxspeed": [None, "30"]})
+
+    def test_apply_changeset(self):
+        """Test that applying the changeset to the old snapshot yields the new one."""
+        diff_graphml(self.old, self.new, output=self.changes)
+        graph = ox.load_graphml(self.old)
+        result = apply_changeset(graph, read_changeset(self.changes))
+        new = ox.load_graphml(self.new)
+        self.assertEqual(set(graph.edges(keys=True)), set(new.edges(keys=True)))
+        self.assertEqual(graph[2][3][0]["maxspeed"], "30")
+        self.assertEqual(graph.nodes[4]["y"], 0.5)
+        self.assertEqual(result["kinds"], {"topology", "tags", "travel_time", "geometry"})
+        self.assertIn((2, 3, 0), result["edges"])
+
+    def test_parallel_edges_are_diffed_separately(self):
+        """Test that a change to the second of two same-osmid edges is applied to it."""
+        root = Path(self.tmpdir.name)
+        graph = ox.load_graphml(self.old)
+        graph.add_edge(1, 2, osmid=10, highway="residential", length=140.0)
+        ox.save_graphml(graph, root / "old_parallel.graphml")
+        graph[1][2][1]["surface"] = "gravel"
+        ox.save_graphml(graph, root / "new_parallel.graphml")
+
+        counts = diff_graphml(root / "old_parallel.graphml", root / "new_parallel.graphml", output=self.changes)
+        self.assertEqual(counts["edge_modified"], 1)
+        record = json.loads(self.changes.read_text())
+        self.assertEqual(record["key"], "1")
+        self.assertEqual(record["attrs"]["length"], "140.0")
+
+        old = ox.load_graphml(root / "old_parallel.graphml")
+        apply_changeset(old, read_changeset(self.changes))
+        self.assertEqual(old[1][2][1]["surface"], "gravel")
+        self.assertNotIn("surface", old[1][2][0])
+
+    def test_exit_code(self):
+        """Test diff-style exit codes."""
+        self.assertEqual(diff_snapshots(self.old, self.old, exit_code=True), 0)
+        self.assertEqual(diff_snapshots(self.old, self.new, exit_code=True), 1)
+        self.assertEqual(diff_snapshots(self.old, self.new), 0)
+        self.assertEqual(diff_snapshots(self.old, Path(self.tmpdir.name) / "missing.graphml"), 2)
+
+
+class TestApplyOsc(unittest.TestCase):
+    """Test applying osmChange files to a simplified graph."""
+
+    OSC = """<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <create>
+    <node id="12" lat="0.001" lon="0.0025"/>
+    <node id="40" lat="0.01" lon="0.02"/>
+    <way id="30"><nd ref="3"/><nd ref="40"/><tag k="highway" v="service"/></way>
+    <node id="50" lat="10.0" lon="10.0"/>
+    <node id="51" lat="10.0" lon="10.01"/>
+    <way id="60"><nd ref="50"/><nd ref="51"/><tag k="highway" v="residential"/></way>
+  </create>
+  <modify>
+    <way id="10"><nd ref="1"/><nd ref="12"/><nd ref="11"/><nd ref="2"/>
+      <tag k="highway" v="residential"/><tag k="maxspeed" v="30"/></way>
+  </modify>
+  <delete>
+    <way id="20"/>
+  </delete>
+</osmChange>
+"""
+
+    def setUp(self):
+        """Create a two-way road 1-(11)-2 and a one-way road 2->3."""
+        self.graph = nx.MultiDiGraph(crs="epsg:4326")
+        for n, x in [(1, 0.0), (2, 0.01), (3, 0.02)]:
+            self.graph.add_node(n, x=x, y=0.0)
+        shape = [(0.0, 0.0), (0.005, 0.0), (0.01, 0.0)]
+        for u, v, points, rev in [(1, 2, shape, False), (2, 1, shape[::-1], True)]:
+            self.graph.add_edge(u, v, osmid=10, highway="residential", oneway=False, reversed=rev,
+                                length=1113.0, geometry=LineString(points))
+        self.graph.add_edge(2, 3, osmid=20, highway="residential", oneway=True, reversed=False, length=1113.0)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.osc = Path(self.tmpdir.name) / "change.osc"
+        self.osc.write_text(self.OSC)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parse_osc(self):
+        """Test streaming parse of creates, modifies and deletes."""
+        changes = parse_osc(self.osc, {"highway", "maxspeed"})
+        self.assertEqual(changes["ways"][10]["nodes"], [1, 12, 11, 2])
+        self.assertEqual(changes["ways"][10]["tags"], {"highway": "residential", "maxspeed": "30"})
+        self.assertEqual(changes["deleted_ways"], {20})
+        self.assertIn(12, changes["created_nodes"])
+
+    def test_apply_changes(self):
+        """Test rebuilt, removed and created ways."""
+        result = apply_osc_changes(self.graph, parse_osc(self.osc, {"highway", "maxspeed"}), date="2025-01-01")
+        self.assertEqual(result["ways_applied"], 2)
+        self.assertEqual(result["ways_removed"], 1)
+        self.assertFalse(self.graph.has_edge(2, 3))
+
+        # the reshaped way keeps its old interior point and gains the new node
+        data = self.graph[1][2][0]
+        self.assertEqual(data["maxspeed"], "30")
+        self.assertEqual(list(data["geometry"].coords), [(0.0, 0.0), (0.0025, 0.001), (0.005, 0.0), (0.01, 0.0)])
+        self.assertTrue(self.graph[2][1][0]["reversed"])
+
+        # new service road from 3 to a new node; the far-away road is ignored
+        self.assertTrue(self.graph.has_edge(3, 40))
+        self.assertEqual(self.graph.nodes[40]["y"], 0.01)
+        self.assertNotIn(50, self.graph)
+
+
+class TestArtifactRegistry(unittest.TestCase):
+    """Test invalidation of derived artifacts after an update."""
+
+    def setUp(self):
+        """Register a component sidecar for a small graph file."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.graph_path = Path(self.tmpdir.name) / "master.graphml"
+        self.graph_path.write_text("v1")
+        self.graph = nx.MultiDiGraph()
+        self.graph.add_edge(1, 2)
+        self.graph.add_edge(2, 1)
+        load_component_index(self.graph, self.graph_path)
+        self.sidecar = Path(self.tmpdir.name) / "master.components.npz"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_unaffected_artifact_is_restamped(self):
+        """Test that travel-time-only changes keep component labels valid."""
+        self.graph_path.write_text("v2")
+        result = refresh_artifacts(self.graph, self.graph_path, {"travel_time"})
+        self.assertEqual(result["kept"], ["master.components.npz"])
+        with np.load(self.sidecar) as data:
+            self.assertEqual(str(data["fingerprint"]), file_fingerprint(self.graph_path))
+
+    def test_dependent_artifact_is_invalidated(self):
+        """Test that topology changes delete component labels."""
+        self.graph_path.write_text("v2")
+        result = refresh_artifacts(self.graph, self.graph_path, {"topology"})
+        self.assertEqual(result["invalidated"], ["master.components.npz"])
+        self.assertFalse(self.sidecar.exists())
+
+    def test_new_output_leaves_source_artifacts(self):
+        """Test that writing the update elsewhere copies kept artifacts under the new stem."""
+        load_node_index(self.graph, self.graph_path)
+        source_registry = self.graph_path.with_name("master.artifacts.json").read_text()
+        output = Path(self.tmpdir.name) / "out" / "master2.graphml"
+        output.parent.mkdir()
+        output.write_text("v2")
+
+        result = refresh_artifacts(self.graph, output, {"tags"}, source_path=self.graph_path)
+        self.assertEqual(result["invalidated"], ["master.components.npz"])
+        self.assertEqual(result["kept"], ["master2.nodeindex.npz"])
+        # the unchanged input keeps its files, fingerprints and registry
+        self.assertTrue(self.sidecar.exists())
+        self.assertTrue(Path(self.tmpdir.name, "master.nodeindex.npz").exists())
+        self.assertEqual(self.graph_path.with_name("master.artifacts.json").read_text(), source_registry)
+        self.assertIsNotNone(ComponentIndex.load(self.sidecar, fingerprint=file_fingerprint(self.graph_path)))
+        # the output registers a re-stamped copy that its loader picks up
+        registry = json.loads(output.with_name("master2.artifacts.json").read_text())
+        self.assertEqual(registry["artifacts"]["master2.nodeindex.npz"]["path"], "master2.nodeindex.npz")
+        self.assertFalse(output.with_name("master2.components.npz").exists())
+        with patch.object(NodeIndex, "build", side_effect=AssertionError("rebuilt")):
+            self.assertEqual(len(load_node_index(self.graph, output)), 2)
+
+    def test_unknown_kind_depends_on_everything(self):
+        """Test that artifacts of unknown kind are invalidated by any change."""
+        other = Path(self.tmpdir.name) / "other.json"
+        other.write_text("{}")
+        register_artifact(self.graph_path, "other", "future_kind", other, "x")
+        result = refresh_artifacts(self.graph, self.graph_path, {"geometry"})
+        self.assertEqual(result["invalidated"], ["other"])
+
+
+class TestMultiFileStats(unittest.TestCase):
+    """Test stats over folders with the per-file results cache."""
+
+    def setUp(self):
+        """Write two small GraphML files into a temporary folder."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmpdir.name)
+        for name, length in (("a.graphml", 1000.0), ("b.graphml", 2500.0)):
+            G = nx.MultiDiGraph(crs="epsg:4326")
+            G.add_node(1, x=-122.0, y=49.0)
+            G.add_node(2, x=-122.01, y=49.0)
+            G.add_edge(1, 2, length=length, highway="track", tracktype="grade2")
+            ox.save_graphml(G, self.folder / name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_resolve_folder_and_glob(self):
+        """Test that folders and glob patterns expand to GraphML files."""
+        expected = [self.folder / "a.graphml", self.folder / "b.graphml"]
+        self.assertEqual(resolve_graph_files(self.folder), expected)
+        self.assertEqual(resolve_graph_files(str(self.folder / "*.graphml")), expected)
+
+    def test_cache_hit_skips_load(self):
+        """Test that an unchanged file is answered from its sidecar."""
+        path = self.folder / "a.graphml"
+        first = file_stats(path)
+        self.assertTrue((self.folder / "a.stats.json").exists())
+        with patch("map_tool.ox.load_graphml", side_effect=AssertionError("reloaded")):
+            self.assertEqual(file_stats(path), first)
+        self.assertAlmostEqual(first["track_km"], 1.0)
+        self.assertEqual(first["tracktype"]["grade2"], 1)
+
+    def test_cached_folder_skips_pool_and_hashing(self):
+        """Test that an unchanged folder is answered without workers or SHA-1."""
+        with patch("builtins.print"):
+            calculate_stats(self.folder, workers=1)
+        with patch("map_tool.ProcessPoolExecutor", side_effect=AssertionError("pool")), \
+                patch("map_tool.file_fingerprint", side_effect=AssertionError("hashed")), \
+                patch("builtins.print"):
+            self.assertEqual(calculate_stats(self.folder, workers=2), 0)
+
+    def test_touched_file_is_verified_by_hash(self):
+        """Test that a new mtime falls back to the fingerprint, not a reload."""
+        path = self.folder / "a.graphml"
+        file_stats(path)
+        os.utime(path, ns=(0, 0))
+        with patch("map_tool.ox.load_graphml", side_effect=AssertionError("reloaded")):
+            self.assertAlmostEqual(file_stats(path)["track_km"], 1.0)
+
+    def test_combined_folder_stats(self):
+        """Test the combined row over a folder, including the worker pool."""
+        with patch("builtins.print") as mock_print:
+            self.assertEqual(calculate_stats(self.folder, workers=2), 0)
+        output = "\n".join(str(call.args[0]) for call in mock_print.call_args_list if call.args)
+        self.assertIn("NETWORK STATISTICS (2 files)", output)
+        combined = next(line for line in output.splitlines() if "Combined" in line)
+        self.assertIn("3.5", combined)
+
+
+class TestCompressedGraphML(unittest.TestCase):
+    """Test transparent reading and writing of compressed GraphML."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmpdir.name)
+        self.graph = nx.MultiDiGraph(crs="epsg:4326")
+        self.graph.add_node(1, x=-122.0, y=49.0)
+        self.graph.add_node(2, x=-122.01, y=49.0)
+        self.graph.add_edge(1, 2, length=731.5, highway="residential")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_gzip_round_trip(self):
+        """Test that .graphml.gz is written compressed and loads back typed."""
+        path = self.folder / "net.graphml.gz"
+        save_graph(self.graph, path)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(2), b"\x1f\x8b")
+        loaded = load_graph(path)
+        self.assertEqual(set(loaded.nodes), {1, 2})
+        self.assertEqual(loaded.edges[1, 2, 0]["length"], 731.5)
+
+    def test_folder_listing_and_stem(self):
+        """Test that folders list compressed files and sidecars drop suffixes."""
+        save_graph(self.graph, self.folder / "a.graphml")
+        save_graph(self.graph, self.folder / "b.graphml.gz")
+        (self.folder / "notes.txt").write_text("x")
+        names = [p.name for p in list_graph_files(self.folder)]
+        self.assertEqual(names, ["a.graphml", "b.graphml.gz"])
+        self.assertEqual(graph_stem("b.graphml.gz"), "b")
+        self.assertEqual(graph_stem("c.graphml.zst"), "c")
+        self.assertEqual(graph_stem("a.graphml"), "a")
+
+    def test_output_filepath_compression(self):
+        """Test that fetch's default name carries the compression suffix."""
+        path = get_output_filepath("Langley, BC", Path("/tmp"), date="2025-01-01", compress="gz")
+        self.assertEqual(path.name, "Langley_BC__20250101.graphml.gz")
+
+
+class TestGeocodeStore(unittest.TestCase):
+    """Test the SQLite place -> boundary store and the geocode command."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "geocode.sqlite"
+        self.store = GeocodeStore(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @staticmethod
+    def fake_gdf(query):
+        if query.startswith("Nowhere"):
+            raise ValueError("Nominatim geocoder returned 0 results")
+        return gpd.GeoDataFrame(
+            {"osm_type": ["relation"], "osm_id": [2316741], "display_name": [f"{query}, Canada"]},
+            geometry=[shapely_box(-122.7, 49.0, -122.5, 49.2)],
+            crs="epsg:4326",
+        )
+
+    def test_put_get_and_key_normalisation(self):
+        """Test that lookups ignore case and repeated whitespace."""
+        self.store.put("Langley, BC", shapely_box(0, 0, 1, 2), osm_type="relation", osm_id=7)
+        record = self.store.get("  langley,   bc ")
+        self.assertEqual(record["place_name"], "Langley, BC")
+        self.assertEqual(record["bbox"], (0.0, 0.0, 1.0, 2.0))
+        self.assertEqual(record["osm_id"], 7)
+        self.assertIn("LANGLEY, BC", self.store)
+        self.assertIsNone(self.store.get("Hope, BC"))
+        self.assertEqual(len(self.store), 1)
+
+    def test_geocode_queries_once(self):
+        """Test that a stored place is not sent to Nominatim again."""
+        with patch("map_tool.ox.geocode_to_gdf", side_effect=self.fake_gdf) as geocode:
+            first = self.store.geocode("Langley, BC")
+            second = self.store.geocode("Langley, BC")
+        self.assertEqual(geocode.call_count, 1)
+        self.assertEqual(first["display_name"], "Langley, BC, Canada")
+        self.assertTrue(second["geometry"].equals(first["geometry"]))
+
+    def test_geocode_command(self):
+        """Test batch geocoding: new, already stored and failed places."""
+        self.store.put("Hope, BC", shapely_box(0, 0, 1, 1))
+        with patch("map_tool.ox.geocode_to_gdf", side_effect=self.fake_gdf) as geocode, patch("builtins.print"):
+            result = geocode_places(["Langley, BC", "Hope, BC", "Nowhere, BC"], db_path=self.path)
+        self.assertEqual(result, 1)
+        self.assertEqual(geocode.call_count, 2)
+        self.assertIn("Langley, BC", self.store)
+        self.assertNotIn("Nowhere, BC", self.store)
+
+
+class TestFetchBatch(unittest.TestCase):
+    """Test the overlapped download/process/write pipeline."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.tmpdir.name) / "raw"
+        # no geocode store under this data_root, so places go through graph_from_place
+        self.config = {**DEFAULT_CONFIG, "data_root": self.tmpdir.name}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @staticmethod
+    def fake_download(place, **kwargs):
+        if place.startswith("Nowhere"):
+            raise ValueError("no such place")
+        G = nx.MultiDiGraph(crs="epsg:4326")
+        G.add_node(1, x=-122.0, y=49.0)
+        G.add_node(2, x=-122.01, y=49.0)
+        G.add_edge(1, 2, osmid=1, length=731.5, highway="residential", maxspeed="50")
+        return G
+
+    def test_places_are_saved(self):
+        """Test that every place is downloaded, processed and saved."""
+        places = ["Langley, BC", "Hope, BC", "Surrey, BC"]
+        with patch("map_tool.ox.graph_from_place", side_effect=self.fake_download), patch("builtins.print"):
+            result = fetch_batch(
+                places, self.output_dir, date="2025-01-01", config=self.config, download_workers=2, queue_size=1
+            )
+        self.assertEqual(result, 0)
+        names = sorted(p.name for p in self.output_dir.iterdir())
+        self.assertEqual(names, ["Hope_BC__20250101.graphml", "Langley_BC__20250101.graphml", "Surrey_BC__20250101.graphml"])
+        graph = ox.load_graphml(self.output_dir / "Hope_BC__20250101.graphml")
+        self.assertEqual(graph.graph["source_place"], "Hope, BC")
+        self.assertIn("travel_time", graph.edges[1, 2, 0])
+
+    def test_failed_place_sets_exit_code(self):
+        """Test that a failed download is reported without stopping the batch."""
+        with patch("map_tool.ox.graph_from_place", side_effect=self.fake_download), patch("builtins.print"):
+            result = fetch_batch(
+                ["Nowhere, BC", "Hope, BC"], self.output_dir, date="2025-01-01", retry=1, config=self.config
+            )
+        self.assertEqual(result, 1)
+        self.assertEqual([p.name for p in self.output_dir.iterdir()], ["Hope_BC__20250101.graphml"])
+
+    def test_geocode_store_replaces_nominatim(self):
+        """Test that a stored boundary is fetched by polygon without geocoding."""
+        store = GeocodeStore(Path(self.tmpdir.name) / "geocode.sqlite")
+        store.put("Hope, BC", shapely_box(-121.5, 49.3, -121.4, 49.4))
+        with patch("map_tool.ox.graph_from_polygon", side_effect=lambda polygon, **kw: self.fake_download("Hope")) as by_polygon, \
+                patch("map_tool.ox.geocode_to_gdf", side_effect=AssertionError("geocoded")), \
+                patch("map_tool.ox.graph_from_place", side_effect=AssertionError("by place")), \
+                patch("builtins.print"):
+            result = fetch_batch(["hope,  bc"], self.output_dir, date="2025-01-01", config=self.config)
+        self.assertEqual(result, 0)
+        self.assertEqual(by_polygon.call_args.args[0].bounds, (-121.5, 49.3, -121.4, 49.4))
+
+    def test_read_places_file(self):
+        """Test that blank lines and comments are skipped."""
+        path = Path(self.tmpdir.name) / "places.txt"
+        path.write_text("# Fraser Valley\nLangley, BC\n\nHope, BC  # town\n")
+        self.assertEqual(read_places_file(path), ["Langley, BC", "Hope, BC"])
+
+
+class TestFetchPlan(unittest.TestCase):
+    """Test manifest fetches of the uncovered union of areas."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = Path(self.tmpdir.name)
+        self.output_dir = root / "plan"
+        self.config = {**DEFAULT_CONFIG, "data_root": self.tmpdir.name}
+        # two bboxes overlapping by half: union is 0.3 x 0.2 degrees
+        self.manifest = root / "plan.json"
+        self.manifest.write_text(json.dumps({
+            "name": "test",
+            "areas": [{"bbox": [-122.3, 49.0, -122.1, 49.2]}, {"bbox": [-122.2, 49.0, -122.0, 49.2]}],
+        }))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @staticmethod
+    def fake_download(polygon, **kwargs):
+        west, south, _, _ = polygon.bounds
+        G = nx.MultiDiGraph(crs="epsg:4326")
+        G.add_node(1, x=west + 0.01, y=south + 0.01)
+        G.add_node(2, x=west + 0.02, y=south + 0.01)
+        G.add_edge(1, 2, osmid=1, length=731.5, highway="residential", maxspeed="50")
+        return G
+
+    def run_plan(self, **kwargs):
+        with patch("map_tool.ox.graph_from_polygon", side_effect=self.fake_download) as download, \
+                patch("builtins.print"):
+            result = fetch_plan(self.manifest, self.output_dir, date="2025-01-01", config=self.config,
+                                tile_deg=0.25, **kwargs)
+        return result, download
+
+    def test_union_is_fetched_once(self):
+        """Test that overlaps are requested once and a re-run fetches nothing."""
+        result, download = self.run_plan()
+        self.assertEqual(result, 0)
+        requested = unary_union([call.args[0] for call in download.call_args_list])
+        self.assertAlmostEqual(requested.area, 0.3 * 0.2, places=9)
+        self.assertAlmostEqual(sum(call.args[0].area for call in download.call_args_list), 0.3 * 0.2, places=9)
+
+        ledger = json.loads((self.output_dir / "coverage.json").read_text())["files"]
+        self.assertEqual(len(ledger), download.call_count)
+        self.assertTrue(all((self.output_dir / e["file"]).exists() for e in ledger))
+
+        result, download = self.run_plan()
+        self.assertEqual(result, 0)
+        self.assertEqual(download.call_count, 0)
+
+    def test_since_ignores_older_coverage(self):
+        """Test that --since refetches areas covered before that date."""
+        self.run_plan()
+        _, download = self.run_plan(since="2025-06-01")
+        self.assertGreater(download.call_count, 0)
+
+    def test_grown_manifest_same_day_keeps_files(self):
+        """Test that a same-day re-run with a grown manifest adds files instead of overwriting."""
+        self.run_plan()
+        first = json.loads((self.output_dir / "coverage.json").read_text())["files"]
+        plan = json.loads(self.manifest.read_text())
+        plan["areas"].append({"bbox": [-122.0, 49.0, -121.9, 49.2]})
+        self.manifest.write_text(json.dumps(plan))
+
+        _, download = self.run_plan()
+        self.assertEqual(download.call_count, 1)
+        ledger = json.loads((self.output_dir / "coverage.json").read_text())["files"]
+        self.assertEqual(len(ledger), len(first) + 1)
+        self.assertEqual(len({e["file"] for e in ledger}), len(ledger))
+        self.assertLessEqual({e["file"] for e in first}, {e["file"] for e in ledger})
+        self.assertEqual(len(list_graph_files(self.output_dir)), len(ledger))
+        self.assertAlmostEqual(covered_area(self.output_dir).area, 0.4 * 0.2, places=9)
+
+    def test_unlisted_graph_files_count_as_coverage(self):
+        """Test that GraphML files missing from the ledger cover their node hull."""
+        self.output_dir.mkdir()
+        G = nx.MultiDiGraph(crs="epsg:4326")
+        for node, (x, y) in enumerate([(-122.3, 49.0), (-122.1, 49.0), (-122.1, 49.2), (-122.3, 49.2)], start=1):
+            G.add_node(node, x=x, y=y)
+        G.add_edge(1, 2, osmid=1, length=100.0)
+        ox.save_graphml(G, self.output_dir / "West_BC__20250101.graphml")
+        self.assertAlmostEqual(covered_area(self.output_dir).area, 0.2 * 0.2, places=9)
+        self.assertTrue(covered_area(self.output_dir, since="2025-06-01").is_empty)
+
+        _, download = self.run_plan()
+        requested = unary_union([call.args[0] for call in download.call_args_list])
+        self.assertAlmostEqual(requested.area, 0.1 * 0.2, places=9)
+        self.assertGreaterEqual(requested.bounds[0], -122.1 - 1e-9)
+
+    def test_dry_run_and_slivers(self):
+        """Test that a dry run fetches nothing and slivers are dropped."""
+        _, download = self.run_plan(dry_run=True)
+        self.assertEqual(download.call_count, 0)
+        self.assertFalse(self.output_dir.exists())
+        sliver = shapely_box(-122.0, 49.0, -121.99999, 49.2)
+        self.assertEqual(split_gaps(sliver, 0.25, min_km2=0.05), [])
+
+
+class TestEdgeStore(unittest.TestCase):
+    """Test the SQLite edge store and SQL-driven stats."""
+
+    def setUp(self):
+        """Write two dated GraphML files into a temporary folder."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmpdir.name) / "raw"
+        self.folder.mkdir()
+        for name, date, x in (("a.graphml", "2025-01-01", -122.0), ("b.graphml", "2025-02-01", -121.0)):
+            G = nx.MultiDiGraph(crs="epsg:4326")
+            G.add_node(1 if x < -121.5 else 11, x=x, y=49.0)
+            G.add_node(2 if x < -121.5 else 12, x=x - 0.01, y=49.0)
+            G.add_node(3 if x < -121.5 else 13, x=x - 0.02, y=49.01)
+            u, v, w = list(G.nodes)
+            G.add_edge(u, v, length=1000.0, highway="track", tracktype="Grade2", surface="gravel",
+                       access="private", date_fetched=date)
+            G.add_edge(v, w, length=500.0, highway="service", service="alley", surface="asphalt",
+                       smoothness="good", date_fetched=date,
+                       geometry=LineString([(x - 0.01, 49.0), (x - 0.03, 49.02), (x - 0.02, 49.01)]))
+            ox.save_graphml(G, self.folder / name)
+        self.store = EdgeStore(Path(self.tmpdir.name) / "edges.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_sql_stats_match_graph_stats(self):
+        """Test that per-source SQL stats equal compute_stats on the loaded graph."""
+        for path in list_graph_files(self.folder):
+            self.assertTrue(self.store.load(path))
+        rows = dict(self.store.stats())
+        self.assertEqual(sorted(rows), ["a.graphml", "b.graphml"])
+        expected = compute_stats(load_graph(self.folder / "a.graphml"))
+        for key, value in expected.items():
+            if isinstance(value, float):
+                self.assertAlmostEqual(rows["a.graphml"][key], value)
+            else:
+                self.assertEqual(rows["a.graphml"][key], value)
+
+    def test_reload_replaces_rows(self):
+        """Test that unchanged files are skipped and forced reloads do not duplicate rows."""
+        path = self.folder / "a.graphml"
+        self.assertTrue(self.store.load(path))
+        self.assertFalse(self.store.load(path))
+        self.assertTrue(self.store.load(path, force=True))
+        self.assertEqual([s["edges"] for s in self.store.sources()], [2])
+
+    def test_group_where_and_bbox(self):
+        """Test grouping by date, SQL filters, bbox filters and JSON tags."""
+        for path in list_graph_files(self.folder):
+            self.store.load(path)
+        rows = dict(self.store.stats(group_by="date_fetched", where="highway = 'track' AND access = 'private'"))
+        self.assertEqual(sorted(rows), ["2025-01-01", "2025-02-01"])
+        self.assertAlmostEqual(rows["2025-01-01"]["track_km"], 1.0)
+        self.assertAlmostEqual(rows["2025-01-01"]["unpaved_km"], 1.0)
+        self.assertEqual(rows["2025-01-01"]["tracktype"]["grade2"], 1)
+        # the alley's geometry bulges west of its end nodes
+        rows = dict(self.store.stats(bbox=(-122.035, 49.015, -122.025, 49.025)))
+        self.assertEqual(list(rows), ["a.graphml"])
+        self.assertAlmostEqual(rows["a.graphml"]["alley_km"], 0.5)
+        rows = self.store.stats(group_by="highway", where="json_extract(tags, '$.smoothness') = 'good'")
+        self.assertEqual([name for name, _ in rows], ["service"])
+
+    def test_merge_updates_existing_store(self):
+        """Test that merge loads its output into an existing edge store."""
+        config = {**DEFAULT_CONFIG, "edge_db": str(self.store.path)}
+        output = Path(self.tmpdir.name) / "merged.graphml"
+        self.assertEqual(merge_graphs(self.folder, output, config=config), 0)
+        self.assertEqual([s["name"] for s in self.store.sources()], ["merged.graphml"])
+        self.assertEqual(dict(self.store.stats())["merged.graphml"]["edges"], 4)
+
+
+class TestIsochrones(unittest.TestCase):
+    """Test cutoff-bounded hub searches, their cache and the isochrones command."""
+
+    def setUp(self):
+        """Create a two-way chain 0..9 with one-minute edges and a blocked spur."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.G = nx.MultiDiGraph(crs="epsg:4326")
+        for i in range(10):
+            self.G.add_node(i, x=-122.0 + i * 0.01, y=49.0 + (i % 2) * 0.005)
+        for i in range(9):
+            for u, v in ((i, i + 1), (i + 1, i)):
+                self.G.add_edge(u, v, length=800.0, travel_time=60.0, weight_nurse=60.0)
+        self.G.add_node(10, x=-122.0, y=49.02)
+        self.G.add_edge(0, 10, length=100.0, travel_time=10.0, weight_nurse=float("inf"))
+        self.path = Path(self.tmpdir.name) / "chain.graphml"
+        save_graph(self.G, self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hub_reach_cutoff_and_exclusions(self):
+        """Test that searches stop at the cutoff and never take excluded edges."""
+        nodes, seconds = hub_reach(self.G, 0, 180.0)
+        self.assertEqual(nodes.tolist(), [0, 10, 1, 2, 3])
+        self.assertEqual(seconds.tolist(), [0.0, 10.0, 60.0, 120.0, 180.0])
+        nodes, _ = hub_reach(self.G, 0, 180.0, weight="weight_nurse")
+        self.assertNotIn(10, nodes.tolist())
+
+    def test_parallel_matches_serial_and_caches(self):
+        """Test the worker pool against in-process searches, then answer from the cache."""
+        serial = hub_isochrones(self.G, [0, 5, 9], 240.0, workers=1)
+        cache = IsochroneCache(Path(self.tmpdir.name) / "iso", "fp1")
+        parallel = hub_isochrones(self.G, [0, 5, 9], 240.0, workers=2, cache=cache)
+        for hub in serial:
+            np.testing.assert_array_equal(serial[hub][0], parallel[hub][0])
+        with patch("map_tool.hub_reach", side_effect=AssertionError("searched")):
+            # a smaller cutoff is answered from the larger stored search
+            cached = hub_isochrones(self.G, [5], 60.0, cache=cache)
+        self.assertEqual(sorted(cached[5][0].tolist()), [4, 5, 6])
+        stale = IsochroneCache(Path(self.tmpdir.name) / "iso", "fp2")
+        self.assertIsNone(stale.get(5, 60.0))
+
+    def test_command_outputs(self):
+        """Test the GeoJSON bands and node CSV of the isochrones command."""
+        prefix = Path(self.tmpdir.name) / "out" / "hubs"
+        with patch("builtins.print"):
+            self.assertEqual(isochrones(self.path, ["0", "49.005,-121.91"], prefix, bands_min=[2, 4], workers=1), 0)
+        with open(prefix.with_suffix(".geojson")) as f:
+            features = json.load(f)["features"]
+        bands = {(f["properties"]["hub"], f["properties"]["band_min"]): f for f in features}
+        self.assertEqual(sorted(bands), [(0, 2), (0, 4), (9, 2), (9, 4)])
+        self.assertEqual(bands[(0, 2)]["properties"]["nodes"], 4)
+        self.assertEqual(bands[(0, 2)]["geometry"]["type"], "Polygon")
+        self.assertGreater(bands[(0, 4)]["properties"]["area_km2"], bands[(0, 2)]["properties"]["area_km2"])
+        with open(prefix.with_suffix(".nodes.csv")) as f:
+            rows = [line.strip().split(",") for line in f][1:]
+        self.assertIn(["0", "3", "3.0", "4"], rows)
+        self.assertEqual(len(list(isochrone_cache_dir(self.path).glob("default__*__240.npz"))), 2)
+
+
+class TestRouteCache(unittest.TestCase):
+    """Test the on-disk LRU route cache."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = Path(self.tmpdir.name) / "routes.sqlite"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_path_encoding(self):
+        """Test that packed paths round-trip, including large OSM IDs."""
+        path = [13053107295, 10199121387, 42, 10199121388]
+        self.assertEqual(decode_path(encode_path(path)), path)
+
+    def test_keyed_by_graph_and_profile(self):
+        """Test that hits persist across instances and are scoped by graph hash and profile."""
+        with RouteCache(self.db, "g1", "nurse") as cache:
+            cache.put(1, 3, [1, 2, 3], length_m=1500.0, travel_s=90.0)
+            self.assertEqual(cache.get(1, 3)["path"], [1, 2, 3])
+        with RouteCache(self.db, "g1", "nurse") as cache:
+            self.assertEqual(cache.get(1, 3), {"path": [1, 2, 3], "length_m": 1500.0, "travel_s": 90.0})
+            self.assertIsNone(cache.get(3, 1))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+        with RouteCache(self.db, "g2", "nurse") as cache:
+            self.assertIsNone(cache.get(1, 3))
+        with RouteCache(self.db, "g1", "default") as cache:
+            self.assertIsNone(cache.get(1, 3))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used routes are evicted past the size cap."""
+        path = list(range(0, 4000, 7))
+        size = len(encode_path(path))
+        with RouteCache(self.db, "g", "p", max_bytes=size * 3) as cache:
+            for dest in (1, 2, 3):
+                cache.put(0, dest, path)
+            time.sleep(0.01)
+            cache.get(0, 1)
+            cache.put(0, 4, path)
+            cache.evict()
+            kept = [dest for dest in (1, 2, 3, 4) if cache.get(0, dest) is not None]
+        self.assertEqual(kept, [1, 4])
+
+    def test_cached_shortest_path_and_graph_hash(self):
+        """Test that a cached route skips the search and that edits change the graph hash."""
+        G = nx.MultiDiGraph()
+        G.add_edge(1, 2, travel_time=5.0)
+        G.add_edge(2, 3, travel_time=5.0)
+        G.add_edge(1, 3, travel_time=20.0)
+        graph_path = Path(self.tmpdir.name) / "g.graphml"
+        ox.save_graphml(G, graph_path)
+        graph_hash = route_graph_hash(graph_path)
+        self.assertNotEqual(graph_hash, route_graph_hash(graph_path, [-123.0, 49.0, -122.0, 50.0]))
+        with RouteCache(self.db, graph_hash, "travel_time") as cache:
+            self.assertEqual(cached_shortest_path(G, 1, 3, cache=cache), [1, 2, 3])
+            with patch("map_tool.nx.dijkstra_path", side_effect=AssertionError("searched")):
+                self.assertEqual(cached_shortest_path(G, 1, 3, cache=cache), [1, 2, 3])
+            self.assertIsNone(cached_shortest_path(G, 3, 1, cache=cache))
+        G.add_edge(3, 1, travel_time=1.0)
+        ox.save_graphml(G, graph_path)
+        self.assertNotEqual(route_graph_hash(graph_path), graph_hash)
+
+    def test_cached_route_opens_cache_per_source(self):
+        """Test the script helper: no cache without a path, reuse with one, scoped by hash parts."""
+        G = nx.MultiDiGraph()
+        G.add_edge(1, 2, travel_time=5.0)
+        G.add_edge(2, 3, travel_time=5.0)
+        graph_path = Path(self.tmpdir.name) / "g.graphml"
+        graph_path.write_text("v1")
+        self.assertEqual(cached_route(G, 1, 3, None, graph_path), [1, 2, 3])
+        self.assertFalse(self.db.exists())
+        self.assertEqual(cached_route(G, 1, 3, self.db, graph_path, 10.0), [1, 2, 3])
+        with patch("map_tool.nx.dijkstra_path", side_effect=AssertionError("searched")):
+            self.assertEqual(cached_route(G, 1, 3, self.db, graph_path, 10.0), [1, 2, 3])
+        with patch("map_tool.nx.dijkstra_path", return_value=[1, 3]) as search:
+            self.assertEqual(cached_route(G, 1, 3, self.db, graph_path, 25.0), [1, 3])
+        search.assert_called_once()
+
+
+class TestHubTables(unittest.TestCase):
+    """Test persisted one-to-all distance and predecessor tables."""
+
+    def setUp(self):
+        """Create a small graph with a shortcut, a one-way link and an unreachable node."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.G = nx.MultiDiGraph()
+        for u, v, t in ((10, 20, 5.0), (20, 30, 5.0), (10, 30, 20.0), (30, 40, 1.0), (40, 10, 3.0)):
+            self.G.add_edge(u, v, travel_time=t)
+        self.G.add_node(99)
+        self.path = Path(self.tmpdir.name) / "g.graphml"
+        self.path.write_text("v1")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lookups_match_dijkstra(self):
+        """Test array distances and predecessor walks against networkx."""
+        tables = load_hub_tables(self.G, self.path, [10, 30], workers=1)
+        index = load_node_index(self.G, self.path)
+        np.testing.assert_array_equal(tables.node_index.ids, index.ids)
+        lengths, paths = nx.single_source_dijkstra(self.G, 10, weight="travel_time")
+        for node, length in lengths.items():
+            self.assertAlmostEqual(tables.distance(10, index.index(node)), length)
+            self.assertEqual(index.node_ids(tables.path(10, index.index(node))), paths[node])
+        self.assertEqual(index.node_ids(tables.path(30, index.index(20))), [30, 40, 10, 20])
+        self.assertEqual(tables.distance(10, index.index(99)), float("inf"))
+        self.assertIsNone(tables.path(10, index.index(99)))
+        self.assertEqual(tables.arrays(10)[0].dtype, np.float32)
+        self.assertIsInstance(tables.arrays(10)[1], np.memmap)
+
+    def test_reuse_extend_and_invalidate(self):
+        """Test reuse across loads, adding hubs, and rebuilds on a new graph hash."""
+        load_hub_tables(self.G, self.path, [10])
+        with patch("map_tool.hub_table_arrays", side_effect=AssertionError("recomputed")):
+            self.assertEqual(load_hub_tables(self.G, self.path, [10]).hubs, [10])
+        with patch("map_tool.hub_table_arrays", wraps=hub_table_arrays) as spy:
+            tables = load_hub_tables(self.G, self.path, [10, 20, 30], workers=1)
+        self.assertEqual([c.args[2] for c in spy.call_args_list], tables.node_index.positions([20, 30]).tolist())
+        self.assertEqual(tables.hubs, [10, 20, 30])
+        self.path.write_text("v2")
+        with patch("map_tool.hub_table_arrays", wraps=hub_table_arrays) as spy:
+            self.assertEqual(load_hub_tables(self.G, self.path, [20]).hubs, [20])
+        self.assertEqual(spy.call_count, 1)
+        self.assertFalse((tables.directory / "10.dist.npy").exists())
+
+    def test_parallel_build_and_artifact_invalidation(self):
+        """Test the worker pool, and that travel-time updates drop the tables."""
+        tables = load_hub_tables(self.G, self.path, [10, 20, 30], workers=2)
+        serial = HubTables.build(self.G, [10, 20, 30], "travel_time", Path(self.tmpdir.name) / "serial", workers=1,
+                                 node_index=tables.node_index)
+        for hub in (10, 20, 30):
+            np.testing.assert_array_equal(tables.arrays(hub)[0], serial.arrays(hub)[0])
+        self.path.write_text("v2")
+        result = refresh_artifacts(self.G, self.path, {"travel_time"})
+        self.assertEqual(result["invalidated"], ["hub_tables.travel_time"])
+        self.assertFalse(tables.directory.exists())
+
+    def test_tables_follow_update_to_new_file(self):
+        """Test that an unaffected update written elsewhere copies and re-stamps the folder."""
+        tables = load_hub_tables(self.G, self.path, [10], workers=1)
+        output = self.path.with_name("g2.graphml")
+        output.write_text("v2")
+        result = refresh_artifacts(self.G, output, {"geometry"}, source_path=self.path)
+        self.assertEqual(result["kept"], ["hub_tables.travel_time"])
+        self.assertIsNotNone(HubTables.open(tables.directory, tables.node_index, fingerprint=file_fingerprint(self.path)))
+        copied = HubTables.open(hub_tables_dir(output, "travel_time"), tables.node_index,
+                                fingerprint=file_fingerprint(output))
+        self.assertEqual(copied.hubs, [10])
+        self.assertTrue((copied.directory / "10.pred.npy").exists())
+
+
+class TestStreamingStats(unittest.TestCase):
+    """Test the mergeable streaming summary and its KLL sketch."""
+
+    def setUp(self):
+        """Draw a skewed sample, like route travel times."""
+        self.values = np.random.default_rng(3).lognormal(2.0, 0.7, 50_000)
+
+    def assertRankClose(self, value, q, tolerance=0.02):
+        self.assertAlmostEqual(float((self.values <= value).mean()), q, delta=tolerance)
+
+    def test_exact_while_small(self):
+        """Test exact moments and nearest-rank quantiles before any compaction."""
+        stats = StreamingStats()
+        for value in [5.0, 1.0, 4.0, 2.0, 3.0, float("nan")]:
+            stats.add(value)
+        summary = stats.summary()
+        self.assertEqual(summary["count"], 5)
+        self.assertEqual((summary["min"], summary["p50"], summary["p90"], summary["max"]), (1.0, 3.0, 5.0, 5.0))
+        self.assertAlmostEqual(summary["mean"], 3.0)
+        self.assertAlmostEqual(summary["std"], np.std([1, 2, 3, 4, 5]))
+        self.assertIsNone(StreamingStats().summary()["p99"])
+
+    def test_bounded_sketch_quantiles(self):
+        """Test that memory stays bounded while quantiles stay within rank error."""
+        stats = StreamingStats()
+        for chunk in np.array_split(self.values, 50):
+            stats.update(chunk)
+        self.assertEqual(stats.count, len(self.values))
+        self.assertAlmostEqual(stats.mean, self.values.mean())
+        self.assertAlmostEqual(stats.std, self.values.std())
+        self.assertLess(sum(len(level) for level in stats._levels), 1000)
+        for q, value in zip([0.5, 0.9, 0.99], stats.quantiles([0.5, 0.9, 0.99])):
+            self.assertRankClose(value, q)
+
+    def test_merge_and_round_trip(self):
+        """Test that merged per-worker summaries match one summary of everything."""
+        parts = []
+        for i, chunk in enumerate(np.array_split(self.values, 4)):
+            part = StreamingStats(seed=i)
+            for value in chunk[:500]:
+                part.add(value)
+            part.update(chunk[500:])
+            parts.append(StreamingStats.from_dict(json.loads(json.dumps(part.to_dict()))))
+        merged = StreamingStats()
+        for part in parts:
+            merged.merge(part)
+        self.assertEqual(merged.count, len(self.values))
+        self.assertAlmostEqual(merged.mean, self.values.mean())
+        self.assertAlmostEqual(merged.std, self.values.std())
+        self.assertEqual((merged.min, merged.max), (self.values.min(), self.values.max()))
+        for q in (0.5, 0.9, 0.99):
+            self.assertRankClose(merged.quantile(q), q)
+
+    def test_merge_is_reproducible_and_checks_k(self):
+        """Test that equal seeds and merge order give equal sketches, and k must match."""
+        def merged():
+            total = StreamingStats(seed=7)
+            for i, chunk in enumerate(np.array_split(self.values, 8)):
+                part = StreamingStats(seed=i)
+                part.update(chunk)
+                total.merge(part)
+            return total.to_dict()
+
+        self.assertEqual(merged(), merged())
+        with self.assertRaises(ValueError):
+            StreamingStats(k=200).merge(StreamingStats(k=100))
+
+
+class TestCoverage(unittest.TestCase):
+    """Test the coverage raster and gap summary."""
+
+    def setUp(self):
+        """Write a network whose roads sit in the west half of a 2x2 grid."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmpdir.name)
+        G = nx.MultiDiGraph(crs="epsg:4326")
+        G.add_node(1, x=-122.09, y=49.01)
+        G.add_node(2, x=-122.04, y=49.01)
+        G.add_node(3, x=-122.09, y=49.09)
+        G.add_node(4, x=-122.08, y=49.09)
+        G.add_edge(1, 2, length=2500.0)
+        G.add_edge(2, 1, length=2500.0)
+        G.add_edge(3, 4, length=200.0)
+        self.path = self.folder / "net.graphml"
+        ox.save_graphml(G, self.path)
+        self.bbox = (-122.1, 49.0, -122.0, 49.1)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_raster_bands(self):
+        """Test node counts, edge midpoints and lengths per north-up cell."""
+        arrays = graphml_coordinate_arrays(self.path)
+        raster, bbox = coverage_raster(arrays, cell_deg=0.05, bbox=self.bbox)
+        self.assertEqual(raster.shape, (3, 2, 2))
+        self.assertEqual(raster.dtype, np.float32)
+        self.assertEqual(bbox, self.bbox)
+        nodes, edges, length_km = raster
+        # south-west cell is the bottom-left of the north-up grid
+        np.testing.assert_array_equal(nodes, [[2, 0], [1, 1]])
+        np.testing.assert_array_equal(edges, [[1, 0], [2, 0]])
+        np.testing.assert_allclose(length_km, [[0.2, 0], [5.0, 0]], rtol=1e-6)
+
+    def test_outputs_flag_gaps(self):
+        """Test that the NPY and GeoJSON outputs flag empty and sparse cells."""
+        prefix = self.folder / "out" / "cov"
+        with patch("builtins.print"):
+            self.assertEqual(coverage(self.path, prefix, cell_deg=0.05, bbox=self.bbox, min_length_km=1.0), 0)
+        self.assertEqual(np.load(prefix.with_suffix(".npy")).shape, (3, 2, 2))
+        with open(prefix.with_suffix(".geojson")) as f:
+            summary = json.load(f)
+        self.assertEqual(summary["summary"]["covered"], 1)
+        self.assertEqual(summary["summary"]["sparse"], 2)
+        self.assertEqual(summary["summary"]["empty"], 1)
+        statuses = sorted(feature["properties"]["status"] for feature in summary["features"])
+        self.assertEqual(statuses, ["empty", "sparse", "sparse"])
+
+
+@unittest.skipIf(pa is None, "pyarrow not installed")
+class TestExport(unittest.TestCase):
+    """Test the columnar node/edge export."""
+
+    def setUp(self):
+        """Write a small network with tags, speeds and a missing value."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmpdir.name)
+        G = nx.MultiDiGraph(crs="epsg:4326")
+        G.add_node(1, x=-122.0, y=49.0, street_count=1)
+        G.add_node(2, x=-122.01, y=49.0, street_count=2)
+        G.add_node(3, x=-122.02, y=49.0, street_count=1)
+        G.add_edge(1, 2, osmid=10, highway="track", surface="gravel", tracktype="grade2",
+                   length=700.5, speed_kph=30.0, travel_time=84.06)
+        G.add_edge(2, 3, osmid=11, highway="residential", surface="asphalt",
+                   length=650.0, speed_kph=50.0, travel_time=46.8)
+        G.add_edge(2, 3, osmid=12, highway="track", length=900.0, speed_kph=30.0, travel_time=108.0)
+        self.path = self.folder / "net.graphml.gz"
+        save_graph(G, self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parquet_types_and_values(self):
+        """Test dictionary-encoded tags and float column types in Parquet."""
+        written = export_tables(self.path, self.folder / "net", "parquet", batch_rows=2)
+        self.assertEqual(written["nodes"][1], 3)
+        self.assertEqual(written["edges"][1], 3)
+        edges = pq.read_table(written["edges"][0])
+        self.assertTrue(pa.types.is_dictionary(edges.schema.field("highway").type))
+        self.assertEqual(edges.schema.field("length").type, pa.float64())
+        self.assertEqual(edges.schema.field("travel_time").type, pa.float32())
+        self.assertEqual(edges.column("highway").to_pylist(), ["track", "residential", "track"])
+        self.assertEqual(edges.column("tracktype").to_pylist(), ["grade2", None, None])
+        self.assertEqual(edges.column("key").to_pylist(), [0, 0, 1])
+        nodes = pq.read_table(written["nodes"][0])
+        self.assertEqual(nodes.column("osmid").to_pylist(), [1, 2, 3])
+        self.assertEqual(nodes.column("street_count").to_pylist(), [1, 2, 1])
+
+    def test_arrow_memory_map(self):
+        """Test that the Arrow file memory-maps, with dictionaries shared across batches."""
+        written = export_tables(self.path, self.folder / "net", "arrow", batch_rows=1)
+        reader = pa.ipc.open_file(pa.memory_map(str(written["edges"][0])))
+        self.assertEqual(reader.num_record_batches, 3)
+        table = reader.read_all()
+        self.assertEqual(table.column("surface").to_pylist(), ["gravel", "asphalt", None])
+        self.assertAlmostEqual(sum(table.column("length").to_pylist()), 2250.5)
+
+
 class TestConstants(unittest.TestCase):
     """Test constant definitions."""
 
@@ -200,6 +1597,86 @@ class TestConstants(unittest.TestCase):
         self.assertNotIn("dirt", PAVED_SURFACES)
 
 
+class TestRunProfile(unittest.TestCase):
+    """Test phase timing instrumentation."""
+
+    def test_phases_aggregate_by_name(self):
+        """Test that repeated phases are aggregated into one entry."""
+        profile = RunProfile("test")
+        profile.start()
+        for _ in range(3):
+            with profile.phase("load"):
+                pass
+        with profile.phase("save"):
+            pass
+        summary = profile.stop()
+
+        names = [p["name"] for p in summary["phases"]]
+        self.assertEqual(names, ["load", "save"])
+        self.assertEqual(summary["phases"][0]["calls"], 3)
+        for key in ("wall_s", "cpu_s", "peak_rss_mb"):
+            self.assertIn(key, summary["total"])
+
+    def test_concurrent_phases_count_own_thread_cpu(self):
+        """Test that a waiting phase is not charged for CPU burnt by another thread."""
+        profile = RunProfile("test")
+        profile.start()
+        started = threading.Event()
+        done = threading.Event()
+
+        def waiting_phase():
+            with profile.phase("wait"):
+                started.set()
+                done.wait(5)
+
+        worker = threading.Thread(target=waiting_phase)
+        worker.start()
+        started.wait(5)
+        with profile.phase("busy"):
+            deadline = time.process_time() + 0.2
+            while time.process_time() < deadline:
+                pass
+        done.set()
+        worker.join()
+        summary = profile.stop()
+
+        phases = {p["name"]: p for p in summary["phases"]}
+        self.assertGreaterEqual(phases["busy"]["cpu_s"], 0.15)
+        self.assertLess(phases["wait"]["cpu_s"], 0.1)
+        self.assertGreaterEqual(summary["total"]["cpu_s"], phases["busy"]["cpu_s"])
+
+    def test_profile_phase_without_active_profile(self):
+        """Test that profile_phase is a no-op outside a profiled run."""
+        with profile_phase("noop"):
+            value = 1
+        self.assertEqual(value, 1)
+
+    def test_profiled_run_writes_summary(self):
+        """Test that an enabled run writes JSON and cProfile output."""
+        with tempfile.TemporaryDirectory() as tmp:
+            with profiled_run("unit", enabled=True, output_dir=Path(tmp)) as profile:
+                with profile_phase("work"):
+                    sum(range(1000))
+
+            summaries = list(Path(tmp).glob("unit__*.json"))
+            self.assertEqual(len(summaries), 1)
+            with open(summaries[0]) as f:
+                summary = json.load(f)
+            self.assertEqual(summary["command"], "unit")
+            self.assertEqual(summary["phases"][0]["name"], "work")
+            self.assertIn("tracemalloc_peak_mb", summary["phases"][0])
+            self.assertTrue(Path(summary["cprofile"]).exists())
+            self.assertIn("work", profile.phases)
+
+    def test_profiled_run_disabled_writes_nothing(self):
+        """Test that phase timers alone do not write files."""
+        with tempfile.TemporaryDirectory() as tmp:
+            with profiled_run("unit", enabled=False, output_dir=Path(tmp)):
+                with profile_phase("work"):
+                    pass
+            self.assertEqual(list(Path(tmp).iterdir()), [])
+
+
 class TestCLIParser(unittest.TestCase):
     """Test CLI argument parsing."""
 
@@ -246,11 +1723,132 @@ class TestCLIParser(unittest.TestCase):
         self.assertEqual(args.command, "stats")
         self.assertEqual(args.filepath, Path("/tmp/network.graphml"))
 
+    def test_fetch_batch_command(self):
+        """Test parsing fetch-batch command."""
+        args = self.parser.parse_args([
+            "fetch-batch", "/tmp/places.txt", "--output-dir", "/tmp/data", "--download-workers", "3",
+        ])
+        self.assertEqual(args.command, "fetch-batch")
+        self.assertEqual(args.places_file, Path("/tmp/places.txt"))
+        self.assertEqual(args.download_workers, 3)
+        self.assertEqual(args.queue_size, 2)
+
+    def test_fetch_plan_command(self):
+        """Test parsing fetch-plan command."""
+        args = self.parser.parse_args([
+            "fetch-plan", "/tmp/plan.json", "--output-dir", "/tmp/data", "--since", "2025-01-01", "--dry-run",
+        ])
+        self.assertEqual(args.command, "fetch-plan")
+        self.assertEqual(args.manifest, Path("/tmp/plan.json"))
+        self.assertEqual(args.since, "2025-01-01")
+        self.assertTrue(args.dry_run)
+        self.assertEqual(args.download_workers, 2)
+
+    def test_geocode_command(self):
+        """Test parsing geocode command."""
+        args = self.parser.parse_args(["geocode", "/tmp/places.txt", "--refresh"])
+        self.assertEqual(args.command, "geocode")
+        self.assertEqual(args.places_file, Path("/tmp/places.txt"))
+        self.assertTrue(args.refresh)
+        self.assertIsNone(args.geocode_db)
+
+    def test_compact_routing_command(self):
+        """Test parsing compact-routing command."""
+        args = self.parser.parse_args([
+            "compact-routing", "/tmp/in.graphml", "--output", "/tmp/out.graphml",
+            "--routing-profile", "nurse", "--drop-excluded",
+        ])
+        self.assertEqual(args.command, "compact-routing")
+        self.assertEqual(args.output, Path("/tmp/out.graphml"))
+        self.assertEqual(args.routing_profile, "nurse")
+        self.assertTrue(args.drop_excluded)
+
+    def test_diff_command(self):
+        """Test parsing diff command."""
+        args = self.parser.parse_args([
+            "diff", "/tmp/old.graphml", "/tmp/new.graphml", "--output", "/tmp/c.jsonl", "--exit-code"
+        ])
+        self.assertEqual(args.command, "diff")
+        self.assertEqual(args.new, Path("/tmp/new.graphml"))
+        self.assertTrue(args.exit_code)
+
+    def test_stats_sql_command(self):
+        """Test parsing stats --sql without a file and the edge-db command."""
+        args = self.parser.parse_args([
+            "stats", "--sql", "--group-by", "date_fetched", "--where", "access = 'private'"
+        ])
+        self.assertTrue(args.sql)
+        self.assertIsNone(args.filepath)
+        self.assertEqual(args.group_by, "date_fetched")
+        args = self.parser.parse_args(["edge-db", "/tmp/raw", "--db", "/tmp/e.sqlite"])
+        self.assertEqual(args.command, "edge-db")
+        self.assertEqual(args.db, Path("/tmp/e.sqlite"))
+        self.assertFalse(args.force)
+
+    def test_isochrones_command(self):
+        """Test parsing isochrones command."""
+        args = self.parser.parse_args([
+            "isochrones", "/tmp/g.graphml", "--hub", "123", "--hub", "49.1,-122.5",
+            "--bands", "20", "30", "--output", "/tmp/iso/hubs", "--routing-profile", "nurse",
+        ])
+        self.assertEqual(args.command, "isochrones")
+        self.assertEqual(args.hub, ["123", "49.1,-122.5"])
+        self.assertEqual(args.bands, [20.0, 30.0])
+        self.assertEqual(args.routing_profile, "nurse")
+        self.assertFalse(args.no_cache)
+
+    def test_hub_tables_command(self):
+        """Test parsing hub-tables command."""
+        args = self.parser.parse_args([
+            "hub-tables", "/tmp/g.graphml", "--hubs-file", "/tmp/hubs.txt", "--workers", "2"
+        ])
+        self.assertEqual(args.command, "hub-tables")
+        self.assertEqual(args.hubs_file, Path("/tmp/hubs.txt"))
+        self.assertEqual(args.hub, [])
+        self.assertEqual(args.workers, 2)
+
+    def test_coverage_command(self):
+        """Test parsing coverage command."""
+        args = self.parser.parse_args([
+            "coverage", "/tmp/in.graphml", "--output", "/tmp/cov/in",
+            "--cell-deg", "0.1", "--bbox", "-123", "49", "-122", "50",
+        ])
+        self.assertEqual(args.command, "coverage")
+        self.assertEqual(args.output, Path("/tmp/cov/in"))
+        self.assertEqual(args.cell_deg, 0.1)
+        self.assertEqual(args.bbox, [-123.0, 49.0, -122.0, 50.0])
+        self.assertEqual(args.min_length_km, 1.0)
+
+    def test_export_command(self):
+        """Test parsing export command."""
+        args = self.parser.parse_args(["export", "/tmp/in.graphml", "--format", "arrow"])
+        self.assertEqual(args.command, "export")
+        self.assertEqual(args.format, "arrow")
+        self.assertIsNone(args.output)
+        self.assertEqual(args.batch_rows, 65536)
+
+    def test_shard_command(self):
+        """Test parsing shard command."""
+        args = self.parser.parse_args([
+            "shard", "/tmp/in.graphml", "--output-dir", "/tmp/shards", "--tile-size", "0.5"
+        ])
+        self.assertEqual(args.command, "shard")
+        self.assertEqual(args.output_dir, Path("/tmp/shards"))
+        self.assertEqual(args.tile_size, 0.5)
+
     def test_verbose_flag(self):
         """Test verbose flag."""
         args = self.parser.parse_args(["-v", "stats", "/tmp/network.graphml"])
         self.assertTrue(args.verbose)
 
+    def test_profile_flags(self):
+        """Test global profile flags."""
+        args = self.parser.parse_args([
+            "--profile", "--profile-dir", "/tmp/prof", "stats", "/tmp/network.graphml"
+        ])
+        self.assertTrue(args.profile)
+        self.assertEqual(args.profile_dir, Path("/tmp/prof"))
+
 
 if __name__ == "__main__":
     unittest.main()